@@ -1,51 +1,71 @@
+from __future__ import annotations
+import asyncio
 import json
+import threading
 from textwrap import dedent
-from openai import AzureOpenAI
-from config import openai
-from config import ACTION_PLAN_CACHE_FILE_PATH
+from typing import TYPE_CHECKING
+from lib.llm_gateway import llm_gateway
+from config import ACTION_PLAN_CACHE_FILE_PATH, CACHE_BACKEND, CACHE_LOCATIONS, CACHE_MAX_ENTRIES, CACHE_TTL_S
+from config import SEMANTIC_PLAN_CACHE_ENABLED, SEMANTIC_PLAN_CACHE_THRESHOLD, SEMANTIC_PLAN_CACHE_MAX_ENTRIES, SEMANTIC_PLAN_CACHE_EMBEDDER
+from lib.cache import create_cache
+from lib.semantic_cache import SemanticPlanCache, EMBEDDERS
+from lib.tracing import tracer
+from lib.logging import log
+
+if TYPE_CHECKING:
+    from openai import AzureOpenAI, AsyncAzureOpenAI
 
 class ActionPlanGeneratorAgent:
-    def __init__(self, openai: AzureOpenAI):
+    def __init__(self, openai: AzureOpenAI, async_openai: AsyncAzureOpenAI = None):
         self.openai = openai
+        self.async_openai = async_openai
+        self.cache = create_cache(
+            "action_plans",
+            backend=CACHE_BACKEND,
+            location=CACHE_LOCATIONS[CACHE_BACKEND],
+            max_entries=CACHE_MAX_ENTRIES,
+            ttl_s=CACHE_TTL_S,
+            legacy_json_path=ACTION_PLAN_CACHE_FILE_PATH,
+        )
+        self.semantic_cache = SemanticPlanCache(
+            embed=EMBEDDERS[SEMANTIC_PLAN_CACHE_EMBEDDER](),
+            threshold=SEMANTIC_PLAN_CACHE_THRESHOLD,
+            max_entries=SEMANTIC_PLAN_CACHE_MAX_ENTRIES,
+        ) if SEMANTIC_PLAN_CACHE_ENABLED else None
+        self._semantic_cache_loaded = False
+        self._semantic_cache_lock = threading.Lock()
 
-    def recall(self, user_query: str) -> dict:
-        # Try to read from plan_cache.json and return cached plan if it exists
-        try:
-            with open(ACTION_PLAN_CACHE_FILE_PATH, 'r') as f:
-                cache = json.load(f)
-                if user_query in cache:
-                    return cache[user_query]
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Return None if file doesn't exist or is invalid JSON
+    def _load_semantic_cache(self):
+        # Index the plans already in the durable cache on first use, once,
+        # concurrent recalls wait for it instead of missing or indexing twice
+        with self._semantic_cache_lock:
+            if self._semantic_cache_loaded:
+                return
+            for user_query, plan in self.cache.items():
+                self.semantic_cache.add(user_query, plan)
+            self._semantic_cache_loaded = True
+
+    def recall(self, user_query: str, query_id: str = None) -> dict:
+        # Return cached plan if it exists, None otherwise
+        plan = self.cache.get(user_query)
+        if plan is None and self.semantic_cache is not None:
+            if not self._semantic_cache_loaded:
+                self._load_semantic_cache()
+            hit = self.semantic_cache.lookup(user_query)
+            if hit is not None:
+                plan, kind, similarity = hit
+                log.info("Action plan cache hit", {"kind": kind, "similarity": round(similarity, 3), "query": user_query})
+        if plan is None:
             return None
-        
-        # Return None if query not found in cache
-        return None
+        # Cached plans carry the query that produced them
+        return {**plan, "query_id": query_id, "query": user_query}
 
     def remember(self, user_query: str, plan: dict):
-        # Write the plan to plan_cache.json
-        try:
-            # Try to read existing cache first
-            with open('plan_cache.json', 'r') as f:
-                cache = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Create new cache if file doesn't exist or is invalid
-            cache = {}
-            
-            # Add/update the plan for this query
-            cache[user_query] = plan
-            
-        # Write updated cache back to file
-        with open('plan_cache.json', 'w') as f:
-            json.dump(cache, f, indent=2)
+        self.cache.set(user_query, plan)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(user_query, plan)
 
-    def generate_action_plan(self, user_query: str, query_id: str) -> dict:
-        cache = self.recall(user_query=user_query)
-
-        if cache is not None:
-            # cache hit
-            return cache
-        
+    def build_prompt(self, user_query: str) -> str:
         prompt = f"""
 You are a human who uses web browser. 
 You will list step by step action plan to accomplish the user query.
@@ -60,17 +80,19 @@ goal property is how to validate.
 output must be in json format.
 """  + "Output into this format - { \"goto\": \"url\", \"action_plan\": [], \"goal\": \"\" }"
 
-        clean_prompt = dedent(prompt)
+        return dedent(prompt)
 
-        response = self.openai.chat.completions.create(
-            model="GPT4o-mini",
-            messages=[{"role": "user", "content": clean_prompt}],
-            temperature=0.3,
-            max_tokens=300,
-            top_p=0.95,
-            response_format={"type": "json_object"}
-        )
-        result = response.choices[0].message.content
+    def completion_params(self, user_query: str) -> dict:
+        return {
+            "model": "GPT4o-mini",
+            "messages": [{"role": "user", "content": self.build_prompt(user_query)}],
+            "temperature": 0.3,
+            "max_tokens": 300,
+            "top_p": 0.95,
+            "response_format": {"type": "json_object"},
+        }
+
+    def parse_plan(self, result: str, user_query: str, query_id: str) -> dict:
         # Parse the JSON string into a Python dictionary
         plan = json.loads(result)
         
@@ -83,4 +105,31 @@ output must be in json format.
         
         return plan
 
-action_plan_generator = ActionPlanGeneratorAgent(openai=openai)
+    def generate_action_plan(self, user_query: str, query_id: str) -> dict:
+        cache = self.recall(user_query=user_query, query_id=query_id)
+        tracer.count("agent_cache_lookups_total", agent="action_plans", result="miss" if cache is None else "hit")
+
+        if cache is not None:
+            # cache hit
+            return cache
+
+        with tracer.span("llm_call", agent="action_plans"):
+            response = self.openai.chat.completions.create(**self.completion_params(user_query))
+        result = response.choices[0].message.content
+        return self.parse_plan(result, user_query=user_query, query_id=query_id)
+
+    async def agenerate_action_plan(self, user_query: str, query_id: str) -> dict:
+        # The caches block (SQLite, Redis), they are read and written on a thread
+        cache = await asyncio.to_thread(self.recall, user_query=user_query, query_id=query_id)
+        tracer.count("agent_cache_lookups_total", agent="action_plans", result="miss" if cache is None else "hit")
+
+        if cache is not None:
+            # cache hit
+            return cache
+
+        with tracer.span("llm_call", agent="action_plans"):
+            response = await self.async_openai.chat.completions.create(**self.completion_params(user_query))
+        result = response.choices[0].message.content
+        return await asyncio.to_thread(self.parse_plan, result, user_query=user_query, query_id=query_id)
+
+action_plan_generator = ActionPlanGeneratorAgent(openai=llm_gateway, async_openai=llm_gateway.aio)
@@ -1,65 +1,106 @@
+from __future__ import annotations
+import asyncio
 import json
+import time
 from textwrap import dedent
-import base64
-from openai import AzureOpenAI
-from config import openai
-from config import BROWSER_ACTION_CACHE_FILE_PATH
-from lib.utils import generate_screenshot_base64
+from typing import TYPE_CHECKING
+from lib.llm_gateway import llm_gateway
+from config import BROWSER_ACTION_CACHE_FILE_PATH, CACHE_BACKEND, CACHE_LOCATIONS, CACHE_MAX_ENTRIES, CACHE_TTL_S
+from config import SCREENSHOT_MATCH_MAX_DISTANCE, SCREENSHOT_CACHE_VARIANTS
+from lib.cache import create_cache
+from lib.tracing import tracer
+from lib.logging import log
+from lib.page_fingerprint import ScreenshotKey, hamming_distance
+from lib.screenshot_pipeline import Screenshot
+from lib.action_stream import ActionStreamParser, normalize_actions
+
+if TYPE_CHECKING:
+    from openai import AzureOpenAI, AsyncAzureOpenAI
+
+ACTION_SCHEMA = '{ "box_click": 1, "input_text": "system generated", "extracted_data": "" }'
+
+
+def numbered(actions: list) -> str:
+    return "\n".join(f"{idx + 1}. {action}" for idx, action in enumerate(actions))
+
+
+class ActionRequest:
+    """
+    One LLM request of a tier, built the same way for the sync and async
+    transports: either the cached result, or the params to send, the
+    llm_call span's labels and how the answer becomes the result.
+    """
+    def __init__(self, cached=None, params: dict = None, span: dict = None, label: str = None, parse=None):
+        self.cached = cached
+        self.params = params
+        self.span = span
+        self.label = label
+        self.parse = parse
+
+    def finish(self, result: str, streamed: bool = False):
+        log.info(f"{self.label} openai {'stream' if streamed else 'call'} result", {"result": result})
+        return self.parse(result)
+
 
 class BrowserActionGeneratorAgent:
-    def __init__(self, openai: AzureOpenAI) -> None:
+    def __init__(self, openai: AzureOpenAI, async_openai: AsyncAzureOpenAI = None) -> None:
         self.openai = openai
-        pass
-
-    def recall(self, screenshot_path: str, action: str,) -> dict:
-        # Try to read from webpage_action_cache.json and return cached data if it exists
-        try:
-            with open(BROWSER_ACTION_CACHE_FILE_PATH, 'r') as f:
-                cache = json.load(f)
-                cache_key = f"{screenshot_path}:{action}"
-                if cache_key in cache:
-                    return cache[cache_key]
-        
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Return empty dict if file doesn't exist or is invalid JSON
+        self.async_openai = async_openai
+        self.cache = create_cache(
+            "browser_actions",
+            backend=CACHE_BACKEND,
+            location=CACHE_LOCATIONS[CACHE_BACKEND],
+            max_entries=CACHE_MAX_ENTRIES,
+            ttl_s=CACHE_TTL_S,
+            legacy_json_path=BROWSER_ACTION_CACHE_FILE_PATH,
+        )
+        tracer.metrics.describe("page_actions_first_action_seconds", "Time from a streamed page actions request to its first complete action")
+
+    def page_key(self, screenshot: Screenshot, fingerprint: str) -> ScreenshotKey:
+        return ScreenshotKey(fingerprint=fingerprint, phash=screenshot.phash)
+
+    def recall(self, key: ScreenshotKey, action: str) -> dict:
+        # Pages must match the structure fingerprint exactly and the
+        # screenshot's perceptual hash approximately
+        variants = self.cache.get(f"{key.fingerprint}:{action}")
+        if not variants:
             return None
-        
-        # Return None if query not found in cache
-        return None
-
-    def remember(self, screenshot_path: str, action: str, data: dict) -> None:
-        try:
-            # Try to read existing cache first
-            with open(BROWSER_ACTION_CACHE_FILE_PATH, 'r') as f:
-                cache = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Create new cache if file doesn't exist or is invalid
-            cache = {}
-        
-        # Create cache key from screenshot path and action
-        cache_key = f"{screenshot_path}:{action}"
-            
-        # Add/update the cache entry
-        cache[cache_key] = data
-            
-        # Write updated cache back to file
-        with open(BROWSER_ACTION_CACHE_FILE_PATH, 'w') as f:
-            json.dump(cache, f, indent=2)
-        pass
 
-    def generate_page_actions(self, screenshot_path: str, action: str):
+        distance, best = min(
+            ((hamming_distance(int(variant["phash"], 16), key.phash), variant) for variant in variants),
+            key=lambda match: match[0]
+        )
+        if distance > SCREENSHOT_MATCH_MAX_DISTANCE:
+            return None
+        if distance > 0:
+            log.info("Near duplicate screenshot cache hit", {"distance": distance})
+        return best["data"]
 
-        cache = self.recall(screenshot_path=screenshot_path, action=action)
+    def remember(self, key: ScreenshotKey, action: str, data: dict) -> None:
+        # Keep a few visual variants per page structure and action
+        cache_key = f"{key.fingerprint}:{action}"
+        phash = f"{key.phash:x}"
+        variants = [variant for variant in (self.cache.get(cache_key) or []) if variant["phash"] != phash]
+        variants.append({"phash": phash, "data": data})
+        self.cache.set(cache_key, variants[-SCREENSHOT_CACHE_VARIANTS:])
 
-        if cache is not None:
-            # cache hit
-            return cache
-        
-        print("generate_page_actions cache miss >", screenshot_path, action)
-        
-        # Read and encode the image
-        image_base64 = generate_screenshot_base64(screenshot_path)
+    def image_messages(self, prompt: str, screenshot: Screenshot) -> list:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": dedent(prompt)},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": screenshot.data_url
+                        }
+                    }
+                ]
+            }
+        ]
 
+    def page_actions_params(self, screenshot: Screenshot, action: str) -> dict:
         prompt = f"""
 This is screenshot of a webpage with highligted boxes.
 
@@ -69,7 +110,7 @@ Output should be sequential list of action that will be performed in order.
 
 If no value then use null, dont use default.
 
-""" + "Give me list of browser actions in this schema - { \"box_click\": 1, \"input_text\": \"system generated\", \"extracted_data\": \"\" }" + """
+Give me list of browser actions in this schema - {ACTION_SCHEMA}
 
 box_click denotes which highlighted box to click
 input_text is what user needs to enter
@@ -77,59 +118,35 @@ extracted_data will hold if any data needed to be extracted from the page
 
 output must be in json format.
 """
+        messages = self.image_messages(prompt, screenshot)
+        log.debug("Browser action generator messages", {"messages": messages})
+        return self.completion_params(messages)
 
-        
-        clean_prompt = dedent(prompt)
+    def outline_params(self, outline: str, action: str) -> dict:
+        prompt = f"""
+These are the interactive elements of a webpage, one per line as [box number] tag "label".
 
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": clean_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
-        ]
+{outline}
 
-        print("browser action generator messages", json.dumps(messages, indent=4))
+We need to perform this action: {action}
 
-        response = self.openai.chat.completions.create(
-            model="GPT4o-mini",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=300,
-            top_p=0.95,
-            response_format={"type": "json_object"}
-        )
-        result = response.choices[0].message.content
+Output should be sequential list of action that will be performed in order.
 
-        print("webpage action openai call result", result)
-        
-        # Parse the JSON string into a Python dictionary
-        data = json.loads(result)
-        
-        # set cache
-        self.remember(screenshot_path=screenshot_path, action=action, data=data)
-        
-        return data
-    
-    def generate_vision_only_actions(self, screenshot_path: str, action: str):
-        cache = self.recall(screenshot_path=screenshot_path, action=action)
+If no value then use null, dont use default.
 
-        if cache is not None:
-            # cache hit
-            return cache
-        
-        print("generate_page_actions cache miss >", screenshot_path, action)
-        
-        # Read and encode the image
-        image_base64 = generate_screenshot_base64(screenshot_path)
+Give me list of browser actions in this schema - {ACTION_SCHEMA}
+
+box_click denotes which box number to click
+input_text is what user needs to enter
+confidence is between 0 and 1, how sure you are these elements perform the action without seeing the page
+
+output must be in json format - {{ "actions": [<browser actions>], "confidence": 0.9 }}
+"""
+        messages = [{"role": "user", "content": dedent(prompt)}]
+        log.debug("Outline action generator messages", {"messages": messages})
+        return self.completion_params(messages)
 
+    def vision_only_params(self, screenshot: Screenshot, action: str) -> dict:
         prompt = f"""
 This is screenshot of a webpage.
 
@@ -137,7 +154,7 @@ We need to perform this action: {action}
 
 If no value then use null, dont use default.
 
-""" + "Give me list of browser actions in this schema - { \"box_click\": 1, \"input_text\": \"system generated\", \"extracted_data\": \"\" }" + """
+Give me list of browser actions in this schema - {ACTION_SCHEMA}
 
 box_click will be null
 input_text will be null
@@ -145,46 +162,312 @@ extracted_data will hold if any data needed to be extracted from the page
 
 output must be in json format.
 """
+        messages = self.image_messages(prompt, screenshot)
+        log.debug("Vision only action generator messages", {"messages": messages})
+        return self.completion_params(messages)
 
-        
-        clean_prompt = dedent(prompt)
+    def vision_only_batch_params(self, screenshot: Screenshot, actions: list) -> dict:
+        prompt = f"""
+This is screenshot of a webpage.
 
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": clean_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
-        ]
+We need to perform each of these actions on it:
+{numbered(actions)}
 
-        print("vision only action generator messages", json.dumps(messages, indent=4))
+If no value then use null, dont use default.
 
-        response = self.openai.chat.completions.create(
-            model="GPT4o-mini",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=300,
-            top_p=0.95,
-            response_format={"type": "json_object"}
-        )
-        result = response.choices[0].message.content
+For each action give me the browser action in this schema - {ACTION_SCHEMA}
 
-        print("vision only action openai call result", result)
-        
+box_click will be null
+input_text will be null
+extracted_data will hold if any data needed to be extracted from the page
+
+output must be in json format - {{ "results": [<action 1 output>, <action 2 output>, ...] }}, one entry per action in the same order.
+"""
+        messages = self.image_messages(prompt, screenshot)
+        log.debug("Vision only batch action generator messages", {"messages": messages})
+        return self.completion_params(messages, max_tokens=300 * len(actions))
+
+    def fused_page_actions_params(self, screenshot: Screenshot, actions: list) -> dict:
+        prompt = f"""
+This is screenshot of a webpage with highligted boxes.
+
+We need to perform these steps in order, all of them on this page:
+{numbered(actions)}
+
+For each step, output the sequential list of browser actions that performs it.
+
+If no value then use null, dont use default.
+
+Each browser action is in this schema - {ACTION_SCHEMA}
+
+box_click denotes which highlighted box to click
+input_text is what user needs to enter
+extracted_data will hold if any data needed to be extracted from the page
+
+output must be in json format - {{ "steps": [[<step 1 actions>], [<step 2 actions>], ...] }}, one entry per step in the same order.
+"""
+        messages = self.image_messages(prompt, screenshot)
+        log.debug("Fused page actions generator messages", {"messages": messages})
+        return self.completion_params(messages, max_tokens=300 * len(actions))
+
+    def completion_params(self, messages: list, max_tokens: int = 300) -> dict:
+        return {
+            "model": "GPT4o-mini",
+            "messages": messages,
+            "temperature": 0.3,
+            "max_tokens": max_tokens,
+            "top_p": 0.95,
+            "response_format": {"type": "json_object"},
+        }
+
+    def parse_actions(self, result: str, key: ScreenshotKey, action: str):
         # Parse the JSON string into a Python dictionary
         data = json.loads(result)
         
         # set cache
-        self.remember(screenshot_path=screenshot_path, action=action, data=data)
+        self.remember(key=key, action=action, data=data)
         
         return data
+
+    def parse_batch(self, result: str, key: ScreenshotKey, actions: list) -> list:
+        results = json.loads(result).get("results")
+        if not isinstance(results, list) or len(results) != len(actions):
+            raise ValueError(f"Expected {len(actions)} results from batched extraction, got: {result}")
+
+        for action, data in zip(actions, results):
+            self.remember(key=key, action=action, data=data)
+
+        return results
+
+    def parse_fused(self, result: str, key: ScreenshotKey, actions: list) -> list:
+        steps = json.loads(result).get("steps")
+        if not isinstance(steps, list) or len(steps) != len(actions):
+            raise ValueError(f"Expected {len(actions)} steps from fused page actions, got: {result}")
+
+        for action, data in zip(actions, steps):
+            self.remember(key=key, action=action, data=data)
+
+        return steps
+
+    def recall_batch(self, key: ScreenshotKey, actions: list) -> tuple:
+        """Cached results by action, and the actions still missing."""
+        cached = {}
+        for action in dict.fromkeys(actions):
+            cached[action] = self.recall(key=key, action=action)
+            tracer.count("agent_cache_lookups_total", agent="browser_actions", result="miss" if cached[action] is None else "hit")
+        return cached, [action for action, data in cached.items() if data is None]
+
+    # Requests of each tier, built once for the sync and async transports
+
+    def page_actions_request(self, screenshot: Screenshot, action: str, fingerprint: str, params=None) -> ActionRequest:
+        key = self.page_key(screenshot, fingerprint)
+        cache = self.recall(key=key, action=action)
+
+        tracer.count("agent_cache_lookups_total", agent="browser_actions", result="miss" if cache is None else "hit")
+        if cache is not None:
+            # cache hit
+            return ActionRequest(cached=cache)
+
+        log.info("Page actions cache miss", {"screenshot": screenshot.path, "action": action})
+        return ActionRequest(
+            params=(params or self.page_actions_params)(screenshot, action),
+            span={"kind": "page_actions"},
+            label="Webpage action",
+            parse=lambda result: self.parse_actions(result, key=key, action=action),
+        )
+
+    def vision_only_request(self, screenshot: Screenshot, action: str, fingerprint: str) -> ActionRequest:
+        request = self.page_actions_request(screenshot, action, fingerprint, params=self.vision_only_params)
+        if request.cached is None:
+            request.span, request.label = {"kind": "vision_only"}, "Vision only action"
+        return request
+
+    def outline_request(self, outline: str, action: str, fingerprint: str) -> ActionRequest:
+        cache_key = f"outline:{fingerprint}:{action}"
+        cache = self.cache.get(cache_key)
+
+        tracer.count("agent_cache_lookups_total", agent="browser_actions_outline", result="miss" if cache is None else "hit")
+        if cache is not None:
+            return ActionRequest(cached=cache)
+
+        def parse(result: str) -> dict:
+            data = json.loads(result)
+            self.cache.set(cache_key, data)
+            return data
+
+        return ActionRequest(params=self.outline_params(outline, action), span={"kind": "outline"}, label="Outline action", parse=parse)
+
+    def vision_only_batch_request(self, screenshot: Screenshot, actions: list, fingerprint: str) -> ActionRequest:
+        key = self.page_key(screenshot, fingerprint)
+        cached, missing = self.recall_batch(key, actions)
+        done = lambda: [cached[action] for action in actions]
+        if not missing:
+            return ActionRequest(cached=done())
+
+        log.info("Vision only batch cache miss", {"screenshot": screenshot.path, "actions": missing})
+
+        def parse(result: str) -> list:
+            if len(missing) > 1:
+                cached.update(zip(missing, self.parse_batch(result, key=key, actions=missing)))
+            else:
+                cached[missing[0]] = self.parse_actions(result, key=key, action=missing[0])
+            return done()
+
+        return ActionRequest(
+            params=self.vision_only_batch_params(screenshot, missing) if len(missing) > 1 else self.vision_only_params(screenshot, missing[0]),
+            span={"kind": "vision_only", "batch": len(missing)},
+            label="Vision only batch",
+            parse=parse,
+        )
+
+    def fused_page_actions_request(self, screenshot: Screenshot, actions: list, fingerprint: str) -> ActionRequest:
+        key = self.page_key(screenshot, fingerprint)
+        cached, missing = self.recall_batch(key, actions)
+        done = lambda: [normalize_actions(cached[action]) for action in actions]
+        if not missing:
+            return ActionRequest(cached=done())
+
+        log.info("Fused page actions cache miss", {"screenshot": screenshot.path, "actions": missing})
+
+        def parse(result: str) -> list:
+            if len(missing) > 1:
+                cached.update(zip(missing, self.parse_fused(result, key=key, actions=missing)))
+            else:
+                cached[missing[0]] = self.parse_actions(result, key=key, action=missing[0])
+            return done()
+
+        return ActionRequest(
+            params=self.fused_page_actions_params(screenshot, missing) if len(missing) > 1 else self.page_actions_params(screenshot, missing[0]),
+            span={"kind": "fused_page_actions", "steps": len(missing)},
+            label="Fused page actions",
+            parse=parse,
+        )
+
+    # Transports
+
+    def complete(self, request: ActionRequest):
+        if request.cached is not None:
+            return request.cached
+        with tracer.span("llm_call", agent="browser_actions", **request.span):
+            response = self.openai.chat.completions.create(**request.params)
+        return request.finish(response.choices[0].message.content)
+
+    async def acomplete(self, build, *args):
+        # Building the request reads the cache and hashes the screenshot,
+        # finishing it writes the cache, both block and run on a thread
+        request = await asyncio.to_thread(build, *args)
+        if request.cached is not None:
+            return request.cached
+        with tracer.span("llm_call", agent="browser_actions", **request.span):
+            response = await self.async_openai.chat.completions.create(**request.params)
+        return await asyncio.to_thread(request.finish, response.choices[0].message.content)
+
+    def generate_page_actions(self, screenshot: Screenshot, action: str, fingerprint: str):
+        return self.complete(self.page_actions_request(screenshot, action, fingerprint))
+
+    def generate_outline_actions(self, outline: str, action: str, fingerprint: str) -> dict:
+        """Text-only decision over the element outline, {"actions": [...], "confidence": ...}."""
+        return self.complete(self.outline_request(outline, action, fingerprint))
+
+    def generate_vision_only_actions(self, screenshot: Screenshot, action: str, fingerprint: str):
+        return self.complete(self.vision_only_request(screenshot, action, fingerprint))
+
+    def generate_vision_only_batch(self, screenshot: Screenshot, actions: list, fingerprint: str) -> list:
+        """
+        Vision only results for several actions on one screenshot, in the
+        order of actions. Uncached actions share a single LLM request.
+        """
+        return self.complete(self.vision_only_batch_request(screenshot, actions, fingerprint))
+
+    def generate_fused_page_actions(self, screenshot: Screenshot, actions: list, fingerprint: str) -> list:
+        """
+        Browser actions of several steps planned on one screenshot, a list
+        of actions per step in the order of actions. Uncached steps share a
+        single LLM request.
+        """
+        return self.complete(self.fused_page_actions_request(screenshot, actions, fingerprint))
+
+    async def agenerate_page_actions(self, screenshot: Screenshot, action: str, fingerprint: str):
+        return await self.acomplete(self.page_actions_request, screenshot, action, fingerprint)
+
+    async def agenerate_outline_actions(self, outline: str, action: str, fingerprint: str) -> dict:
+        return await self.acomplete(self.outline_request, outline, action, fingerprint)
+
+    async def agenerate_vision_only_actions(self, screenshot: Screenshot, action: str, fingerprint: str):
+        return await self.acomplete(self.vision_only_request, screenshot, action, fingerprint)
+
+    async def agenerate_vision_only_batch(self, screenshot: Screenshot, actions: list, fingerprint: str) -> list:
+        return await self.acomplete(self.vision_only_batch_request, screenshot, actions, fingerprint)
+
+    async def agenerate_fused_page_actions(self, screenshot: Screenshot, actions: list, fingerprint: str) -> list:
+        return await self.acomplete(self.fused_page_actions_request, screenshot, actions, fingerprint)
+
+    def stream_page_actions(self, screenshot: Screenshot, action: str, fingerprint: str):
+        """
+        Browser actions for a step, yielded one at a time as the streamed
+        completion finishes each of them, so the executor can run the
+        first while the rest are being generated.
+        """
+        request = self.page_actions_request(screenshot, action, fingerprint)
+        if request.cached is not None:
+            yield from normalize_actions(request.cached)
+            return
+
+        parser = ActionStreamParser()
+        started = time.perf_counter()
+        with tracer.span("llm_call", agent="browser_actions", stream=True, **request.span) as span:
+            stream = self.openai.chat.completions.create(**request.params, stream=True)
+            try:
+                for chunk in stream:
+                    yield from self.stream_chunk(parser, chunk, span, started)
+            finally:
+                stream.close()
+
+        yield from self.stream_rest(request, parser)
+
+    async def astream_page_actions(self, screenshot: Screenshot, action: str, fingerprint: str):
+        request = await asyncio.to_thread(self.page_actions_request, screenshot, action, fingerprint)
+        if request.cached is not None:
+            for item in normalize_actions(request.cached):
+                yield item
+            return
+
+        parser = ActionStreamParser()
+        started = time.perf_counter()
+        with tracer.span("llm_call", agent="browser_actions", stream=True, **request.span) as span:
+            stream = await self.async_openai.chat.completions.create(**request.params, stream=True)
+            try:
+                async for chunk in stream:
+                    for item in self.stream_chunk(parser, chunk, span, started):
+                        yield item
+            finally:
+                await stream.close()
+
+        for item in await asyncio.to_thread(self.stream_rest, request, parser):
+            yield item
+
+    def stream_chunk(self, parser: ActionStreamParser, chunk, span, started: float) -> list:
+        """Actions a streamed chunk completed."""
+        items = parser.feed(self.delta_text(chunk))
+        if items and parser.emitted == len(items):
+            self.first_action(span, started)
+        return items
+
+    def stream_rest(self, request: ActionRequest, parser: ActionStreamParser) -> list:
+        # The full completion is parsed and cached as before, actions the
+        # incremental parser didn't complete follow
+        return normalize_actions(request.finish(parser.text, streamed=True))[parser.emitted:]
+
+    @staticmethod
+    def delta_text(chunk) -> str:
+        # Azure sends a first chunk without choices with the content filter results
+        return (chunk.choices[0].delta.content or "") if chunk.choices else ""
+
+    def first_action(self, span, started: float):
+        elapsed = time.perf_counter() - started
+        span.set(first_action_ms=round(elapsed * 1000, 2))
+        if tracer.enabled:
+            tracer.metrics.observe("page_actions_first_action_seconds", elapsed)
     
 # singleton
-browser_action_generator = BrowserActionGeneratorAgent(openai=openai)
+browser_action_generator = BrowserActionGeneratorAgent(openai=llm_gateway, async_openai=llm_gateway.aio)
@@ -0,0 +1,105 @@
+"""
+Time to first action and step time of the vision tier, buffered against
+streamed completions, with a stub LLM that has a first token latency and a
+per-chunk generation time:
+
+    buffered   the whole completion is parsed, then every action runs
+    streamed   each action runs as soon as the incremental parser
+               completes it, while the rest is being generated
+
+Action execution is simulated (--action-ms per action), the agent, parser
+and StreamedActions are the real ones. Usage, from backend/:
+
+    python -m benchmarks.bench_action_streaming --actions 1 2 4 --llm-latency 0.4 --token-latency 0.02
+"""
+import argparse
+import io
+import json
+import os
+import time
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+os.environ["CACHE_BACKEND"] = "memory"
+# Every lookup misses so each step pays for its completion
+os.environ["CACHE_TTL_S"] = "0"
+
+from PIL import Image
+from benchmarks.stub_llm import ScriptedResponder, StubOpenAI
+from agents.browser_action_generator_agent import BrowserActionGeneratorAgent
+from lib.action_stream import StreamedActions, normalize_actions
+from lib.screenshot_pipeline import Screenshot
+
+STEP = "Fill the form and submit it"
+
+
+def make_screenshot() -> Screenshot:
+    buffer = io.BytesIO()
+    Image.effect_noise((320, 200), 64).convert("RGB").save(buffer, format="JPEG", quality=70)
+    return Screenshot(buffer.getvalue(), "jpeg")
+
+
+def make_actions(count: int) -> list:
+    actions = [{"box_click": idx + 1, "input_text": f"value {idx + 1}", "extracted_data": None} for idx in range(count - 1)]
+    return actions + [{"box_click": count, "input_text": None, "extracted_data": None}]
+
+
+def run_step(agent, screenshot, mode: str, run_id: str, action_ms: float) -> tuple:
+    started = time.perf_counter()
+    if mode == "streamed":
+        source = agent.stream_page_actions(screenshot, STEP, run_id)
+    else:
+        source = normalize_actions(agent.generate_page_actions(screenshot, STEP, run_id))
+    resolved = StreamedActions(source, "vision", started)
+    for _ in resolved:
+        time.sleep(action_ms / 1000)
+    return resolved, (time.perf_counter() - started) * 1000
+
+
+def measure(mode: str, count: int, args) -> dict:
+    responder = ScriptedResponder(plan={}, page_actions={STEP: make_actions(count)})
+    agent = BrowserActionGeneratorAgent(openai=StubOpenAI(responder, args.llm_latency, args.token_latency))
+    screenshot = make_screenshot()
+
+    first_action, steps = [], []
+    for idx in range(args.iterations):
+        resolved, step_ms = run_step(agent, screenshot, mode, f"{mode}-{count}-{idx}", args.action_ms)
+        assert resolved.actions == make_actions(count)
+        first_action.append(resolved.first_action_ms)
+        steps.append(step_ms)
+
+    return {
+        "mode": mode,
+        "actions": count,
+        "first_action_p50_ms": round(percentile(first_action, 50), 2),
+        "first_action_p95_ms": round(percentile(first_action, 95), 2),
+        "step_p50_ms": round(percentile(steps, 50), 2),
+        "step_p95_ms": round(percentile(steps, 95), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--actions", type=int, nargs="+", default=[1, 2, 4], help="actions per completion")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="seconds to the first token")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds per streamed chunk")
+    parser.add_argument("--action-ms", type=float, default=150, help="execution time per action")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for count in args.actions:
+        for mode in ("buffered", "streamed"):
+            results.append(measure(mode, count, args))
+            print(json.dumps(results[-1]))
+
+    summary = {"llm_latency_s": args.llm_latency, "token_latency_s": args.token_latency}
+    for count in args.actions:
+        buffered, streamed = (next(r for r in results if r["mode"] == mode and r["actions"] == count) for mode in ("buffered", "streamed"))
+        summary[f"{count}_actions_first_action_speedup"] = round(buffered["first_action_p50_ms"] / streamed["first_action_p50_ms"], 2)
+        summary[f"{count}_actions_step_speedup"] = round(buffered["step_p50_ms"] / streamed["step_p50_ms"], 2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Micro-benchmark of the page annotation done before every browser step.
+
+Compares the previous per-element approach (one evaluate per overlay) with
+the batched annotation script on a large local fixture page. Usage,
+from backend/:
+
+    python -m benchmarks.bench_annotation --iterations 20
+"""
+import argparse
+import json
+import time
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+
+from playwright.sync_api import sync_playwright
+from benchmarks.fixture_server import start_fixture_server
+from lib.page_annotator import BOX_SELECTOR, PageAnnotator
+
+
+# The annotation as it was done before batching, kept here for comparison
+LEGACY_COLLECT_BOXES_JS = """
+(elements) => {
+    return elements.map((el, idx) => {
+        el.setAttribute('data-box-number', idx + 1);
+        const rect = el.getBoundingClientRect();
+        return {
+            x: rect.x + window.scrollX,
+            y: rect.y + window.scrollY,
+            width: rect.width,
+            height: rect.height,
+            box_number: idx + 1,
+            tag: el.tagName.toLowerCase(),
+            type: el.type || null
+        };
+    });
+}
+"""
+
+LEGACY_DRAW_BOX_JS = """
+([box, color]) => {
+    const div = document.createElement('div');
+    div.style.position = 'absolute';
+    div.style.left = box.x + 'px';
+    div.style.top = box.y + 'px';
+    div.style.width = box.width + 'px';
+    div.style.height = box.height + 'px';
+    div.style.border = '3px solid ' + color;
+    div.style.zIndex = 9999;
+    div.style.pointerEvents = 'none';
+
+    const label = document.createElement('span');
+    label.textContent = box.box_number;
+    label.style.position = 'absolute';
+    label.style.left = '0';
+    label.style.top = '0';
+    label.style.background = color;
+    label.style.color = '#fff';
+    label.style.fontWeight = 'bold';
+    label.style.padding = '2px 6px';
+    label.style.fontSize = '16px';
+    div.appendChild(label);
+
+    document.body.appendChild(div);
+}
+"""
+
+
+def annotate_legacy(page) -> tuple[int, int]:
+    boxes = page.eval_on_selector_all(BOX_SELECTOR, LEGACY_COLLECT_BOXES_JS)
+    for box in boxes:
+        page.evaluate(LEGACY_DRAW_BOX_JS, [box, "#ff0000"])
+    return len(boxes), 1 + len(boxes)
+
+
+def annotate_batched(page) -> tuple[int, int]:
+    # Every iteration loads the page again, so this is the first step's annotation
+    boxes = PageAnnotator(BOX_SELECTOR, incremental=False).annotate(page)["boxes"]
+    return len(boxes), 1
+
+
+def run(page, url: str, annotate, iterations: int) -> dict:
+    timings = []
+    boxes = round_trips = 0
+    for _ in range(iterations):
+        page.goto(url)
+        started = time.perf_counter()
+        boxes, round_trips = annotate(page)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "boxes": boxes,
+        "round_trips": round_trips,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "mean_ms": round(sum(timings) / len(timings), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--page", default="heavy_dom.html")
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    url = f"{base_url}/{args.page}"
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            page = browser.new_page(viewport={"width": 1280, "height": 800})
+            results = {
+                "page": args.page,
+                "iterations": args.iterations,
+                "legacy": run(page, url, annotate_legacy, args.iterations),
+                "batched": run(page, url, annotate_batched, args.iterations),
+            }
+            browser.close()
+    finally:
+        server.shutdown()
+
+    results["speedup_p50"] = round(results["legacy"]["p50_ms"] / max(results["batched"]["p50_ms"], 0.01), 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
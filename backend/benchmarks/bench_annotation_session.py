@@ -0,0 +1,133 @@
+"""
+Per step annotation cost over a long single page session, full redraw and
+renumbering on every step against the incremental annotator.
+
+The spa_session.html fixture is never reloaded: every step loads more
+items, saves or expands one, filters the list, scrolls or does nothing,
+then the page is annotated. Reports annotation latency per step (and over
+the last tenth of the session, where the page is largest), the overlays
+written, the DOM size at the end and how many elements kept their box
+number from one step to the next. Usage, from backend/:
+
+    python -m benchmarks.bench_annotation_session --steps 200
+"""
+import argparse
+import json
+import time
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+
+from playwright.sync_api import sync_playwright
+from benchmarks.fixture_server import start_fixture_server
+from lib.page_annotator import BOX_SELECTOR, PageAnnotator
+
+
+def load_more(page, step):
+    page.click("#more")
+
+
+def save_item(page, step):
+    page.click(f"#save-{step % 20 + 1}")
+
+
+def toggle_details(page, step):
+    page.click(f"#toggle-{step % 20 + 1}")
+
+
+def filter_items(page, step):
+    page.fill("#search", str(step % 10))
+
+
+def clear_filter(page, step):
+    page.fill("#search", "")
+
+
+def scroll(page, step):
+    page.mouse.wheel(0, 400 if step % 2 else -400)
+
+
+def idle(page, step):
+    pass
+
+
+# Cycled through in order, a step that changes nothing is in every cycle
+ACTIONS = [load_more, save_item, idle, toggle_details, filter_items, clear_filter, scroll, idle]
+
+DOM_STATS_JS = """
+() => ({
+    dom_nodes: document.getElementsByTagName('*').length,
+    overlays: document.querySelectorAll('#__cd_box_overlays > div').length,
+})
+"""
+
+
+def run(page, url: str, incremental: bool, steps: int) -> dict:
+    annotator = PageAnnotator(BOX_SELECTOR, incremental=incremental)
+    page.goto(url)
+    timings = []
+    writes = cached = 0
+    kept = common = 0
+    previous = {}
+    for step in range(steps):
+        ACTIONS[step % len(ACTIONS)](page, step)
+        started = time.perf_counter()
+        result = annotator.annotate(page)
+        timings.append((time.perf_counter() - started) * 1000)
+        writes += result["added"] + result["moved"] + result["removed"]
+        cached += result["cached"]
+
+        # Elements are identified by their fixture id across steps
+        numbers = {box["id"]: box["box_number"] for box in result["boxes"] if box["id"]}
+        shared = numbers.keys() & previous.keys()
+        common += len(shared)
+        kept += sum(numbers[element_id] == previous[element_id] for element_id in shared)
+        previous = numbers
+
+    tail = timings[-max(1, steps // 10):]
+    return {
+        "mode": "incremental" if incremental else "full",
+        "steps": steps,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "mean_ms": round(sum(timings) / len(timings), 2),
+        "last_tenth_mean_ms": round(sum(tail) / len(tail), 2),
+        "cached_steps": cached,
+        "overlay_writes": writes,
+        "stable_numbers": round(kept / common, 3) if common else None,
+        **page.evaluate(DOM_STATS_JS),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    url = f"{base_url}/spa_session.html"
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            page = browser.new_page(viewport={"width": 1280, "height": 800})
+            results = [run(page, url, incremental, args.steps) for incremental in (False, True)]
+            browser.close()
+    finally:
+        server.shutdown()
+
+    for result in results:
+        print(json.dumps(result))
+    full, incremental = results
+    print(json.dumps({
+        "steps": args.steps,
+        "speedup_mean": round(full["mean_ms"] / max(incremental["mean_ms"], 0.01), 2),
+        "speedup_last_tenth": round(full["last_tenth_mean_ms"] / max(incremental["last_tenth_mean_ms"], 0.01), 2),
+        "overlay_writes_full": full["overlay_writes"],
+        "overlay_writes_incremental": incremental["overlay_writes"],
+        "stable_numbers_full": full["stable_numbers"],
+        "stable_numbers_incremental": incremental["stable_numbers"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+LLM calls and wall time to finish a job after a fault, rerunning it from
+scratch (checkpoints off) against resuming it from its last checkpoint
+(checkpoints on).
+
+Every job runs the checkout form scenario (benchmarks.scenarios) through
+QueryProcessorService.process_query against the fixture server and a stub
+LLM with --llm-latency per call, one fault is injected per job:
+
+    step_error    the --fail-at'th browser action raises
+    worker_crash  the --fail-at'th browser action kills the worker, the job
+                  is picked up again by a fresh process_query call
+    goal_miss     the extraction answers no data once
+
+With checkpoints off a failed job is submitted again and starts over. The
+fast resolver tiers and the replay of recorded traces are off, so every
+step needs the vision agent. Usage, from backend/:
+
+    python -m benchmarks.bench_checkpoints --jobs 5 --fail-at 8
+"""
+import argparse
+import json
+import os
+import time
+from benchmarks.common import setup_environment, percentile
+
+WORKDIR = setup_environment()
+os.environ.setdefault("CACHE_BACKEND", "memory")
+# Every cache lookup misses, so each job pays for its LLM calls
+os.environ["CACHE_TTL_S"] = "0"
+os.environ["SEMANTIC_PLAN_CACHE_ENABLED"] = "false"
+os.environ["REPLAY_ENABLED"] = "false"
+
+from benchmarks.fixture_server import start_fixture_server
+from benchmarks.scenarios import FORM_SCENARIOS, query_for, scenario_responder
+from benchmarks.stub_llm import StubOpenAI
+from lib.action_resolver import action_resolver
+from lib.browser_interactor import browser_pool
+from lib.checkpoints import checkpoints, unmet_step
+from lib.job_repository import job_repository
+from lib.llm_gateway import llm_gateway
+from service.query_processor import query_processor_service
+
+FAULTS = ("step_error", "worker_crash", "goal_miss")
+
+
+class WorkerCrash(BaseException):
+    """Escapes every handler of the job, like the worker process dying."""
+
+
+class FaultInjector:
+    """Wraps the service's act_on_box and the stub's responder, fires once per job."""
+    def __init__(self, responder, fail_at: int):
+        self.responder = responder
+        self.fail_at = fail_at
+        self.fault = None
+        self.actions = 0
+        self.fired = False
+        self._act_on_box = query_processor_service.act_on_box
+        query_processor_service.act_on_box = self.act_on_box
+
+    def arm(self, fault: str):
+        self.fault, self.actions, self.fired = fault, 0, False
+
+    def act_on_box(self, page, action):
+        self.actions += 1
+        if not self.fired and self.fault in ("step_error", "worker_crash") and self.actions == self.fail_at:
+            self.fired = True
+            if self.fault == "worker_crash":
+                raise WorkerCrash()
+            raise RuntimeError("Injected step error")
+        return self._act_on_box(page, action)
+
+    def __call__(self, params: dict) -> str:
+        content = self.responder(params)
+        if not self.fired and self.fault == "goal_miss" and self.responder.extracted in content:
+            self.fired = True
+            return content.replace(json.dumps(self.responder.extracted), "null")
+        return content
+
+
+def run_job(query_id: str, query: str, injector: FaultInjector, resumable: bool) -> int:
+    """Runs the job until its goal is met, returns the number of process_query calls."""
+    job_repository.create(query_id, query)
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            query_processor_service.process_query(query_id, None)
+        except WorkerCrash:
+            # The job is delivered again, with checkpoints it picks up where it was
+            if not resumable:
+                # The crashed run ends and the job starts over
+                job_repository.transition(query_id, "error", error="worker crashed")
+                job_repository.create(query_id, query)
+            continue
+        job = job_repository.get(query_id)
+        plan = (job.get("result") or {}).get("action_plan")
+        if (job["status"] == "done" and plan and unmet_step(plan, job_repository.steps(query_id)) is None) or attempts > 3:
+            return attempts
+        # Without checkpoints the user submits the job again
+        job_repository.create(query_id, query)
+
+
+def run(fault: str, resumable: bool, injector: FaultInjector, stub: StubOpenAI, args) -> dict:
+    checkpoints.enabled = resumable
+    resumes = sum(checkpoints.stats()["resumes"].values())
+    latencies, calls, attempts, statuses = [], [], [], {}
+    for idx in range(args.jobs):
+        query_id = f"checkpoints-{'on' if resumable else 'off'}-{fault}-{idx}-{int(time.time() * 1000)}"
+        injector.arm(fault)
+        calls_before = stub.calls
+        started = time.perf_counter()
+        attempts.append(run_job(query_id, query_for("checkout", query_id), injector, resumable))
+        latencies.append(time.perf_counter() - started)
+        calls.append(stub.calls - calls_before)
+        status = job_repository.get(query_id)["status"]
+        statuses[status] = statuses.get(status, 0) + 1
+
+    return {
+        "fault": fault,
+        "checkpoints": "on" if resumable else "off",
+        "jobs": args.jobs,
+        "statuses": statuses,
+        "submissions_per_job": round(sum(attempts) / len(attempts), 2),
+        "resumes": sum(checkpoints.stats()["resumes"].values()) - resumes,
+        "llm_calls_per_job": round(sum(calls) / len(calls), 2),
+        "job_p50_s": round(percentile(latencies, 50), 3),
+        "job_p95_s": round(percentile(latencies, 95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5, help="jobs per fault and mode")
+    parser.add_argument("--faults", nargs="+", default=list(FAULTS), choices=FAULTS)
+    parser.add_argument("--fail-at", type=int, default=8, help="browser action that fails, 8 is the CVC on the payment page")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    responder = scenario_responder(base_url, FORM_SCENARIOS)
+    injector = FaultInjector(responder, args.fail_at)
+    stub = StubOpenAI(injector, args.llm_latency)
+    llm_gateway.client = stub
+    action_resolver.tiers = {"vision"}
+    os.chdir(WORKDIR)
+
+    results = []
+    browser_pool.bind_thread()
+    try:
+        for fault in args.faults:
+            for resumable in (False, True):
+                result = run(fault, resumable, injector, stub, args)
+                results.append(result)
+                print(json.dumps(result))
+    finally:
+        browser_pool.release_thread()
+        browser_pool.shutdown()
+        server.shutdown()
+
+    summary = {"llm_latency_s": args.llm_latency, "fail_at": args.fail_at}
+    for fault in args.faults:
+        off, on = (next(r for r in results if r["fault"] == fault and r["checkpoints"] == mode) for mode in ("off", "on"))
+        summary[fault] = {
+            "llm_calls_off": off["llm_calls_per_job"],
+            "llm_calls_on": on["llm_calls_per_job"],
+            "llm_calls_saved": round(1 - on["llm_calls_per_job"] / max(off["llm_calls_per_job"], 0.01), 3),
+            "wall_time_saved": round(1 - on["job_p50_s"] / max(off["job_p50_s"], 0.001), 3),
+        }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+End-to-end throughput of QueryProcessorService.process_query against the
+local fixture server and a stub LLM, at several concurrency levels.
+
+Every level runs --jobs jobs over the scenarios round-robin, --concurrency
+at a time, and reports jobs/s, job latency and per-stage span latency
+percentiles (from the tracer timelines), peak RSS of this process and peak
+Chromium process count and RSS. Agent caches are cold unless --warm-caches.
+Results are written as JSON to --output for benchmarks.compare. Usage, from
+backend/:
+
+    python -m benchmarks.bench_end_to_end --concurrency 1 4 8 --jobs 16 --output base.json
+    python -m benchmarks.compare base.json head.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from benchmarks.common import setup_environment, percentile, process_tree_stats
+
+WORKDIR = setup_environment()
+os.environ.setdefault("CACHE_BACKEND", "memory")
+if "--warm-caches" not in sys.argv:
+    # Every cache lookup misses, so each job pays for its LLM calls
+    os.environ["CACHE_TTL_S"] = "0"
+    os.environ["SEMANTIC_PLAN_CACHE_ENABLED"] = "false"
+    os.environ["REPLAY_ENABLED"] = "false"
+
+from benchmarks.fixture_server import start_fixture_server
+from benchmarks.scenarios import SCENARIOS, query_for, scenario_responder
+from benchmarks.stub_llm import StubOpenAI, AsyncStubOpenAI
+from lib.action_resolver import action_resolver
+from lib.browser_interactor import browser_pool
+from lib.async_browser_interactor import async_browser_pool
+from lib.async_runner import async_runner
+from lib.job_repository import job_repository
+from lib.llm_gateway import llm_gateway
+from lib.tracing import tracer
+from service.query_processor import query_processor_service
+from service.async_query_processor import async_query_processor_service
+
+
+def install_stub_llm(base_url: str, latency_s: float) -> tuple:
+    responder = scenario_responder(base_url)
+    sync_client = StubOpenAI(responder, latency_s)
+    async_client = AsyncStubOpenAI(responder, latency_s)
+    # Agents call through the gateway, so its limits and coalescing apply
+    llm_gateway.client = sync_client
+    llm_gateway.async_client = async_client
+    return sync_client, async_client
+
+
+def run_threaded(query_ids: list, concurrency: int) -> dict:
+    latencies = {}
+    pending = list(query_ids)
+    lock = threading.Lock()
+
+    def worker():
+        browser_pool.bind_thread()
+        try:
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    query_id = pending.pop(0)
+                started = time.perf_counter()
+                query_processor_service.process_query(query_id, None)
+                latencies[query_id] = time.perf_counter() - started
+        finally:
+            browser_pool.release_thread()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+async def _run_async(query_ids: list, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    latencies = {}
+
+    async def job(query_id):
+        async with slots:
+            started = time.perf_counter()
+            await async_query_processor_service.process_query(query_id, None)
+            latencies[query_id] = time.perf_counter() - started
+
+    await asyncio.gather(*(job(query_id) for query_id in query_ids))
+    return latencies
+
+
+def run_async(query_ids: list, concurrency: int) -> dict:
+    return async_runner.run(_run_async(query_ids, concurrency))
+
+
+def stage_percentiles(query_ids: list) -> dict:
+    durations = defaultdict(list)
+    for query_id in query_ids:
+        timeline = tracer.timeline(query_id) or {"spans": []}
+        for span in timeline["spans"]:
+            durations[span["name"]].append(span["duration_ms"])
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+        }
+        for name, values in sorted(durations.items())
+    }
+
+
+def measure(mode: str, concurrency: int, args, clients) -> dict:
+    run_id = f"e2e-{int(time.time() * 1000)}-{concurrency}"
+    scenarios = args.scenarios
+    query_ids = []
+    for idx in range(args.jobs):
+        query_id = f"{run_id}-{idx}"
+        job_repository.create(query_id, query_for(scenarios[idx % len(scenarios)], query_id))
+        query_ids.append(query_id)
+
+    peak = process_tree_stats()
+    stop_sampling = threading.Event()
+
+    def sample():
+        while not stop_sampling.wait(args.sample_interval):
+            current = process_tree_stats()
+            for key, value in current.items():
+                if value is not None and (peak[key] is None or value > peak[key]):
+                    peak[key] = value
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    llm_calls = sum(client.calls for client in clients)
+    resolver_steps = action_resolver.stats()["steps"]
+    started = time.perf_counter()
+    try:
+        latencies = (run_threaded if mode == "threaded" else run_async)(query_ids, concurrency)
+    finally:
+        stop_sampling.set()
+        sampler.join()
+    wall = time.perf_counter() - started
+
+    statuses = defaultdict(int)
+    for query_id in query_ids:
+        statuses[job_repository.get(query_id)["status"]] += 1
+    values = list(latencies.values())
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "jobs": args.jobs,
+        "statuses": dict(statuses),
+        "wall_s": round(wall, 3),
+        "jobs_per_s": round(args.jobs / wall, 3),
+        "job_p50_s": round(percentile(values, 50), 3),
+        "job_p95_s": round(percentile(values, 95), 3),
+        "job_p99_s": round(percentile(values, 99), 3),
+        "llm_calls": sum(client.calls for client in clients) - llm_calls,
+        "resolver_tiers": {tier: count - resolver_steps[tier] for tier, count in action_resolver.stats()["steps"].items()},
+        "peak_rss_mb": peak["rss_mb"],
+        "peak_chromium_processes": peak["chromium_processes"],
+        "peak_chromium_rss_mb": peak["chromium_rss_mb"],
+        "stages": stage_percentiles(query_ids),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--jobs", type=int, default=16, help="jobs per concurrency level")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--mode", default="threaded", choices=["threaded", "asyncio"])
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--browsers", type=int, default=2)
+    parser.add_argument("--contexts-per-browser", type=int, default=4)
+    parser.add_argument("--resolver-tiers", nargs="*", default=None, help="fast resolver tiers, none to always use vision")
+    parser.add_argument("--warm-caches", action="store_true", help="keep agent caches, plan cache and replay between jobs")
+    parser.add_argument("--sample-interval", type=float, default=0.25)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    server, base_url = start_fixture_server()
+    clients = install_stub_llm(base_url, args.llm_latency)
+    for pool in (browser_pool, async_browser_pool):
+        pool.size = args.browsers
+        pool.max_contexts_per_browser = args.contexts_per_browser
+    if args.resolver_tiers is not None:
+        action_resolver.tiers = set(args.resolver_tiers) | {"vision"}
+    commit = git_commit()
+    os.chdir(WORKDIR)
+
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            result = measure(args.mode, concurrency, args, clients)
+            results.append(result)
+            print(json.dumps({key: value for key, value in result.items() if key != "stages"}))
+    finally:
+        browser_pool.shutdown()
+        async_runner.run(async_browser_pool.shutdown())
+        async_runner.stop()
+        server.shutdown()
+
+    report = {
+        "benchmark": "end_to_end",
+        "commit": commit,
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Bytes and events each SSE client receives while several jobs run at once,
+against an in-process Redis stand-in (fakeredis):
+
+    legacy      every event on the single flask_sse channel, screenshots
+                inline as base64, every client receives every job
+    per_query   one stream per query with coalesced progress messages,
+                clients follow their own query and fetch screenshots by URL
+
+In per_query mode one client per job drops after a few events and resumes with
+Last-Event-ID, resume_ok says whether it still saw every event exactly
+once. Usage, from backend/:
+
+    python -m benchmarks.bench_event_stream --clients 20 --jobs 5 --steps 6
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from benchmarks.common import setup_environment
+
+setup_environment()
+
+import fakeredis
+from flask_sse import Message
+from lib.event_stream import EventStream
+from lib.screenshot_pipeline import Screenshot
+
+
+def job_events(job: int, steps: int, progress_per_step: int, image_kb: int):
+    """(payload, screenshot) pairs of one job, in the order the query processor sends them."""
+    yield {"message": "Processing query..."}, None
+    yield {"message": f"Action plan generated for query ID: job-{job}", "action_plan": {"goto": "https://www.google.com", "action_plan": ["goto", "search"]}}, None
+    for step in range(steps):
+        for idx in range(progress_per_step):
+            yield {"message": f"Doing step {step}: progress {idx}"}, None
+        yield {"message": "Screenshot taken for browser action"}, Screenshot(os.urandom(image_kb * 1024), "jpeg")
+        yield {"message": "Browser actions generated", "actions": [{"box_click": step, "input_text": "query"}]}, None
+        yield {"message": f"Browser actions done for step {step}", "settle_ms": 420}, None
+    yield {"message": f"Processing complete for query ID: job-{job}", "done": True}, None
+
+
+def run_jobs(publish, args):
+    def run(job):
+        for payload, screenshot in job_events(job, args.steps, args.progress_per_step, args.image_kb):
+            publish(job, payload, screenshot)
+            # Progress messages come in bursts, the rest once per stage
+            time.sleep(0.005 if payload.keys() == {"message"} else args.stage_ms / 1000)
+
+    threads = [threading.Thread(target=run, args=(job,)) for job in range(args.jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_legacy(server, args) -> list:
+    publisher = fakeredis.FakeRedis(server=server)
+    clients = [{"bytes": 0, "events": 0} for _ in range(args.clients)]
+    subscriptions = []
+    for _ in range(args.clients):
+        pubsub = fakeredis.FakeRedis(server=server).pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe("sse")
+        subscriptions.append(pubsub)
+
+    def listen(pubsub, client):
+        done = 0
+        while done < args.jobs:
+            message = pubsub.get_message(timeout=1)
+            if message is None:
+                continue
+            frame = str(Message(**json.loads(message["data"])))
+            client["bytes"] += len(frame)
+            client["events"] += 1
+            done += '"done": true' in frame
+
+    def publish(job, payload, screenshot):
+        if screenshot is not None:
+            payload = {**payload, "img": screenshot.base64, "img_type": screenshot.mime_type}
+        publisher.publish("sse", json.dumps(Message(payload).to_dict()))
+
+    listeners = [threading.Thread(target=listen, args=pair) for pair in zip(subscriptions, clients)]
+    for listener in listeners:
+        listener.start()
+    run_jobs(publish, args)
+    for listener in listeners:
+        listener.join()
+    return clients
+
+
+def run_per_query(server, args) -> tuple:
+    stream = EventStream(
+        redis_client=fakeredis.FakeRedis(server=server),
+        replay_size=args.replay_size,
+        progress_interval_ms=args.coalesce_ms,
+    )
+    clients = [{"bytes": 0, "events": 0, "job": idx % args.jobs, "resumes": idx < args.jobs} for idx in range(args.clients)]
+
+    def follow(client):
+        reader = EventStream(redis_client=fakeredis.FakeRedis(server=server))
+        query_id = f"job-{client['job']}"
+        seen, last_id, dropped = [], None, False
+        while True:
+            for frame in reader.subscribe(query_id, last_id):
+                if frame.startswith(":"):
+                    continue
+                data = json.loads(frame.split("data:", 1)[1].split("\nid:", 1)[0])
+                last_id = frame.rsplit("id:", 1)[1].strip()
+                seen.append(data)
+                client["bytes"] += len(frame)
+                client["events"] += 1
+                if "img_url" in data:
+                    # What the browser downloads when it renders the screenshot
+                    client["bytes"] += len(reader.images.get(data["img_hash"]))
+                if client["resumes"] and not dropped and len(seen) == 4:
+                    dropped = True
+                    break
+            else:
+                break
+        client["seen"] = seen
+
+    def publish(job, payload, screenshot):
+        stream.publish(f"job-{job}", payload, screenshot=screenshot)
+
+    followers = [threading.Thread(target=follow, args=(client,)) for client in clients]
+    for follower in followers:
+        follower.start()
+    run_jobs(publish, args)
+    for follower in followers:
+        follower.join()
+
+    # Compared with a client of the same job that never disconnected
+    references = {client["job"]: client["seen"] for client in clients if not client["resumes"]}
+    resume_ok = all(client["seen"] == references.get(client["job"]) for client in clients if client["resumes"])
+    return clients, resume_ok, stream.stats()
+
+
+def summarize(mode: str, clients: list, elapsed: float) -> dict:
+    total_bytes = sum(client["bytes"] for client in clients)
+    total_events = sum(client["events"] for client in clients)
+    return {
+        "mode": mode,
+        "bytes_per_client": round(total_bytes / len(clients)),
+        "events_per_client": round(total_events / len(clients), 1),
+        "total_mb": round(total_bytes / 1e6, 2),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--jobs", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=6)
+    parser.add_argument("--progress-per-step", type=int, default=4)
+    parser.add_argument("--image-kb", type=int, default=150)
+    parser.add_argument("--stage-ms", type=float, default=50)
+    parser.add_argument("--coalesce-ms", type=float, default=250)
+    parser.add_argument("--replay-size", type=int, default=200)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    legacy = summarize("legacy", run_legacy(fakeredis.FakeServer(), args), time.perf_counter() - started)
+    print(json.dumps(legacy))
+
+    started = time.perf_counter()
+    clients, resume_ok, stats = run_per_query(fakeredis.FakeServer(), args)
+    per_query = {**summarize("per_query", clients, time.perf_counter() - started), "resume_ok": resume_ok, "coalesced": stats["coalesced"]}
+    print(json.dumps(per_query))
+
+    print(json.dumps({
+        "clients": args.clients,
+        "jobs": args.jobs,
+        "bytes_ratio": round(per_query["bytes_per_client"] / legacy["bytes_per_client"], 4),
+        "events_ratio": round(per_query["events_per_client"] / legacy["events_per_client"], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
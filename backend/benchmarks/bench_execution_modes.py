@@ -0,0 +1,169 @@
+"""
+Compares how many concurrent jobs one process sustains in the threaded and
+the asyncio execution modes.
+
+Runs entirely offline against the local fixture server with a stub LLM of
+fixed latency. Usage, from backend/:
+
+    python -m benchmarks.bench_execution_modes --jobs 4 8 16 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from benchmarks.common import setup_environment, percentile
+
+WORKDIR = setup_environment()
+
+from benchmarks.fixture_server import start_fixture_server
+from benchmarks.stub_llm import ScriptedResponder, StubOpenAI, AsyncStubOpenAI
+from lib.browser_interactor import browser_pool
+from lib.async_browser_interactor import async_browser_pool
+from lib.async_runner import async_runner
+from lib.job_repository import job_repository
+from lib.llm_gateway import llm_gateway
+from service.query_processor import query_processor_service
+from service.async_query_processor import async_query_processor_service
+
+
+SEARCH_STEP = "Type 'green frontier capital' into the search bar and submit"
+READ_STEP = "Read the title of the first result"
+
+
+def install_stub_llm(base_url: str, latency_s: float):
+    plan = {
+        "goto": f"{base_url}/search.html",
+        "action_plan": [f"Open {base_url}/search.html", SEARCH_STEP, READ_STEP],
+        "goal": "Title of the first result",
+        "vision_only": [READ_STEP],
+    }
+    responder = ScriptedResponder(plan, page_actions={
+        SEARCH_STEP: [
+            {"box_click": 1, "input_text": "green frontier capital", "extracted_data": None},
+            {"box_click": 2, "input_text": None, "extracted_data": None},
+        ],
+    })
+    sync_client = StubOpenAI(responder, latency_s)
+    async_client = AsyncStubOpenAI(responder, latency_s)
+    # Agents call through the gateway, so its limits and coalescing apply
+    llm_gateway.client = sync_client
+    llm_gateway.async_client = async_client
+
+
+def write_job(query_id: str):
+    # Unique queries so neither agent cache short-circuits the LLM
+    job_repository.create(query_id, f"benchmark query {query_id}")
+
+
+def run_threaded(n_jobs: int, run_id: str) -> list[float]:
+    latencies = []
+
+    def worker(query_id):
+        browser_pool.bind_thread()
+        try:
+            started = time.monotonic()
+            query_processor_service.process_query(query_id, None)
+            latencies.append(time.monotonic() - started)
+        finally:
+            browser_pool.release_thread()
+
+    threads = []
+    for idx in range(n_jobs):
+        query_id = f"threaded-{run_id}-{idx}"
+        write_job(query_id)
+        threads.append(threading.Thread(target=worker, args=(query_id,)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+async def _run_async(n_jobs: int, run_id: str) -> list[float]:
+    async def job(query_id):
+        started = time.monotonic()
+        await async_query_processor_service.process_query(query_id, None)
+        return time.monotonic() - started
+
+    query_ids = [f"async-{run_id}-{idx}" for idx in range(n_jobs)]
+    for query_id in query_ids:
+        write_job(query_id)
+    return list(await asyncio.gather(*(job(query_id) for query_id in query_ids)))
+
+
+def run_async(n_jobs: int, run_id: str) -> list[float]:
+    return async_runner.run(_run_async(n_jobs, run_id))
+
+
+def count_done(prefix: str) -> int:
+    jobs, _ = job_repository.list_jobs(status="done", limit=1_000_000)
+    return sum(job["query_id"].startswith(prefix) for job in jobs)
+
+
+def measure(mode: str, n_jobs: int) -> dict:
+    run = run_threaded if mode == "threaded" else run_async
+    peak_threads = [threading.active_count()]
+    stop_sampling = threading.Event()
+
+    def sample_threads():
+        while not stop_sampling.wait(0.05):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    started = time.monotonic()
+    run_id = str(int(started * 1000))
+    try:
+        latencies = run(n_jobs, run_id=run_id)
+    finally:
+        stop_sampling.set()
+        sampler.join()
+    wall = time.monotonic() - started
+    return {
+        "mode": mode,
+        "jobs": n_jobs,
+        "completed": count_done(f"{'threaded' if mode == 'threaded' else 'async'}-{run_id}-"),
+        "wall_s": round(wall, 3),
+        "jobs_per_s": round(n_jobs / wall, 3),
+        "job_latency_p50_s": round(percentile(latencies, 50), 3),
+        "job_latency_p95_s": round(percentile(latencies, 95), 3),
+        "threads_peak": peak_threads[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--browsers", type=int, default=2)
+    parser.add_argument("--contexts-per-browser", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", default=["threaded", "asyncio"], choices=["threaded", "asyncio"])
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    install_stub_llm(base_url, args.llm_latency)
+    for pool in (browser_pool, async_browser_pool):
+        pool.size = args.browsers
+        pool.max_contexts_per_browser = args.contexts_per_browser
+    os.chdir(WORKDIR)
+
+    results = []
+    try:
+        for n_jobs in args.jobs:
+            for mode in args.modes:
+                result = measure(mode, n_jobs)
+                results.append(result)
+                print(json.dumps(result))
+    finally:
+        browser_pool.shutdown()
+        async_runner.run(async_browser_pool.shutdown())
+        async_runner.stop()
+        server.shutdown()
+
+    print(json.dumps({"llm_latency_s": args.llm_latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
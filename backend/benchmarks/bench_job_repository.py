@@ -0,0 +1,133 @@
+"""
+Job store writes per second with concurrent workers, and the cost of
+listing jobs by status:
+
+    files     one ./jobs/{query_id}.json per job, read and rewritten whole
+              on every status change or step result
+    sqlite    JobRepository, single-row inserts and updates in WAL mode
+
+Each worker runs full job lifecycles, create, in_progress, one write per
+step and done. Usage, from backend/:
+
+    python -m benchmarks.bench_job_repository --workers 1 4 16 --jobs 200 --steps 5
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from benchmarks.common import setup_environment
+
+setup_environment()
+
+from lib.job_repository import JobRepository
+
+
+class FileJobStore:
+    """The previous approach, whole-file JSON rewrites per change."""
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def _path(self, query_id: str) -> str:
+        return os.path.join(self.folder, f"{query_id}.json")
+
+    def _update(self, query_id: str, change):
+        with open(self._path(query_id), "r") as f:
+            job = json.load(f)
+        change(job)
+        with open(self._path(query_id), "w") as f:
+            json.dump(job, f)
+
+    def create(self, query_id: str, query: str):
+        with open(self._path(query_id), "w") as f:
+            json.dump({"query": query, "query_id": query_id, "status": "pending", "result": None,
+                       "created_at": datetime.now().isoformat(), "steps": []}, f)
+
+    def transition(self, query_id: str, status: str, result=None):
+        def change(job):
+            job["status"] = status
+            if result is not None:
+                job["result"] = result
+        self._update(query_id, change)
+
+    def add_step(self, query_id: str, step_idx: int, data: dict):
+        self._update(query_id, lambda job: job["steps"].append({"step_idx": step_idx, **data}))
+
+    def list_jobs(self, status: str, limit: int):
+        jobs = []
+        for path in glob.glob(os.path.join(self.folder, "*.json")):
+            with open(path, "r") as f:
+                job = json.load(f)
+            if job["status"] == status:
+                jobs.append(job)
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return jobs[:limit], len(jobs)
+
+
+STEP_DATA = {"action": "search for green frontier capital", "actions": [{"box_click": 3, "input_text": "green frontier capital"}], "settle_ms": 420}
+
+
+def run(store, workers: int, jobs: int, steps: int, prefix: str) -> dict:
+    per_worker = jobs // workers
+
+    def worker(idx):
+        for job in range(per_worker):
+            query_id = f"{prefix}-{idx}-{job}"
+            store.create(query_id, f"benchmark query {query_id}")
+            store.transition(query_id, "in_progress")
+            for step in range(steps):
+                store.add_step(query_id, step, STEP_DATA)
+            store.transition(query_id, "done", result={"actions": STEP_DATA["actions"]})
+
+    threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    writes = per_worker * workers * (3 + steps)
+
+    started = time.perf_counter()
+    page, total = store.list_jobs(status="done", limit=50)
+    list_ms = (time.perf_counter() - started) * 1000
+    return {
+        "workers": workers,
+        "writes": writes,
+        "writes_per_s": round(writes / elapsed),
+        "list_done_ms": round(list_ms, 2),
+        "jobs_stored": total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--jobs", type=int, default=200, help="jobs per run, split across the workers")
+    parser.add_argument("--steps", type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        folder = tempfile.mkdtemp(prefix="cd_jobs_files_")
+        results.append({"store": "files", **run(FileJobStore(folder), workers, args.jobs, args.steps, "files")})
+        print(json.dumps(results[-1]))
+        folder = tempfile.mkdtemp(prefix="cd_jobs_sqlite_")
+        results.append({"store": "sqlite", **run(JobRepository(os.path.join(folder, "jobs.db")), workers, args.jobs, args.steps, "sqlite")})
+        print(json.dumps(results[-1]))
+
+    summary = {}
+    for workers in args.workers:
+        files, sqlite = [r for r in results if r["workers"] == workers]
+        summary[workers] = {
+            "writes_speedup": round(sqlite["writes_per_s"] / files["writes_per_s"], 2),
+            "list_speedup": round(files["list_done_ms"] / max(sqlite["list_done_ms"], 0.01), 1),
+        }
+    print(json.dumps({"jobs": args.jobs, "steps": args.steps, "summary": summary}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+LLM calls from many concurrent jobs against a stub endpoint that answers
+429 (with Retry-After) once more than --capacity requests are in flight:
+
+    direct     jobs call the client themselves, without retries
+    gateway    jobs call through LLMGateway (concurrency limit, retries,
+               coalescing of identical requests in flight)
+
+A --duplicates share of the prompts is identical across jobs, like the page
+action prompts of jobs running the same plan on the same page. Reports
+success rate, upstream calls and latency percentiles. Usage, from backend/:
+
+    python -m benchmarks.bench_llm_gateway --jobs 32 --calls 4 --capacity 8
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+
+try:
+    import httpx
+except ImportError:
+    import httpx2 as httpx
+import openai
+from benchmarks.stub_llm import _response
+from lib.llm_gateway import LLMGateway
+
+
+class CapacityStub:
+    """Chat completions endpoint with a fixed number of concurrent slots."""
+    def __init__(self, capacity: int, latency_s: float, retry_after_s: float):
+        self.capacity = capacity
+        self.latency_s = latency_s
+        self.retry_after_s = retry_after_s
+        self.calls = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.chat = self
+        self.completions = self
+
+    def create(self, **params):
+        with self._lock:
+            self.calls += 1
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                response = httpx.Response(429, headers={"retry-after": str(self.retry_after_s)}, request=httpx.Request("POST", "http://stub"))
+                raise openai.RateLimitError("Rate limit exceeded", response=response, body=None)
+            self._in_flight += 1
+        try:
+            time.sleep(self.latency_s * random.uniform(0.8, 1.2))
+            return _response(json.dumps({"box_click": None, "input_text": None, "extracted_data": "stub"}))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def prompts(args) -> list:
+    rng = random.Random(args.seed)
+    per_job = []
+    for job in range(args.jobs):
+        calls = []
+        for idx in range(args.calls):
+            shared = rng.random() < args.duplicates
+            text = f"shared prompt {idx}" if shared else f"job {job} prompt {idx}"
+            calls.append({"model": "stub", "max_tokens": 300, "messages": [{"role": "user", "content": text}]})
+        per_job.append(calls)
+    return per_job
+
+
+def measure(mode: str, args) -> dict:
+    stub = CapacityStub(args.capacity, args.llm_latency, args.retry_after)
+    if mode == "gateway":
+        client = LLMGateway(stub, max_concurrency=args.capacity, max_retries=args.max_retries)
+    else:
+        client = stub
+    latencies, outcomes = [], {"ok": 0, "error": 0}
+    lock = threading.Lock()
+
+    def job(calls):
+        for params in calls:
+            started = time.perf_counter()
+            try:
+                client.chat.completions.create(**params)
+                outcome = "ok"
+            except openai.APIError:
+                outcome = "error"
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=job, args=(calls,)) for calls in prompts(args)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    total = args.jobs * args.calls
+    result = {
+        "mode": mode,
+        "requests": total,
+        "success_rate": round(outcomes["ok"] / total, 3),
+        "upstream_calls": stub.calls,
+        "upstream_429": stub.rejected,
+        "wall_s": round(wall, 3),
+        "call_p50_s": round(percentile(latencies, 50), 3),
+        "call_p95_s": round(percentile(latencies, 95), 3),
+    }
+    if mode == "gateway":
+        stats = client.stats()
+        result.update(retries=stats["retries"], coalesced=stats["coalesced"])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=32)
+    parser.add_argument("--calls", type=int, default=4, help="LLM calls per job")
+    parser.add_argument("--capacity", type=int, default=8, help="concurrent requests the stub accepts")
+    parser.add_argument("--duplicates", type=float, default=0.25, help="share of prompts identical across jobs")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--modes", nargs="+", default=["direct", "gateway"], choices=["direct", "gateway"])
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        results.append(measure(mode, args))
+        print(json.dumps(results[-1]))
+
+    summary = {"capacity": args.capacity, "jobs": args.jobs, "llm_latency_s": args.llm_latency}
+    for result in results:
+        summary[f"{result['mode']}_success_rate"] = result["success_rate"]
+        summary[f"{result['mode']}_upstream_calls"] = result["upstream_calls"]
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
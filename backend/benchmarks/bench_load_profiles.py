@@ -0,0 +1,117 @@
+"""
+What each page load profile saves on a media heavy page, and what the
+low-memory launch preset saves in browser memory.
+
+The media_heavy.html fixture loads a gallery, a web font, a video, a
+tracker script from ads.test and an ad iframe from video.test, the *.test
+hosts are mapped to the fixture server. For every launch preset and load
+profile the page is loaded --runs times in a fresh context, reporting body
+bytes and requests the server answered, requests the profile blocked and
+time to the load event. Then --pages pages stay open at once under the
+"full" profile and the RSS of the Chromium processes is read. Usage, from
+backend/:
+
+    python -m benchmarks.bench_load_profiles --runs 5 --pages 8
+"""
+import argparse
+import json
+import time
+from benchmarks.common import setup_environment, percentile, process_tree_stats
+
+setup_environment()
+
+from playwright.sync_api import sync_playwright
+from benchmarks.fixture_server import start_fixture_server
+from lib.browser_pool import LAUNCH_PRESETS
+from lib.load_profiles import LoadProfiles, build_profiles
+
+HOST_RULES = "--host-resolver-rules=MAP *.test 127.0.0.1"
+
+
+def load(browser, server, profiles: LoadProfiles, profile, url: str) -> dict:
+    context = browser.new_context(**profile.context_options())
+    profiles.install(context, profile)
+    blocked = profile.blocked
+    with server.served_lock:
+        server.served.update(requests=0, bytes=0)
+    page = context.new_page()
+    started = time.perf_counter()
+    page.goto(url, wait_until="load")
+    load_ms = (time.perf_counter() - started) * 1000
+    # Let late requests (video buffering, the iframe's own loads) land
+    page.wait_for_timeout(300)
+    context.close()
+    return {"load_ms": load_ms, "bytes": server.served["bytes"], "requests": server.served["requests"], "blocked": profile.blocked - blocked}
+
+
+def memory(browser, profiles: LoadProfiles, url: str, pages: int) -> dict:
+    profile = profiles.profiles["full"]
+    contexts = []
+    for _ in range(pages):
+        context = browser.new_context(**profile.context_options())
+        contexts.append(context)
+        context.new_page().goto(url, wait_until="load")
+    time.sleep(1)
+    stats = process_tree_stats()
+    for context in contexts:
+        context.close()
+    return {"pages": pages, "chromium_processes": stats["chromium_processes"], "chromium_rss_mb": stats["chromium_rss_mb"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--presets", nargs="+", default=list(LAUNCH_PRESETS))
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    port = server.server_address[1]
+    # Loaded through a .test host so the embeds are on other sites
+    url = f"http://www.site.test:{port}/media_heavy.html"
+    profiles = LoadProfiles(build_profiles(["ads.test"]))
+    results = []
+    memory_results = {}
+    try:
+        with sync_playwright() as p:
+            for preset in args.presets:
+                browser = p.chromium.launch(headless=True, args=[HOST_RULES, *LAUNCH_PRESETS[preset]])
+                for name, profile in profiles.profiles.items():
+                    runs = [load(browser, server, profiles, profile, url) for _ in range(args.runs)]
+                    result = {
+                        "preset": preset,
+                        "profile": name,
+                        "runs": args.runs,
+                        "load_p50_ms": round(percentile([run["load_ms"] for run in runs], 50), 1),
+                        "kb_transferred": round(sum(run["bytes"] for run in runs) / len(runs) / 1024, 1),
+                        "requests": round(sum(run["requests"] for run in runs) / len(runs), 1),
+                        "blocked": round(sum(run["blocked"] for run in runs) / len(runs), 1),
+                    }
+                    results.append(result)
+                    print(json.dumps(result))
+                memory_results[preset] = memory(browser, profiles, url, args.pages)
+                print(json.dumps({"preset": preset, **memory_results[preset]}))
+                browser.close()
+    finally:
+        server.shutdown()
+
+    summary = {}
+    for preset in args.presets:
+        by_profile = {result["profile"]: result for result in results if result["preset"] == preset}
+        full = by_profile["full"]
+        summary[preset] = {
+            name: {
+                "bytes_saved": round(1 - result["kb_transferred"] / max(full["kb_transferred"], 0.1), 3),
+                "load_speedup": round(full["load_p50_ms"] / max(result["load_p50_ms"], 0.1), 2),
+            }
+            for name, result in by_profile.items() if name != "full"
+        }
+        summary[preset]["chromium_rss_mb"] = memory_results[preset]["chromium_rss_mb"]
+    if "default" in memory_results and "low-memory" in memory_results:
+        default_rss = memory_results["default"]["chromium_rss_mb"] or 0
+        summary["low_memory_rss_saved"] = round(1 - (memory_results["low-memory"]["chromium_rss_mb"] or 0) / max(default_rss, 0.1), 3)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
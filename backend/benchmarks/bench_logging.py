@@ -0,0 +1,193 @@
+"""
+Logging throughput and the cost to the calling thread, with several jobs
+logging at once:
+
+    print    the agents' old print(json.dumps(..., indent=4)) to stdout
+    legacy   the previous ThreadedLogger, one executor task and one file
+             write per record on an unbounded queue
+    sink     StructuredLogger, bounded queue, batched writes and redaction
+
+Payloads are a small step record or an LLM request carrying a screenshot
+as a base64 data URL. Reports per call latency on the caller, records per
+second until everything is on disk, bytes written per record, records
+dropped and the largest backlog seen. Usage, from backend/:
+
+    python -m benchmarks.bench_logging --threads 1 4 16 --records 2000
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+
+from lib.logging import StructuredLogger
+
+
+class LegacyLogger:
+    """The ThreadedLogger this sink replaced, kept here for comparison."""
+    def __init__(self, path: str):
+        self.logger = logging.getLogger(f"legacy_{path}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger.addHandler(handler)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="logger")
+
+    def _log_message(self, level, message, data=None):
+        entry = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3], "level": level.upper(), "message": message}
+        if data:
+            entry.update(data)
+        getattr(self.logger, level)(json.dumps(entry))
+
+    def info(self, message, data=None):
+        self.executor.submit(self._log_message, "info", message, data)
+
+    def backlog(self) -> int:
+        return self.executor._work_queue.qsize()
+
+    def flush(self):
+        self.executor.shutdown(wait=True)
+        for handler in self.logger.handlers:
+            handler.close()
+
+
+class CountingStdout:
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text):
+        self.bytes += len(text)
+
+    def flush(self):
+        pass
+
+
+def payloads(screenshot_kb: int) -> dict:
+    data_url = "data:image/png;base64," + base64.b64encode(os.urandom(screenshot_kb * 768)).decode()
+    return {
+        "step": {"query_id": "q-1", "step": 3, "tier": "vision", "actions": [{"box_click": 12, "input_text": "green frontier", "extracted_data": None}]},
+        "llm": {"messages": [
+            {"role": "system", "content": "You are a browser agent."},
+            {"role": "user", "content": [
+                {"type": "text", "text": "This is screenshot of a webpage with highligted boxes. Type the query into the search box."},
+                {"type": "image_url", "image_url": {"url": data_url}},
+            ]},
+        ]},
+    }
+
+
+def run(kind: str, payload: dict, threads: int, records: int, workdir: str, args) -> dict:
+    path = os.path.join(workdir, f"{kind}_{threads}_{time.monotonic_ns()}.log")
+    stdout = None
+    if kind == "print":
+        stdout, sys.stdout = sys.stdout, CountingStdout()
+        counter = sys.stdout
+        call = lambda: print("browser action generator messages", json.dumps(payload, indent=4))
+    elif kind == "legacy":
+        logger = LegacyLogger(path)
+        call = lambda: logger.info("browser action generator messages", payload)
+    else:
+        logger = StructuredLogger(path, level="info", queue_size=args.queue_size, overflow=args.overflow)
+        call = lambda: logger.info("browser action generator messages", payload)
+
+    timings = [[] for _ in range(threads)]
+    backlog = [0]
+    done = threading.Event()
+
+    def worker(idx):
+        for _ in range(records):
+            started = time.perf_counter()
+            call()
+            timings[idx].append((time.perf_counter() - started) * 1e6)
+
+    def watch():
+        while not done.is_set():
+            if kind == "legacy":
+                backlog[0] = max(backlog[0], logger.backlog())
+            elif kind == "sink":
+                backlog[0] = max(backlog[0], logger.stats()["queued"])
+            time.sleep(0.005)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(idx,)) for idx in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    calls_done = time.perf_counter() - started
+    if kind == "print":
+        sys.stdout = stdout
+        written_bytes, dropped = counter.bytes, 0
+    else:
+        logger.flush() if kind == "legacy" else logger.flush(timeout_s=600)
+        written_bytes = os.path.getsize(path)
+        dropped = logger.stats()["dropped"] if kind == "sink" else 0
+    wall = time.perf_counter() - started
+    done.set()
+
+    all_timings = [value for values in timings for value in values]
+    total = threads * records
+    return {
+        "logger": kind,
+        "threads": threads,
+        "records": total,
+        "caller_p50_us": round(percentile(all_timings, 50), 1),
+        "caller_p99_us": round(percentile(all_timings, 99), 1),
+        "caller_s": round(calls_done, 3),
+        "records_per_s": round((total - dropped) / wall, 1),
+        "bytes_per_record": round(written_bytes / max(1, total - dropped)),
+        "dropped": dropped,
+        "max_backlog": backlog[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--records", type=int, default=2000, help="records per thread")
+    parser.add_argument("--payload", choices=["step", "llm"], nargs="+", default=["step", "llm"])
+    parser.add_argument("--screenshot-kb", type=int, default=200)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--overflow", default="drop_oldest")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="cd_browser_agent_bench_logs_")
+    available = payloads(args.screenshot_kb)
+    results = []
+    for name in args.payload:
+        # Fewer LLM records, each one carries a screenshot
+        records = args.records if name == "step" else max(1, args.records // 20)
+        for threads in args.threads:
+            for kind in ("print", "legacy", "sink"):
+                result = {"payload": name, **run(kind, available[name], threads, records, workdir, args)}
+                results.append(result)
+                print(json.dumps(result))
+
+    summary = {}
+    for name in args.payload:
+        for threads in args.threads:
+            by_kind = {result["logger"]: result for result in results if result["payload"] == name and result["threads"] == threads}
+            summary[f"{name}_{threads}_threads"] = {
+                "caller_p50_speedup_vs_legacy": round(by_kind["legacy"]["caller_p50_us"] / max(by_kind["sink"]["caller_p50_us"], 0.1), 1),
+                "caller_p50_speedup_vs_print": round(by_kind["print"]["caller_p50_us"] / max(by_kind["sink"]["caller_p50_us"], 0.1), 1),
+                "throughput_speedup_vs_legacy": round(by_kind["sink"]["records_per_s"] / max(by_kind["legacy"]["records_per_s"], 0.1), 1),
+                "bytes_per_record_legacy": by_kind["legacy"]["bytes_per_record"],
+                "bytes_per_record_sink": by_kind["sink"]["bytes_per_record"],
+            }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Wall clock spent waiting after a step's browser actions, the old fixed
+sleep against adaptive settle detection, on local fixture pages:
+
+    static   form submit that navigates to a new document
+    xhr      button that renders results after a delayed fetch
+    spa      client side route change rendered over two fetches
+
+A wait only counts as ready if the page's final content is there when it
+returns. Usage, from backend/:
+
+    python -m benchmarks.bench_page_settle --iterations 5 --fixed-sleep 5
+"""
+import argparse
+import json
+import time
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+
+from playwright.sync_api import sync_playwright
+from benchmarks.fixture_server import start_fixture_server
+from lib.page_settle import PageSettler
+
+
+def act_static(page):
+    page.fill("input[name=q]", "green frontier capital")
+    page.click("button[type=submit]")
+
+
+def act_click(selector):
+    return lambda page: page.click(selector)
+
+
+# name -> (page, action, readiness check)
+SCENARIOS = {
+    "static": ("search.html", act_static, "() => document.querySelectorAll('.result').length > 0"),
+    "xhr": ("xhr.html?api_ms=800", act_click("#load"), "() => document.body.dataset.ready === 'true'"),
+    "spa": ("spa.html?api_ms=400", act_click("#details"), "() => document.body.dataset.ready === 'true'"),
+}
+
+
+def run(page, base_url: str, scenario: str, strategy: str, iterations: int, fixed_sleep_s: float, timeout_s: float) -> dict:
+    path, act, ready_js = SCENARIOS[scenario]
+    timings = []
+    ready = 0
+    settled = 0
+    settler = PageSettler(page, timeout_s=timeout_s)
+    for _ in range(iterations):
+        page.goto(f"{base_url}/{path}")
+        act(page)
+        started = time.perf_counter()
+        if strategy == "fixed":
+            page.wait_for_timeout(fixed_sleep_s * 1000)
+        else:
+            settled += settler.wait().settled
+        timings.append((time.perf_counter() - started) * 1000)
+        ready += page.evaluate(ready_js)
+    result = {
+        "scenario": scenario,
+        "strategy": strategy,
+        "wait_p50_ms": round(percentile(timings, 50)),
+        "wait_p95_ms": round(percentile(timings, 95)),
+        "ready_rate": round(ready / iterations, 3),
+    }
+    if strategy == "adaptive":
+        result["settled_rate"] = round(settled / iterations, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--fixed-sleep", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    results = []
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            for scenario in args.scenarios:
+                for strategy in ("fixed", "adaptive"):
+                    # Fresh page per run so page listeners don't pile up
+                    page = browser.new_page(viewport={"width": 1280, "height": 800})
+                    result = run(page, base_url, scenario, strategy, args.iterations, args.fixed_sleep, args.timeout)
+                    page.close()
+                    results.append(result)
+                    print(json.dumps(result))
+            browser.close()
+    finally:
+        server.shutdown()
+
+    summary = {}
+    for scenario in args.scenarios:
+        fixed, adaptive = [r for r in results if r["scenario"] == scenario]
+        summary[scenario] = {
+            "saved_per_step_ms": fixed["wait_p50_ms"] - adaptive["wait_p50_ms"],
+            "speedup": round(fixed["wait_p50_ms"] / max(adaptive["wait_p50_ms"], 1), 1),
+        }
+    print(json.dumps({"iterations": args.iterations, "results": results, "summary": summary}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Bytes per step and capture + encode time of the screenshot path.
+
+    legacy      PNG written to disk, read back and base64 encoded twice
+                (once for the SSE payload, once for the LLM request)
+    pipeline    in-memory capture, optional downscale, encoded once as
+                PNG/JPEG/WebP and shared by both consumers
+
+By default frames come from the fixture pages in a headless browser. With
+--png the given PNG files are used instead, which only measures the
+encoding side. Usage, from backend/:
+
+    python -m benchmarks.bench_screenshot_pipeline --iterations 10
+    python -m benchmarks.bench_screenshot_pipeline --png ./screenshots/*.png
+"""
+import argparse
+import json
+import os
+import time
+from benchmarks.common import setup_environment, percentile
+
+WORKDIR = setup_environment()
+
+from lib.screenshot_pipeline import ScreenshotPipeline, Screenshot
+from lib.utils import generate_screenshot_base64
+
+
+# name -> pipeline options
+CONFIGS = {
+    "png": {"format": "png"},
+    "jpeg_q80": {"format": "jpeg", "quality": 80},
+    "jpeg_q60_1024": {"format": "jpeg", "quality": 60, "max_width": 1024, "max_height": 1024},
+    "webp_q80": {"format": "webp", "quality": 80},
+    "webp_q60_1024": {"format": "webp", "quality": 60, "max_width": 1024, "max_height": 1024},
+}
+
+
+def legacy_step(capture_png, path: str) -> int:
+    capture_png(path)
+    sse_payload = generate_screenshot_base64(path)
+    llm_payload = generate_screenshot_base64(path)
+    return len(sse_payload) + len(llm_payload)
+
+
+def pipeline_step(capture, name: str) -> int:
+    screenshot = capture(name)
+    sse_payload = screenshot.base64
+    llm_payload = screenshot.data_url
+    return len(sse_payload) + len(llm_payload)
+
+
+def measure(step, iterations: int) -> dict:
+    timings, sizes = [], []
+    for idx in range(iterations):
+        started = time.perf_counter()
+        sizes.append(step(idx))
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "bytes_per_step": round(sum(sizes) / len(sizes)),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+    }
+
+
+def run_offline(png_paths: list, iterations: int) -> list:
+    frames = []
+    for path in png_paths:
+        with open(path, "rb") as f:
+            frames.append(f.read())
+
+    def write_png(idx, path):
+        with open(path, "wb") as f:
+            f.write(frames[idx % len(frames)])
+
+    results = [{"strategy": "legacy", **measure(
+        lambda idx: legacy_step(lambda path: write_png(idx, path), os.path.join(WORKDIR, "screenshots", f"legacy_{idx}.png")),
+        iterations,
+    )}]
+    for name, options in CONFIGS.items():
+        pipeline = ScreenshotPipeline(**options)
+        results.append({"strategy": name, **measure(
+            lambda idx: pipeline_step(lambda _: Screenshot(pipeline.encode(frames[idx % len(frames)]), pipeline.format), str(idx)),
+            iterations,
+        )})
+    return results
+
+
+def run_browser(iterations: int, page_name: str) -> list:
+    from playwright.sync_api import sync_playwright
+    from benchmarks.fixture_server import start_fixture_server
+
+    server, base_url = start_fixture_server()
+    results = []
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            page = browser.new_page(viewport={"width": 1280, "height": 800})
+            page.goto(f"{base_url}/{page_name}")
+            results.append({"strategy": "legacy", **measure(
+                lambda idx: legacy_step(
+                    lambda path: page.screenshot(path=path, full_page=False),
+                    os.path.join(WORKDIR, "screenshots", f"legacy_{idx}.png"),
+                ),
+                iterations,
+            )})
+            for name, options in CONFIGS.items():
+                pipeline = ScreenshotPipeline(**options, persist_dir=os.path.join(WORKDIR, "screenshots"))
+                results.append({"strategy": name, **measure(
+                    lambda idx: pipeline_step(lambda step_name: pipeline.capture(page, name=f"{name}_{step_name}"), str(idx)),
+                    iterations,
+                )})
+            browser.close()
+    finally:
+        server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--page", default="heavy_dom.html")
+    parser.add_argument("--png", nargs="+", help="encode these PNG files instead of capturing from a browser")
+    args = parser.parse_args()
+
+    results = run_offline(args.png, args.iterations) if args.png else run_browser(args.iterations, args.page)
+    legacy = results[0]
+    for result in results:
+        result["bytes_vs_legacy"] = round(result["bytes_per_step"] / legacy["bytes_per_step"], 3)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Hit rate and lookup latency of the semantic action plan cache on a
+synthetic query set, no LLM or browser involved.
+
+The cache is warmed with one query per (intent, entity) for a few
+entities, then replayed with three kinds of query:
+
+    paraphrase   same intent and entity, reworded, should hit
+    new_entity   same wording, an unseen entity, should hit via the template
+    near_miss    a cached query with one value changed that its plan only
+                 mentions in plain text (a flight's destination), should miss
+    unrelated    a different intent, should miss
+
+A hit counts as correct only if the returned plan equals the plan the
+LLM would have produced. Usage, from backend/:
+
+    python -m benchmarks.bench_semantic_plan_cache --thresholds 0.7 0.8 0.9 --index-sizes 100 1000 5000
+"""
+import argparse
+import json
+import random
+import time
+from urllib.parse import quote_plus
+from benchmarks.common import percentile
+from lib.semantic_cache import SemanticPlanCache, HashingEmbedder
+
+
+ENTITIES = [
+    "green frontier capital", "acme corp", "blue harbor logistics", "northwind traders", "contoso ltd",
+    "fabrikam", "globex corporation", "initech", "umbrella health", "stark industries", "wayne enterprises",
+    "cyberdyne systems", "tyrell corporation", "soylent foods", "hooli", "pied piper", "vandelay industries",
+    "wonka chocolates", "oscorp", "massive dynamic",
+]
+
+# (site, search url, wordings), the first wording is the one that warms the cache
+INTENTS = [
+    ("google", "https://www.google.com/search?q={q}", [
+        "search {e} on google", "google search for {e}", "search google for {e}", "search for {e} on google",
+    ]),
+    ("bing", "https://www.bing.com/search?q={q}", [
+        "search {e} on bing", "bing search for {e}", "search bing for {e}", "look for {e} on bing",
+    ]),
+    ("linkedin", "https://www.linkedin.com/search/results/companies/?keywords={q}", [
+        "find the linkedin page of {e}", "linkedin page for {e}", "find {e} linkedin page", "open linkedin page of {e}",
+    ]),
+    ("crunchbase", "https://www.crunchbase.com/textsearch?q={q}", [
+        "how much funding has {e} raised according to crunchbase", "crunchbase funding of {e}",
+        "total funding raised by {e} on crunchbase", "{e} funding on crunchbase",
+    ]),
+]
+
+UNRELATED = [
+    "what is the weather in berlin tomorrow", "book a table for two at an italian restaurant",
+    "find cheap flights from delhi to london", "show me the latest nba scores", "translate hello into french",
+    "what time does the louvre open on sunday", "order a large pepperoni pizza", "convert 100 usd to inr",
+]
+
+
+# (cached query, changed query, cached plan), the plan names the cities in
+# plain text so they are no slots, reusing it would fly to the wrong city
+NEAR_MISSES = [
+    ("find the cheapest flight from {a} to {b} next week", "https://www.google.com/travel/flights",
+     "Search flights from {a} to {b} departing next week"),
+    ("book a hotel in {b} for two nights", "https://www.booking.com",
+     "Search hotels in {b} for two nights"),
+]
+CITIES = [("new york", "paris", "london"), ("delhi", "tokyo", "singapore"), ("berlin", "rome", "madrid")]
+
+
+def llm_plan(site: str, url: str, entity: str) -> dict:
+    """The plan the LLM would return, deterministic so hits can be checked."""
+    return {
+        "goto": url.format(q=quote_plus(entity)),
+        "action_plan": [
+            f"Open {site}",
+            f"Type '{entity}' into the search bar and submit",
+            "Read the title of the first result",
+        ],
+        "goal": f"The first {site} result mentions {entity}",
+        "vision_only": ["Read the title of the first result"],
+    }
+
+
+def filler_queries(count: int, rng: random.Random) -> list:
+    vocabulary = ("price review compare buy install reset update cancel subscribe download track return "
+                  "account order invoice ticket refund warranty manual store hours near map").split()
+    return [" ".join(rng.sample(vocabulary, 5)) + f" {idx}" for idx in range(count)]
+
+
+def build_workload(warm_entities: int, rng: random.Random):
+    warm, probes = [], []
+    for site, url, wordings in INTENTS:
+        for entity in ENTITIES[:warm_entities]:
+            warm.append((wordings[0].format(e=entity), llm_plan(site, url, entity)))
+            for wording in wordings[1:]:
+                probes.append(("paraphrase", wording.format(e=entity), llm_plan(site, url, entity)))
+        for entity in ENTITIES[warm_entities:]:
+            probes.append(("new_entity", wordings[0].format(e=entity), llm_plan(site, url, entity)))
+    for wording, url, step in NEAR_MISSES:
+        for origin, destination, changed in CITIES:
+            plan = {
+                "goto": url,
+                "action_plan": [step.format(a=origin, b=destination).capitalize(), "Read the first result"],
+                "goal": "",
+                "vision_only": ["Read the first result"],
+            }
+            warm.append((wording.format(a=origin, b=destination), plan))
+            probes.append(("near_miss", wording.format(a=origin, b=changed), None))
+    for query in UNRELATED:
+        probes.append(("unrelated", query, None))
+    rng.shuffle(probes)
+    return warm, probes
+
+
+def run(threshold: float, index_size: int, warm_entities: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    warm, probes = build_workload(warm_entities, rng)
+    cache = SemanticPlanCache(embed=HashingEmbedder(), threshold=threshold, max_entries=index_size + len(warm))
+    for query in filler_queries(max(index_size - len(warm), 0), rng):
+        cache.add(query, {"goto": "https://example.com", "action_plan": [query], "goal": "", "vision_only": []})
+    for query, plan in warm:
+        cache.add(query, plan)
+
+    by_kind = {}
+    timings = []
+    for kind, query, expected in probes:
+        started = time.perf_counter()
+        hit = cache.lookup(query)
+        timings.append((time.perf_counter() - started) * 1000)
+        counts = by_kind.setdefault(kind, {"queries": 0, "hits": 0, "correct": 0, "wrong": 0})
+        counts["queries"] += 1
+        if hit is not None:
+            counts["hits"] += 1
+            counts["correct" if hit[0] == expected else "wrong"] += 1
+
+    for counts in by_kind.values():
+        counts["hit_rate"] = round(counts["hits"] / counts["queries"], 3)
+    should_hit = [counts for kind, counts in by_kind.items() if kind not in ("near_miss", "unrelated")]
+    return {
+        "threshold": threshold,
+        "index_size": len(cache.index),
+        "correct_hit_rate": round(sum(c["correct"] for c in should_hit) / sum(c["queries"] for c in should_hit), 3),
+        "wrong_hits": sum(c["wrong"] for c in by_kind.values()),
+        "lookup_p50_ms": round(percentile(timings, 50), 3),
+        "lookup_p95_ms": round(percentile(timings, 95), 3),
+        "by_kind": by_kind,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.9])
+    parser.add_argument("--index-sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--warm-entities", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = []
+    for index_size in args.index_sizes:
+        for threshold in args.thresholds:
+            result = run(threshold, index_size, args.warm_entities, args.seed)
+            results.append(result)
+            print(json.dumps({k: v for k, v in result.items() if k != "by_kind"}))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
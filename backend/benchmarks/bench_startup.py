@@ -0,0 +1,127 @@
+"""
+Cold start of the API process, for this tree and a baseline commit.
+
+Each run starts a fresh interpreter that imports main, builds the app
+(create_app(start_workers=False), or the module level app of trees without
+a factory) and serves GET / through the test client. Reports the import
+time, the time to the first response measured in the process and from the
+parent (interpreter start included) and which heavy modules (Playwright,
+the OpenAI SDK, PIL) got imported on the way. The baseline tree is checked
+out from --baseline-ref into a temporary git worktree. Then prewarm() runs
+--runs times in this tree, reporting the seconds spent importing the query
+processor, launching browsers and opening LLM connections. Usage, from
+backend/:
+
+    python -m benchmarks.bench_startup --runs 5 --baseline-ref HEAD~1
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("playwright.sync_api", "playwright.async_api", "openai", "PIL.Image", "service.query_processor",
+                 "service.job_scheduler", "lib.browser_pool", "lib.llm_gateway", "lib.action_resolver")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app(start_workers=False) if hasattr(main, "create_app") else main.app
+status = app.test_client().get("/").status_code
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (served - started) * 1000,
+    "status": status,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}), flush=True)
+""" % (HEAVY_MODULES,)
+
+PREWARM_PROBE = """
+import json
+from service.job_scheduler import prewarm
+print(json.dumps(prewarm()), flush=True)
+"""
+
+
+def probe(backend_dir: str, code: str) -> dict:
+    """Runs code in a fresh interpreter in backend_dir, returns its JSON line and the seconds until it arrived."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=backend_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        start_new_session=True,
+    )
+    try:
+        line = process.stdout.readline()
+        elapsed = time.perf_counter() - started
+    finally:
+        # Trees that start job workers on import run Playwright drivers, the
+        # whole process group goes so none are left to compete with the next run
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    if not line:
+        raise RuntimeError(f"Startup probe in {backend_dir} printed nothing")
+    return {**json.loads(line), "process_ms": elapsed * 1000}
+
+
+def startup(name: str, backend_dir: str, runs: int) -> dict:
+    # The first run compiles the tree's bytecode, it isn't counted
+    probe(backend_dir, PROBE)
+    results = [probe(backend_dir, PROBE) for _ in range(runs)]
+    return {
+        "tree": name,
+        "runs": runs,
+        "import_p50_ms": round(percentile([result["import_ms"] for result in results], 50), 1),
+        "first_request_p50_ms": round(percentile([result["first_request_ms"] for result in results], 50), 1),
+        "process_to_first_response_p50_ms": round(percentile([result["process_ms"] for result in results], 50), 1),
+        "status": results[0]["status"],
+        "heavy_modules": results[0]["heavy_modules"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline-ref", default="HEAD~1", help="git ref to compare against, none to skip")
+    args = parser.parse_args()
+
+    results = [startup("current", BACKEND_DIR, args.runs)]
+    print(json.dumps(results[-1]))
+
+    worktree = None
+    if args.baseline_ref.lower() != "none":
+        repo = subprocess.check_output(["git", "rev-parse", "--show-toplevel"], cwd=BACKEND_DIR, text=True).strip()
+        worktree = tempfile.mkdtemp(prefix="cd_browser_agent_baseline_")
+        subprocess.check_call(["git", "worktree", "add", "--detach", worktree, args.baseline_ref], cwd=repo, stdout=subprocess.DEVNULL)
+        try:
+            results.append(startup(args.baseline_ref, os.path.join(worktree, os.path.relpath(BACKEND_DIR, repo)), args.runs))
+            print(json.dumps(results[-1]))
+        finally:
+            subprocess.call(["git", "worktree", "remove", "--force", worktree], cwd=repo)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    prewarms = [probe(BACKEND_DIR, PREWARM_PROBE) for _ in range(args.runs)]
+    prewarm = {f"{name}_p50": round(percentile([run[name] for run in prewarms], 50), 3) for name in ("import_s", "browsers_s", "llm_s")}
+    print(json.dumps({"tree": "current", "prewarm": prewarm}))
+
+    summary = {"current": results[0], "prewarm": prewarm}
+    if len(results) > 1:
+        current, baseline = results
+        summary["baseline"] = baseline
+        summary["import_speedup"] = round(baseline["import_p50_ms"] / max(current["import_p50_ms"], 0.1), 2)
+        summary["first_request_speedup"] = round(baseline["first_request_p50_ms"] / max(current["first_request_p50_ms"], 0.1), 2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
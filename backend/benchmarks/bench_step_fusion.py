@@ -0,0 +1,120 @@
+"""
+LLM calls and latency per query with step fusion off and on, over the
+form filling scenarios (benchmarks.scenarios.FORM_SCENARIOS).
+
+Each scenario runs --jobs times through QueryProcessorService.process_query
+against the fixture server and a stub LLM with --llm-latency per call.
+checkout fills a shipping form, moves to a payment form and pays,
+business_checkout reveals more fields half way through a form, which makes
+the fused group plan its remaining steps again. Reports LLM calls per
+query (from the query's trace) by kind, job latency, the tier of each step,
+replans and whether both runs took the same actions. The fast resolver
+tiers are off unless --resolver-tiers, so every step needs the vision
+agent. Usage, from backend/:
+
+    python -m benchmarks.bench_step_fusion --jobs 5 --max-steps 4
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from benchmarks.common import setup_environment, percentile
+
+WORKDIR = setup_environment()
+os.environ.setdefault("CACHE_BACKEND", "memory")
+# Every cache lookup misses, so each job pays for its LLM calls
+os.environ["CACHE_TTL_S"] = "0"
+os.environ["SEMANTIC_PLAN_CACHE_ENABLED"] = "false"
+os.environ["REPLAY_ENABLED"] = "false"
+
+from benchmarks.fixture_server import start_fixture_server
+from benchmarks.scenarios import FORM_SCENARIOS, query_for, scenario_responder
+from benchmarks.stub_llm import StubOpenAI
+from lib.action_resolver import action_resolver
+from lib.browser_interactor import browser_pool
+from lib.job_repository import job_repository
+from lib.llm_gateway import llm_gateway
+from lib.step_fusion import step_fusion
+from lib.tracing import tracer
+from service.query_processor import query_processor_service
+
+
+def run(scenario: str, fused: bool, args) -> dict:
+    step_fusion.enabled = fused
+    replans = sum(step_fusion.stats()["replans"].values())
+    latencies, calls, kinds, tiers, actions, statuses = [], [], Counter(), Counter(), [], Counter()
+    for idx in range(args.jobs):
+        query_id = f"fusion-{'on' if fused else 'off'}-{scenario}-{idx}-{int(time.time() * 1000)}"
+        job_repository.create(query_id, query_for(scenario, query_id))
+        started = time.perf_counter()
+        query_processor_service.process_query(query_id, None)
+        latencies.append(time.perf_counter() - started)
+
+        statuses[job_repository.get(query_id)["status"]] += 1
+        llm_calls = tracer.timeline(query_id)["llm_calls"]
+        calls.append(llm_calls["total"])
+        kinds.update(llm_calls["by_kind"])
+        steps = job_repository.steps(query_id)
+        tiers.update(step["tier"] for step in steps if step.get("tier"))
+        actions.append([[(action.get("box_click"), action.get("input_text")) for action in step.get("actions") or []] for step in steps if not step.get("vision_only")])
+
+    return {
+        "scenario": scenario,
+        "fusion": "on" if fused else "off",
+        "jobs": args.jobs,
+        "statuses": dict(statuses),
+        "llm_calls_per_query": round(sum(calls) / len(calls), 2),
+        "llm_calls_by_kind": {kind: round(count / args.jobs, 2) for kind, count in sorted(kinds.items())},
+        "job_p50_s": round(percentile(latencies, 50), 3),
+        "job_p95_s": round(percentile(latencies, 95), 3),
+        "tiers": dict(tiers),
+        "replans": sum(step_fusion.stats()["replans"].values()) - replans,
+        "actions": actions[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5, help="jobs per scenario and mode")
+    parser.add_argument("--scenarios", nargs="+", default=list(FORM_SCENARIOS), choices=list(FORM_SCENARIOS))
+    parser.add_argument("--max-steps", type=int, default=step_fusion.max_steps, help="steps per fused group")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--resolver-tiers", nargs="*", default=[], help="fast resolver tiers, none by default")
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    llm_gateway.client = StubOpenAI(scenario_responder(base_url, FORM_SCENARIOS), args.llm_latency)
+    action_resolver.tiers = set(args.resolver_tiers) | {"vision"}
+    step_fusion.max_steps = args.max_steps
+    os.chdir(WORKDIR)
+
+    results = []
+    browser_pool.bind_thread()
+    try:
+        for scenario in args.scenarios:
+            for fused in (False, True):
+                result = run(scenario, fused, args)
+                results.append(result)
+                print(json.dumps({key: value for key, value in result.items() if key != "actions"}))
+    finally:
+        browser_pool.release_thread()
+        browser_pool.shutdown()
+        server.shutdown()
+
+    summary = {"llm_latency_s": args.llm_latency, "max_steps": args.max_steps}
+    for scenario in args.scenarios:
+        off, on = (next(r for r in results if r["scenario"] == scenario and r["fusion"] == mode) for mode in ("off", "on"))
+        summary[scenario] = {
+            "llm_calls_off": off["llm_calls_per_query"],
+            "llm_calls_on": on["llm_calls_per_query"],
+            "llm_calls_saved": round(1 - on["llm_calls_per_query"] / max(off["llm_calls_per_query"], 0.01), 3),
+            "job_p50_speedup": round(off["job_p50_s"] / max(on["job_p50_s"], 0.001), 2),
+            "replans": on["replans"],
+            "same_actions": off["actions"] == on["actions"],
+        }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
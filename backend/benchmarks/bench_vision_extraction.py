@@ -0,0 +1,143 @@
+"""
+Wall time of action plans mixing browser steps (B) and vision only
+extraction steps (V), with a stub LLM of configurable latency:
+
+    sequential   every extraction blocks the loop on its LLM call
+    parallel     extraction calls run on the executor while the browser
+                 carries on with the next steps, merged in plan order
+    batched      parallel, and consecutive extractions share one screenshot
+                 and one LLM request
+
+Browser steps are simulated (screenshot + page action LLM call + settle
+time), the agent, scheduler and cache code are the real ones. Usage, from
+backend/:
+
+    python -m benchmarks.bench_vision_extraction --plan BVVBVVV --llm-latency 0.5 --jobs 4
+"""
+import argparse
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import setup_environment, percentile
+
+setup_environment()
+os.environ["CACHE_BACKEND"] = "memory"
+
+from PIL import Image
+from benchmarks.stub_llm import ScriptedResponder, StubOpenAI
+from agents.browser_action_generator_agent import BrowserActionGeneratorAgent
+from lib.screenshot_pipeline import Screenshot
+from lib.step_scheduler import ExtractionScheduler, group_steps
+
+MODES = {
+    "sequential": {"parallel": False, "batch": False},
+    "parallel": {"parallel": True, "batch": False},
+    "batched": {"parallel": True, "batch": True},
+}
+
+
+def make_screenshot(seed: int) -> Screenshot:
+    image = Image.effect_noise((320, 200), 64 + seed % 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+    return Screenshot(buffer.getvalue(), "jpeg")
+
+
+def make_plan(pattern: str) -> tuple:
+    steps, vision_only = [], []
+    for idx, kind in enumerate(pattern.upper()):
+        if kind == "V":
+            steps.append(f"Read the value of field {idx} on the page")
+            vision_only.append(steps[-1])
+        else:
+            steps.append(f"Click the button number {idx}")
+    return steps, vision_only
+
+
+def run_plan(agent, steps, vision_only, scheduler, batch_size, run_id, args) -> dict:
+    """Mirrors the step loop of QueryProcessorService.execute_action_plan."""
+    step_results = {}
+    for extraction, group in group_steps(steps, vision_only, batch_size):
+        step_idx, action = group[0]
+        time.sleep(args.capture_ms / 1000)
+        screenshot = make_screenshot(step_idx)
+        fingerprint = f"{run_id}:{step_idx}"
+        if extraction:
+            scheduler.submit(group, agent.generate_vision_only_batch, screenshot, [action for _, action in group], fingerprint)
+            continue
+        step_results[step_idx] = agent.generate_page_actions(screenshot, action, fingerprint)
+        time.sleep(args.browser_ms / 1000)
+
+    for group, results in scheduler.collect():
+        for (step_idx, _), actions in zip(group, results):
+            step_results[step_idx] = actions
+    return step_results
+
+
+def measure(mode: str, args) -> dict:
+    settings = MODES[mode]
+    stub = StubOpenAI(ScriptedResponder(plan={}, page_actions={}), latency_s=args.llm_latency)
+    agent = BrowserActionGeneratorAgent(openai=stub)
+    steps, vision_only = make_plan(args.plan)
+    batch_size = args.batch_size if settings["batch"] else 1
+    executor = ThreadPoolExecutor(max_workers=args.concurrency) if settings["parallel"] else None
+
+    latencies, orders = [], []
+
+    def job(idx):
+        started = time.perf_counter()
+        results = run_plan(agent, steps, vision_only, ExtractionScheduler(executor), batch_size, f"{mode}-{idx}", args)
+        latencies.append(time.perf_counter() - started)
+        orders.append(sorted(results) == list(range(len(steps))))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=job, args=(idx,)) for idx in range(args.jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    if executor is not None:
+        executor.shutdown()
+
+    return {
+        "mode": mode,
+        "jobs": args.jobs,
+        "wall_s": round(wall, 3),
+        "plan_p50_s": round(percentile(latencies, 50), 3),
+        "plan_p95_s": round(percentile(latencies, 95), 3),
+        "llm_calls": stub.calls,
+        "all_steps_merged": all(orders),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plan", default="BVVBVVV", help="B for a browser step, V for a vision only step")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--browser-ms", type=float, default=300, help="action execution and settle time per browser step")
+    parser.add_argument("--capture-ms", type=float, default=60)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        results.append(measure(mode, args))
+        print(json.dumps(results[-1]))
+
+    summary = {"plan": args.plan, "llm_latency_s": args.llm_latency}
+    baseline = next((r for r in results if r["mode"] == "sequential"), None)
+    if baseline is not None:
+        for result in results:
+            summary[f"{result['mode']}_speedup"] = round(baseline["plan_p50_s"] / result["plan_p50_s"], 2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Jobs distributed over several worker processes through the Redis job queue
+(RedisJobQueue + JobScheduler, the code worker.py runs), against REDIS_URL
+or an in-process fakeredis server when --redis-url isn't given.
+
+Jobs are simulated (they sleep --job-s with cancellation points) so the
+queue itself is measured. Optionally one worker is killed with SIGKILL part
+way, its jobs must be redelivered after the visibility timeout, and another
+is sent SIGTERM, it must drain and requeue. Reports throughput, statuses,
+jobs per worker and redeliveries. Usage, from backend/:
+
+    python -m benchmarks.bench_worker_pool --workers 1 2 4 --jobs 24
+    python -m benchmarks.bench_worker_pool --workers 3 --jobs 24 --kill-after 1 --drain-after 2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import Counter
+from benchmarks.common import setup_environment
+
+setup_environment()
+
+import redis
+from lib.redis_job_queue import RedisJobQueue
+from lib.job_repository import TERMINAL_STATUSES
+
+
+def start_fake_redis() -> tuple:
+    import fakeredis
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{server.server_address[1]}"
+
+
+def run_worker(redis_url: str, prefix: str, worker_id: str, capacity: int, job_s: float, heartbeat_s: float, visibility_s: float, drain_s: float, block_ms: int):
+    """Worker process, mirrors worker.py with a simulated job."""
+    from lib.job_context import check_cancelled
+    from lib.job_repository import job_repository
+    from service.job_scheduler import JobScheduler
+
+    client = redis.StrictRedis.from_url(redis_url)
+
+    def run_job(query_id, app):
+        client.hincrby(f"{prefix}:bench:runs", query_id, 1)
+        job_repository.transition(query_id, "in_progress")
+        deadline = time.monotonic() + job_s
+        while time.monotonic() < deadline:
+            check_cancelled()
+            time.sleep(0.02)
+        job_repository.transition(query_id, "done", result={"worker": worker_id})
+
+    scheduler = JobScheduler(
+        queue=RedisJobQueue(client, consumer=worker_id, prefix=prefix, visibility_timeout_s=visibility_s, max_deliveries=5, block_ms=block_ms),
+        run_job=run_job,
+        concurrency=capacity,
+        max_queue_size=None,
+        default_timeout=None,
+        bind_browser_driver=False,
+        heartbeat_s=heartbeat_s,
+    )
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    scheduler.start(None)
+    stop.wait()
+    scheduler.drain(drain_s)
+
+
+def measure(workers: int, args, redis_url: str) -> dict:
+    from lib.job_repository import job_repository
+
+    prefix = f"bench-{int(time.time() * 1000)}-{workers}"
+    client = redis.StrictRedis.from_url(redis_url)
+    queue = RedisJobQueue(client, consumer="producer", prefix=prefix)
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(redis_url, prefix, f"worker-{idx}", args.capacity, args.job_s, args.heartbeat, args.visibility, args.drain_timeout, args.block_ms))
+        for idx in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # Wait for every worker's first heartbeat so startup isn't measured
+    while len(queue.workers()) < workers:
+        time.sleep(0.05)
+
+    query_ids = [f"{prefix}-{idx}" for idx in range(args.jobs)]
+    started = time.perf_counter()
+    for query_id in query_ids:
+        job_repository.create(query_id, "benchmark job")
+        queue.put(query_id)
+
+    killed = drained = None
+    deadline = started + args.timeout
+    while time.perf_counter() < deadline:
+        elapsed = time.perf_counter() - started
+        if args.kill_after is not None and killed is None and elapsed >= args.kill_after:
+            killed = processes[0]
+            os.kill(killed.pid, signal.SIGKILL)
+        if args.drain_after is not None and drained is None and elapsed >= args.drain_after and workers > 1:
+            drained = processes[-1]
+            os.kill(drained.pid, signal.SIGTERM)
+        if all(job_repository.get(query_id)["status"] in TERMINAL_STATUSES for query_id in query_ids):
+            break
+        time.sleep(0.05)
+    wall = time.perf_counter() - started
+
+    for process in processes:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+    for process in processes:
+        process.join(timeout=args.drain_timeout + 10)
+
+    jobs = [job_repository.get(query_id) for query_id in query_ids]
+    runs = {key.decode(): int(value) for key, value in client.hgetall(f"{prefix}:bench:runs").items()}
+    return {
+        "workers": workers,
+        "capacity": args.capacity,
+        "jobs": args.jobs,
+        "wall_s": round(wall, 3),
+        "jobs_per_s": round(args.jobs / wall, 3),
+        "ideal_jobs_per_s": round(workers * args.capacity / args.job_s, 3),
+        "statuses": dict(Counter(job["status"] for job in jobs)),
+        "per_worker": dict(Counter((job["result"] or {}).get("worker") for job in jobs)),
+        "runs_beyond_first": sum(count - 1 for count in runs.values()),
+        "killed_worker": killed is not None,
+        "drained_worker": drained is not None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--capacity", type=int, default=2, help="jobs per worker at once")
+    parser.add_argument("--jobs", type=int, default=24)
+    parser.add_argument("--job-s", type=float, default=0.5)
+    parser.add_argument("--heartbeat", type=float, default=0.5)
+    parser.add_argument("--visibility", type=float, default=2.0)
+    parser.add_argument("--drain-timeout", type=float, default=0.3)
+    parser.add_argument("--kill-after", type=float, help="SIGKILL the first worker after this many seconds")
+    parser.add_argument("--drain-after", type=float, help="SIGTERM the last worker after this many seconds")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--redis-url", help="defaults to an in-process fakeredis server")
+    parser.add_argument("--block-ms", type=int, help="blocking claim time, 0 to poll")
+    args = parser.parse_args()
+
+    server, redis_url = (None, args.redis_url) if args.redis_url else start_fake_redis()
+    if args.block_ms is None:
+        # fakeredis serves blocking reads one at a time, workers poll it instead
+        args.block_ms = 1000 if args.redis_url else 0
+    results = []
+    try:
+        for workers in args.workers:
+            results.append(measure(workers, args, redis_url))
+            print(json.dumps(results[-1]))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    summary = {"job_s": args.job_s, "capacity": args.capacity}
+    for result in results:
+        summary[f"{result['workers']}_workers_jobs_per_s"] = result["jobs_per_s"]
+        summary[f"{result['workers']}_workers_all_done"] = result["statuses"] == {"done": result["jobs"]}
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+
+def setup_environment() -> str:
+    """
+    Prepares the process for an offline benchmark run.
+
+    Must be called before importing config or anything that imports it, it
+    fills in dummy Azure credentials so the real clients can be constructed
+    and creates a scratch working directory for jobs, screenshots and caches
+    so benchmark runs never touch the checked in ones.
+    """
+    os.environ.setdefault("OPENAI_AZURE_API_KEY", "benchmark")
+    os.environ.setdefault("OPENAI_AZURE_API_VERSION", "2024-06-01")
+    os.environ.setdefault("OPENAI_AZURE_ENDPOINT", "http://127.0.0.1:9")
+    os.environ.setdefault("OPENAI_AZURE_DEPLOYMENT", "benchmark")
+    os.environ.setdefault("BROWSER_POOL_HEADLESS", "true")
+    os.environ.setdefault("BROWSER_POOL_CHANNEL", "chromium")
+
+    workdir = tempfile.mkdtemp(prefix="cd_browser_agent_bench_")
+    for folder in ("jobs", "screenshots", "cache"):
+        os.makedirs(os.path.join(workdir, folder), exist_ok=True)
+    os.environ.setdefault("JOB_QUEUE_DB_PATH", os.path.join(workdir, "jobs", "job_queue.db"))
+    os.environ.setdefault("JOB_DB_PATH", os.path.join(workdir, "jobs", "jobs.db"))
+    return workdir
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _proc_status(pid: int) -> dict:
+    status = {}
+    with open(f"/proc/{pid}/status", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value.strip()
+    return status
+
+
+def process_tree_stats() -> dict:
+    """
+    RSS of this process and of its Chromium descendants, read from /proc.
+    Values are None where /proc isn't available (macOS, Windows).
+    """
+    if not os.path.isdir("/proc"):
+        return {"rss_mb": None, "chromium_processes": None, "chromium_rss_mb": None}
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            status = _proc_status(int(entry))
+        except OSError:
+            continue
+        children.setdefault(int(status.get("PPid", 0)), []).append((int(entry), status))
+
+    chromium, chromium_kb = 0, 0
+    pending = [os.getpid()]
+    while pending:
+        for pid, status in children.get(pending.pop(), []):
+            pending.append(pid)
+            name = status.get("Name", "").lower()
+            if "chrom" in name or "headless_shell" in name:
+                chromium += 1
+                chromium_kb += int(status.get("VmRSS", "0 kB").split()[0])
+
+    own_kb = int(_proc_status(os.getpid()).get("VmRSS", "0 kB").split()[0])
+    return {"rss_mb": round(own_kb / 1024, 1), "chromium_processes": chromium, "chromium_rss_mb": round(chromium_kb / 1024, 1)}
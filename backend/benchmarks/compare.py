@@ -0,0 +1,78 @@
+"""
+Compares two end-to-end benchmark reports, e.g. from the base and head
+commits of a change. Results are matched by mode and concurrency, a
+metric regresses when it is worse by more than --threshold (relative).
+Exits with status 1 if anything regressed. Usage, from backend/:
+
+    python -m benchmarks.compare base.json head.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# metric: True if higher is better
+METRICS = {
+    "jobs_per_s": True,
+    "job_p50_s": False,
+    "job_p95_s": False,
+    "llm_calls": False,
+    "peak_rss_mb": False,
+    "peak_chromium_processes": False,
+    "peak_chromium_rss_mb": False,
+}
+
+
+def _change(base: float, head: float) -> float:
+    if base in (None, 0) or head is None:
+        return None
+    return (head - base) / base
+
+
+def compare(base: dict, head: dict, threshold: float, stages: bool = True) -> tuple:
+    """Rows of (mode, concurrency, metric, base, head, change, regressed)."""
+    rows = []
+    head_results = {(r["mode"], r["concurrency"]): r for r in head["results"]}
+    for base_result in base["results"]:
+        key = (base_result["mode"], base_result["concurrency"])
+        head_result = head_results.get(key)
+        if head_result is None:
+            continue
+        metrics = [(name, base_result.get(name), head_result.get(name), higher) for name, higher in METRICS.items()]
+        if stages:
+            for stage, values in base_result.get("stages", {}).items():
+                head_stage = head_result.get("stages", {}).get(stage)
+                if head_stage is not None:
+                    metrics.append((f"{stage}.p95_ms", values["p95_ms"], head_stage["p95_ms"], False))
+        for name, base_value, head_value, higher in metrics:
+            change = _change(base_value, head_value)
+            regressed = change is not None and (change < -threshold if higher else change > threshold)
+            rows.append((*key, name, base_value, head_value, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--no-stages", action="store_true", help="only compare the job level metrics")
+    args = parser.parse_args()
+
+    with open(args.base, "r") as f:
+        base = json.load(f)
+    with open(args.head, "r") as f:
+        head = json.load(f)
+
+    rows = compare(base, head, args.threshold, stages=not args.no_stages)
+    print(f"base {base.get('commit')} -> head {head.get('commit')}, threshold {args.threshold:.0%}")
+    for mode, concurrency, name, base_value, head_value, change, regressed in rows:
+        delta = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"{mode:<9} c={concurrency:<3} {name:<32} {base_value!s:>10} -> {head_value!s:<10} {delta:>8}{'  REGRESSED' if regressed else ''}")
+
+    regressions = [row for row in rows if row[-1]]
+    print(json.dumps({"compared": len(rows), "regressions": [f"{row[0]}/c={row[1]}/{row[2]}" for row in regressions]}, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class FixtureRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the HTML fixtures plus a couple of dynamic endpoints.
+
+    /api/delay?ms=N     JSON response after N milliseconds, for XHR heavy pages
+    /api/blob?kb=N&type=T  N KB body of content type T (image/png, font/woff2,
+                        video/mp4, text/javascript, text/css...), for pages
+                        that load heavy subresources
+    any path ?delay_ms=N delays a static file the same way
+
+    The server counts the requests it answered and the body bytes it sent
+    in server.served.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == "content-length":
+            with self.server.served_lock:
+                self.server.served["requests"] += 1
+                self.server.served["bytes"] += int(value)
+        super().send_header(keyword, value)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+
+        delay_ms = int(params.get("delay_ms", params.get("ms", ["0"]))[0])
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        if parsed.path == "/api/delay":
+            body = json.dumps({"ok": True, "delay_ms": delay_ms}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if parsed.path == "/api/blob":
+            size = int(params.get("kb", ["10"])[0]) * 1024
+            content_type = params.get("type", ["application/octet-stream"])[0]
+            if content_type in ("text/javascript", "text/css"):
+                # Parses as an empty script or stylesheet
+                body = b"/*" + b"x" * max(0, size - 4) + b"*/"
+            else:
+                body = os.urandom(size)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        return super().do_GET()
+
+
+def start_fixture_server(host: str = "127.0.0.1", port: int = 0) -> tuple[ThreadingHTTPServer, str]:
+    """Starts the fixture server on a background thread, returns it with its base URL."""
+    handler = partial(FixtureRequestHandler, directory=FIXTURES_DIR)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.served = {"requests": 0, "bytes": 0}
+    server.served_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
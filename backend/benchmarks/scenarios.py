@@ -0,0 +1,86 @@
+"""
+End-to-end scenarios over the local fixtures, each one a scripted plan and
+the browser actions the stub LLM answers for its steps. Box numbers follow
+the annotation order of the fixture's visible elements.
+"""
+from benchmarks.stub_llm import ScriptedResponder
+
+
+def _fill(box: int, text: str) -> dict:
+    return {"box_click": box, "input_text": text, "extracted_data": None}
+
+
+def _click(box: int) -> dict:
+    return {"box_click": box, "input_text": None, "extracted_data": None}
+
+
+# name: (fixture page, [(step, browser actions or None for a vision only step)])
+SCENARIOS = {
+    "search": ("search.html", [
+        ("Type 'green frontier capital' into the search bar and submit", [_fill(1, "green frontier capital"), _click(2)]),
+        ("Read the title of the first result", None),
+    ]),
+    "article": ("results.html?q=green+frontier+capital", [
+        ("Click the link containing 'Result 1: Green Frontier Capital launches fund number 1'", [_click(3)]),
+        ("Read the headline of the article", None),
+        ("Read the byline of the article", None),
+    ]),
+    "spa": ("spa.html?api_ms=300", [
+        ("Click the link 'Details'", [_click(2)]),
+        ("Read the list of details", None),
+    ]),
+    "heavy_dom": ("heavy_dom.html", [
+        ("Type 'frontier' into the search bar", [_fill(1, "frontier")]),
+        ("Read the first result link", None),
+    ]),
+}
+
+# Multi field forms, most steps fill a field and stay on the page. Box
+# numbers on checkout.html after a company is typed are those of the
+# business fields revealed below the others
+FORM_SCENARIOS = {
+    "checkout": ("checkout.html", [
+        ("Type 'Ada Lovelace' into the full name field", [_fill(1, "Ada Lovelace")]),
+        ("Type 'ada@example.com' into the email field", [_fill(2, "ada@example.com")]),
+        ("Type '12 Analytical Way' into the street address field", [_fill(4, "12 Analytical Way")]),
+        ("Type 'London' into the city field", [_fill(5, "London")]),
+        ("Click the button 'Continue to payment'", [_click(7)]),
+        ("Type '4242 4242 4242 4242' into the card number field", [_fill(1, "4242 4242 4242 4242")]),
+        ("Type '12/30' into the expiry field", [_fill(2, "12/30")]),
+        ("Type '123' into the CVC field", [_fill(3, "123")]),
+        ("Click the button 'Pay now'", [_click(4)]),
+        ("Read the title of the first result", None),
+    ]),
+    "business_checkout": ("checkout.html", [
+        ("Type 'Charles Babbage' into the full name field", [_fill(1, "Charles Babbage")]),
+        ("Type 'Analytical Engines Ltd' into the company field", [_fill(3, "Analytical Engines Ltd")]),
+        ("Type 'GB123456789' into the VAT number field", [_fill(8, "GB123456789")]),
+        ("Type 'PO-1842' into the purchase order number field", [_fill(9, "PO-1842")]),
+        ("Type '1 Difference Street' into the street address field", [_fill(4, "1 Difference Street")]),
+        ("Type 'London' into the city field", [_fill(5, "London")]),
+        ("Click the button 'Continue to payment'", [_click(7)]),
+    ]),
+}
+
+
+def query_for(scenario: str, query_id: str) -> str:
+    # Unique per job so the exact match plan cache never short-circuits it
+    return f"benchmark {scenario} scenario {query_id}"
+
+
+def scenario_plan(scenario: str, base_url: str, scenarios: dict = SCENARIOS) -> dict:
+    page, steps = scenarios[scenario]
+    url = f"{base_url}/{page}"
+    return {
+        "goto": url,
+        "action_plan": [f"Open {url}"] + [step for step, _ in steps],
+        "goal": f"Complete the {scenario} scenario",
+        "vision_only": [step for step, actions in steps if actions is None],
+    }
+
+
+def scenario_responder(base_url: str, scenarios: dict = SCENARIOS) -> ScriptedResponder:
+    """One responder for every scenario, plans are picked by the query in the prompt."""
+    plans = {f"benchmark {name} scenario": scenario_plan(name, base_url, scenarios) for name in scenarios}
+    page_actions = {step: actions for _, steps in scenarios.values() for step, actions in steps if actions is not None}
+    return ScriptedResponder(plan=next(iter(plans.values())), page_actions=page_actions, plans=plans)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(part["text"] for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+
+class ScriptedResponder:
+    """
+    Returns canned completions for the agents' prompts.
+
+    plan is returned for action plan prompts, or the first of plans whose
+    key appears in the prompt. page_actions maps a plan step to the browser
+    actions returned for it and extracted is the data returned for vision
+    only steps.
+    """
+    def __init__(self, plan: dict, page_actions: dict, extracted: str = "stub extracted data", plans: dict = None):
+        self.plan = plan
+        self.plans = plans or {}
+        self.page_actions = page_actions
+        self.extracted = extracted
+
+    def __call__(self, params: dict) -> str:
+        prompt = _prompt_text(params["messages"])
+        if "step by step action plan" in prompt:
+            plan = next((plan for marker, plan in self.plans.items() if marker in prompt), self.plan)
+            return json.dumps(plan)
+        for step, actions in self.page_actions.items():
+            if f"We need to perform this action: {step}" in prompt:
+                if "without seeing the page" in prompt:
+                    # Text-only prompt over the element outline
+                    return json.dumps({"actions": actions, "confidence": 0.9})
+                return json.dumps(actions)
+        if "We need to perform these steps in order" in prompt:
+            # Fused page actions prompt, one numbered line per step
+            steps = re.findall(r"^\d+\. (.+)$", prompt, flags=re.MULTILINE)
+            return json.dumps({"steps": [self.page_actions.get(step, []) for step in steps]})
+        extracted = {"box_click": None, "input_text": None, "extracted_data": self.extracted}
+        if "We need to perform each of these actions on it:" in prompt:
+            # Batched vision only prompt, one numbered line per action
+            batch = len(re.findall(r"^\d+\. ", prompt, flags=re.MULTILINE))
+            return json.dumps({"results": [extracted] * batch})
+        return json.dumps(extracted)
+
+
+def _response(content: str) -> SimpleNamespace:
+    message = SimpleNamespace(role="assistant", content=content)
+    usage = SimpleNamespace(prompt_tokens=0, completion_tokens=len(content) // 4, total_tokens=len(content) // 4)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")], usage=usage)
+
+
+# Characters per streamed chunk, roughly a token
+CHUNK_CHARS = 4
+
+
+def _chunks(content: str) -> list:
+    return [content[idx:idx + CHUNK_CHARS] for idx in range(0, len(content), CHUNK_CHARS)]
+
+
+def _chunk(content: str) -> SimpleNamespace:
+    delta = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+
+
+class _StubStream:
+    """
+    Streamed completion. Chunk i is due latency_s + i * token_latency_s after
+    the request, like a server that keeps generating while the client is busy.
+    """
+    def __init__(self, content: str, started: float, latency_s: float, token_latency_s: float):
+        self._due = [(started + latency_s + idx * token_latency_s, piece) for idx, piece in enumerate(_chunks(content))]
+        self.closed = False
+
+    def __iter__(self):
+        for due, piece in self._due:
+            if self.closed:
+                return
+            time.sleep(max(0.0, due - time.perf_counter()))
+            yield _chunk(piece)
+
+    def close(self):
+        self.closed = True
+
+
+class _AsyncStubStream(_StubStream):
+    async def __aiter__(self):
+        for due, piece in self._due:
+            if self.closed:
+                return
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            yield _chunk(piece)
+
+    async def close(self):
+        self.closed = True
+
+
+class _StubCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, stream: bool = False, **params):
+        self._owner._record()
+        content = self._owner.responder(params)
+        if stream:
+            return _StubStream(content, time.perf_counter(), self._owner.latency_s, self._owner.token_latency_s)
+        time.sleep(self._owner.latency_s + len(_chunks(content)) * self._owner.token_latency_s)
+        return _response(content)
+
+
+class _AsyncStubCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def create(self, stream: bool = False, **params):
+        self._owner._record()
+        content = self._owner.responder(params)
+        if stream:
+            return _AsyncStubStream(content, time.perf_counter(), self._owner.latency_s, self._owner.token_latency_s)
+        await asyncio.sleep(self._owner.latency_s + len(_chunks(content)) * self._owner.token_latency_s)
+        return _response(content)
+
+
+class StubOpenAI:
+    """
+    Drop-in for AzureOpenAI exposing chat.completions.create with a fixed
+    latency to the first token plus token_latency_s per generated chunk.
+    """
+    def __init__(self, responder, latency_s: float = 0.0, token_latency_s: float = 0.0):
+        self.responder = responder
+        self.latency_s = latency_s
+        self.token_latency_s = token_latency_s
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_StubCompletions(self))
+
+    def _record(self):
+        with self._lock:
+            self.calls += 1
+
+
+class AsyncStubOpenAI(StubOpenAI):
+    """Drop-in for AsyncAzureOpenAI."""
+    def __init__(self, responder, latency_s: float = 0.0, token_latency_s: float = 0.0):
+        super().__init__(responder, latency_s, token_latency_s)
+        self.chat = SimpleNamespace(completions=_AsyncStubCompletions(self))
@@ -1,15 +1,233 @@
 from dotenv import load_dotenv
-from lib.logging import log
-import openai
 import os
+import socket
 
 # Load variables from .env file
 load_dotenv()
 
 LOG_FILE = "chat_history.log"
+
+# Structured log sink. Records go through a bounded queue of LOG_QUEUE_SIZE,
+# on overflow "drop_oldest", "drop_newest" or "block" (for up to
+# LOG_BLOCK_TIMEOUT_S), and a background thread writes them in batches of up
+# to LOG_BATCH_SIZE or every LOG_FLUSH_INTERVAL_S. The file is named by the
+# strftime LOG_FILE_PATTERN (daily by default) and rolls over past
+# LOG_MAX_BYTES, LOG_BACKUP_COUNT old files are kept. Base64 payloads are
+# redacted and strings cut at LOG_MAX_FIELD_CHARS. LOG_SAMPLE_RATES keeps a
+# fraction of a level's records ("debug=0.1,info=0.5")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+LOG_FILE_PATTERN = os.getenv("LOG_FILE_PATTERN", "logs/app_%Y%m%d.log")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop_oldest")
+LOG_BLOCK_TIMEOUT_S = float(os.getenv("LOG_BLOCK_TIMEOUT_S", "0.05"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL_S = float(os.getenv("LOG_FLUSH_INTERVAL_S", "0.5"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "10"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+LOG_SAMPLE_RATES = {
+    level.strip().lower(): float(rate)
+    for level, _, rate in (item.partition("=") for item in os.getenv("LOG_SAMPLE_RATES", "").split(",") if item)
+}
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "false").lower() == "true"
 BROWSER_ACTION_CACHE_FILE_PATH="./cache/browser_actions_cache.json"
 ACTION_PLAN_CACHE_FILE_PATH="./cache/action_plan_cache.json"
 
+# Agent caches, an in-process LRU in front of a durable backend
+# (sqlite, jsonl or memory). The JSON files above are imported on first use.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_LOCATIONS = {
+    "sqlite": os.getenv("CACHE_SQLITE_PATH", "./cache/agent_cache.db"),
+    "jsonl": os.getenv("CACHE_JSONL_PATH", "./cache/agent_cache.jsonl"),
+    "memory": None,
+}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL_S = float(os.getenv("CACHE_TTL_S")) if os.getenv("CACHE_TTL_S") else None
+
+# Semantic action plan cache, queries within SEMANTIC_PLAN_CACHE_THRESHOLD
+# cosine similarity of a cached one (or matching its template) reuse its plan
+SEMANTIC_PLAN_CACHE_ENABLED = os.getenv("SEMANTIC_PLAN_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_PLAN_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_PLAN_CACHE_THRESHOLD", "0.8"))
+SEMANTIC_PLAN_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_PLAN_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_PLAN_CACHE_EMBEDDER = os.getenv("SEMANTIC_PLAN_CACHE_EMBEDDER", "hashing")
+
+# Record and replay, steps of a workflow that succeeded before are replayed
+# on the elements matching their recorded fingerprints without a screenshot
+# or LLM call. A match needs REPLAY_MIN_SCORE and a REPLAY_MIN_MARGIN lead
+# over the next best element, otherwise the step goes to the vision agent
+REPLAY_ENABLED = os.getenv("REPLAY_ENABLED", "true").lower() == "true"
+REPLAY_MIN_SCORE = float(os.getenv("REPLAY_MIN_SCORE", "5"))
+REPLAY_MIN_MARGIN = float(os.getenv("REPLAY_MIN_MARGIN", "1"))
+
+# Tiered resolution of browser steps, the fast tiers (a deterministic match
+# over the annotated elements and a text-only LLM prompt over their outline)
+# are tried before the screenshot + vision LLM, each above its min confidence.
+# Time saved is measured against a running average of the vision tier
+ACTION_RESOLVER_TIERS = [tier for tier in os.getenv("ACTION_RESOLVER_TIERS", "deterministic,text").split(",") if tier]
+ACTION_RESOLVER_MIN_CONFIDENCE = float(os.getenv("ACTION_RESOLVER_MIN_CONFIDENCE", "0.8"))
+ACTION_RESOLVER_TEXT_MIN_CONFIDENCE = float(os.getenv("ACTION_RESOLVER_TEXT_MIN_CONFIDENCE", "0.7"))
+ACTION_RESOLVER_VISION_BASELINE_MS = float(os.getenv("ACTION_RESOLVER_VISION_BASELINE_MS", "3000"))
+
+# Stream the vision tier's completion and execute each browser action as soon
+# as it is complete, instead of waiting for the whole list
+STREAM_PAGE_ACTIONS = os.getenv("STREAM_PAGE_ACTIONS", "true").lower() == "true"
+
+# Step fusion, consecutive browser steps that stay on the same page (filling
+# form fields) are planned together with the step after them, up to
+# STEP_FUSION_MAX_STEPS, from one screenshot and one vision request. The rest
+# of a fused group is planned again after a navigation or when more than
+# STEP_FUSION_MAX_DOM_CHANGE of the annotated elements changed
+STEP_FUSION_ENABLED = os.getenv("STEP_FUSION_ENABLED", "true").lower() == "true"
+STEP_FUSION_MAX_STEPS = int(os.getenv("STEP_FUSION_MAX_STEPS", "4"))
+STEP_FUSION_MAX_DOM_CHANGE = float(os.getenv("STEP_FUSION_MAX_DOM_CHANGE", "0.2"))
+
+# Vision only extraction steps, their LLM calls run next to the following
+# browser steps (at most VISION_EXTRACTION_CONCURRENCY at once in threaded
+# mode) and results are merged in plan order. Up to
+# VISION_EXTRACTION_BATCH_SIZE consecutive ones share one screenshot and request
+VISION_EXTRACTION_PARALLEL = os.getenv("VISION_EXTRACTION_PARALLEL", "true").lower() == "true"
+VISION_EXTRACTION_CONCURRENCY = int(os.getenv("VISION_EXTRACTION_CONCURRENCY", "4"))
+VISION_EXTRACTION_BATCH_SIZE = int(os.getenv("VISION_EXTRACTION_BATCH_SIZE", "4"))
+
+# Browser action cache matching, max differing bits out of the 256 bit
+# screenshot hash for a near duplicate hit, and variants kept per page
+SCREENSHOT_MATCH_MAX_DISTANCE = int(os.getenv("SCREENSHOT_MATCH_MAX_DISTANCE", "12"))
+SCREENSHOT_CACHE_VARIANTS = int(os.getenv("SCREENSHOT_CACHE_VARIANTS", "8"))
+
+# Screenshots sent to the vision LLM and the UI, encoded once in memory.
+# Format is png, jpeg or webp, frames larger than the max size are
+# downscaled, disk copies in SCREENSHOT_DIR are optional
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "jpeg")
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+SCREENSHOT_MAX_WIDTH = int(os.getenv("SCREENSHOT_MAX_WIDTH", "1280"))
+SCREENSHOT_MAX_HEIGHT = int(os.getenv("SCREENSHOT_MAX_HEIGHT", "1280"))
+SCREENSHOT_PERSIST = os.getenv("SCREENSHOT_PERSIST", "true").lower() == "true"
+SCREENSHOT_DIR = os.getenv("SCREENSHOT_DIR", "./screenshots")
+
+# Page settle detection after each step's browser actions, the wait ends
+# once network, DOM, navigation and screenshots have been quiet for
+# PAGE_SETTLE_QUIET_MS, or at PAGE_SETTLE_TIMEOUT_S at the latest
+PAGE_SETTLE_TIMEOUT_S = float(os.getenv("PAGE_SETTLE_TIMEOUT_S", "5"))
+PAGE_SETTLE_QUIET_MS = float(os.getenv("PAGE_SETTLE_QUIET_MS", "300"))
+PAGE_SETTLE_VISUAL_MAX_DISTANCE = int(os.getenv("PAGE_SETTLE_VISUAL_MAX_DISTANCE", "0"))
+
+# Page annotation, the overlay layer stays on the page between steps and only
+# boxes of changed elements are redrawn, unchanged elements keep their box
+# number. Set to false to redraw and renumber every box on every step
+ANNOTATION_INCREMENTAL = os.getenv("ANNOTATION_INCREMENTAL", "true").lower() == "true"
+
+# Tracing, per query span timelines and the /metrics endpoint. Disabled
+# spans are a shared no-op object
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_RETENTION = int(os.getenv("TRACE_RETENTION", "200"))
+METRICS_SUMMARY_SAMPLES = int(os.getenv("METRICS_SUMMARY_SAMPLES", "1024"))
+
+# Event streams, one Redis stream per query holding the last
+# SSE_REPLAY_BUFFER_SIZE events for Last-Event-ID resumes. Progress messages
+# closer than SSE_PROGRESS_MIN_INTERVAL_MS apart are coalesced, screenshots
+# are served from /screenshots/<sha256> and kept for SSE_IMAGE_TTL_S
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+SSE_REPLAY_BUFFER_SIZE = int(os.getenv("SSE_REPLAY_BUFFER_SIZE", "200"))
+SSE_STREAM_TTL_S = int(os.getenv("SSE_STREAM_TTL_S", "3600"))
+SSE_PROGRESS_MIN_INTERVAL_MS = float(os.getenv("SSE_PROGRESS_MIN_INTERVAL_MS", "250"))
+SSE_IMAGE_TTL_S = int(os.getenv("SSE_IMAGE_TTL_S", "3600"))
+SSE_KEEPALIVE_S = float(os.getenv("SSE_KEEPALIVE_S", "15"))
+
+# Browser pool
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_POOL_MAX_CONTEXTS_PER_BROWSER = int(os.getenv("BROWSER_POOL_MAX_CONTEXTS_PER_BROWSER", "4"))
+BROWSER_POOL_MAX_JOBS_PER_BROWSER = int(os.getenv("BROWSER_POOL_MAX_JOBS_PER_BROWSER", "50"))
+BROWSER_POOL_LEASE_TIMEOUT = float(os.getenv("BROWSER_POOL_LEASE_TIMEOUT", "120"))
+BROWSER_POOL_HEADLESS = os.getenv("BROWSER_POOL_HEADLESS", "false").lower() == "true"
+BROWSER_POOL_CHANNEL = os.getenv("BROWSER_POOL_CHANNEL", "chrome")
+BROWSER_EXECUTABLE_PATH = os.getenv("BROWSER_EXECUTABLE_PATH")
+# "low-memory" launches headless with GPU, extensions and per site
+# processes off and a smaller JS heap, "default" launches Chrome as is
+BROWSER_LAUNCH_PRESET = os.getenv("BROWSER_LAUNCH_PRESET", "default")
+
+# Page load profiles applied to each job's browser context. "full" loads
+# everything, "no-media" blocks images, media, fonts and the ad and tracker
+# domains in LOAD_PROFILE_BLOCKED_DOMAINS, "text-first" also blocks cross
+# site iframes and uses a smaller viewport. A query can ask for a profile,
+# otherwise LOAD_PROFILE_DOMAINS picks one by the domain the plan starts on
+# ("example.com=text-first,shop.com=no-media") and LOAD_PROFILE_DEFAULT applies
+LOAD_PROFILE_DEFAULT = os.getenv("LOAD_PROFILE_DEFAULT", "full")
+LOAD_PROFILE_DOMAINS = {
+    domain.strip().lower(): profile.strip()
+    for domain, _, profile in (item.partition("=") for item in os.getenv("LOAD_PROFILE_DOMAINS", "").split(",") if item)
+}
+LOAD_PROFILE_BLOCKED_DOMAINS = [domain.strip().lower() for domain in os.getenv("LOAD_PROFILE_BLOCKED_DOMAINS", ",".join([
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "google-analytics.com", "googletagmanager.com",
+    "adservice.google.com", "amazon-adsystem.com", "facebook.net", "scorecardresearch.com", "hotjar.com",
+    "criteo.com", "taboola.com", "outbrain.com", "adnxs.com", "quantserve.com",
+])).split(",") if domain.strip()]
+
+# Job scheduler
+JOB_QUEUE_DB_PATH = os.getenv("JOB_QUEUE_DB_PATH", "./jobs/job_queue.db")
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+JOB_DEFAULT_TIMEOUT = float(os.getenv("JOB_DEFAULT_TIMEOUT", "600"))
+
+# Job distribution, "sqlite" runs jobs in the app process, "redis" only
+# enqueues them on Redis streams for `python worker.py` processes on any
+# host. Workers heartbeat every JOB_HEARTBEAT_S, a job whose worker stops
+# heartbeating for JOB_VISIBILITY_TIMEOUT_S is redelivered, at most
+# JOB_MAX_DELIVERIES times. On SIGTERM a worker takes no new jobs and waits
+# up to JOB_DRAIN_TIMEOUT_S for its running ones before requeueing them
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqlite")
+JOB_WORKER_ID = os.getenv("JOB_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", "5"))
+JOB_VISIBILITY_TIMEOUT_S = float(os.getenv("JOB_VISIBILITY_TIMEOUT_S", "30"))
+JOB_MAX_DELIVERIES = int(os.getenv("JOB_MAX_DELIVERIES", "3"))
+JOB_DRAIN_TIMEOUT_S = float(os.getenv("JOB_DRAIN_TIMEOUT_S", "120"))
+
+# Job records and step results, finished jobs are purged JOB_RETENTION_DAYS
+# after completion, checked every JOB_PURGE_INTERVAL_S
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "./jobs/jobs.db")
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+JOB_PURGE_INTERVAL_S = float(os.getenv("JOB_PURGE_INTERVAL_S", "3600"))
+JOBS_PAGE_MAX_LIMIT = int(os.getenv("JOBS_PAGE_MAX_LIMIT", "200"))
+
+# Job checkpoints, the plan and page URL saved before every step. A job
+# whose step failed resumes from that step's checkpoint up to
+# CHECKPOINT_MAX_RESUMES times, a job picked up again after a worker restart
+# resumes the same way. Once all steps ran, the results the goal depends on
+# are checked and the plan is retried from the first step without one, up to
+# GOAL_VALIDATION_RETRIES times. CHECKPOINT_STORAGE_STATE also saves the
+# context's cookies and local storage, unencrypted in the job database until
+# the job finishes, so a resumed job stays logged in
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+CHECKPOINT_MAX_RESUMES = int(os.getenv("CHECKPOINT_MAX_RESUMES", "2"))
+CHECKPOINT_STORAGE_STATE = os.getenv("CHECKPOINT_STORAGE_STATE", "false").lower() == "true"
+GOAL_VALIDATION_RETRIES = int(os.getenv("GOAL_VALIDATION_RETRIES", "1"))
+
+# Execution mode, "threaded" runs one job per worker thread with the sync
+# Playwright API, "asyncio" drives every job from a single event loop
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "threaded")
+ASYNC_MAX_CONCURRENT_JOBS = int(os.getenv("ASYNC_MAX_CONCURRENT_JOBS", "16"))
+
+# LLM gateway in front of the Azure OpenAI clients. At most
+# LLM_MAX_CONCURRENCY calls are in flight, LLM_MODEL_CONCURRENCY caps single
+# models ("GPT4o-mini=8,..."), and a token bucket allows LLM_RATE_LIMIT_RPM
+# requests and LLM_RATE_LIMIT_TPM tokens per minute (0 disables). Failed
+# calls are retried with jittered exponential backoff, honouring Retry-After,
+# and identical in-flight requests share one call
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "32"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "16"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MODEL_CONCURRENCY = {
+    model.strip(): int(limit)
+    for model, _, limit in (item.partition("=") for item in os.getenv("LLM_MODEL_CONCURRENCY", "").split(",") if item)
+}
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "300"))
+LLM_RATE_LIMIT_TPM = float(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_S = float(os.getenv("LLM_RETRY_BASE_S", "0.5"))
+LLM_RETRY_MAX_S = float(os.getenv("LLM_RETRY_MAX_S", "20"))
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() == "true"
+
 # Access your keys
 config = {
     "openai_api_key": os.getenv("OPENAI_AZURE_API_KEY"),
@@ -18,9 +236,49 @@ config = {
     "openai_azure_endpoint": os.getenv("OPENAI_AZURE_ENDPOINT"),
 }
 
-openai = openai.AzureOpenAI(
-  api_key = config["openai_api_key"],
-  api_version = config["openai_api_version"],
-  azure_endpoint = config["openai_azure_endpoint"],
-  azure_deployment= config["openai_azure_deployment"]
-)
+# Warm up before taking jobs: import the query processor, launch the pool's
+# browsers and open the LLM connections. The API serves requests meanwhile,
+# its local workers start once it is done
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() == "true"
+
+
+# The OpenAI SDK takes most of a cold start to import, so the clients are
+# built by the LLM gateway on first use. Keep-alive connection pools sized
+# for the gateway's concurrency, retries are done by the gateway so the
+# SDK's own are off
+def _llm_pool() -> tuple:
+    try:
+        import httpx
+    except ImportError:
+        # Newer openai releases are built on the httpx2 fork
+        import httpx2 as httpx
+    limits = httpx.Limits(max_connections=LLM_POOL_MAX_CONNECTIONS, max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE)
+    return limits, httpx.Timeout(LLM_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S)
+
+
+def llm_client():
+    import openai
+    llm_limits, llm_timeout = _llm_pool()
+    return openai.AzureOpenAI(
+      api_key = config["openai_api_key"],
+      api_version = config["openai_api_version"],
+      azure_endpoint = config["openai_azure_endpoint"],
+      azure_deployment= config["openai_azure_deployment"],
+      max_retries = 0,
+      timeout = llm_timeout,
+      http_client = openai.DefaultHttpxClient(limits=llm_limits, timeout=llm_timeout)
+    )
+
+
+def async_llm_client():
+    import openai
+    llm_limits, llm_timeout = _llm_pool()
+    return openai.AsyncAzureOpenAI(
+      api_key = config["openai_api_key"],
+      api_version = config["openai_api_version"],
+      azure_endpoint = config["openai_azure_endpoint"],
+      azure_deployment= config["openai_azure_deployment"],
+      max_retries = 0,
+      timeout = llm_timeout,
+      http_client = openai.DefaultAsyncHttpxClient(limits=llm_limits, timeout=llm_timeout)
+    )
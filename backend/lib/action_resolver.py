@@ -0,0 +1,218 @@
+import re
+import threading
+from collections import namedtuple
+from lib.tracing import tracer
+from config import ACTION_RESOLVER_TIERS, ACTION_RESOLVER_MIN_CONFIDENCE, ACTION_RESOLVER_TEXT_MIN_CONFIDENCE
+from config import ACTION_RESOLVER_VISION_BASELINE_MS
+
+
+QUOTED_RE = re.compile(r"['\"“‘]([^'\"”’]+)['\"”’]")
+TYPE_RE = re.compile(r"\b(type|enter|fill|input|write)\b", re.IGNORECASE)
+CLICK_RE = re.compile(r"\b(click|tap|press|open|select|follow)\b", re.IGNORECASE)
+SUBMIT_RE = re.compile(r"\b(press(es)? enter|hit enter|submit|and search)\b", re.IGNORECASE)
+FIELD_RE = re.compile(r"\b(?:into|in)\s+(?:the\s+)?(.+?)\s*(?:bar|box|field|input|textarea)\b", re.IGNORECASE)
+TARGET_RE = re.compile(r"\b(?:link|button)\s+(?:containing|labelled|labeled|named|titled|that says|with(?: the)? text)\s+(.+?)\.?$", re.IGNORECASE)
+ORDINAL_RE = re.compile(r"\b(first|second|third|last|next|previous|\d+(?:st|nd|rd|th))\b", re.IGNORECASE)
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {"the", "a", "an", "of", "on", "to", "page", "google", "website", "site", "top", "main"}
+NOT_FILLABLE = {"submit", "button", "checkbox", "radio", "hidden", "image", "reset", "file"}
+SUBMIT_WORDS = {"search", "go", "submit", "find"}
+
+Match = namedtuple("Match", ["actions", "confidence", "reason"])
+
+NO_MATCH = Match(None, 0.0, "unparsed")
+
+
+def _words(text: str) -> set:
+    return set(WORD_RE.findall((text or "").lower())) - STOPWORDS
+
+
+def _box_words(box: dict) -> set:
+    return _words(" ".join(str(box.get(field) or "") for field in ("label", "name", "id", "role", "type")))
+
+
+def _fillable(box: dict) -> bool:
+    return box["tag"] == "textarea" or (box["tag"] == "input" and (box.get("type") or "text") not in NOT_FILLABLE)
+
+
+def _clickable(box: dict) -> bool:
+    return box["tag"] in ("a", "button") or (box["tag"] == "input" and box.get("type") in ("submit", "button"))
+
+
+def _action(box: dict, input_text: str = None) -> dict:
+    return {"box_click": box["box_number"], "input_text": input_text, "extracted_data": None}
+
+
+def _best(scored: list) -> tuple:
+    """Best (score, box) and the runner-up's score."""
+    scored = sorted(scored, key=lambda pair: pair[0], reverse=True)
+    return scored[0], (scored[1][0] if len(scored) > 1 else 0.0)
+
+
+def match_fill(boxes: list, step: str) -> Match:
+    quoted = QUOTED_RE.findall(step)
+    if not quoted:
+        return Match(None, 0.0, "no text to type")
+    candidates = [box for box in boxes if _fillable(box)]
+    if not candidates:
+        return Match(None, 0.0, "no input")
+
+    field = FIELD_RE.search(QUOTED_RE.sub(" ", step))
+    wanted = _words(field.group(1)) if field else set()
+    scored = [(len(wanted & _box_words(box)) / len(wanted) if wanted else 0.0, box) for box in candidates]
+    (score, box), runner_up = _best(scored)
+    if len(candidates) == 1:
+        confidence = 1.0 if score > 0 or not wanted else 0.8
+    elif score > 0 and score > runner_up:
+        confidence = min(1.0, 0.6 + 0.4 * score)
+    else:
+        return Match(None, 0.0, "ambiguous input")
+    actions = [_action(box, quoted[0])]
+
+    if SUBMIT_RE.search(step):
+        # Only clicks and fills are executed, so submitting needs a button
+        buttons = [(len((_box_words(button) | _words(button.get("text"))) & (SUBMIT_WORDS | wanted)) + (button.get("type") == "submit"), button)
+                   for button in boxes if _clickable(button) and button["tag"] != "a"]
+        if not buttons:
+            return Match(None, 0.0, "no submit button")
+        (button_score, button), runner_up = _best(buttons)
+        if button_score == 0 or button_score == runner_up:
+            return Match(None, 0.0, "ambiguous submit button")
+        actions.append(_action(button))
+    return Match(actions, confidence, "fill")
+
+
+def match_click(boxes: list, step: str) -> Match:
+    quoted = QUOTED_RE.findall(step)
+    target = quoted[0] if quoted else None
+    if target is None:
+        explicit = TARGET_RE.search(step)
+        if explicit is None or ORDINAL_RE.search(step):
+            # "the first article" and the like need to see the page
+            return Match(None, 0.0, "no explicit target")
+        target = explicit.group(1)
+    target = target.strip().lower()
+
+    lowered = step.lower()
+    scored = []
+    for box in boxes:
+        if not _clickable(box):
+            continue
+        texts = [(box.get("label") or "").lower(), (box.get("text") or "").lower()]
+        if target in texts:
+            score = 1.0
+        elif any(target in text for text in texts if text):
+            score = 0.7
+        else:
+            continue
+        # Small bonus when the element kind matches the wording
+        if ("link" in lowered and box["tag"] == "a") or ("button" in lowered and box["tag"] != "a"):
+            score += 0.1
+        scored.append((score, box))
+    if not scored:
+        return Match(None, 0.0, "no element with that text")
+    (score, box), runner_up = _best(scored)
+    if score - runner_up < 0.2:
+        return Match(None, 0.0, "ambiguous element")
+    return Match([_action(box)], min(score, 1.0), "click")
+
+
+def match_step(boxes: list, step: str) -> Match:
+    """
+    Deterministic resolution of simple steps over the annotated boxes,
+    typing quoted text into a field or clicking an element by its text.
+    """
+    if TYPE_RE.search(step):
+        return match_fill(boxes, step)
+    if CLICK_RE.search(step):
+        return match_click(boxes, step)
+    return NO_MATCH
+
+
+def element_outline(boxes: list) -> str:
+    """One line per annotated box, what the text tier sees instead of the screenshot."""
+    lines = []
+    for box in boxes:
+        kind = box["tag"] + (f"[{box['type']}]" if box.get("type") and box["tag"] in ("input", "button") else "")
+        line = f"[{box['box_number']}] {kind} \"{box.get('label') or ''}\""
+        for field in ("role", "name", "id"):
+            if box.get(field):
+                line += f" {field}={box[field]}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class ActionResolver:
+    """
+    Tiered resolution of browser steps.
+
+    A deterministic matcher over the annotated elements is tried first,
+    then a text-only LLM prompt over their outline, and the screenshot +
+    vision LLM only runs when neither is confident. Every step records the
+    tier that resolved it and the time saved against a running average of
+    the vision tier. Steps planned together with others from one vision
+    request (lib/step_fusion.py) are the "fused" tier.
+    """
+    TIERS = ("deterministic", "fused", "text", "vision")
+
+    def __init__(self, tiers: list, min_confidence: float = 0.8, text_min_confidence: float = 0.7, vision_baseline_ms: float = 3000):
+        self.tiers = set(tiers) | {"vision"}
+        self.min_confidence = min_confidence
+        self.text_min_confidence = text_min_confidence
+        self._vision_ms = vision_baseline_ms
+        self._steps = {tier: 0 for tier in self.TIERS}
+        self._elapsed_ms = {tier: 0.0 for tier in self.TIERS}
+        self._saved_ms = 0.0
+        self._lock = threading.Lock()
+
+    def enabled(self, tier: str) -> bool:
+        return tier in self.tiers
+
+    def match(self, boxes: list, step: str) -> list:
+        """Actions of the deterministic tier, None when it isn't confident."""
+        if not self.enabled("deterministic"):
+            return None
+        match = match_step(boxes, step)
+        return match.actions if match.actions and match.confidence >= self.min_confidence else None
+
+    def accept_text(self, result: dict, boxes: list) -> list:
+        """Actions of the text tier, None unless confident and every box exists."""
+        if not isinstance(result, dict) or not isinstance(result.get("actions"), list) or not result["actions"]:
+            return None
+        if (result.get("confidence") or 0) < self.text_min_confidence:
+            return None
+        numbers = {box["box_number"] for box in boxes}
+        if any(action.get("box_click") not in numbers for action in result["actions"]):
+            return None
+        return result["actions"]
+
+    def record(self, tier: str, elapsed_ms: float) -> float:
+        """Records a resolved step, returns the ms saved compared with the vision tier."""
+        tracer.count("action_resolver_steps_total", tier=tier)
+        with self._lock:
+            self._steps[tier] += 1
+            self._elapsed_ms[tier] += elapsed_ms
+            if tier == "vision":
+                self._vision_ms = 0.8 * self._vision_ms + 0.2 * elapsed_ms
+                return 0.0
+            saved = max(0.0, self._vision_ms - elapsed_ms)
+            self._saved_ms += saved
+        return round(saved, 2)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "steps": dict(self._steps),
+                "avg_ms": {tier: round(self._elapsed_ms[tier] / count, 2) for tier, count in self._steps.items() if count},
+                "vision_avg_ms": round(self._vision_ms, 2),
+                "saved_ms_total": round(self._saved_ms, 2),
+            }
+
+
+action_resolver = ActionResolver(
+    ACTION_RESOLVER_TIERS,
+    min_confidence=ACTION_RESOLVER_MIN_CONFIDENCE,
+    text_min_confidence=ACTION_RESOLVER_TEXT_MIN_CONFIDENCE,
+    vision_baseline_ms=ACTION_RESOLVER_VISION_BASELINE_MS,
+)
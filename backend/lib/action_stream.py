@@ -0,0 +1,119 @@
+import json
+import time
+
+# Fields of the browser action schema
+ACTION_KEYS = {"box_click", "input_text", "extracted_data"}
+
+
+def normalize_actions(data) -> list:
+    """Browser actions as a list, whether the model returned a list, one action or {"<key>": [actions]}."""
+    if isinstance(data, list):
+        return [action for action in data if isinstance(action, dict)]
+    if isinstance(data, dict):
+        if ACTION_KEYS & data.keys():
+            return [data]
+        for value in data.values():
+            if isinstance(value, list):
+                return normalize_actions(value)
+    return []
+
+
+class ActionStreamParser:
+    """
+    Incremental parser for a streamed browser actions completion.
+
+    feed() takes the text as it arrives and returns the action objects it
+    completed, whatever they are wrapped in. text is the completion so far,
+    emitted the number of actions returned.
+    """
+    def __init__(self):
+        self.text = ""
+        self.emitted = 0
+        self._pos = 0
+        self._starts = []
+        self._in_string = False
+        self._escaped = False
+
+    def _action(self, text: str) -> dict:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        return data if ACTION_KEYS & data.keys() else None
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        actions = []
+        for pos in range(self._pos, len(self.text)):
+            char = self.text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._starts.append(pos)
+            elif char == "}" and self._starts:
+                action = self._action(self.text[self._starts.pop():pos + 1])
+                if action is not None:
+                    actions.append(action)
+        self._pos = len(self.text)
+        self.emitted += len(actions)
+        return actions
+
+
+class StreamedActions:
+    """
+    Browser actions of a resolved step, iterated by the executor as they
+    arrive. Keeps the actions seen so far and the time to the first one and
+    to the last, both without the time spent executing them in between.
+    """
+    def __init__(self, source, tier: str, started: float):
+        self.source = source
+        self.tier = tier
+        self.started = started
+        self.actions = []
+        self.first_action_ms = None
+        self.resolve_ms = None
+        self._executing_s = 0.0
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started - self._executing_s) * 1000, 2)
+
+    def _received(self, action: dict):
+        if self.first_action_ms is None:
+            self.first_action_ms = self._elapsed_ms()
+        self.actions.append(action)
+
+    def __iter__(self):
+        try:
+            for action in self.source:
+                self._received(action)
+                paused = time.perf_counter()
+                yield action
+                self._executing_s += time.perf_counter() - paused
+            self.resolve_ms = self._elapsed_ms()
+        finally:
+            # Closes the completion stream when execution fails part way
+            close = getattr(self.source, "close", None)
+            if close is not None:
+                close()
+
+    async def __aiter__(self):
+        if not hasattr(self.source, "__aiter__"):
+            for action in self.__iter__():
+                yield action
+            return
+        try:
+            async for action in self.source:
+                self._received(action)
+                paused = time.perf_counter()
+                yield action
+                self._executing_s += time.perf_counter() - paused
+            self.resolve_ms = self._elapsed_ms()
+        finally:
+            await self.source.aclose()
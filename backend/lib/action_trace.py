@@ -0,0 +1,172 @@
+import hashlib
+import json
+import time
+from lib.cache import Cache, create_cache
+from config import CACHE_BACKEND, CACHE_LOCATIONS, CACHE_MAX_ENTRIES, CACHE_TTL_S
+from config import REPLAY_ENABLED, REPLAY_MIN_SCORE, REPLAY_MIN_MARGIN
+
+
+# Box fields that identify an element across page loads, box numbers and
+# absolute coordinates change between runs so they are left out
+FINGERPRINT_FIELDS = ("tag", "type", "role", "label", "text", "id", "name", "rx", "ry")
+
+# Finds the element matching each recorded fingerprint in one round-trip.
+# Candidates are scored on tag, id, name, role, accessible label, text and
+# position relative to the viewport. A target resolves only if the best
+# candidate reaches min_score and beats the runner-up by min_margin, the
+# winner's data-cd-replay attribute lists the target indexes it matched.
+RESOLVE_ELEMENTS_JS = """
+({ selector, targets, minScore, minMargin }) => {
+    document.querySelectorAll('[data-cd-replay]').forEach(el => el.removeAttribute('data-cd-replay'));
+    const viewportWidth = window.innerWidth;
+    const viewportHeight = window.innerHeight;
+    const candidates = [];
+    for (const el of document.querySelectorAll(selector)) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) continue;
+        const style = window.getComputedStyle(el);
+        if (style.display === 'none' || style.visibility === 'hidden' || parseFloat(style.opacity) === 0) continue;
+        candidates.push([el, {
+            tag: el.tagName.toLowerCase(),
+            type: el.type || null,
+            role: el.getAttribute('role'),
+            label: (el.getAttribute('aria-label') || el.placeholder || el.innerText || el.title || el.name || '').trim().slice(0, 80),
+            text: (el.innerText || el.value || '').trim().slice(0, 80),
+            id: el.id || null,
+            name: el.getAttribute('name'),
+            rx: (rect.x + rect.width / 2) / viewportWidth,
+            ry: (rect.y + rect.height / 2) / viewportHeight,
+        }]);
+    }
+
+    const score = (target, found) => {
+        let total = 0;
+        if (target.id && found.id === target.id) total += 4;
+        if (target.name && found.name === target.name) total += 3;
+        if (target.label && found.label) {
+            if (found.label === target.label) total += 4;
+            else if (found.label.includes(target.label) || target.label.includes(found.label)) total += 2;
+        }
+        if (target.text && found.text === target.text) total += 2;
+        if (target.role && found.role === target.role) total += 1;
+        if (target.type && found.type === target.type) total += 1;
+        // Up to 2 points for sitting where it used to, nothing beyond half a viewport away
+        const distance = Math.hypot(found.rx - target.rx, found.ry - target.ry);
+        total += Math.max(0, 2 - distance * 4);
+        return total;
+    };
+
+    return targets.map((target, idx) => {
+        let best = null, bestScore = -1, runnerUp = -1;
+        for (const [el, found] of candidates) {
+            if (found.tag !== target.tag) continue;
+            const value = score(target, found);
+            if (value > bestScore) {
+                runnerUp = bestScore;
+                bestScore = value;
+                best = el;
+            } else if (value > runnerUp) {
+                runnerUp = value;
+            }
+        }
+        if (best === null || bestScore < minScore || bestScore - runnerUp < minMargin) return null;
+        // Several actions of a step may target the same element
+        best.setAttribute('data-cd-replay', `${best.getAttribute('data-cd-replay') || ''} ${idx}`.trim());
+        return { score: Math.round(bestScore * 100) / 100 };
+    });
+}
+"""
+
+
+def element_fingerprint(box: dict) -> dict:
+    return {field: box.get(field) for field in FINGERPRINT_FIELDS}
+
+
+def workflow_key(plan: dict) -> str:
+    """Runs of the same plan are the same workflow, whatever query produced it."""
+    normalized = [plan.get("goto"), plan.get("action_plan"), plan.get("vision_only")]
+    return hashlib.sha1(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+
+class TraceRecorder:
+    """Collects the actions of one run, with the fingerprint of every element acted on."""
+    def __init__(self):
+        self.steps = {}
+
+    def record(self, step_idx: int, action: str, actions: list, boxes: list = None):
+        """
+        Records a step from the generated actions and the annotated boxes
+        they refer to. A step with an action whose box is unknown is kept
+        without targets, so it is never replayed.
+        """
+        by_number = {box["box_number"]: box for box in boxes or []}
+        recorded = []
+        for item in actions or []:
+            box = by_number.get(item.get("box_click"))
+            if box is None:
+                self.steps[str(step_idx)] = {"action": action, "actions": None}
+                return
+            recorded.append({"input_text": item.get("input_text"), "target": element_fingerprint(box)})
+        self.steps[str(step_idx)] = {"action": action, "actions": recorded}
+
+    def record_replayed(self, step_idx: int, step: dict):
+        self.steps[str(step_idx)] = step
+
+
+class ActionTraceStore:
+    """
+    Recorded action traces of successful runs, one per workflow.
+
+    A later run of the same workflow replays a step's recorded actions on
+    the elements matching their fingerprints, and only asks the vision
+    agent when one of them no longer resolves.
+    """
+    def __init__(self, cache: Cache, min_score: float = 5, min_margin: float = 1):
+        self.cache = cache
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+    def lookup(self, plan: dict) -> dict:
+        trace = self.cache.get(workflow_key(plan))
+        return trace["steps"] if trace else None
+
+    def save(self, plan: dict, recorder: TraceRecorder):
+        self.cache.set(workflow_key(plan), {"steps": recorder.steps, "recorded_at": time.time()})
+
+    @staticmethod
+    def replayable(steps: dict, step_idx: int, action: str) -> dict:
+        step = (steps or {}).get(str(step_idx))
+        if step is None or step["action"] != action or not step["actions"]:
+            return None
+        return step
+
+    def resolve_args(self, step: dict, selector: str) -> dict:
+        return {
+            "selector": selector,
+            "targets": [item["target"] for item in step["actions"]],
+            "minScore": self.min_score,
+            "minMargin": self.min_margin,
+        }
+
+    @staticmethod
+    def resolved_actions(step: dict, results: list) -> list:
+        """(selector, action) pairs to replay, None unless every target resolved."""
+        if not results or any(result is None for result in results):
+            return None
+        return [
+            (f'[data-cd-replay~="{idx}"]', {"input_text": item["input_text"]})
+            for idx, item in enumerate(step["actions"])
+        ]
+
+
+action_trace_store = ActionTraceStore(
+    create_cache(
+        "action_traces",
+        backend=CACHE_BACKEND,
+        location=CACHE_LOCATIONS[CACHE_BACKEND],
+        max_entries=CACHE_MAX_ENTRIES,
+        ttl_s=CACHE_TTL_S,
+    ),
+    min_score=REPLAY_MIN_SCORE,
+    min_margin=REPLAY_MIN_MARGIN,
+) if REPLAY_ENABLED else None
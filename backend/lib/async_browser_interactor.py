@@ -0,0 +1,77 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from lib.job_context import call_timeout
+from lib.logging import log
+from lib.browser_pool import AsyncBrowserPool
+from config import (
+    BROWSER_POOL_SIZE,
+    BROWSER_POOL_MAX_CONTEXTS_PER_BROWSER,
+    BROWSER_POOL_MAX_JOBS_PER_BROWSER,
+    BROWSER_POOL_LEASE_TIMEOUT,
+    BROWSER_POOL_HEADLESS,
+    BROWSER_POOL_CHANNEL,
+    BROWSER_EXECUTABLE_PATH,
+    BROWSER_LAUNCH_PRESET,
+)
+
+# Playwright's own default, used outside of a job with a deadline
+PAGE_TIMEOUT_S = 30
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Page
+
+
+# Browser pool owned by the async execution engine's event loop
+async_browser_pool = AsyncBrowserPool(
+    size=BROWSER_POOL_SIZE,
+    max_contexts_per_browser=BROWSER_POOL_MAX_CONTEXTS_PER_BROWSER,
+    max_jobs_per_browser=BROWSER_POOL_MAX_JOBS_PER_BROWSER,
+    lease_timeout=BROWSER_POOL_LEASE_TIMEOUT,
+    headless=BROWSER_POOL_HEADLESS,
+    channel=BROWSER_POOL_CHANNEL,
+    executable_path=BROWSER_EXECUTABLE_PATH,
+    launch_preset=BROWSER_LAUNCH_PRESET,
+)
+
+class AsyncBrowserInteractor:
+    """Asynchronous Browser Interactor."""
+    def __init__(self, context: BrowserContext):
+        self._context = context
+
+    async def new_page(self) -> Page:
+        """Creates a new page in the leased context."""
+        page = await self._context.new_page()
+        self.apply_deadline(page)
+        return page
+
+    def apply_deadline(self, page: Page):
+        """Caps the page's action and navigation timeouts at the time the current job has left."""
+        timeout_ms = call_timeout(PAGE_TIMEOUT_S) * 1000
+        page.set_default_timeout(timeout_ms)
+        page.set_default_navigation_timeout(timeout_ms)
+
+    async def goto(self, page: Page, url):
+        """Navigates to a given URL using a specific page."""
+        await page.goto(url)
+        log.info("Navigated", {"url": url})
+
+    async def click(self, page: Page, selector):
+        """Clicks on an element using a specific page."""
+        await page.click(selector)
+        log.debug("Clicked", {"selector": selector})
+
+    async def extract_text(self, page: Page, selector):
+        """Extracts text from an element using a specific page."""
+        element = await page.query_selector(selector)
+        if element:
+            text = await element.inner_text()
+            log.debug("Extracted text", {"selector": selector, "chars": len(text)})
+            return text
+        else:
+            log.debug("Element not found", {"selector": selector})
+            return None
+
+    async def input_text(self, page: Page, selector, text):
+        """Inputs text into an element using a specific page."""
+        await page.fill(selector, text)
+        log.debug("Filled input", {"selector": selector, "chars": len(text)})
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class AsyncRunner:
+    """Runs one asyncio event loop on a background thread and accepts coroutines from any thread."""
+    def __init__(self, name: str = "async-runner"):
+        self.name = name
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+
+    def _run_loop(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._thread is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run_loop, args=(ready,), name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+        return self._loop
+
+    def submit(self, coro) -> Future:
+        """Schedules a coroutine on the loop and returns a concurrent Future for it."""
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro, timeout: float = None):
+        """Blocks the calling thread until the coroutine finishes on the loop."""
+        return self.submit(coro).result(timeout=timeout)
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+
+# Event loop shared by every job in the asyncio execution mode
+async_runner = AsyncRunner()
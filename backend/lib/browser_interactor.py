@@ -1,44 +1,78 @@
-import threading
-from playwright.sync_api import sync_playwright, Browser, Page
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from lib.job_context import call_timeout
+from lib.logging import log
+from lib.browser_pool import BrowserPool
+from config import (
+    BROWSER_POOL_SIZE,
+    BROWSER_POOL_MAX_CONTEXTS_PER_BROWSER,
+    BROWSER_POOL_MAX_JOBS_PER_BROWSER,
+    BROWSER_POOL_LEASE_TIMEOUT,
+    BROWSER_POOL_HEADLESS,
+    BROWSER_POOL_CHANNEL,
+    BROWSER_EXECUTABLE_PATH,
+    BROWSER_LAUNCH_PRESET,
+)
 
+# Playwright's own default, used outside of a job with a deadline
+PAGE_TIMEOUT_S = 30
 
-# Global instance of the synchronous Browser instance
-# We'll manage pages per task
-browser_instance: Browser = None
-# A lock to protect access to the shared browser instance (basic protection)
-browser_lock = threading.Lock()
+if TYPE_CHECKING:
+    from playwright.sync_api import BrowserContext, Page
+
+
+# Shared pool of long-lived browser processes
+# Each task leases its own isolated BrowserContext and manages pages on it
+browser_pool = BrowserPool(
+    size=BROWSER_POOL_SIZE,
+    max_contexts_per_browser=BROWSER_POOL_MAX_CONTEXTS_PER_BROWSER,
+    max_jobs_per_browser=BROWSER_POOL_MAX_JOBS_PER_BROWSER,
+    lease_timeout=BROWSER_POOL_LEASE_TIMEOUT,
+    headless=BROWSER_POOL_HEADLESS,
+    channel=BROWSER_POOL_CHANNEL,
+    executable_path=BROWSER_EXECUTABLE_PATH,
+    launch_preset=BROWSER_LAUNCH_PRESET,
+)
 
 class BrowserInteractor:
     """Synchronous Browser Interactor."""
-    def __init__(self, browser_instance: Browser):
-        self._browser = browser_instance
+    def __init__(self, context: BrowserContext):
+        self._context = context
 
     def new_page(self) -> Page:
-        """Creates a new synchronous page."""
-        return self._browser.new_page()
+        """Creates a new synchronous page in the leased context."""
+        page = self._context.new_page()
+        self.apply_deadline(page)
+        return page
+
+    def apply_deadline(self, page: Page):
+        """Caps the page's action and navigation timeouts at the time the current job has left."""
+        timeout_ms = call_timeout(PAGE_TIMEOUT_S) * 1000
+        page.set_default_timeout(timeout_ms)
+        page.set_default_navigation_timeout(timeout_ms)
 
     def goto(self, page: Page, url):
         """Navigates to a given URL using a specific page."""
         page.goto(url)
-        print(f"Navigated to: {url}")
+        log.info("Navigated", {"url": url})
 
     def click(self, page: Page, selector):
         """Clicks on an element using a specific page."""
         page.click(selector)
-        print(f"Clicked on: {selector}")
+        log.debug("Clicked", {"selector": selector})
 
     def extract_text(self, page: Page, selector):
         """Extracts text from an element using a specific page."""
         element = page.query_selector(selector)
         if element:
             text = element.inner_text()
-            print(f"Extracted text from {selector}: {text}")
+            log.debug("Extracted text", {"selector": selector, "chars": len(text)})
             return text
         else:
-            print(f"Element not found: {selector}")
+            log.debug("Element not found", {"selector": selector})
             return None
 
     def input_text(self, page: Page, selector, text):
         """Inputs text into an element using a specific page."""
         page.fill(selector, text)
-        print(f"Inputted text '{text}' into: {selector}")
+        log.debug("Filled input", {"selector": selector, "chars": len(text)})
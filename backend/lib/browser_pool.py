@@ -0,0 +1,624 @@
+from __future__ import annotations
+import asyncio
+import itertools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager, asynccontextmanager
+from typing import TYPE_CHECKING
+from lib.logging import log
+from lib.tracing import tracer
+
+if TYPE_CHECKING:
+    from playwright.sync_api import BrowserContext
+    from playwright.async_api import Browser as AsyncBrowser, BrowserContext as AsyncBrowserContext
+
+
+# Well known install locations for the "chrome" channel, used when the pool
+# launches Chrome itself instead of letting Playwright do it.
+CHROME_CHANNEL_PATHS = {
+    "linux": ["/opt/google/chrome/chrome"],
+    "darwin": ["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"],
+    "win32": [
+        os.path.expandvars(r"%ProgramFiles%\Google\Chrome\Application\chrome.exe"),
+        os.path.expandvars(r"%ProgramFiles(x86)%\Google\Chrome\Application\chrome.exe"),
+        os.path.expandvars(r"%LocalAppData%\Google\Chrome\Application\chrome.exe"),
+    ],
+}
+
+
+# Extra Chromium flags per launch preset. "low-memory" also forces headless:
+# one process for all sites' renderers, no GPU process, a capped V8 heap
+# and /tmp instead of /dev/shm, which is small in containers
+LAUNCH_PRESETS = {
+    "default": [],
+    "low-memory": [
+        "--disable-gpu",
+        "--disable-dev-shm-usage",
+        "--disable-extensions",
+        "--mute-audio",
+        "--disable-features=site-per-process,Translate,BackForwardCache,MediaRouter,OptimizationHints",
+        "--renderer-process-limit=2",
+        "--js-flags=--max-old-space-size=512",
+    ],
+}
+
+
+def _start_playwright():
+    # Imported once a driver is needed, not with the module
+    from playwright.sync_api import sync_playwright
+    return sync_playwright().start()
+
+
+async def _a_start_playwright():
+    from playwright.async_api import async_playwright
+    return await async_playwright().start()
+
+
+class BrowserPoolExhausted(Exception):
+    """Raised when no browser context could be leased within the lease timeout."""
+
+
+class PooledBrowser:
+    """A long-lived Chromium process that Playwright connects to over CDP."""
+    def __init__(self, browser_id: int, executable_path: str, headless: bool, launch_timeout: float = 30, extra_args: list = None):
+        self.browser_id = browser_id
+        self.active_contexts = 0
+        self.jobs_served = 0
+        self.retiring = False
+        self.launched_at = time.time()
+        self._user_data_dir = tempfile.mkdtemp(prefix=f"browser_pool_{browser_id}_")
+
+        args = [
+            executable_path,
+            "--remote-debugging-port=0",
+            f"--user-data-dir={self._user_data_dir}",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--disable-background-networking",
+            *(extra_args or []),
+        ]
+        if headless:
+            args.append("--headless=new")
+        args.append("about:blank")
+
+        self._process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.cdp_endpoint = self._wait_for_devtools(launch_timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def _wait_for_devtools(self, timeout: float) -> str:
+        # Chrome writes the port it picked into DevToolsActivePort once the
+        # debugging endpoint is ready to accept connections.
+        port_file = os.path.join(self._user_data_dir, "DevToolsActivePort")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Browser {self.browser_id} exited during launch with code {self._process.returncode}")
+            if os.path.exists(port_file):
+                with open(port_file, "r") as f:
+                    port = f.readline().strip()
+                if port:
+                    return f"http://127.0.0.1:{port}"
+            time.sleep(0.05)
+        raise TimeoutError(f"Browser {self.browser_id} did not expose a devtools endpoint within {timeout}s")
+
+    def is_healthy(self) -> bool:
+        if self._process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"{self.cdp_endpoint}/json/version", timeout=2) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        shutil.rmtree(self._user_data_dir, ignore_errors=True)
+
+
+class BrowserPool:
+    """
+    Fixed set of long-lived browser processes handing out isolated contexts.
+
+    Each lease connects the calling thread's Playwright driver to one of the
+    pooled processes and creates a fresh BrowserContext on it, so jobs never
+    share cookies or storage. Leases queue when every browser is at its
+    context cap, and browsers are recycled after serving max_jobs_per_browser
+    jobs or failing a health check.
+    """
+    def __init__(self, size: int, max_contexts_per_browser: int, max_jobs_per_browser: int,
+                 lease_timeout: float, headless: bool, channel: str = None, executable_path: str = None,
+                 launch_preset: str = "default"):
+        self.size = size
+        self.max_contexts_per_browser = max_contexts_per_browser
+        self.max_jobs_per_browser = max_jobs_per_browser
+        self.lease_timeout = lease_timeout
+        if launch_preset not in LAUNCH_PRESETS:
+            raise ValueError(f"Unknown browser launch preset {launch_preset!r}, expected one of {sorted(LAUNCH_PRESETS)}")
+        self.launch_preset = launch_preset
+        self.launch_args = LAUNCH_PRESETS[launch_preset]
+        self.headless = headless or launch_preset == "low-memory"
+        self.channel = channel
+        self._executable_path = executable_path
+
+        self._browsers: list[PooledBrowser] = []
+        self._launching = 0
+        self._browser_ids = itertools.count(1)
+        self._closed = False
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+        self._stats = {
+            "launches": 0,
+            "launch_failures": 0,
+            "recycles": 0,
+            "health_check_failures": 0,
+            "leases": 0,
+            "lease_timeouts": 0,
+            "waiting": 0,
+            "lease_wait_total_s": 0.0,
+            "lease_wait_max_s": 0.0,
+        }
+
+    def _resolve_executable_path(self, playwright) -> str:
+        if self._executable_path:
+            return self._executable_path
+        if self.channel == "chrome":
+            for path in CHROME_CHANNEL_PATHS.get(sys.platform, CHROME_CHANNEL_PATHS["linux"]):
+                if os.path.exists(path):
+                    self._executable_path = path
+                    return path
+        # Fall back to the Chromium build bundled with Playwright
+        self._executable_path = playwright.chromium.executable_path
+        return self._executable_path
+
+    def _launch(self, playwright) -> PooledBrowser:
+        browser_id = next(self._browser_ids)
+        started = time.monotonic()
+        with tracer.span("browser_launch"):
+            browser = PooledBrowser(browser_id, self._resolve_executable_path(playwright), self.headless, extra_args=self.launch_args)
+        log.info("Browser launched", {"browser_id": browser_id, "launch_s": round(time.monotonic() - started, 3)})
+        return browser
+
+    def _retire(self, browser: PooledBrowser, reason: str):
+        # Must be called with the condition held and no active contexts
+        self._browsers.remove(browser)
+        self._stats["recycles"] += 1
+        log.info("Browser recycled", {"browser_id": browser.browser_id, "reason": reason, "jobs_served": browser.jobs_served})
+        threading.Thread(target=browser.close, daemon=True).start()
+
+    def _assign(self, browser: PooledBrowser):
+        # Must be called with the condition held
+        browser.active_contexts += 1
+        browser.jobs_served += 1
+        if browser.jobs_served >= self.max_jobs_per_browser:
+            # Stop handing out new contexts, recycle once the last one is released
+            browser.retiring = True
+
+    def _acquire_browser(self, playwright) -> tuple[PooledBrowser, float]:
+        started = time.monotonic()
+        deadline = started + self.lease_timeout
+        with self._condition:
+            self._stats["waiting"] += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise BrowserPoolExhausted("Browser pool is shut down")
+
+                    candidates = [b for b in self._browsers if not b.retiring and b.active_contexts < self.max_contexts_per_browser]
+                    if candidates:
+                        # Prefer the least loaded browser. Its slot is taken
+                        # before the health check, which is an HTTP request
+                        # and runs without the lock so other leases and
+                        # releases don't wait on a slow browser
+                        browser = min(candidates, key=lambda b: b.active_contexts)
+                        self._assign(browser)
+                        self._condition.release()
+                        try:
+                            healthy = browser.is_healthy()
+                        finally:
+                            self._condition.acquire()
+                        if healthy:
+                            return browser, time.monotonic() - started
+                        self._stats["health_check_failures"] += 1
+                        browser.active_contexts -= 1
+                        browser.jobs_served -= 1
+                        browser.retiring = True
+                        if browser.active_contexts == 0 and browser in self._browsers:
+                            self._retire(browser, reason="unhealthy")
+                        self._condition.notify_all()
+                        continue
+
+                    if len(self._browsers) + self._launching < self.size:
+                        self._launching += 1
+                        self._condition.release()
+                        try:
+                            browser = self._launch(playwright)
+                        except Exception as e:
+                            log.error("Browser launch failed", {"error": str(e)})
+                            browser = None
+                        finally:
+                            self._condition.acquire()
+                            self._launching -= 1
+                        if browser is None:
+                            self._stats["launch_failures"] += 1
+                            raise BrowserPoolExhausted("Browser launch failed")
+                        self._stats["launches"] += 1
+                        self._browsers.append(browser)
+                        self._assign(browser)
+                        self._condition.notify_all()
+                        return browser, time.monotonic() - started
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["lease_timeouts"] += 1
+                        raise BrowserPoolExhausted(f"No browser context available within {self.lease_timeout}s")
+                    self._condition.wait(timeout=remaining)
+            finally:
+                self._stats["waiting"] -= 1
+
+    def _release_browser(self, browser: PooledBrowser):
+        with self._condition:
+            browser.active_contexts -= 1
+            if browser.retiring and browser.active_contexts == 0 and browser in self._browsers:
+                self._retire(browser, reason="max_jobs" if browser.jobs_served >= self.max_jobs_per_browser else "unhealthy")
+            self._condition.notify_all()
+
+    def bind_thread(self):
+        """Keeps a Playwright driver alive for the calling thread across leases."""
+        if getattr(self._local, "playwright", None) is None:
+            self._local.playwright = _start_playwright()
+
+    def release_thread(self):
+        """Stops the Playwright driver bound to the calling thread, if any."""
+        playwright = getattr(self._local, "playwright", None)
+        if playwright is not None:
+            self._local.playwright = None
+            playwright.stop()
+
+    @contextmanager
+    def lease(self, **context_options):
+        """Leases an isolated BrowserContext, queueing while the pool is full."""
+        transient = getattr(self._local, "playwright", None) is None
+        playwright = _start_playwright() if transient else self._local.playwright
+        try:
+            with tracer.span("browser_lease"):
+                browser, waited = self._acquire_browser(playwright)
+        except Exception:
+            if transient:
+                playwright.stop()
+            raise
+        with self._condition:
+            self._stats["leases"] += 1
+            self._stats["lease_wait_total_s"] += waited
+            self._stats["lease_wait_max_s"] = max(self._stats["lease_wait_max_s"], waited)
+        log.info("Browser context leased", {"browser_id": browser.browser_id, "lease_wait_s": round(waited, 3)})
+
+        connection = None
+        context: BrowserContext = None
+        try:
+            connection = playwright.chromium.connect_over_cdp(browser.cdp_endpoint)
+            context = connection.new_context(**context_options)
+            yield context
+        except Exception:
+            if not browser.is_healthy():
+                browser.retiring = True
+            raise
+        finally:
+            try:
+                if context is not None:
+                    context.close()
+                if connection is not None:
+                    # Disconnects only, the pooled browser process keeps running
+                    connection.close()
+            except Exception as e:
+                log.warning("Failed to close leased browser context", {"browser_id": browser.browser_id, "error": str(e)})
+                browser.retiring = True
+            finally:
+                if transient:
+                    playwright.stop()
+                self._release_browser(browser)
+
+    def start(self):
+        """Launches every browser up front so the first queries don't pay for it."""
+        with self._condition:
+            missing = max(self.size - len(self._browsers) - self._launching, 0)
+            self._launching += missing
+        if not missing:
+            return
+        transient = getattr(self._local, "playwright", None) is None
+        try:
+            playwright = _start_playwright() if transient else self._local.playwright
+        except Exception:
+            # Nothing was launched, hand the reserved slots back
+            with self._condition:
+                self._launching -= missing
+                self._condition.notify_all()
+            raise
+        for _ in range(missing):
+            try:
+                browser = self._launch(playwright)
+            except Exception as e:
+                log.error("Browser launch failed", {"error": str(e)})
+                with self._condition:
+                    self._launching -= 1
+                    self._stats["launch_failures"] += 1
+                continue
+            with self._condition:
+                self._launching -= 1
+                self._stats["launches"] += 1
+                self._browsers.append(browser)
+                self._condition.notify_all()
+        if transient:
+            playwright.stop()
+
+    def stats(self) -> dict:
+        with self._condition:
+            stats = dict(self._stats)
+            stats["lease_wait_avg_s"] = stats["lease_wait_total_s"] / stats["leases"] if stats["leases"] else 0.0
+            stats["browsers"] = [
+                {
+                    "browser_id": b.browser_id,
+                    "active_contexts": b.active_contexts,
+                    "jobs_served": b.jobs_served,
+                    "retiring": b.retiring,
+                    "uptime_s": round(time.time() - b.launched_at, 1),
+                }
+                for b in self._browsers
+            ]
+            stats["size"] = self.size
+            stats["max_contexts_per_browser"] = self.max_contexts_per_browser
+            stats["launch_preset"] = self.launch_preset
+        return stats
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            browsers, self._browsers = self._browsers, []
+            self._condition.notify_all()
+        for browser in browsers:
+            browser.close()
+
+
+class AsyncPooledBrowser:
+    """A browser launched by the event loop's own Playwright driver."""
+    def __init__(self, browser_id: int, browser: AsyncBrowser):
+        self.browser_id = browser_id
+        self.browser = browser
+        self.active_contexts = 0
+        self.jobs_served = 0
+        self.retiring = False
+        self.launched_at = time.time()
+
+    def is_healthy(self) -> bool:
+        return self.browser.is_connected()
+
+
+class AsyncBrowserPool:
+    """
+    asyncio counterpart of BrowserPool for the async execution mode.
+
+    Everything runs on one event loop, so browsers are launched directly by
+    a single async Playwright driver and many contexts can be open on the
+    same browser concurrently.
+    """
+    def __init__(self, size: int, max_contexts_per_browser: int, max_jobs_per_browser: int,
+                 lease_timeout: float, headless: bool, channel: str = None, executable_path: str = None,
+                 launch_preset: str = "default"):
+        self.size = size
+        self.max_contexts_per_browser = max_contexts_per_browser
+        self.max_jobs_per_browser = max_jobs_per_browser
+        self.lease_timeout = lease_timeout
+        if launch_preset not in LAUNCH_PRESETS:
+            raise ValueError(f"Unknown browser launch preset {launch_preset!r}, expected one of {sorted(LAUNCH_PRESETS)}")
+        self.launch_preset = launch_preset
+        self.launch_args = LAUNCH_PRESETS[launch_preset]
+        self.headless = headless or launch_preset == "low-memory"
+        self.channel = channel
+        self.executable_path = executable_path
+
+        self._playwright = None
+        self._driver_lock: asyncio.Lock = None
+        self._browsers: list[AsyncPooledBrowser] = []
+        self._launching = 0
+        self._browser_ids = itertools.count(1)
+        self._condition: asyncio.Condition = None
+
+        self._stats = {
+            "launches": 0,
+            "launch_failures": 0,
+            "recycles": 0,
+            "health_check_failures": 0,
+            "leases": 0,
+            "lease_timeouts": 0,
+            "waiting": 0,
+            "lease_wait_total_s": 0.0,
+            "lease_wait_max_s": 0.0,
+        }
+
+    async def _driver(self):
+        # Launches run concurrently, only the first one starts the driver
+        if self._playwright is None:
+            if self._driver_lock is None:
+                self._driver_lock = asyncio.Lock()
+            async with self._driver_lock:
+                if self._playwright is None:
+                    self._playwright = await _a_start_playwright()
+        return self._playwright
+
+    async def _launch(self) -> AsyncPooledBrowser:
+        playwright = await self._driver()
+        browser_id = next(self._browser_ids)
+        started = time.monotonic()
+        with tracer.span("browser_launch"):
+            browser = await playwright.chromium.launch(
+                headless=self.headless,
+                channel=None if self.executable_path else self.channel,
+                executable_path=self.executable_path,
+                args=self.launch_args,
+            )
+        log.info("Browser launched", {"browser_id": browser_id, "launch_s": round(time.monotonic() - started, 3), "mode": "asyncio"})
+        return AsyncPooledBrowser(browser_id, browser)
+
+    def _retire(self, browser: AsyncPooledBrowser, reason: str):
+        self._browsers.remove(browser)
+        self._stats["recycles"] += 1
+        log.info("Browser recycled", {"browser_id": browser.browser_id, "reason": reason, "jobs_served": browser.jobs_served, "mode": "asyncio"})
+        asyncio.ensure_future(browser.browser.close())
+
+    def _assign(self, browser: AsyncPooledBrowser):
+        browser.active_contexts += 1
+        browser.jobs_served += 1
+        if browser.jobs_served >= self.max_jobs_per_browser:
+            browser.retiring = True
+
+    async def _acquire_browser(self) -> tuple[AsyncPooledBrowser, float]:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        started = time.monotonic()
+        deadline = started + self.lease_timeout
+        async with self._condition:
+            self._stats["waiting"] += 1
+            try:
+                while True:
+                    candidates = [b for b in self._browsers if not b.retiring and b.active_contexts < self.max_contexts_per_browser]
+                    candidates.sort(key=lambda b: b.active_contexts)
+                    for browser in candidates:
+                        if browser.is_healthy():
+                            self._assign(browser)
+                            return browser, time.monotonic() - started
+                        self._stats["health_check_failures"] += 1
+                        browser.retiring = True
+                        if browser.active_contexts == 0:
+                            self._retire(browser, reason="unhealthy")
+
+                    if len(self._browsers) + self._launching < self.size:
+                        # The slot is reserved and the launch runs without
+                        # the condition, leases of free browsers and
+                        # releases go on meanwhile
+                        self._launching += 1
+                        self._condition.release()
+                        try:
+                            browser = await self._launch()
+                        except Exception as e:
+                            log.error("Browser launch failed", {"error": str(e)})
+                            browser = None
+                        finally:
+                            await self._condition.acquire()
+                            self._launching -= 1
+                        if browser is None:
+                            self._stats["launch_failures"] += 1
+                            raise BrowserPoolExhausted("Browser launch failed")
+                        self._stats["launches"] += 1
+                        self._browsers.append(browser)
+                        self._assign(browser)
+                        self._condition.notify_all()
+                        return browser, time.monotonic() - started
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["lease_timeouts"] += 1
+                        raise BrowserPoolExhausted(f"No browser context available within {self.lease_timeout}s")
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._stats["waiting"] -= 1
+
+    async def _release_browser(self, browser: AsyncPooledBrowser):
+        async with self._condition:
+            browser.active_contexts -= 1
+            if browser.retiring and browser.active_contexts == 0 and browser in self._browsers:
+                self._retire(browser, reason="max_jobs" if browser.jobs_served >= self.max_jobs_per_browser else "unhealthy")
+            self._condition.notify_all()
+
+    async def start(self):
+        """Launches every browser up front so the first queries don't pay for it."""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            missing = max(self.size - len(self._browsers) - self._launching, 0)
+            self._launching += missing
+        for _ in range(missing):
+            try:
+                browser = await self._launch()
+            except Exception as e:
+                log.error("Browser launch failed", {"error": str(e), "mode": "asyncio"})
+                async with self._condition:
+                    self._launching -= 1
+                    self._stats["launch_failures"] += 1
+                continue
+            async with self._condition:
+                self._launching -= 1
+                self._stats["launches"] += 1
+                self._browsers.append(browser)
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def lease(self, **context_options):
+        """Leases an isolated BrowserContext, waiting while the pool is full."""
+        with tracer.span("browser_lease"):
+            browser, waited = await self._acquire_browser()
+        self._stats["leases"] += 1
+        self._stats["lease_wait_total_s"] += waited
+        self._stats["lease_wait_max_s"] = max(self._stats["lease_wait_max_s"], waited)
+        log.info("Browser context leased", {"browser_id": browser.browser_id, "lease_wait_s": round(waited, 3), "mode": "asyncio"})
+
+        context: AsyncBrowserContext = None
+        try:
+            context = await browser.browser.new_context(**context_options)
+            yield context
+        except Exception:
+            if not browser.is_healthy():
+                browser.retiring = True
+            raise
+        finally:
+            try:
+                if context is not None:
+                    await context.close()
+            except Exception as e:
+                log.warning("Failed to close leased browser context", {"browser_id": browser.browser_id, "error": str(e)})
+                browser.retiring = True
+            finally:
+                await self._release_browser(browser)
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["lease_wait_avg_s"] = stats["lease_wait_total_s"] / stats["leases"] if stats["leases"] else 0.0
+        stats["browsers"] = [
+            {
+                "browser_id": b.browser_id,
+                "active_contexts": b.active_contexts,
+                "jobs_served": b.jobs_served,
+                "retiring": b.retiring,
+                "uptime_s": round(time.time() - b.launched_at, 1),
+            }
+            for b in self._browsers
+        ]
+        stats["size"] = self.size
+        stats["max_contexts_per_browser"] = self.max_contexts_per_browser
+        stats["launch_preset"] = self.launch_preset
+        return stats
+
+    async def shutdown(self):
+        browsers, self._browsers = self._browsers, []
+        for browser in browsers:
+            await browser.browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
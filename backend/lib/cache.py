@@ -0,0 +1,348 @@
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Set while a job redoes steps whose cached answers led nowhere
+_bypass: contextvars.ContextVar = contextvars.ContextVar("cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_cache():
+    """Lookups inside the block miss, so the answers are generated and cached again."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class CacheBackend:
+    """Durable storage behind the in-process cache, values are JSON serialisable."""
+    def get(self, namespace: str, key: str) -> tuple:
+        """Returns (value, stored_at) or None."""
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value, stored_at: float):
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    def count(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def items(self, namespace: str):
+        """Yields (key, value, stored_at) for every entry of a namespace."""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Non durable backend, mostly useful for benchmarks."""
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            return self._data.get((namespace, key))
+
+    def set(self, namespace, key, value, stored_at):
+        with self._lock:
+            self._data[(namespace, key)] = (value, stored_at)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def count(self, namespace):
+        with self._lock:
+            return sum(1 for ns, _ in self._data if ns == namespace)
+
+    def items(self, namespace):
+        with self._lock:
+            entries = [(key, value, stored_at) for (ns, key), (value, stored_at) in self._data.items() if ns == namespace]
+        yield from entries
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Single-row upserts into a WAL mode SQLite table instead of rewriting a whole file."""
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing the agents doesn't touch the filesystem
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+        return self._conn
+
+    def get(self, namespace, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, stored_at FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, namespace, key, value, stored_at):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), stored_at)
+            )
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._connection().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def count(self, namespace):
+        with self._lock:
+            (count,) = self._connection().execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (namespace,)).fetchone()
+        return count
+
+    def items(self, namespace):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value, stored_at FROM cache_entries WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        for key, value, stored_at in rows:
+            yield key, json.loads(value), stored_at
+
+
+class JsonlCacheBackend(CacheBackend):
+    """
+    Append-only JSON lines log, one record per write.
+
+    The log is replayed into an index on first use, later writes only append
+    a line. It is compacted once dead records outnumber live ones.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._index = None
+        self._dead_records = 0
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if self._index is None:
+            self._index = {}
+            try:
+                with open(self.path, "r") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Torn write at the end of the log
+                            continue
+                        entry_key = (record["ns"], record["key"])
+                        if entry_key in self._index:
+                            self._dead_records += 1
+                        if record.get("deleted"):
+                            self._index.pop(entry_key, None)
+                            self._dead_records += 1
+                        else:
+                            self._index[entry_key] = (record["value"], record["ts"])
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return self._index
+
+    def _append(self, record: dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _maybe_compact(self):
+        if self._dead_records <= max(len(self._index), 100):
+            return
+        tmp_path = f"{self.path}.compact"
+        with open(tmp_path, "w") as f:
+            for (namespace, key), (value, stored_at) in self._index.items():
+                f.write(json.dumps({"ns": namespace, "key": key, "value": value, "ts": stored_at}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._dead_records = 0
+
+    def get(self, namespace, key):
+        with self._lock:
+            return self._load().get((namespace, key))
+
+    def set(self, namespace, key, value, stored_at):
+        with self._lock:
+            index = self._load()
+            if (namespace, key) in index:
+                self._dead_records += 1
+            index[(namespace, key)] = (value, stored_at)
+            self._append({"ns": namespace, "key": key, "value": value, "ts": stored_at})
+            self._maybe_compact()
+
+    def delete(self, namespace, key):
+        with self._lock:
+            index = self._load()
+            if index.pop((namespace, key), None) is not None:
+                self._dead_records += 2
+                self._append({"ns": namespace, "key": key, "deleted": True, "ts": time.time()})
+                self._maybe_compact()
+
+    def count(self, namespace):
+        with self._lock:
+            return sum(1 for ns, _ in self._load() if ns == namespace)
+
+    def items(self, namespace):
+        with self._lock:
+            entries = [(key, value, stored_at) for (ns, key), (value, stored_at) in self._load().items() if ns == namespace]
+        yield from entries
+
+
+class Cache:
+    """
+    Thread-safe in-process LRU in front of a durable CacheBackend.
+
+    Reads are served from memory when possible and fall through to the
+    backend otherwise, writes go to both. max_entries bounds the in-memory
+    layer, ttl_s (if set) expires entries in both layers.
+    """
+    def __init__(self, namespace: str, backend: CacheBackend, max_entries: int = 1000, ttl_s: float = None,
+                 legacy_json_path: str = None):
+        self.namespace = namespace
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.legacy_json_path = legacy_json_path
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._legacy_imported = legacy_json_path is None
+        self._stats = {"hits": 0, "misses": 0, "backend_hits": 0, "evictions": 0, "expirations": 0, "writes": 0, "bypassed": 0}
+
+    def _import_legacy(self):
+        # One-off migration of the old single JSON file cache
+        self._legacy_imported = True
+        if self.backend.count(self.namespace) > 0:
+            return
+        try:
+            with open(self.legacy_json_path, "r") as f:
+                legacy = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        now = time.time()
+        for key, value in legacy.items():
+            self.backend.set(self.namespace, key, value, now)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_s is not None and time.time() - stored_at > self.ttl_s
+
+    def _put_in_memory(self, key: str, value, stored_at: float):
+        # Must be called with the lock held
+        self._entries[key] = (value, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, key: str):
+        if _bypass.get():
+            with self._lock:
+                self._stats["misses"] += 1
+                self._stats["bypassed"] += 1
+            return None
+        with self._lock:
+            if not self._legacy_imported:
+                self._import_legacy()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[0]
+                # Counted as an expiration below, once the backend copy is checked too
+                del self._entries[key]
+
+        entry = self.backend.get(self.namespace, key)
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, stored_at = entry
+            if self._expired(stored_at):
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                expired = True
+            else:
+                self._put_in_memory(key, value, stored_at)
+                self._stats["hits"] += 1
+                self._stats["backend_hits"] += 1
+                expired = False
+        if expired:
+            self.backend.delete(self.namespace, key)
+            return None
+        return value
+
+    def set(self, key: str, value):
+        stored_at = time.time()
+        with self._lock:
+            if not self._legacy_imported:
+                self._import_legacy()
+            self._put_in_memory(key, value, stored_at)
+            self._stats["writes"] += 1
+        self.backend.set(self.namespace, key, value, stored_at)
+
+    def items(self):
+        """Yields (key, value) for every live entry in the durable backend."""
+        with self._lock:
+            if not self._legacy_imported:
+                self._import_legacy()
+        for key, value, stored_at in self.backend.items(self.namespace):
+            if not self._expired(stored_at):
+                yield key, value
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries_in_memory"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+CACHE_BACKENDS = {
+    "sqlite": SQLiteCacheBackend,
+    "jsonl": JsonlCacheBackend,
+    "memory": MemoryCacheBackend,
+}
+
+_backends: dict = {}
+_caches: dict = {}
+_registry_lock = threading.Lock()
+
+def create_cache(namespace: str, backend: str, location: str = None, max_entries: int = 1000, ttl_s: float = None,
+                 legacy_json_path: str = None) -> Cache:
+    """Creates a named cache, caches using the same backend and location share its storage."""
+    with _registry_lock:
+        backend_key = (backend, location)
+        if backend_key not in _backends:
+            backend_cls = CACHE_BACKENDS[backend]
+            _backends[backend_key] = backend_cls(location) if location is not None else backend_cls()
+        cache = Cache(namespace, _backends[backend_key], max_entries=max_entries, ttl_s=ttl_s, legacy_json_path=legacy_json_path)
+        _caches[namespace] = cache
+    return cache
+
+def cache_stats() -> dict:
+    with _registry_lock:
+        caches = dict(_caches)
+    return {namespace: cache.stats() for namespace, cache in caches.items()}
@@ -0,0 +1,167 @@
+import threading
+from contextlib import nullcontext
+from urllib.parse import urldefrag
+from lib.action_stream import normalize_actions
+from lib.cache import bypass_cache
+from lib.logging import log
+from lib.job_repository import JobRepository, job_repository
+from lib.tracing import tracer
+from config import CHECKPOINT_ENABLED, CHECKPOINT_MAX_RESUMES, CHECKPOINT_STORAGE_STATE, GOAL_VALIDATION_RETRIES
+
+
+class StepFailed(Exception):
+    """A step of a checkpointed job raised, the job can resume from its last checkpoint."""
+    def __init__(self, query_id: str, error: Exception):
+        super().__init__(f"Query {query_id} step failed: {error}")
+        self.query_id = query_id
+        self.error = error
+
+
+def unmet_step(plan: dict, steps: list) -> int:
+    """
+    Goal validation over a run's step records: the first step without a
+    record or extraction step that found no data, the goal is read from
+    those. None when every step has its result.
+    """
+    done = {step["step_idx"]: step for step in steps}
+    for step_idx in range(len(plan["action_plan"]) - 1):
+        step = done.get(step_idx)
+        if step is None:
+            return step_idx
+        if step.get("vision_only") and not any(action.get("extracted_data") not in (None, "") for action in normalize_actions(step.get("actions"))):
+            return step_idx
+    return None
+
+
+class CheckpointStore:
+    """
+    Checkpoints of running jobs, kept in the job database next to their
+    step results.
+
+    Before each step the job saves its plan, the page URL and, with
+    keep_storage_state, the context's storage_state. resume() turns them
+    into the point a job continues from: the checkpoint where the job
+    arrived on the page of its first step without a recorded result, with
+    the results of the steps before it, so neither the plan nor those steps
+    cost another LLM call. The job database drops them once the job
+    finishes.
+    """
+    def __init__(self, jobs: JobRepository, enabled: bool = True, max_resumes: int = 2, validation_retries: int = 1,
+                 keep_storage_state: bool = False):
+        self.jobs = jobs
+        self.enabled = enabled
+        self.keep_storage_state = keep_storage_state
+        self.max_resumes = max_resumes
+        self.validation_retries = validation_retries
+        self._stats = {"saved": 0, "resumes": {}}
+        self._lock = threading.Lock()
+
+    def save(self, query_id: str, step_idx: int, plan: dict, url: str, storage_state: dict):
+        with tracer.span("checkpoint", step_idx=step_idx):
+            self.jobs.save_checkpoint(query_id, step_idx, {"plan": plan, "url": url, "storage_state": storage_state})
+        with self._lock:
+            self._stats["saved"] += 1
+
+    def resume(self, query_id: str, reason: str, from_step: int = None) -> dict:
+        """
+        Resume point of a job, None if it has no checkpoint. from_step
+        resumes no later than that step. Recorded results of the resumed
+        step and every later one are dropped, those steps run again.
+        """
+        if not self.enabled:
+            return None
+        saved = self.jobs.checkpoints(query_id)
+        if not saved:
+            return None
+        plan = saved[-1]["plan"]
+        done = {step["step_idx"]: step for step in self.jobs.steps(query_id)}
+        first = next((idx for idx in range(len(plan["action_plan"]) - 1) if idx not in done), len(plan["action_plan"]) - 1)
+        if from_step is not None:
+            first = min(first, from_step)
+        # Values typed into the page aren't part of storage_state, so the
+        # job goes back to the step that arrived on the page
+        saved = [checkpoint for checkpoint in saved if checkpoint["step_idx"] <= first]
+        checkpoint = saved.pop() if saved else {"step_idx": 0, "url": plan["goto"], "storage_state": None}
+        while saved and urldefrag(saved[-1]["url"])[0] == urldefrag(checkpoint["url"])[0]:
+            checkpoint = saved.pop()
+        self.jobs.delete_steps(query_id, checkpoint["step_idx"])
+
+        tracer.count("job_resumes_total", reason=reason)
+        with self._lock:
+            self._stats["resumes"][reason] = self._stats["resumes"].get(reason, 0) + 1
+        return {
+            "step_idx": checkpoint["step_idx"],
+            "plan": plan,
+            "url": checkpoint["url"],
+            "storage_state": checkpoint["storage_state"],
+            "step_results": {idx: step["actions"] for idx, step in done.items() if idx < checkpoint["step_idx"]},
+        }
+
+    def clear(self, query_id: str):
+        self.jobs.delete_checkpoints(query_id)
+
+    def attempts(self, query_id: str, resume: dict = None) -> "PlanAttempts":
+        return PlanAttempts(self, query_id, resume)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "keep_storage_state": self.keep_storage_state, "saved": self._stats["saved"], "resumes": dict(self._stats["resumes"])}
+
+
+class PlanAttempts:
+    """
+    When run_action_plan runs a plan again, kept apart from the services so
+    the threaded and asyncio ones follow the same policy and only the calls
+    differ. A failed step resumes from its checkpoint up to max_resumes
+    times, a finished run whose goal is missing a result is retried from
+    that step, without the cache, up to validation_retries times.
+
+    Both decisions return the message to notify, failed() sets resume to
+    None once the job gives up.
+    """
+    def __init__(self, store: CheckpointStore, query_id: str, resume: dict = None):
+        self.store = store
+        self.query_id = query_id
+        self.resume = resume
+        self.resumes = 0
+        self.retries = 0
+
+    def cache(self):
+        # A retried run must not get the answers that missed the goal again
+        return bypass_cache() if self.retries else nullcontext()
+
+    def failed(self, error: StepFailed) -> dict:
+        self.resume = self.store.resume(self.query_id, "step_failed") if self.resumes < self.store.max_resumes else None
+        if self.resume is None:
+            tracer.set_status("error")
+            return {"message": f"An error occurred: {error.error}", "status": "error"}
+        self.resumes += 1
+        return {"message": f"Step failed, resuming from step {self.resume['step_idx']}: {error.error}"}
+
+    def last_actions(self):
+        """Actions of the last recorded step, the result of a job that gave up."""
+        steps = self.store.jobs.steps(self.query_id)
+        return steps[-1]["actions"] if steps else None
+
+    def unmet(self, plan: dict) -> dict:
+        """Message for a retry of a goal that isn't met, None once the run is final."""
+        if not self.store.enabled or self.retries >= self.store.validation_retries:
+            return None
+        step_idx = unmet_step(plan, self.store.jobs.steps(self.query_id))
+        if step_idx is None:
+            return None
+        self.resume = self.store.resume(self.query_id, "goal_unmet", from_step=step_idx)
+        if self.resume is None:
+            return None
+        self.retries += 1
+        log.info("Goal not met, retrying", {"query_id": self.query_id, "step": step_idx, "resume_step": self.resume["step_idx"]})
+        return {"message": f"Step {step_idx} found nothing, retrying from step {self.resume['step_idx']}"}
+
+
+checkpoints = CheckpointStore(
+    job_repository,
+    enabled=CHECKPOINT_ENABLED,
+    max_resumes=CHECKPOINT_MAX_RESUMES,
+    validation_retries=GOAL_VALIDATION_RETRIES,
+    keep_storage_state=CHECKPOINT_STORAGE_STATE,
+)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import redis
+from flask_sse import Message
+from config import REDIS_URL, SSE_REPLAY_BUFFER_SIZE, SSE_STREAM_TTL_S, SSE_PROGRESS_MIN_INTERVAL_MS, SSE_IMAGE_TTL_S, SSE_KEEPALIVE_S
+
+
+# Events made of these keys only are progress messages and may be coalesced
+PROGRESS_KEYS = frozenset({"message"})
+
+IMAGE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+IMAGE_MIME_TYPES = {ext: mime for mime, ext in IMAGE_EXTENSIONS.items()}
+
+STREAM_ID_RE = re.compile(r"^\d+-\d+$")
+
+
+class ImageStore:
+    """
+    Screenshots in Redis keyed by the sha256 of their bytes.
+
+    Events only carry the image URL, so a frame is stored once however many
+    events or clients refer to it, and browsers can cache it for good.
+    """
+    def __init__(self, redis_client, ttl_s: int = 3600):
+        self.redis = redis_client
+        self.ttl_s = ttl_s
+
+    @staticmethod
+    def key(digest: str) -> str:
+        return f"sse:img:{digest}"
+
+    def put(self, data: bytes, mime_type: str, pipe=None) -> dict:
+        """Stores the image (in pipe when given) and returns the event fields pointing at it."""
+        digest = hashlib.sha256(data).hexdigest()
+        (pipe or self.redis).set(self.key(digest), data, ex=self.ttl_s, nx=True)
+        return {
+            "img_url": f"/screenshots/{digest}.{IMAGE_EXTENSIONS[mime_type]}",
+            "img_hash": digest,
+            "img_type": mime_type,
+        }
+
+    def get(self, digest: str) -> bytes:
+        return self.redis.get(self.key(digest))
+
+
+class _ChannelState:
+    __slots__ = ("lock", "last_sent", "pending", "coalesced", "timer")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_sent = 0.0
+        self.pending = None
+        self.coalesced = 0
+        self.timer = None
+
+
+class EventStream:
+    """
+    Per query event channels backed by Redis streams.
+
+    Each query's events go to their own stream capped at replay_size
+    entries, so clients only receive the query they follow and can resume
+    after a reconnect from the last id they saw (the SSE Last-Event-ID).
+    Progress messages published less than progress_interval_ms apart are
+    coalesced, the latest one is sent once the interval has passed or right
+    before the next event that is not a progress message.
+    """
+    def __init__(self, redis_client=None, url: str = REDIS_URL, replay_size: int = 200, ttl_s: int = 3600,
+                 progress_interval_ms: float = 250, image_ttl_s: int = 3600, keepalive_s: float = 15):
+        # One client and connection pool for the process, flask_sse builds a new one per publish
+        self.redis = redis_client or redis.StrictRedis.from_url(url)
+        self.images = ImageStore(self.redis, ttl_s=image_ttl_s)
+        self.replay_size = replay_size
+        self.ttl_s = ttl_s
+        self.progress_interval_s = progress_interval_ms / 1000
+        self.keepalive_s = keepalive_s
+        self._channels: dict = {}
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "coalesced": 0, "images": 0, "image_bytes": 0}
+
+    @staticmethod
+    def stream_key(query_id: str) -> str:
+        return f"sse:query:{query_id}"
+
+    def _channel(self, query_id: str) -> _ChannelState:
+        with self._lock:
+            state = self._channels.get(query_id)
+            if state is None:
+                state = self._channels[query_id] = _ChannelState()
+            return state
+
+    def publish(self, query_id: str, payload: dict, screenshot=None):
+        """Publishes an event on the query's channel, screenshot bytes are offloaded to the image store."""
+        is_progress = screenshot is None and payload.keys() <= PROGRESS_KEYS
+        state = self._channel(query_id)
+        with state.lock:
+            if is_progress and self.progress_interval_s:
+                now = time.monotonic()
+                if state.pending is None and now - state.last_sent >= self.progress_interval_s:
+                    self._send(query_id, state, payload)
+                    return
+                if state.pending is not None:
+                    state.coalesced += 1
+                    with self._lock:
+                        self._stats["coalesced"] += 1
+                state.pending = payload
+                if state.timer is None:
+                    delay = max(0.0, self.progress_interval_s - (now - state.last_sent))
+                    state.timer = threading.Timer(delay, self._flush, (query_id, state))
+                    state.timer.daemon = True
+                    state.timer.start()
+                return
+
+            self._send_pending(query_id, state)
+            self._send(query_id, state, payload, screenshot=screenshot)
+            if payload.get("done"):
+                with self._lock:
+                    self._channels.pop(query_id, None)
+
+    def _flush(self, query_id: str, state: _ChannelState):
+        with state.lock:
+            state.timer = None
+            self._send_pending(query_id, state)
+
+    def _send_pending(self, query_id: str, state: _ChannelState):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        if state.pending is not None:
+            payload, state.pending = state.pending, None
+            if state.coalesced:
+                payload = {**payload, "coalesced": state.coalesced}
+                state.coalesced = 0
+            self._send(query_id, state, payload)
+
+    def _send(self, query_id: str, state: _ChannelState, payload: dict, screenshot=None):
+        key = self.stream_key(query_id)
+        # Image, event and expiry go out in a single round trip
+        pipe = self.redis.pipeline(transaction=False)
+        if screenshot is not None:
+            payload = {**payload, **self.images.put(screenshot.data, screenshot.mime_type, pipe=pipe)}
+        fields = {"data": json.dumps(payload)}
+        if payload.get("done"):
+            fields["done"] = 1
+        pipe.xadd(key, fields, maxlen=self.replay_size, approximate=False)
+        pipe.expire(key, self.ttl_s)
+        pipe.execute()
+        state.last_sent = time.monotonic()
+        with self._lock:
+            self._stats["published"] += 1
+            if screenshot is not None:
+                self._stats["images"] += 1
+                self._stats["image_bytes"] += len(screenshot.data)
+
+    def finished(self, query_id: str, last_event_id: str) -> bool:
+        """True if last_event_id is the query's final event, nothing more will come."""
+        if not last_event_id:
+            return False
+        entries = self.redis.xrevrange(self.stream_key(query_id), count=1)
+        return bool(entries) and entries[0][0].decode() == last_event_id and b"done" in entries[0][1]
+
+    def subscribe(self, query_id: str, last_event_id: str = None):
+        """
+        Yields SSE frames for a query's events after last_event_id, replaying
+        what is still buffered first, then follows new events until the
+        final one. A comment line is sent every keepalive_s while idle.
+        """
+        last_id = last_event_id if last_event_id and STREAM_ID_RE.match(last_event_id) else "0-0"
+        key = self.stream_key(query_id)
+        while True:
+            response = self.redis.xread({key: last_id}, count=100, block=int(self.keepalive_s * 1000))
+            if not response:
+                yield ": keepalive\n\n"
+                continue
+            for entry_id, fields in response[0][1]:
+                last_id = entry_id.decode()
+                yield str(Message(fields[b"data"].decode(), id=last_id))
+                if b"done" in fields:
+                    return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "open_channels": len(self._channels)}
+
+
+event_stream = EventStream(
+    replay_size=SSE_REPLAY_BUFFER_SIZE,
+    ttl_s=SSE_STREAM_TTL_S,
+    progress_interval_ms=SSE_PROGRESS_MIN_INTERVAL_MS,
+    image_ttl_s=SSE_IMAGE_TTL_S,
+    keepalive_s=SSE_KEEPALIVE_S,
+)
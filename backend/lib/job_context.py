@@ -0,0 +1,70 @@
+import contextvars
+import threading
+import time
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled or has timed out."""
+    def __init__(self, query_id: str, reason: str):
+        super().__init__(f"Query {query_id} {reason}")
+        self.query_id = query_id
+        self.reason = reason
+
+
+class JobContext:
+    """Cancellation token and deadline of the job running on the current worker thread."""
+    def __init__(self, query_id: str, timeout_s: float = None):
+        self.query_id = query_id
+        self.deadline = time.monotonic() + timeout_s if timeout_s else None
+        self.reason = None
+        self._cancelled = threading.Event()
+
+    def cancel(self, reason: str = "cancelled"):
+        if self.reason is None:
+            self.reason = reason
+        self._cancelled.set()
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, None without one."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check(self):
+        if not self._cancelled.is_set() and self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel("timed_out")
+        if self._cancelled.is_set():
+            raise JobCancelled(self.query_id, self.reason)
+
+
+# A context variable rather than a thread local, so it is scoped to the worker
+# thread in threaded mode and to the job's task in asyncio mode
+_current_job: contextvars.ContextVar = contextvars.ContextVar("current_job", default=None)
+
+def current_job() -> JobContext:
+    return _current_job.get()
+
+def set_current_job(job: JobContext):
+    _current_job.set(job)
+
+def check_cancelled():
+    """Cooperative cancellation point, a no-op outside of a scheduled job."""
+    job = current_job()
+    if job is not None:
+        job.check()
+
+def call_timeout(default: float = None) -> float:
+    """
+    Timeout for a blocking call made by the current job: default, capped at
+    the time the job has left. Raises JobCancelled once that is used up.
+    """
+    job = current_job()
+    if job is None:
+        return default
+    job.check()
+    left = job.remaining()
+    if left is None:
+        return default
+    # Zero means no timeout to Playwright
+    left = max(left, 0.001)
+    return left if default is None else min(default, left)
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class QueueFull(Exception):
+    """Raised when the job queue has reached its maximum number of pending jobs."""
+
+
+class JobExists(Exception):
+    """Raised when a job with the same query_id is already queued or running."""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class PersistentJobQueue:
+    """
+    Priority queue of pending jobs stored in SQLite.
+
+    Jobs stay in the table until a worker completes them, so queued and
+    interrupted jobs survive a restart. Claiming runs in an IMMEDIATE
+    transaction, which keeps it safe across several app processes sharing
+    the same database file.
+    """
+    # Seconds idle workers wait before polling again
+    poll_interval_s = 1
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing the scheduler doesn't touch the filesystem
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_queue (
+                    query_id TEXT PRIMARY KEY,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    timeout_s REAL,
+                    state TEXT NOT NULL,
+                    owner_pid INTEGER,
+                    enqueued_at REAL NOT NULL,
+                    started_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_pending ON job_queue(state, priority DESC, enqueued_at)")
+            self._conn = conn
+        return self._conn
+
+    def put(self, query_id: str, priority: int = 0, timeout_s: float = None, max_size: int = None) -> int:
+        """Enqueues a job and returns its 1-based position in the queue, raises JobExists for a job that is already in it."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if max_size is not None:
+                    (queued,) = conn.execute("SELECT COUNT(*) FROM job_queue WHERE state = 'queued'").fetchone()
+                    if queued >= max_size:
+                        raise QueueFull(f"Job queue is full ({queued} pending jobs)")
+                # A row exists while the job is queued or running
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO job_queue (query_id, priority, timeout_s, state, enqueued_at) VALUES (?, ?, ?, 'queued', ?)",
+                    (query_id, priority, timeout_s, time.time())
+                )
+                if cursor.rowcount == 0:
+                    raise JobExists(f"Job {query_id} is already queued or running")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.position(query_id)
+
+    def claim(self) -> dict:
+        """Atomically moves the highest priority queued job to running."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT query_id, priority, timeout_s FROM job_queue WHERE state = 'queued' ORDER BY priority DESC, enqueued_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE job_queue SET state = 'running', owner_pid = ?, started_at = ? WHERE query_id = ?",
+                        (os.getpid(), time.time(), row[0])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"query_id": row[0], "priority": row[1], "timeout_s": row[2]}
+
+    def complete(self, query_id: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM job_queue WHERE query_id = ?", (query_id,))
+
+    def requeue(self, query_id: str):
+        """Puts a running job back in the queue."""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE job_queue SET state = 'queued', owner_pid = NULL, started_at = NULL WHERE query_id = ?",
+                (query_id,)
+            )
+
+    def remove_queued(self, query_id: str) -> bool:
+        """Drops a job that has not started yet, returns False if it is not queued."""
+        with self._lock:
+            cursor = self._connection().execute("DELETE FROM job_queue WHERE query_id = ? AND state = 'queued'", (query_id,))
+        return cursor.rowcount > 0
+
+    def position(self, query_id: str) -> int:
+        """1-based position among queued jobs, 0 if running and None if unknown."""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT state, priority, enqueued_at FROM job_queue WHERE query_id = ?", (query_id,)).fetchone()
+            if row is None:
+                return None
+            state, priority, enqueued_at = row
+            if state != "queued":
+                return 0
+            (ahead,) = conn.execute(
+                "SELECT COUNT(*) FROM job_queue WHERE state = 'queued' AND (priority > ? OR (priority = ? AND enqueued_at < ?))",
+                (priority, priority, enqueued_at)
+            ).fetchone()
+        return ahead + 1
+
+    def size(self) -> int:
+        with self._lock:
+            (queued,) = self._connection().execute("SELECT COUNT(*) FROM job_queue WHERE state = 'queued'").fetchone()
+        return queued
+
+    def recover(self) -> list[str]:
+        """Requeues running jobs whose owning process is gone, e.g. after a crash."""
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute("SELECT query_id, owner_pid FROM job_queue WHERE state = 'running'").fetchall()
+            orphaned = [query_id for query_id, pid in rows if pid is None or pid == os.getpid() or not _pid_alive(pid)]
+            for query_id in orphaned:
+                conn.execute(
+                    "UPDATE job_queue SET state = 'queued', owner_pid = NULL, started_at = NULL WHERE query_id = ?",
+                    (query_id,)
+                )
+        return orphaned
@@ -0,0 +1,280 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from config import JOB_DB_PATH
+
+
+TERMINAL_STATUSES = ("done", "error", "cancelled", "timed_out", "rejected")
+ACTIVE_STATUSES = ("pending", "in_progress")
+
+JOB_COLUMNS = "query_id, query, status, priority, result, error, created_at, updated_at, started_at, completed_at, options"
+
+
+def _timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value).isoformat() if value is not None else None
+
+
+class JobRepository:
+    """
+    Job records and per-step results in SQLite.
+
+    Each status change is a single-row UPDATE that only applies if the job
+    is in one of the expected statuses, so concurrent workers and cancel
+    requests can't overwrite each other. Lookups by id, status and age are
+    indexed, finished jobs older than the retention period are purged.
+    """
+    def __init__(self, db_path: str, legacy_dir: str = None):
+        self.db_path = db_path
+        self.legacy_dir = legacy_dir
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing the services doesn't touch the filesystem
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            # Must be set before the first table is created to take effect
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    query_id TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    started_at REAL,
+                    completed_at REAL,
+                    options TEXT
+                )
+            """)
+            # Databases created before per job options existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "options" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN options TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_steps (
+                    query_id TEXT NOT NULL,
+                    step_idx INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (query_id, step_idx)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_checkpoints (
+                    query_id TEXT NOT NULL,
+                    step_idx INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (query_id, step_idx)
+                )
+            """)
+            self._conn = conn
+            if self.legacy_dir:
+                self._import_legacy()
+        return self._conn
+
+    def _import_legacy(self):
+        # One-off migration of the old ./jobs/{query_id}.json files
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+        if count > 0:
+            return
+        rows = []
+        for path in glob.glob(os.path.join(self.legacy_dir, "*.json")):
+            if path.endswith(".trace.json"):
+                continue
+            try:
+                with open(path, "r") as f:
+                    job = json.load(f)
+                created_at = datetime.fromisoformat(job["created_at"]).timestamp()
+                completed_at = datetime.fromisoformat(job["completed_at"]).timestamp() if job.get("completed_at") else None
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            result = json.dumps(job["result"]) if job.get("result") is not None else None
+            rows.append((job["query_id"], job.get("query") or "", job.get("status", "pending"), result,
+                         created_at, completed_at or created_at, completed_at))
+        if rows:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (query_id, query, status, result, created_at, updated_at, completed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        query_id, query, status, priority, result, error, created_at, updated_at, started_at, completed_at, options = row
+        return {
+            "query_id": query_id,
+            "query": query,
+            "status": status,
+            "priority": priority,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "created_at": _timestamp(created_at),
+            "updated_at": _timestamp(updated_at),
+            "started_at": _timestamp(started_at),
+            "completed_at": _timestamp(completed_at),
+            "options": json.loads(options) if options is not None else {},
+        }
+
+    def create(self, query_id: str, query: str, priority: int = 0, options: dict = None, enqueue=None) -> dict:
+        """
+        Records a new pending job, options are per job settings such as
+        load_profile. A query_id of a finished job starts over, one of a
+        pending or running job is left alone and None returned.
+
+        enqueue (e.g. JobScheduler.submit) runs inside the same transaction,
+        if it raises (QueueFull) nothing is recorded and a reused job keeps
+        its history.
+        """
+        now = time.time()
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(
+                    f"""INSERT INTO jobs (query_id, query, status, priority, created_at, updated_at, options) VALUES (?, ?, 'pending', ?, ?, ?, ?)
+                        ON CONFLICT(query_id) DO UPDATE SET query = excluded.query, status = 'pending', priority = excluded.priority,
+                            result = NULL, error = NULL, created_at = excluded.created_at, updated_at = excluded.updated_at,
+                            started_at = NULL, completed_at = NULL, options = excluded.options
+                        WHERE jobs.status IN ({placeholders})""",
+                    (query_id, query, priority, now, now, json.dumps(options) if options else None, *TERMINAL_STATUSES)
+                )
+                if cursor.rowcount == 0:
+                    conn.execute("ROLLBACK")
+                    return None
+                conn.execute("DELETE FROM job_steps WHERE query_id = ?", (query_id,))
+                conn.execute("DELETE FROM job_checkpoints WHERE query_id = ?", (query_id,))
+                if enqueue is not None:
+                    enqueue()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(query_id)
+
+    def get(self, query_id: str) -> dict:
+        with self._lock:
+            row = self._connection().execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE query_id = ?", (query_id,)).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def transition(self, query_id: str, status: str, from_statuses: tuple = ACTIVE_STATUSES, result=None, error: str = None) -> bool:
+        """
+        Moves a job to status if it is currently in one of from_statuses,
+        returns False if it isn't (unknown, already finished, ...). A
+        finished job's checkpoints, and the storage state in them, go with it.
+        """
+        now = time.time()
+        assignments = ["status = ?", "updated_at = ?"]
+        params = [status, now]
+        if status == "in_progress":
+            assignments.append("started_at = ?")
+            params.append(now)
+        if status in TERMINAL_STATUSES:
+            assignments.append("completed_at = ?")
+            params.append(now)
+        if result is not None:
+            assignments.append("result = ?")
+            params.append(json.dumps(result))
+        if error is not None:
+            assignments.append("error = ?")
+            params.append(error)
+        placeholders = ", ".join("?" for _ in from_statuses)
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                f"UPDATE jobs SET {', '.join(assignments)} WHERE query_id = ? AND status IN ({placeholders})",
+                (*params, query_id, *from_statuses)
+            )
+            if cursor.rowcount > 0 and status in TERMINAL_STATUSES:
+                conn.execute("DELETE FROM job_checkpoints WHERE query_id = ?", (query_id,))
+        return cursor.rowcount > 0
+
+    def add_step(self, query_id: str, step_idx: int, data: dict):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO job_steps (query_id, step_idx, data, created_at) VALUES (?, ?, ?, ?)",
+                (query_id, step_idx, json.dumps(data), time.time())
+            )
+
+    def steps(self, query_id: str) -> list:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT step_idx, data, created_at FROM job_steps WHERE query_id = ? ORDER BY step_idx", (query_id,)
+            ).fetchall()
+        return [{"step_idx": step_idx, **json.loads(data), "created_at": _timestamp(created_at)} for step_idx, data, created_at in rows]
+
+    def delete_steps(self, query_id: str, from_step: int = 0):
+        """Forgets the results of from_step and every later step, they are about to run again."""
+        with self._lock:
+            self._connection().execute("DELETE FROM job_steps WHERE query_id = ? AND step_idx >= ?", (query_id, from_step))
+
+    def save_checkpoint(self, query_id: str, step_idx: int, data: dict):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO job_checkpoints (query_id, step_idx, data, created_at) VALUES (?, ?, ?, ?)",
+                (query_id, step_idx, json.dumps(data), time.time())
+            )
+
+    def checkpoints(self, query_id: str) -> list:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT step_idx, data FROM job_checkpoints WHERE query_id = ? ORDER BY step_idx", (query_id,)
+            ).fetchall()
+        return [{"step_idx": step_idx, **json.loads(data)} for step_idx, data in rows]
+
+    def delete_checkpoints(self, query_id: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM job_checkpoints WHERE query_id = ?", (query_id,))
+
+    def list_jobs(self, status: str = None, limit: int = 50, offset: int = 0) -> tuple:
+        """Newest jobs first, returns (jobs, total matching)."""
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        with self._lock:
+            conn = self._connection()
+            (total,) = conn.execute(f"SELECT COUNT(*) FROM jobs {where}", params).fetchone()
+            rows = conn.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs {where} ORDER BY created_at DESC LIMIT ? OFFSET ?", (*params, limit, offset)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows], total
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def purge(self, older_than_s: float) -> int:
+        """Deletes finished jobs completed more than older_than_s ago and gives the space back."""
+        cutoff = time.time() - older_than_s
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = f"SELECT query_id FROM jobs WHERE status IN ({placeholders}) AND completed_at < ?"
+                conn.execute(f"DELETE FROM job_steps WHERE query_id IN ({expired})", (*TERMINAL_STATUSES, cutoff))
+                conn.execute(f"DELETE FROM job_checkpoints WHERE query_id IN ({expired})", (*TERMINAL_STATUSES, cutoff))
+                cursor = conn.execute(f"DELETE FROM jobs WHERE query_id IN ({expired})", (*TERMINAL_STATUSES, cutoff))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if cursor.rowcount > 0:
+                conn.execute("PRAGMA incremental_vacuum")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return cursor.rowcount
+
+
+job_repository = JobRepository(JOB_DB_PATH, legacy_dir=os.path.dirname(JOB_DB_PATH))
@@ -0,0 +1,463 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from types import SimpleNamespace
+from lib.tracing import tracer
+from lib.logging import log
+from lib.job_context import call_timeout, check_cancelled
+from config import llm_client, async_llm_client, LLM_TIMEOUT_S
+from config import LLM_MAX_CONCURRENCY, LLM_MODEL_CONCURRENCY, LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM
+from config import LLM_MAX_RETRIES, LLM_RETRY_BASE_S, LLM_RETRY_MAX_S, LLM_COALESCE
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at rate_per_s up to capacity.
+
+    reserve() takes the tokens right away and returns how long the caller
+    must wait before using them, so sync and async callers share one bucket.
+    """
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+            self._updated = now
+            # Requests larger than the whole bucket wait for a full one
+            self._tokens -= min(cost, self.capacity)
+            return max(0.0, -self._tokens / self.rate_per_s)
+
+
+def _retry_after_s(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def _retryable(error: Exception) -> bool:
+    from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+    if isinstance(error, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code >= 500 or error.status_code == 408)
+
+
+def _estimated_tokens(params: dict) -> int:
+    # Rough prompt size, images are counted at a flat rate
+    chars, images = 0, 0
+    for message in params.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                chars += len(part["text"])
+            else:
+                images += 1
+    return chars // 4 + images * 850 + params.get("max_tokens", 0)
+
+
+class HeldStream:
+    """
+    A streamed response that keeps its call's concurrency slots until it is
+    consumed or closed, the generation goes on for as long as it is read.
+    """
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self._release()
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def __del__(self):
+        # An abandoned stream still gives its slots back
+        self._release()
+
+
+class AsyncHeldStream(HeldStream):
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._release()
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+
+class LLMGateway:
+    """
+    Shared entry point for chat completions, used like the OpenAI client.
+
+    Calls wait for the request/token rate limits and then for a global and
+    a per-model concurrency slot, a streamed call holds its slots until the
+    stream is consumed or closed. Failed calls are retried with jittered
+    exponential backoff (or after the server's Retry-After), and identical
+    requests already in flight share one call. Latency, queueing time,
+    token usage, retries and outcomes are exported as metrics.
+
+    Clients not given are built by client_factory / async_client_factory
+    on first use.
+    """
+    def __init__(self, client=None, async_client=None, max_concurrency: int = 16, model_concurrency: dict = None,
+                 rpm: float = 0, tpm: float = 0, max_retries: int = 4, retry_base_s: float = 0.5,
+                 retry_max_s: float = 20, coalesce: bool = True, client_factory=None, async_client_factory=None,
+                 timeout_s: float = None):
+        self._client = client
+        self._async_client = async_client
+        self.client_factory = client_factory
+        self.async_client_factory = async_client_factory
+        self._client_lock = threading.Lock()
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency or {}
+        self.max_retries = max_retries
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self.coalesce = coalesce
+        self.timeout_s = timeout_s
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * 10)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, tpm / 6) if tpm else None
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._model_slots = {model: threading.BoundedSemaphore(limit) for model, limit in self.model_concurrency.items()}
+        # asyncio semaphores belong to the loop they are used on
+        self._async_slots = weakref.WeakKeyDictionary()
+        self._in_flight = {}
+        self._async_in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0, "in_flight": 0}
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        # Drop-in for the async client
+        self.aio = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self.acreate)))
+
+        metrics = tracer.metrics
+        metrics.describe("llm_request_seconds", "LLM call latency, retries included")
+        metrics.describe("llm_queue_seconds", "Time LLM calls waited for a concurrency slot or the rate limiter")
+        metrics.describe("llm_tokens_total", "Tokens used by LLM calls")
+        metrics.describe("llm_requests_total", "LLM calls by outcome")
+        metrics.describe("llm_retries_total", "Retried LLM calls")
+        metrics.describe("llm_coalesced_total", "LLM calls answered by an identical call in flight")
+
+    @staticmethod
+    def request_key(params: dict) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _rate_delay(self, params: dict) -> float:
+        delay = self.requests.reserve() if self.requests else 0.0
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(_estimated_tokens(params)))
+        return delay
+
+    def _backoff_s(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after_s(error)
+        if retry_after is not None:
+            return min(retry_after, self.retry_max_s)
+        # Full jitter
+        return random.uniform(0, min(self.retry_max_s, self.retry_base_s * 2 ** attempt))
+
+    def _wait_rate_limit(self, params: dict) -> float:
+        # Waited out before taking a slot, so calls that could run now
+        # aren't held up, and no longer than the job has left
+        delay = self._rate_delay(params)
+        return call_timeout(delay) if delay else 0.0
+
+    def _holder(self, slots, model_slots):
+        """Counts a call in flight and returns the function giving its slots back, once."""
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["in_flight"] += 1
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self._stats["in_flight"] -= 1
+            if model_slots is not None:
+                model_slots.release()
+            slots.release()
+        return release
+
+    def _record(self, model: str, started: float, queued_s: float, response=None, error: Exception = None):
+        if not tracer.enabled:
+            return
+        labels = {"model": model}
+        tracer.metrics.observe("llm_request_seconds", time.perf_counter() - started, labels)
+        tracer.metrics.observe("llm_queue_seconds", queued_s, labels)
+        tracer.count("llm_requests_total", model=model, outcome="error" if error else "ok")
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            tracer.metrics.inc("llm_tokens_total", {"model": model, "kind": "prompt"}, usage.prompt_tokens or 0)
+            tracer.metrics.inc("llm_tokens_total", {"model": model, "kind": "completion"}, usage.completion_tokens or 0)
+
+    def _request(self, params: dict) -> dict:
+        # A call made by a job times out with the job's deadline at the latest
+        timeout = call_timeout(self.timeout_s)
+        return params if timeout is None else {**params, "timeout": timeout}
+
+    def _retry(self, model: str, attempt: int, error: Exception) -> float:
+        # No retries past the job's deadline, the job ends as timed out
+        check_cancelled()
+        if attempt >= self.max_retries or not _retryable(error):
+            with self._lock:
+                self._stats["failures"] += 1
+            raise error
+        backoff = self._backoff_s(attempt, error)
+        tracer.count("llm_retries_total", model=model, error=type(error).__name__)
+        with self._lock:
+            self._stats["retries"] += 1
+        log.warning("LLM call failed, retrying", {"error": type(error).__name__, "retry": attempt + 1, "backoff_s": round(backoff, 2)})
+        return backoff
+
+    def _call(self, params: dict):
+        model = params.get("model", "default")
+        started = time.perf_counter()
+        queued_s = 0.0
+        attempt = 0
+        model_slots = self._model_slots.get(model)
+        while True:
+            waiting = time.perf_counter()
+            delay = self._wait_rate_limit(params)
+            if delay:
+                time.sleep(delay)
+            self._slots.acquire()
+            if model_slots is not None:
+                model_slots.acquire()
+            queued_s += time.perf_counter() - waiting
+            release = self._holder(self._slots, model_slots)
+            try:
+                response = self.client.chat.completions.create(**self._request(params))
+            except Exception as e:
+                release()
+                error = e
+            except BaseException:
+                release()
+                raise
+            else:
+                self._record(model, started, queued_s, response=response)
+                if params.get("stream"):
+                    return HeldStream(response, release)
+                release()
+                return response
+            try:
+                backoff = self._retry(model, attempt, error)
+            except Exception:
+                self._record(model, started, queued_s, error=error)
+                raise
+            # Backoff happens outside the slots so other calls can go ahead
+            time.sleep(call_timeout(backoff))
+            attempt += 1
+
+    def create(self, **params):
+        # A stream can't be shared
+        if not self.coalesce or params.get("stream"):
+            return self._call(params)
+
+        key = self.request_key(params)
+        with self._lock:
+            leader = self._in_flight.get(key)
+            if leader is None:
+                future = self._in_flight[key] = Future()
+        if leader is not None:
+            tracer.count("llm_coalesced_total", model=params.get("model", "default"))
+            with self._lock:
+                self._stats["coalesced"] += 1
+            try:
+                return leader.result(timeout=call_timeout())
+            except FutureTimeout:
+                # The leader outlived this job's deadline
+                check_cancelled()
+                raise
+
+        try:
+            response = self._call(params)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _loop_slots(self, model: str) -> tuple:
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = (
+                asyncio.Semaphore(self.max_concurrency),
+                {name: asyncio.Semaphore(limit) for name, limit in self.model_concurrency.items()},
+            )
+        return slots[0], slots[1].get(model)
+
+    async def _acall(self, params: dict):
+        model = params.get("model", "default")
+        started = time.perf_counter()
+        queued_s = 0.0
+        attempt = 0
+        slots, model_slots = self._loop_slots(model)
+        while True:
+            waiting = time.perf_counter()
+            delay = self._wait_rate_limit(params)
+            if delay:
+                await asyncio.sleep(delay)
+            await slots.acquire()
+            if model_slots is not None:
+                try:
+                    await model_slots.acquire()
+                except BaseException:
+                    slots.release()
+                    raise
+            queued_s += time.perf_counter() - waiting
+            release = self._holder(slots, model_slots)
+            try:
+                response = await self.async_client.chat.completions.create(**self._request(params))
+            except Exception as e:
+                release()
+                error = e
+            except BaseException:
+                release()
+                raise
+            else:
+                self._record(model, started, queued_s, response=response)
+                if params.get("stream"):
+                    return AsyncHeldStream(response, release)
+                release()
+                return response
+            try:
+                backoff = self._retry(model, attempt, error)
+            except Exception:
+                self._record(model, started, queued_s, error=error)
+                raise
+            await asyncio.sleep(call_timeout(backoff))
+            attempt += 1
+
+    async def acreate(self, **params):
+        if not self.coalesce or params.get("stream"):
+            return await self._acall(params)
+
+        key = self.request_key(params)
+        leader = self._async_in_flight.get(key)
+        if leader is not None:
+            tracer.count("llm_coalesced_total", model=params.get("model", "default"))
+            with self._lock:
+                self._stats["coalesced"] += 1
+            # shield, so a cancelled follower doesn't cancel the leader's call
+            return await asyncio.shield(leader)
+
+        future = self._async_in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._acall(params)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the error retrieved, there may be no followers
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._async_in_flight.pop(key, None)
+
+    @property
+    def client(self):
+        if self._client is None and self.client_factory is not None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.client_factory()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @property
+    def async_client(self):
+        if self._async_client is None and self.async_client_factory is not None:
+            with self._client_lock:
+                if self._async_client is None:
+                    self._async_client = self.async_client_factory()
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, client):
+        self._async_client = client
+
+    def prewarm(self):
+        """
+        Builds the client and opens a pooled connection to the endpoint.
+        Any answer, an error status too, leaves a keep-alive connection
+        behind, failures are only logged.
+        """
+        try:
+            self.client.models.list()
+        except Exception as e:
+            log.debug("LLM prewarm request failed", {"error": str(e)})
+
+    async def aprewarm(self):
+        try:
+            await self.async_client.models.list()
+        except Exception as e:
+            log.debug("LLM prewarm request failed", {"error": str(e)})
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["max_concurrency"] = self.max_concurrency
+        stats["model_concurrency"] = self.model_concurrency
+        return stats
+
+
+llm_gateway = LLMGateway(
+    client_factory=llm_client,
+    async_client_factory=async_llm_client,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    model_concurrency=LLM_MODEL_CONCURRENCY,
+    rpm=LLM_RATE_LIMIT_RPM,
+    tpm=LLM_RATE_LIMIT_TPM,
+    max_retries=LLM_MAX_RETRIES,
+    retry_base_s=LLM_RETRY_BASE_S,
+    retry_max_s=LLM_RETRY_MAX_S,
+    coalesce=LLM_COALESCE,
+    timeout_s=LLM_TIMEOUT_S,
+)
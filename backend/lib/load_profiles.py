@@ -0,0 +1,140 @@
+from urllib.parse import urlparse
+from config import LOAD_PROFILE_DEFAULT, LOAD_PROFILE_DOMAINS, LOAD_PROFILE_BLOCKED_DOMAINS
+
+
+def _host_matches(host: str, domains) -> bool:
+    # A domain covers itself and its subdomains
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def _site(host: str) -> str:
+    # Last two labels, close enough to the registrable domain for telling embeds apart
+    return ".".join(host.split(".")[-2:])
+
+
+class LoadProfile:
+    """
+    How much of a page a job loads. Requests of blocked_resource_types
+    (Playwright's request.resource_type) or to blocked_domains are aborted
+    by the context's request routing, block_third_party_frames also drops
+    documents loaded into iframes of another site (ads, embeds). viewport
+    None keeps the browser's default size.
+    """
+    def __init__(self, name: str, blocked_resource_types=(), blocked_domains=(), block_third_party_frames: bool = False,
+                 viewport: dict = None):
+        self.name = name
+        self.blocked_resource_types = frozenset(blocked_resource_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.block_third_party_frames = block_third_party_frames
+        self.viewport = viewport
+        self.jobs = 0
+        self.blocked = 0
+
+    @property
+    def routes(self) -> bool:
+        return bool(self.blocked_resource_types or self.blocked_domains or self.block_third_party_frames)
+
+    def context_options(self) -> dict:
+        return {"viewport": self.viewport} if self.viewport else {}
+
+    def should_block(self, request) -> bool:
+        if request.resource_type in self.blocked_resource_types:
+            return True
+        host = urlparse(request.url).hostname or ""
+        if _host_matches(host, self.blocked_domains):
+            return True
+        if self.block_third_party_frames and request.resource_type == "document":
+            try:
+                frame = request.frame
+                if frame.parent_frame is None:
+                    return False
+                top_host = urlparse(frame.page.url).hostname or ""
+            except Exception:
+                # Service worker requests have no frame
+                return False
+            return _site(host) != _site(top_host)
+        return False
+
+
+def build_profiles(blocked_domains) -> dict:
+    """The built in profiles, blocked_domains are the ad and tracker domains the lighter ones drop."""
+    media = ("image", "media", "font")
+    profiles = [
+        LoadProfile("full"),
+        LoadProfile("no-media", blocked_resource_types=media, blocked_domains=blocked_domains, viewport={"width": 1280, "height": 800}),
+        LoadProfile(
+            "text-first",
+            blocked_resource_types=media + ("texttrack", "manifest", "other"),
+            blocked_domains=blocked_domains,
+            block_third_party_frames=True,
+            viewport={"width": 1024, "height": 768},
+        ),
+    ]
+    return {profile.name: profile for profile in profiles}
+
+
+class LoadProfiles:
+    """
+    Picks a job's load profile, the one its query asked for, else the first
+    domain rule matching the page it starts on, else the default, and
+    applies it to the job's browser context.
+    """
+    def __init__(self, profiles: dict, default: str = "full", domain_rules: dict = None):
+        if default not in profiles:
+            raise ValueError(f"Unknown default load profile {default!r}")
+        unknown = set((domain_rules or {}).values()) - set(profiles)
+        if unknown:
+            raise ValueError(f"Unknown load profiles in domain rules: {sorted(unknown)}")
+        self.profiles = profiles
+        self.default = default
+        self.domain_rules = domain_rules or {}
+
+    def select(self, url: str, requested: str = None) -> LoadProfile:
+        if requested:
+            if requested not in self.profiles:
+                raise ValueError(f"Unknown load profile {requested!r}, expected one of {sorted(self.profiles)}")
+            return self.profiles[requested]
+        host = urlparse(url or "").hostname or ""
+        for domain, name in self.domain_rules.items():
+            if _host_matches(host, (domain,)):
+                return self.profiles[name]
+        return self.profiles[self.default]
+
+    def install(self, context, profile: LoadProfile):
+        profile.jobs += 1
+        if not profile.routes:
+            # Routing sends every request through the driver, skip it when nothing is blocked
+            return
+
+        def handle(route):
+            if profile.should_block(route.request):
+                profile.blocked += 1
+                route.abort("blockedbyclient")
+            else:
+                route.continue_()
+
+        context.route("**/*", handle)
+
+    async def ainstall(self, context, profile: LoadProfile):
+        profile.jobs += 1
+        if not profile.routes:
+            return
+
+        async def handle(route):
+            if profile.should_block(route.request):
+                profile.blocked += 1
+                await route.abort("blockedbyclient")
+            else:
+                await route.continue_()
+
+        await context.route("**/*", handle)
+
+    def stats(self) -> dict:
+        return {
+            "default": self.default,
+            "domain_rules": self.domain_rules,
+            "profiles": {name: {"jobs": profile.jobs, "blocked_requests": profile.blocked} for name, profile in self.profiles.items()},
+        }
+
+
+load_profiles = LoadProfiles(build_profiles(LOAD_PROFILE_BLOCKED_DOMAINS), default=LOAD_PROFILE_DEFAULT, domain_rules=LOAD_PROFILE_DOMAINS)
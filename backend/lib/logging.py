@@ -1,60 +1,282 @@
-import logging
-import os
+import atexit
+import glob
 import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-
-class ThreadedLogger:
-    def __init__(self):
-        self.logger = logging.getLogger('threaded_logger')
-        self.logger.setLevel(logging.INFO)
-        
-        # Create logs directory if it doesn't exist
-        os.makedirs('logs', exist_ok=True)
-        
-        # Create file handler
-        log_file = f'logs/app_{datetime.now().strftime("%Y%m%d")}.log'
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.INFO)
-        
-        # Create formatter that only outputs the message
-        formatter = logging.Formatter('%(message)s')
-        file_handler.setFormatter(formatter)
-        
-        # Add handler to logger
-        self.logger.addHandler(file_handler)
-        
-        # Create thread pool for logging
-        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="logger")
-
-    def _log_message(self, level, message, data=None):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
-        log_entry = {
-            "timestamp": timestamp,
-            "level": level.upper(),
-            "message": message
-        }
-        if data:
-            log_entry.update(data)
-        getattr(self.logger, level)(json.dumps(log_entry))
+from config import LOG_LEVEL, LOG_FILE_PATTERN, LOG_QUEUE_SIZE, LOG_OVERFLOW_POLICY, LOG_BLOCK_TIMEOUT_S
+from config import LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_S, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_MAX_FIELD_CHARS
+from config import LOG_SAMPLE_RATES, LOG_CONSOLE
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+MAX_DEPTH = 8
+
+
+def redact(value, max_chars: int, depth: int = 0):
+    """
+    Copy of a log field that is cheap to write: base64 data URLs (the
+    screenshots in LLM messages) are replaced by their size, bytes by their
+    length and other strings are cut at max_chars.
+    """
+    if isinstance(value, str):
+        if value.startswith("data:") and ";base64," in value[:100]:
+            return f"<{value[5:value.index(';')]} redacted, {len(value)} chars>"
+        if len(value) > max_chars:
+            return f"{value[:max_chars]}...<{len(value) - max_chars} more chars>"
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, dict):
+        if depth >= MAX_DEPTH:
+            return "<nested>"
+        return {str(key): redact(item, max_chars, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if depth >= MAX_DEPTH:
+            return "<nested>"
+        return [redact(item, max_chars, depth + 1) for item in value]
+    return value
+
+
+class RotatingLogFile:
+    """
+    Appends to the file named by a strftime pattern. A new file starts when
+    the name changes (daily for the default pattern) or when the current
+    one would grow past max_bytes, those are numbered app_20240101.1.log,
+    .2 and so on. Only the backup_count newest files beside the current
+    one are kept.
+    """
+    def __init__(self, pattern: str, max_bytes: int = 0, backup_count: int = 0):
+        self.pattern = pattern
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotations = 0
+        self.path = None
+        self._base = None
+        self._index = 0
+        self._file = None
+        self._size = 0
+
+    def _open(self, base: str, index: int):
+        if self._file is not None:
+            self._file.close()
+            self.rotations += 1
+        root, ext = os.path.splitext(base)
+        self.path = f"{root}.{index}{ext}" if index else base
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        self._base, self._index = base, index
+        self._prune()
+
+    def _prune(self):
+        if not self.backup_count:
+            return
+        # Files of this pattern are the ones sharing its fixed prefix and extension
+        prefix = self.pattern.split("%", 1)[0]
+        ext = os.path.splitext(self.pattern)[1]
+        files = sorted(glob.glob(f"{glob.escape(prefix)}*{ext}"), key=os.path.getmtime)
+        for path in files[:-(self.backup_count + 1)]:
+            if path != self.path:
+                os.remove(path)
+
+    def write(self, lines: list[str]):
+        base = datetime.now().strftime(self.pattern)
+        if base != self._base:
+            self._open(base, 0)
+        chunk = []
+        for line in lines:
+            if self.max_bytes and self._size and self._size + len(line) > self.max_bytes:
+                self._file.write("".join(chunk))
+                chunk = []
+                self._open(base, self._index + 1)
+            chunk.append(line)
+            self._size += len(line)
+        self._file.write("".join(chunk))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StructuredLogger:
+    """
+    JSON lines logger whose calls cost the calling thread a level check, a
+    sampling draw and an append to a bounded in-memory queue.
+
+    A background thread takes whatever has queued up, every flush_interval_s
+    or as soon as batch_size records are waiting, redacts and serializes it
+    and writes it to the log file in one call. When the queue is full,
+    overflow decides what is lost: "drop_oldest" (the default) evicts the
+    oldest record, "drop_newest" discards the new one and "block" makes the
+    caller wait up to block_timeout_s before discarding it. sample_rates
+    keeps a fraction of the records of a level, e.g. {"debug": 0.1}.
+    """
+    def __init__(self, path_pattern: str, level: str = "info", queue_size: int = 10000, overflow: str = "drop_oldest",
+                 block_timeout_s: float = 0.05, batch_size: int = 256, flush_interval_s: float = 0.5,
+                 max_bytes: int = 0, backup_count: int = 0, max_field_chars: int = 2000,
+                 sample_rates: dict = None, console: bool = False):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.level = LEVELS[level.lower()]
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.block_timeout_s = block_timeout_s
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_field_chars = max_field_chars
+        self.sample_rates = {name.lower(): rate for name, rate in (sample_rates or {}).items()}
+        self.console = console
+        self.file = RotatingLogFile(path_pattern, max_bytes, backup_count)
+        self._records = deque()
+        self._condition = threading.Condition()
+        self._writing = False
+        self._flush_requested = False
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.format_errors = 0
+
+    def _start(self):
+        # Started on first use, and again in a forked child that lost the thread
+        with self._condition:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _log(self, level: str, message: str, data: dict = None):
+        if LEVELS[level] < self.level:
+            return
+        rate = self.sample_rates.get(level, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        if self._pid != os.getpid():
+            self._start()
+
+        record = (time.time(), level, message, data)
+        with self._condition:
+            if len(self._records) >= self.queue_size:
+                if self.overflow == "block":
+                    self._condition.wait_for(lambda: len(self._records) < self.queue_size, timeout=self.block_timeout_s)
+                if len(self._records) >= self.queue_size:
+                    self.dropped += 1
+                    if self.overflow != "drop_oldest":
+                        return
+                    self._records.popleft()
+            self._records.append(record)
+            if len(self._records) >= self.batch_size:
+                self._condition.notify_all()
 
     def info(self, message, data=None):
-        self.executor.submit(self._log_message, 'info', message, data)
-        
+        self._log("info", message, data)
+
     def error(self, message, data=None):
-        self.executor.submit(self._log_message, 'error', message, data)
-        
+        self._log("error", message, data)
+
     def warning(self, message, data=None):
-        self.executor.submit(self._log_message, 'warning', message, data)
-        
+        self._log("warning", message, data)
+
     def debug(self, message, data=None):
-        self.executor.submit(self._log_message, 'debug', message, data)
+        self._log("debug", message, data)
 
-# Create singleton instance
-log = ThreadedLogger()
+    def enabled(self, level: str) -> bool:
+        """Lets callers skip building expensive log data for a level that is off."""
+        return LEVELS[level] >= self.level
 
-# if __name__ == "__main__":
-#     log.info("Hello, How are you doing!", {"user": "test", "action": "greeting"})
-#     # # Give some time for the log to be written
-#     # from time import sleep
-#     # sleep(0.1)
+    def format(self, record) -> str:
+        created, level, message, data = record
+        entry = {
+            "timestamp": datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S,%f")[:-3],
+            "level": level.upper(),
+            "message": message,
+        }
+        if data:
+            entry.update(redact(data, self.max_field_chars))
+        return json.dumps(entry, default=str) + "\n"
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._records) >= self.batch_size or self._flush_requested, timeout=self.flush_interval_s)
+                batch = list(self._records)
+                self._records.clear()
+                self._flush_requested = False
+                self._writing = bool(batch)
+                # Room for callers blocked on a full queue
+                self._condition.notify_all()
+            if not batch:
+                continue
+            lines = []
+            for record in batch:
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    # Only the record that can't be serialized is lost
+                    self.format_errors += 1
+            try:
+                self.file.write(lines)
+                if self.console:
+                    sys.stdout.write("".join(lines))
+                    sys.stdout.flush()
+                self.written += len(lines)
+            except Exception:
+                # A logger that raises would take the job down with it
+                self.write_errors += 1
+            finally:
+                self.batches += 1
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def flush(self, timeout_s: float = 5) -> bool:
+        """Waits until every queued record is written, False on timeout."""
+        if self._thread is None or self._pid != os.getpid():
+            return not self._records
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._records and not self._writing, timeout=timeout_s)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._records),
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+            "format_errors": self.format_errors,
+            "rotations": self.file.rotations,
+            "file": self.file.path,
+        }
+
+
+# Create singleton instance
+log = StructuredLogger(
+    LOG_FILE_PATTERN,
+    level=LOG_LEVEL,
+    queue_size=LOG_QUEUE_SIZE,
+    overflow=LOG_OVERFLOW_POLICY,
+    block_timeout_s=LOG_BLOCK_TIMEOUT_S,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval_s=LOG_FLUSH_INTERVAL_S,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    max_field_chars=LOG_MAX_FIELD_CHARS,
+    sample_rates=LOG_SAMPLE_RATES,
+    console=LOG_CONSOLE,
+)
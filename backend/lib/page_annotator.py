@@ -0,0 +1,201 @@
+from config import ANNOTATION_INCREMENTAL
+
+# Select all buttons and input elements
+BOX_SELECTOR = "button, input, textarea, a"
+
+# Annotation state kept in the page between steps: a persistent overlay
+# layer, the box number of every element annotated so far and a
+# MutationObserver (plus scroll, resize and input listeners) flagging when
+# the element set may have changed. An unchanged page returns the previous
+# boxes without touching the DOM, otherwise every candidate is measured in
+# one pass and only overlays of added, moved or removed elements are
+# written. Elements keep their number while they stay in the document, new
+# ones get the next free number. With incremental false the state is reset
+# and every box is drawn and numbered again from 1. A navigation starts
+# from a fresh document and so from fresh state.
+ANNOTATE_PAGE_JS = """
+([selector, incremental]) => {
+    const LAYER_ID = '__cd_box_overlays';
+    let state = window.__cdAnnotator;
+    if (state && !incremental) {
+        state.teardown();
+        state = null;
+    }
+    if (!state) {
+        // Leftovers of a previous annotator in this document
+        document.getElementById(LAYER_ID)?.remove();
+        document.querySelectorAll('[data-box-number]').forEach(el => el.removeAttribute('data-box-number'));
+
+        const layer = document.createElement('div');
+        layer.id = LAYER_ID;
+        layer.style.cssText = 'position:absolute;left:0;top:0;z-index:2147483647;pointer-events:none;';
+        const ours = (node) => node && node.nodeType === 1 && (node === layer || layer.contains(node));
+        const relevant = (mutations) => mutations.some(m => {
+            if (ours(m.target) || (m.type === 'attributes' && m.attributeName === 'data-box-number')) return false;
+            return !(m.type === 'childList' && [...m.addedNodes, ...m.removedNodes].every(ours));
+        });
+        const markDirty = () => { state.dirty = true; };
+        const observer = new MutationObserver((mutations) => { if (relevant(mutations)) markDirty(); });
+        observer.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+        // Scrolled containers, typed values and finished transitions don't mutate the DOM
+        const events = ['scroll', 'input', 'change', 'transitionend', 'animationend'];
+        events.forEach(name => document.addEventListener(name, markDirty, { capture: true, passive: true }));
+        window.addEventListener('resize', markDirty, { passive: true });
+
+        state = window.__cdAnnotator = {
+            layer,
+            entries: new Map(),
+            nextNumber: 1,
+            dirty: true,
+            view: null,
+            boxes: [],
+            flush: () => { if (relevant(observer.takeRecords())) markDirty(); },
+            teardown: () => {
+                observer.disconnect();
+                events.forEach(name => document.removeEventListener(name, markDirty, { capture: true }));
+                window.removeEventListener('resize', markDirty);
+                layer.remove();
+                for (const el of state.entries.keys()) el.removeAttribute('data-box-number');
+                delete window.__cdAnnotator;
+            },
+        };
+    }
+
+    const viewportWidth = window.innerWidth;
+    const viewportHeight = window.innerHeight;
+    const scrollX = window.scrollX;
+    const scrollY = window.scrollY;
+
+    state.flush();
+    const view = `${viewportWidth}x${viewportHeight}@${scrollX},${scrollY}`;
+    if (!state.layer.isConnected) {
+        // The page replaced the body or removed our layer
+        (document.body || document.documentElement).appendChild(state.layer);
+        state.dirty = true;
+    }
+    state.layer.style.display = '';
+    if (!state.dirty && state.view === view) {
+        return { boxes: state.boxes, added: 0, moved: 0, removed: 0, cached: true };
+    }
+
+    // Measure everything before touching the DOM so layout is computed once
+    const visible = [];
+    for (const el of document.querySelectorAll(selector)) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) continue;
+        if (rect.bottom <= 0 || rect.right <= 0 || rect.top >= viewportHeight || rect.left >= viewportWidth) continue;
+        const style = window.getComputedStyle(el);
+        if (style.display === 'none' || style.visibility === 'hidden' || parseFloat(style.opacity) === 0) continue;
+        visible.push([el, rect]);
+    }
+
+    const boxes = visible.map(([el, rect]) => {
+        const entry = state.entries.get(el);
+        return {
+            x: rect.x + scrollX,
+            y: rect.y + scrollY,
+            width: rect.width,
+            height: rect.height,
+            box_number: entry ? entry.number : state.nextNumber++,
+            tag: el.tagName.toLowerCase(),
+            type: el.type || null,
+            label: (el.getAttribute('aria-label') || el.placeholder || el.innerText || el.title || el.name || '').trim().slice(0, 80),
+            // Fingerprint fields used to find the element again on replay
+            role: el.getAttribute('role'),
+            text: (el.innerText || el.value || '').trim().slice(0, 80),
+            id: el.id || null,
+            name: el.getAttribute('name'),
+            rx: (rect.x + rect.width / 2) / viewportWidth,
+            ry: (rect.y + rect.height / 2) / viewportHeight
+        };
+    });
+
+    // Only the overlays whose element appeared, moved or went away are written
+    let added = 0, moved = 0, removed = 0;
+    const seen = new Set();
+    const fragment = document.createDocumentFragment();
+    visible.forEach(([el], idx) => {
+        const box = boxes[idx];
+        const geometry = `${box.x},${box.y},${box.width},${box.height}`;
+        let entry = state.entries.get(el);
+        if (!entry) {
+            entry = { number: box.box_number, overlay: null, geometry: null };
+            state.entries.set(el, entry);
+        }
+        if (el.getAttribute('data-box-number') !== String(entry.number)) {
+            el.setAttribute('data-box-number', entry.number);
+        }
+        seen.add(el);
+        if (!entry.overlay) {
+            // Color derived from the number so a box looks the same on every step
+            const color = `hsl(${(entry.number * 137) % 360}, 90%, 40%)`;
+            const div = document.createElement('div');
+            div.style.cssText = `position:absolute;left:${box.x}px;top:${box.y}px;width:${box.width}px;height:${box.height}px;border:3px solid ${color};pointer-events:none;`;
+            const label = document.createElement('span');
+            label.textContent = entry.number;
+            label.style.cssText = `position:absolute;left:0;top:0;background:${color};color:#fff;font-weight:bold;padding:2px 6px;font-size:16px;`;
+            div.appendChild(label);
+            fragment.appendChild(div);
+            entry.overlay = div;
+            added++;
+        } else if (entry.geometry !== geometry) {
+            Object.assign(entry.overlay.style, { left: `${box.x}px`, top: `${box.y}px`, width: `${box.width}px`, height: `${box.height}px` });
+            moved++;
+        }
+        entry.geometry = geometry;
+    });
+    for (const [el, entry] of state.entries) {
+        if (seen.has(el)) continue;
+        if (entry.overlay) {
+            entry.overlay.remove();
+            entry.overlay = null;
+            removed++;
+        }
+        // Off screen elements keep their number, detached ones are forgotten
+        if (!el.isConnected) state.entries.delete(el);
+    }
+    state.layer.appendChild(fragment);
+
+    // Drop the records of our own writes, they are not changes of the page
+    state.flush();
+    state.boxes = boxes;
+    state.view = view;
+    state.dirty = false;
+    return { boxes, added, moved, removed, cached: false };
+}
+"""
+
+# Hides the overlays for screenshots of the bare page, the next annotation shows them again
+HIDE_ANNOTATIONS_JS = """
+() => {
+    const state = window.__cdAnnotator;
+    if (state) state.layer.style.display = 'none';
+}
+"""
+
+
+class PageAnnotator:
+    """
+    Numbers the interactive elements of a page and draws their boxes for
+    the vision LLM. annotate() returns the visible boxes with the number of
+    overlays added, moved and removed since the previous step, cached is
+    true when nothing on the page changed and no DOM work was done.
+    """
+    def __init__(self, selector: str = BOX_SELECTOR, incremental: bool = True):
+        self.selector = selector
+        self.incremental = incremental
+
+    def annotate(self, page) -> dict:
+        return page.evaluate(ANNOTATE_PAGE_JS, [self.selector, self.incremental])
+
+    async def aannotate(self, page) -> dict:
+        return await page.evaluate(ANNOTATE_PAGE_JS, [self.selector, self.incremental])
+
+    def hide(self, page):
+        page.evaluate(HIDE_ANNOTATIONS_JS)
+
+    async def ahide(self, page):
+        await page.evaluate(HIDE_ANNOTATIONS_JS)
+
+
+page_annotator = PageAnnotator(BOX_SELECTOR, incremental=ANNOTATION_INCREMENTAL)
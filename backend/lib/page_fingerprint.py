@@ -0,0 +1,70 @@
+import hashlib
+import io
+import json
+from collections import namedtuple
+from PIL import Image
+
+
+# Width and height of the dHash grid, the hash has HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 16
+
+# Identifies what a page looks like rather than where its screenshot was saved
+ScreenshotKey = namedtuple("ScreenshotKey", ["fingerprint", "phash"])
+
+
+def perceptual_hash(image) -> int:
+    """
+    Difference hash of a screenshot given as a path or PNG/JPEG bytes.
+
+    The image is shrunk to a (HASH_SIZE + 1) x HASH_SIZE grayscale grid and
+    each bit records whether a pixel is brighter than its right neighbour,
+    so re-renders of the same page land within a few bits of each other.
+    """
+    source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+    with Image.open(source) as img:
+        small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+        pixels = list(small.getdata())
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def box_fingerprint(boxes: list, grid: int = 8) -> str:
+    """
+    Stable digest of the annotated box list.
+
+    Box numbers, element kinds and labels must match exactly for a cached
+    decision to be reusable, positions are snapped to a grid so sub-pixel
+    layout differences don't matter.
+    """
+    normalized = [
+        [
+            box["box_number"],
+            box["tag"],
+            box.get("type"),
+            box.get("label"),
+            round(box["x"] / grid),
+            round(box["y"] / grid),
+            round(box["width"] / grid),
+            round(box["height"] / grid),
+        ]
+        for box in boxes
+    ]
+    return hashlib.sha1(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+
+def text_fingerprint(text: str) -> str:
+    """Digest of a page's visible text, used for pages without annotated boxes."""
+    normalized = " ".join(text.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def screenshot_key(image, fingerprint: str) -> ScreenshotKey:
+    return ScreenshotKey(fingerprint=fingerprint, phash=perceptual_hash(image))
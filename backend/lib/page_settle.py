@@ -0,0 +1,217 @@
+import asyncio
+import time
+from collections import namedtuple
+from playwright.sync_api import Page, Error as PlaywrightError
+from playwright.async_api import Page as AsyncPage, Error as AsyncPlaywrightError
+from lib.page_fingerprint import perceptual_hash, hamming_distance
+
+
+# Records when the DOM last changed, ignoring the annotation overlays we
+# add ourselves. Installed as an init script so it survives navigations.
+DOM_MONITOR_JS = """
+(() => {
+    if (window.__cdSettle) return;
+    const state = window.__cdSettle = { lastMutation: performance.now() };
+    const ours = (node) => node && node.nodeType === 1 && (node.id === '__cd_box_overlays' || node.closest?.('#__cd_box_overlays'));
+    const start = () => {
+        new MutationObserver((mutations) => {
+            for (const m of mutations) {
+                if (ours(m.target) || (m.type === 'attributes' && m.attributeName === 'data-box-number')) continue;
+                if (m.type === 'childList' && [...m.addedNodes, ...m.removedNodes].every(ours)) continue;
+                state.lastMutation = performance.now();
+                return;
+            }
+        }).observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+    };
+    if (document.documentElement) start();
+    else document.addEventListener('readystatechange', start, { once: true });
+})()
+"""
+
+DOM_STATE_JS = """
+() => ({
+    sinceMutationMs: window.__cdSettle ? performance.now() - window.__cdSettle.lastMutation : null,
+    readyState: document.readyState,
+})
+"""
+
+SettleResult = namedtuple("SettleResult", ["settled", "settle_ms", "reason", "checks"])
+
+
+class SettleTracker:
+    """
+    Signals shared by the sync and async settlers.
+
+    Network and navigation activity comes from Playwright page events, DOM
+    activity from DOM_MONITOR_JS. The page is settled once every signal has
+    been quiet for quiet_ms since the wait started and two consecutive
+    screenshots match.
+    """
+    def __init__(self, quiet_ms: float, long_request_ms: float, visual_max_distance: int):
+        self.quiet_ms = quiet_ms
+        self.long_request_ms = long_request_ms
+        self.visual_max_distance = visual_max_distance
+        self.inflight = {}
+        self.last_activity = 0.0
+        self.last_navigation = 0.0
+
+    def attach(self, page):
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_request_done)
+        page.on("requestfailed", self._on_request_done)
+        page.on("framenavigated", lambda frame: self._on_navigated(page, frame))
+
+    def _on_request(self, request):
+        self.inflight[request] = time.monotonic()
+        self.last_activity = time.monotonic()
+
+    def _on_request_done(self, request):
+        self.inflight.pop(request, None)
+        self.last_activity = time.monotonic()
+
+    def _on_navigated(self, page, frame):
+        if frame == page.main_frame:
+            self.last_navigation = time.monotonic()
+
+    def network_quiet(self, now: float, since: float) -> bool:
+        # Long polls and streams never finish, they don't count after long_request_ms
+        pending = [started for started in self.inflight.values() if (now - started) * 1000 < self.long_request_ms]
+        return not pending and (now - max(since, self.last_activity)) * 1000 >= self.quiet_ms
+
+    def navigation_quiet(self, now: float, since: float, dom_state: dict) -> bool:
+        return dom_state["readyState"] != "loading" and (now - max(since, self.last_navigation)) * 1000 >= self.quiet_ms
+
+    def dom_quiet(self, now: float, since: float, dom_state: dict) -> bool:
+        elapsed_ms = (now - since) * 1000
+        return min(dom_state["sinceMutationMs"], elapsed_ms) >= self.quiet_ms
+
+    def visually_stable(self, previous: int, current: int) -> bool:
+        return previous is not None and hamming_distance(previous, current) <= self.visual_max_distance
+
+
+class PageSettler:
+    """Waits until a page stops changing instead of sleeping for a fixed time."""
+    def __init__(self, page: Page, timeout_s: float = 5, quiet_ms: float = 300, poll_ms: float = 50,
+                 long_request_ms: float = 2000, visual_max_distance: int = 0):
+        self.page = page
+        self.timeout_s = timeout_s
+        self.poll_ms = poll_ms
+        self.tracker = SettleTracker(quiet_ms, long_request_ms, visual_max_distance)
+        self.tracker.attach(page)
+        page.add_init_script(DOM_MONITOR_JS)
+        self._install_monitor()
+
+    def _install_monitor(self):
+        try:
+            self.page.evaluate(DOM_MONITOR_JS)
+        except PlaywrightError:
+            # Document is navigating, the init script takes over
+            pass
+
+    def _dom_state(self):
+        try:
+            return self.page.evaluate(DOM_STATE_JS)
+        except PlaywrightError:
+            return None
+
+    def _frame_hash(self):
+        try:
+            return perceptual_hash(self.page.screenshot(type="jpeg", quality=40))
+        except PlaywrightError:
+            return None
+
+    def wait(self) -> SettleResult:
+        started = time.monotonic()
+        deadline = started + self.timeout_s
+        previous_frame = None
+        checks = 0
+        while True:
+            checks += 1
+            now = time.monotonic()
+            dom_state = self._dom_state()
+            if dom_state is not None and dom_state["sinceMutationMs"] is None:
+                # New document loaded before the init script was registered
+                self._install_monitor()
+                dom_state["sinceMutationMs"] = 0
+            quiet = (
+                dom_state is not None
+                and self.tracker.network_quiet(now, started)
+                and self.tracker.navigation_quiet(now, started, dom_state)
+                and self.tracker.dom_quiet(now, started, dom_state)
+            )
+            if quiet:
+                frame = self._frame_hash()
+                if frame is not None and self.tracker.visually_stable(previous_frame, frame):
+                    return SettleResult(True, round((time.monotonic() - started) * 1000), "settled", checks)
+                previous_frame = frame
+            else:
+                previous_frame = None
+
+            if time.monotonic() >= deadline:
+                return SettleResult(False, round((time.monotonic() - started) * 1000), "timeout", checks)
+            self.page.wait_for_timeout(self.poll_ms)
+
+
+class AsyncPageSettler:
+    """asyncio version of PageSettler."""
+    def __init__(self, page: AsyncPage, timeout_s: float = 5, quiet_ms: float = 300, poll_ms: float = 50,
+                 long_request_ms: float = 2000, visual_max_distance: int = 0):
+        self.page = page
+        self.timeout_s = timeout_s
+        self.poll_ms = poll_ms
+        self.tracker = SettleTracker(quiet_ms, long_request_ms, visual_max_distance)
+        self.tracker.attach(page)
+
+    async def install(self):
+        await self.page.add_init_script(DOM_MONITOR_JS)
+        await self._install_monitor()
+
+    async def _install_monitor(self):
+        try:
+            await self.page.evaluate(DOM_MONITOR_JS)
+        except AsyncPlaywrightError:
+            pass
+
+    async def _dom_state(self):
+        try:
+            return await self.page.evaluate(DOM_STATE_JS)
+        except AsyncPlaywrightError:
+            return None
+
+    async def _frame_hash(self):
+        try:
+            frame = await self.page.screenshot(type="jpeg", quality=40)
+        except AsyncPlaywrightError:
+            return None
+        # Decoding the frame is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(perceptual_hash, frame)
+
+    async def wait(self) -> SettleResult:
+        started = time.monotonic()
+        deadline = started + self.timeout_s
+        previous_frame = None
+        checks = 0
+        while True:
+            checks += 1
+            now = time.monotonic()
+            dom_state = await self._dom_state()
+            if dom_state is not None and dom_state["sinceMutationMs"] is None:
+                await self._install_monitor()
+                dom_state["sinceMutationMs"] = 0
+            quiet = (
+                dom_state is not None
+                and self.tracker.network_quiet(now, started)
+                and self.tracker.navigation_quiet(now, started, dom_state)
+                and self.tracker.dom_quiet(now, started, dom_state)
+            )
+            if quiet:
+                frame = await self._frame_hash()
+                if frame is not None and self.tracker.visually_stable(previous_frame, frame):
+                    return SettleResult(True, round((time.monotonic() - started) * 1000), "settled", checks)
+                previous_frame = frame
+            else:
+                previous_frame = None
+
+            if time.monotonic() >= deadline:
+                return SettleResult(False, round((time.monotonic() - started) * 1000), "timeout", checks)
+            await self.page.wait_for_timeout(self.poll_ms)
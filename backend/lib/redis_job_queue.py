@@ -0,0 +1,271 @@
+import os
+import socket
+import threading
+import time
+import redis
+from lib.job_queue import JobExists, QueueFull
+
+GROUP = "workers"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisJobQueue:
+    """
+    Job queue shared by worker processes on any number of hosts, same
+    interface as PersistentJobQueue.
+
+    Jobs are entries of a Redis stream read through a consumer group, one
+    stream for priority > 0 and one for the rest, the first is always read
+    first. A claimed entry stays pending until the job completes, workers
+    reset its idle time on every heartbeat, so an entry idle for longer than
+    the visibility timeout belongs to a crashed or stuck worker and is
+    claimed again by the next free one. Entries delivered more than
+    max_deliveries times are handed out flagged as exhausted. A sorted set
+    of queued ids gives queue positions and lets queued jobs be cancelled,
+    running ones are cancelled through a flag the owner sees on its next
+    heartbeat. claim() blocks on the streams for up to block_ms, 0 makes it
+    return at once and idle workers poll instead.
+    """
+    def __init__(self, redis_client, consumer: str = None, prefix: str = "jobs", visibility_timeout_s: float = 60,
+                 max_deliveries: int = 3, block_ms: int = 1000):
+        self.redis = redis_client
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.prefix = prefix
+        self.streams = (f"{prefix}:stream:high", f"{prefix}:stream:normal")
+        self.queued_key = f"{prefix}:queued"
+        self.running_key = f"{prefix}:running"
+        self.workers_key = f"{prefix}:workers"
+        self.visibility_timeout_ms = int(visibility_timeout_s * 1000)
+        self.max_deliveries = max_deliveries
+        self.block_ms = block_ms
+        self.poll_interval_s = 0 if block_ms else 0.05
+        # query_id -> (stream, entry id) of the jobs this process is running
+        self._claimed = {}
+        self._lock = threading.Lock()
+        self._groups_ready = False
+
+    def _ensure_groups(self):
+        if self._groups_ready:
+            return
+        for stream in self.streams:
+            if self.redis.exists(stream) and any(_text(group["name"]) == GROUP for group in self.redis.xinfo_groups(stream)):
+                continue
+            try:
+                self.redis.xgroup_create(stream, GROUP, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._groups_ready = True
+
+    def _stream_for(self, priority: int) -> str:
+        return self.streams[0] if priority > 0 else self.streams[1]
+
+    @staticmethod
+    def _score(priority: int, enqueued_at: float) -> float:
+        # Higher priority first, then oldest first
+        return -priority * 1e10 + enqueued_at
+
+    def _add(self, pipe, query_id: str, priority: int, timeout_s: float, enqueued_at: float):
+        pipe.zadd(self.queued_key, {query_id: self._score(priority, enqueued_at)})
+        pipe.xadd(self._stream_for(priority), {
+            "query_id": query_id,
+            "priority": priority,
+            "timeout_s": timeout_s if timeout_s is not None else "",
+            "enqueued_at": enqueued_at,
+        })
+
+    def put(self, query_id: str, priority: int = 0, timeout_s: float = None, max_size: int = None) -> int:
+        """Enqueues a job and returns its 1-based position in the queue, raises JobExists for a job that is already in it."""
+        self._ensure_groups()
+        # The checks are best effort across several producers
+        if max_size is not None and self.redis.zcard(self.queued_key) >= max_size:
+            raise QueueFull(f"Job queue is full ({max_size} pending jobs)")
+        if self.redis.zscore(self.queued_key, query_id) is not None or self.redis.hexists(self.running_key, query_id):
+            raise JobExists(f"Job {query_id} is already queued or running")
+        pipe = self.redis.pipeline()
+        self._add(pipe, query_id, priority, timeout_s, time.time())
+        pipe.execute()
+        return self.position(query_id)
+
+    def _job(self, stream: str, entry_id: bytes, fields: dict, deliveries: int = 1) -> dict:
+        query_id = fields[b"query_id"].decode()
+        if deliveries == 1 and not self.redis.zrem(self.queued_key, query_id):
+            # Cancelled while queued
+            self._ack(stream, entry_id)
+            return None
+        with self._lock:
+            self._claimed[query_id] = (stream, entry_id)
+        self.redis.hset(self.running_key, query_id, self.consumer)
+        timeout_s = fields.get(b"timeout_s", b"").decode()
+        return {
+            "query_id": query_id,
+            "priority": int(fields[b"priority"]),
+            "timeout_s": float(timeout_s) if timeout_s else None,
+            "deliveries": deliveries,
+            "exhausted": deliveries > self.max_deliveries,
+        }
+
+    def _reclaim(self) -> dict:
+        for stream in self.streams:
+            # Redis 7 adds the deleted ids as a third element
+            entries = self.redis.xautoclaim(stream, GROUP, self.consumer, min_idle_time=self.visibility_timeout_ms, count=1)[1]
+            for entry_id, fields in entries:
+                pending = self.redis.xpending_range(stream, GROUP, entry_id, entry_id, 1)
+                deliveries = pending[0]["times_delivered"] if pending else self.max_deliveries + 1
+                job = self._job(stream, entry_id, fields, deliveries=max(deliveries, 2))
+                if job is not None:
+                    return job
+        return None
+
+    def claim(self) -> dict:
+        """
+        Next job for this consumer, a reclaimed one from a dead worker first,
+        then high before normal priority. Blocks up to block_ms, None if
+        nothing came.
+        """
+        self._ensure_groups()
+        job = self._reclaim()
+        if job is not None:
+            return job
+
+        for stream in self.streams:
+            response = self.redis.xreadgroup(GROUP, self.consumer, {stream: ">"}, count=1)
+            if response:
+                (entry_id, fields), = response[0][1]
+                return self._job(stream, entry_id, fields)
+
+        response = self.redis.xreadgroup(GROUP, self.consumer, {stream: ">" for stream in self.streams}, count=1, block=self.block_ms or None)
+        job = None
+        for stream, entries in response or []:
+            for entry_id, fields in entries:
+                if job is None:
+                    job = self._job(stream.decode(), entry_id, fields)
+                else:
+                    # Both streams answered, the second entry goes back for another worker
+                    self._requeue_entry(stream.decode(), entry_id, fields)
+        return job
+
+    def _ack(self, stream: str, entry_id):
+        pipe = self.redis.pipeline()
+        pipe.xack(stream, GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        pipe.execute()
+
+    def _requeue_entry(self, stream: str, entry_id, fields: dict):
+        query_id = fields[b"query_id"].decode()
+        timeout_s = fields.get(b"timeout_s", b"").decode()
+        pipe = self.redis.pipeline()
+        self._add(pipe, query_id, int(fields[b"priority"]), float(timeout_s) if timeout_s else None, float(fields[b"enqueued_at"]))
+        pipe.xack(stream, GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        pipe.hdel(self.running_key, query_id)
+        pipe.execute()
+
+    def complete(self, query_id: str):
+        with self._lock:
+            claimed = self._claimed.pop(query_id, None)
+        if claimed is None:
+            return
+        stream, entry_id = claimed
+        pipe = self.redis.pipeline()
+        pipe.xack(stream, GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        pipe.hdel(self.running_key, query_id)
+        pipe.delete(self.cancel_key(query_id))
+        pipe.execute()
+
+    def requeue(self, query_id: str):
+        """Puts a job this process claimed back in the queue, e.g. when draining."""
+        with self._lock:
+            claimed = self._claimed.pop(query_id, None)
+        if claimed is None:
+            return
+        stream, entry_id = claimed
+        entries = self.redis.xrange(stream, entry_id, entry_id)
+        if entries:
+            self._requeue_entry(stream, entry_id, entries[0][1])
+
+    def remove_queued(self, query_id: str) -> bool:
+        """Drops a job that has not started yet, its stream entry is skipped when claimed."""
+        return self.redis.zrem(self.queued_key, query_id) > 0
+
+    def position(self, query_id: str) -> int:
+        """1-based position among queued jobs, 0 if running and None if unknown."""
+        pipe = self.redis.pipeline()
+        pipe.zrank(self.queued_key, query_id)
+        pipe.hexists(self.running_key, query_id)
+        rank, running = pipe.execute()
+        if rank is not None:
+            return rank + 1
+        return 0 if running else None
+
+    def size(self) -> int:
+        return self.redis.zcard(self.queued_key)
+
+    def recover(self) -> list[str]:
+        """Requeues jobs left pending under this consumer name by a previous run of the same worker."""
+        self._ensure_groups()
+        recovered = []
+        for stream in self.streams:
+            response = self.redis.xreadgroup(GROUP, self.consumer, {stream: "0"})
+            for entry_id, fields in (response[0][1] if response else []):
+                if fields:
+                    self._requeue_entry(stream, entry_id, fields)
+                    recovered.append(fields[b"query_id"].decode())
+                else:
+                    # Deleted entry still in the pending list
+                    self.redis.xack(stream, GROUP, entry_id)
+        return recovered
+
+    def cancel_key(self, query_id: str) -> str:
+        return f"{self.prefix}:cancel:{query_id}"
+
+    def request_cancel(self, query_id: str) -> bool:
+        """Flags a running job for cancellation by whichever worker runs it, False if none does."""
+        if not self.redis.hexists(self.running_key, query_id):
+            return False
+        self.redis.set(self.cancel_key(query_id), 1, ex=3600)
+        return True
+
+    def heartbeat(self, info: dict, ttl_s: float) -> list[str]:
+        """
+        Advertises this worker (capacity, running jobs, state) for ttl_s,
+        resets the idle time of its claimed entries so they aren't reclaimed
+        and returns the ids of its jobs that have been asked to cancel.
+        """
+        with self._lock:
+            claimed = dict(self._claimed)
+        now = time.time()
+        pipe = self.redis.pipeline()
+        key = f"{self.workers_key}:{self.consumer}"
+        pipe.hset(key, mapping={name: str(value) for name, value in info.items()})
+        pipe.expire(key, int(ttl_s) + 1)
+        pipe.zadd(self.workers_key, {self.consumer: now})
+        pipe.zremrangebyscore(self.workers_key, "-inf", now - ttl_s)
+        for stream, entry_id in claimed.values():
+            pipe.xclaim(stream, GROUP, self.consumer, 0, [entry_id], justid=True)
+        query_ids = list(claimed)
+        if query_ids:
+            pipe.mget([self.cancel_key(query_id) for query_id in query_ids])
+        results = pipe.execute()
+        if not query_ids:
+            return []
+        return [query_id for query_id, flag in zip(query_ids, results[-1]) if flag]
+
+    def remove_worker(self):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.workers_key, self.consumer)
+        pipe.delete(f"{self.workers_key}:{self.consumer}")
+        pipe.execute()
+
+    def workers(self) -> list[dict]:
+        """Live workers and what they advertised in their last heartbeat."""
+        workers = []
+        for consumer in self.redis.zrange(self.workers_key, 0, -1):
+            info = self.redis.hgetall(f"{self.workers_key}:{consumer.decode()}")
+            if info:
+                workers.append({key.decode(): value.decode() for key, value in info.items()})
+        return workers
@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from PIL import Image
+from lib.page_fingerprint import perceptual_hash
+from lib.tracing import tracer
+from config import SCREENSHOT_FORMAT, SCREENSHOT_QUALITY, SCREENSHOT_MAX_WIDTH, SCREENSHOT_MAX_HEIGHT, SCREENSHOT_PERSIST, SCREENSHOT_DIR
+
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class Screenshot:
+    """
+    One captured frame, encoded once in memory.
+
+    The same bytes back the SSE payload, the LLM request and the cache key,
+    base64 and the perceptual hash are computed on first use and reused.
+    """
+    def __init__(self, data: bytes, format: str, path: str = None):
+        self.data = data
+        self.format = format
+        self.path = path
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+    @cached_property
+    def base64(self) -> str:
+        with tracer.span("base64_encode", bytes=len(self.data)):
+            return base64.b64encode(self.data).decode("utf-8")
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @cached_property
+    def phash(self) -> int:
+        return perceptual_hash(self.data)
+
+
+class ScreenshotPipeline:
+    """
+    Captures screenshots to bytes, optionally downscaled to fit
+    max_width x max_height and re-encoded as JPEG or WebP.
+
+    When Playwright can produce the final encoding itself (JPEG at the
+    viewport size) it does, otherwise the PNG capture is resized and
+    encoded with Pillow. Copies on disk are optional and written on a
+    background thread.
+    """
+    def __init__(self, format: str = "jpeg", quality: int = 80, max_width: int = None, max_height: int = None,
+                 persist_dir: str = None):
+        if format not in MIME_TYPES:
+            raise ValueError(f"Unsupported screenshot format: {format}")
+        self.format = format
+        self.quality = quality
+        self.max_width = max_width
+        self.max_height = max_height
+        self.persist_dir = persist_dir
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot-writer") if persist_dir else None
+
+    def _fits(self, viewport: dict) -> bool:
+        if viewport is None:
+            return False
+        return (not self.max_width or viewport["width"] <= self.max_width) and \
+            (not self.max_height or viewport["height"] <= self.max_height)
+
+    def _native_options(self, page) -> dict:
+        """Screenshot options for Playwright to encode directly, None if Pillow has to."""
+        if not self._fits(page.viewport_size):
+            return None
+        if self.format == "png":
+            return {"type": "png"}
+        if self.format == "jpeg":
+            return {"type": "jpeg", "quality": self.quality}
+        return None
+
+    def encode(self, png: bytes) -> bytes:
+        """Downscales a PNG capture to fit the max size and encodes it in the configured format."""
+        with tracer.span("image_encode", format=self.format):
+            with Image.open(io.BytesIO(png)) as img:
+                if self.max_width or self.max_height:
+                    img.thumbnail((self.max_width or img.width, self.max_height or img.height), Image.Resampling.LANCZOS)
+                out = io.BytesIO()
+                if self.format == "jpeg":
+                    img.convert("RGB").save(out, "JPEG", quality=self.quality, optimize=True)
+                elif self.format == "webp":
+                    img.save(out, "WEBP", quality=self.quality, method=4)
+                else:
+                    img.save(out, "PNG", optimize=False)
+                return out.getvalue()
+
+    def _persist(self, data: bytes, name: str) -> str:
+        if self._writer is None:
+            return None
+        path = os.path.join(self.persist_dir, f"{name}.{'jpg' if self.format == 'jpeg' else self.format}")
+
+        def write():
+            os.makedirs(self.persist_dir, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+
+        self._writer.submit(write)
+        return path
+
+    def capture(self, page, name: str) -> Screenshot:
+        native = self._native_options(page)
+        with tracer.span("screenshot"):
+            data = page.screenshot(full_page=False, **(native or {"type": "png"}))
+        if native is None:
+            data = self.encode(data)
+        return Screenshot(data, self.format, path=self._persist(data, name))
+
+    async def acapture(self, page, name: str) -> Screenshot:
+        native = self._native_options(page)
+        with tracer.span("screenshot"):
+            data = await page.screenshot(full_page=False, **(native or {"type": "png"}))
+        if native is None:
+            # Encoding is CPU bound, keep it off the event loop
+            data = await asyncio.to_thread(self.encode, data)
+        return Screenshot(data, self.format, path=self._persist(data, name))
+
+
+screenshot_pipeline = ScreenshotPipeline(
+    format=SCREENSHOT_FORMAT,
+    quality=SCREENSHOT_QUALITY,
+    max_width=SCREENSHOT_MAX_WIDTH,
+    max_height=SCREENSHOT_MAX_HEIGHT,
+    persist_dir=SCREENSHOT_DIR if SCREENSHOT_PERSIST else None,
+)
@@ -0,0 +1,334 @@
+import copy
+import math
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import quote, quote_plus, urlparse, parse_qsl
+
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from how i in is it me my of on or please the this to what which with
+""".split())
+
+WORD_RE = re.compile(r"\w+(?:['&.-]\w+)*")
+QUOTED_RE = re.compile(r"[\"'‘“]([^\"'’”]+)[\"'’”]")
+URL_RE = re.compile(r"https?://\S+")
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def content_words(normalized_query: str) -> set:
+    return {word for word in normalized_query.split() if word not in STOPWORDS}
+
+
+class HashingEmbedder:
+    """
+    Stateless local embedding, word unigrams, word bigrams and character
+    trigrams hashed into a fixed number of dimensions.
+
+    Returns a sparse, L2 normalised {dimension: weight} mapping so the
+    index can score by dot product.
+    """
+    def __init__(self, dimensions: int = 2**18, bigram_weight: float = 0.5, char_weight: float = 0.3):
+        self.dimensions = dimensions
+        self.bigram_weight = bigram_weight
+        self.char_weight = char_weight
+
+    def _bucket(self, feature: str) -> int:
+        return zlib.crc32(feature.encode("utf-8")) % self.dimensions
+
+    def __call__(self, text: str) -> dict:
+        words = [word for word in normalize_query(text).split() if word not in STOPWORDS]
+        features = {}
+
+        def add(feature, weight):
+            bucket = self._bucket(feature)
+            features[bucket] = features.get(bucket, 0.0) + weight
+
+        for word in words:
+            add(f"w:{word}", 1.0)
+            padded = f"#{word}#"
+            for idx in range(len(padded) - 2):
+                add(f"c:{padded[idx:idx + 3]}", self.char_weight)
+        for first, second in zip(words, words[1:]):
+            add(f"b:{first} {second}", self.bigram_weight)
+
+        norm = math.sqrt(sum(weight * weight for weight in features.values()))
+        if norm == 0:
+            return {}
+        return {bucket: weight / norm for bucket, weight in features.items()}
+
+
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+}
+
+
+class VectorIndex:
+    """
+    Inverted index over sparse unit vectors with LRU eviction.
+
+    search() only touches the postings of dimensions the query actually
+    has, so lookups stay cheap as long as queries are short.
+    """
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._vectors: OrderedDict = OrderedDict()
+        self._postings: dict = {}
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def __contains__(self, key: str):
+        return key in self._vectors
+
+    def add(self, key: str, vector: dict):
+        self.remove(key)
+        self._vectors[key] = vector
+        for dimension, weight in vector.items():
+            self._postings.setdefault(dimension, {})[key] = weight
+        while len(self._vectors) > self.max_entries:
+            oldest = next(iter(self._vectors))
+            self.remove(oldest)
+            self.evictions += 1
+
+    def remove(self, key: str):
+        vector = self._vectors.pop(key, None)
+        if vector is None:
+            return
+        for dimension in vector:
+            posting = self._postings.get(dimension)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[dimension]
+
+    def touch(self, key: str):
+        if key in self._vectors:
+            self._vectors.move_to_end(key)
+
+    def search(self, vector: dict, k: int = 5) -> list:
+        """Returns up to k (key, cosine similarity) pairs, best first."""
+        scores = {}
+        for dimension, weight in vector.items():
+            for key, other in self._postings.get(dimension, {}).items():
+                scores[key] = scores.get(key, 0.0) + weight * other
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class PlanTemplate:
+    """
+    A cached plan with the query values it copies, its "slots".
+
+    A slot is a span of the query that the plan quotes verbatim or passes
+    as a URL parameter, typically a search term. Queries that only differ
+    in those spans can reuse the plan with the new values filled in, any
+    other content word that differs may change what the plan has to do.
+    """
+    def __init__(self, query: str, plan: dict):
+        self.query = query
+        self.plan = plan
+        self.normalized_query = normalize_query(query)
+        self.numbers = set(NUMBER_RE.findall(self.normalized_query))
+        self.slots = self._find_slots()
+        self.pattern = self._compile_pattern()
+        self.words = content_words(self.normalized_query)
+        self.slot_words = content_words(" ".join(self.slot_values()))
+
+    def _plan_strings(self) -> list:
+        strings = []
+
+        def walk(value):
+            if isinstance(value, str):
+                strings.append(value)
+            elif isinstance(value, list):
+                for item in value:
+                    walk(item)
+            elif isinstance(value, dict):
+                for item in value.values():
+                    walk(item)
+
+        walk({k: v for k, v in self.plan.items() if k not in ("query", "query_id")})
+        return strings
+
+    def _find_slots(self) -> list:
+        carriers = set()
+        for text in self._plan_strings():
+            carriers.update(normalize_query(value) for value in QUOTED_RE.findall(text))
+            for url in URL_RE.findall(text):
+                carriers.update(normalize_query(value) for _, value in parse_qsl(urlparse(url).query))
+
+        words = self.normalized_query.split()
+        taken = [False] * len(words)
+        slots = []
+        # Longest spans first so "green frontier capital" wins over "capital"
+        for length in range(len(words), 0, -1):
+            for start in range(len(words) - length + 1):
+                span = words[start:start + length]
+                if any(taken[start:start + length]) or all(word in STOPWORDS for word in span):
+                    continue
+                if " ".join(span) in carriers:
+                    slots.append((start, length))
+                    taken[start:start + length] = [True] * length
+        return sorted(slots)
+
+    def _compile_pattern(self):
+        if not self.slots:
+            return None
+        words = self.normalized_query.split()
+        parts = []
+        fixed = []
+        cursor = 0
+        for start, length in self.slots:
+            fixed.extend(words[cursor:start])
+            parts.extend(re.escape(word) for word in words[cursor:start])
+            parts.append("(.+?)")
+            cursor = start + length
+        fixed.extend(words[cursor:])
+        parts.extend(re.escape(word) for word in words[cursor:])
+        # A template that is all slot would match any query
+        if all(word in STOPWORDS for word in fixed):
+            return None
+        return re.compile(" ".join(parts))
+
+    def slot_values(self) -> list:
+        words = self.normalized_query.split()
+        return [" ".join(words[start:start + length]) for start, length in self.slots]
+
+    def unslotted_changes(self, normalized_query: str, values: tuple = ()) -> set:
+        """
+        Content words that differ between the query and the template's
+        query outside the slots. values are the query's own slot values
+        when it fills the template.
+        """
+        changed = self.words ^ content_words(normalized_query)
+        return changed - self.slot_words - content_words(" ".join(values))
+
+    def covers(self, normalized_query: str) -> bool:
+        """True if the plan can be reused as is: its slot values and numbers appear in the query and no other content word differs."""
+        padded = f" {normalized_query} "
+        if set(NUMBER_RE.findall(normalized_query)) != self.numbers:
+            return False
+        if not all(f" {value} " in padded for value in self.slot_values()):
+            return False
+        return not self.unslotted_changes(normalized_query)
+
+    def fill(self, normalized_query: str):
+        """Returns a copy of the plan with the query's slot values substituted, or None if the query doesn't fit."""
+        if self.pattern is None:
+            return None
+        match = self.pattern.fullmatch(normalized_query)
+        if match is None or self.unslotted_changes(normalized_query, match.groups()):
+            return None
+        replacements = list(zip(self.slot_values(), match.groups()))
+
+        def replace(text: str, old: str, new: str) -> str:
+            return re.sub(re.escape(old), lambda _: new, text, flags=re.IGNORECASE)
+
+        def substitute(text: str) -> str:
+            # URLs carry slot values encoded, everything else verbatim
+            pieces = []
+            cursor = 0
+            for url in URL_RE.finditer(text):
+                pieces.append((text[cursor:url.start()], False))
+                pieces.append((url.group(), True))
+                cursor = url.end()
+            pieces.append((text[cursor:], False))
+
+            result = []
+            for piece, is_url in pieces:
+                for old, new in replacements:
+                    if is_url:
+                        for encode in (quote_plus, quote):
+                            piece = replace(piece, encode(old), encode(new))
+                    else:
+                        piece = replace(piece, old, new)
+                result.append(piece)
+            return "".join(result)
+
+        def walk(value):
+            if isinstance(value, str):
+                return substitute(value)
+            if isinstance(value, list):
+                return [walk(item) for item in value]
+            if isinstance(value, dict):
+                return {k: walk(v) for k, v in value.items()}
+            return value
+
+        return walk(copy.deepcopy(self.plan))
+
+
+class SemanticPlanCache:
+    """
+    Similarity lookup of cached action plans.
+
+    A query hits when its nearest neighbour is above the threshold, the
+    neighbour's slot values all appear in it and the two share every other
+    content word ("semantic" hit, word order and stopwords may differ), or
+    when it fits one of the nearest templates with different slot values
+    ("template" hit, the plan is returned with the new values filled in).
+    A query that differs from its neighbour in a word the plan doesn't
+    carry as a slot, say a destination mentioned in plain text, misses.
+    """
+    def __init__(self, embed=None, threshold: float = 0.8, max_entries: int = 1000, candidates: int = 8):
+        self.embed = embed or HashingEmbedder()
+        self.threshold = threshold
+        self.candidates = candidates
+        self.index = VectorIndex(max_entries=max_entries)
+        self._templates: dict = {}
+        self._lock = threading.Lock()
+        self._stats = {"semantic_hits": 0, "template_hits": 0, "misses": 0, "lookup_ms_total": 0.0}
+
+    def add(self, query: str, plan: dict):
+        template = PlanTemplate(query, plan)
+        vector = self.embed(template.normalized_query)
+        with self._lock:
+            self.index.add(template.normalized_query, vector)
+            self._templates[template.normalized_query] = template
+            # Drop templates the index evicted
+            if len(self._templates) > len(self.index):
+                for key in [key for key in self._templates if key not in self.index]:
+                    del self._templates[key]
+
+    def lookup(self, query: str):
+        """Returns (plan, kind, similarity) for a hit, None otherwise. The plan is a copy."""
+        started = time.perf_counter()
+        normalized = normalize_query(query)
+        vector = self.embed(normalized)
+        result = None
+        with self._lock:
+            neighbours = self.index.search(vector, k=self.candidates)
+            for key, similarity in neighbours:
+                template = self._templates[key]
+                if similarity >= self.threshold and template.covers(normalized):
+                    result = (copy.deepcopy(template.plan), "semantic", similarity)
+                    break
+            if result is None:
+                for key, similarity in neighbours:
+                    filled = self._templates[key].fill(normalized)
+                    if filled is not None:
+                        result = (filled, "template", similarity)
+                        break
+            if result is not None:
+                self.index.touch(key)
+                self._stats[f"{result[1]}_hits"] += 1
+            else:
+                self._stats["misses"] += 1
+            self._stats["lookup_ms_total"] += (time.perf_counter() - started) * 1000
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self.index)
+            stats["evictions"] = self.index.evictions
+        lookups = stats["semantic_hits"] + stats["template_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["semantic_hits"] + stats["template_hits"]) / lookups, 3) if lookups else 0.0
+        stats["lookup_ms_avg"] = round(stats.pop("lookup_ms_total") / lookups, 3) if lookups else 0.0
+        return stats
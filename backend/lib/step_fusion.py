@@ -0,0 +1,133 @@
+import re
+import threading
+from collections import namedtuple
+from urllib.parse import urldefrag
+from lib.action_resolver import SUBMIT_RE
+from lib.tracing import tracer
+from config import STEP_FUSION_ENABLED, STEP_FUSION_MAX_STEPS, STEP_FUSION_MAX_DOM_CHANGE
+
+# Steps that edit the page in place, filling, ticking or picking an option,
+# and the words that mean a step probably leaves the page
+IN_PAGE_RE = re.compile(
+    r"^\W*(type|enter|fill|input|write|check|uncheck|tick|untick|choose|clear|set)\b"
+    r"|\bselect\b.+\b(from|in)\b.+\b(dropdown|drop-down|list|menu|options?)\b",
+    re.IGNORECASE,
+)
+LEAVES_PAGE_RE = re.compile(r"\b(click|tap|press|submit|open|go to|navigate|follow|search for)\b", re.IGNORECASE)
+
+# What a plan made from a screenshot relies on: the page's URL and its
+# annotated elements, filled in values aren't part of an element's label
+PageState = namedtuple("PageState", ["url", "elements"])
+
+
+def keeps_page(step: str) -> bool:
+    """Whether a plan step likely leaves the page where it was, so the next step sees the same screenshot."""
+    return bool(IN_PAGE_RE.search(step)) and not LEAVES_PAGE_RE.search(step) and not SUBMIT_RE.search(step)
+
+
+def page_state(url: str, boxes: list) -> PageState:
+    elements = frozenset((box["box_number"], box["tag"], box.get("type"), box.get("label")) for box in boxes)
+    return PageState(urldefrag(url or "")[0], elements)
+
+
+class FusedSteps:
+    """The browser steps of one fused group and the actions planned for them."""
+    def __init__(self, steps: list):
+        self.steps = steps
+        self.planned = {}
+        self.state = None
+
+    def remaining(self, step_idx: int) -> list:
+        return [(idx, action) for idx, action in self.steps if idx >= step_idx]
+
+
+class StepFusionPlanner:
+    """
+    Plans runs of consecutive browser steps from one screenshot.
+
+    A step that keeps the page (typing into a field, ticking a box) is
+    grouped with the steps after it, up to max_steps, and the vision agent
+    returns the actions of every step of the group in one request. Each
+    step's actions are only used while the page still looks like it did
+    when they were planned, after a navigation, a change of more than
+    max_dom_change of the annotated elements or a planned box that is
+    gone, the rest of the group is planned again from a fresh screenshot.
+    """
+    def __init__(self, enabled: bool = True, max_steps: int = 4, max_dom_change: float = 0.2):
+        self.enabled = enabled and max_steps > 1
+        self.max_steps = max_steps
+        self.max_dom_change = max_dom_change
+        self._stats = {"groups": 0, "fused_steps": 0, "plans": 0, "planned_steps": 0, "steps_from_plan": 0, "replans": {}}
+        self._lock = threading.Lock()
+
+    def plan(self, groups: list) -> list:
+        """
+        (extraction, steps, fused) per group of group_steps() output, in
+        order. Browser steps stay one per entry, the steps of a fused group
+        share its FusedSteps, fused is None for steps planned on their own.
+        """
+        runs = []
+        for extraction, steps in groups:
+            previous = runs[-1] if runs else None
+            if (self.enabled and not extraction and previous is not None and not previous[0]
+                    and len(previous[1]) < self.max_steps and keeps_page(previous[1][-1][1])):
+                previous[1].extend(steps)
+            else:
+                runs.append((extraction, list(steps)))
+
+        planned = []
+        for extraction, steps in runs:
+            if extraction:
+                planned.append((True, steps, None))
+                continue
+            fused = FusedSteps(steps) if len(steps) > 1 else None
+            if fused is not None:
+                with self._lock:
+                    self._stats["groups"] += 1
+                    self._stats["fused_steps"] += len(steps)
+            planned.extend((False, [step], fused) for step in steps)
+        return planned
+
+    def changed(self, before: PageState, after: PageState) -> str:
+        """Why actions planned on before don't hold on after, None if they do."""
+        if before.url != after.url:
+            return "navigation"
+        union = before.elements | after.elements
+        if union and len(before.elements ^ after.elements) / len(union) > self.max_dom_change:
+            return "dom_change"
+        return None
+
+    def actions(self, fused: FusedSteps, step_idx: int, url: str, boxes: list) -> list:
+        """The step's planned actions, None when the group has to be planned (again) first."""
+        actions = fused.planned.get(step_idx)
+        if actions is None:
+            return None
+        reason = self.changed(fused.state, page_state(url, boxes))
+        numbers = {box["box_number"] for box in boxes}
+        if reason is None and any(action.get("box_click") is not None and action["box_click"] not in numbers for action in actions):
+            reason = "missing_box"
+        if reason is not None:
+            fused.planned.clear()
+            tracer.count("step_fusion_replans_total", reason=reason)
+            with self._lock:
+                self._stats["replans"][reason] = self._stats["replans"].get(reason, 0) + 1
+            return None
+        with self._lock:
+            self._stats["steps_from_plan"] += 1
+        return fused.planned.pop(step_idx)
+
+    def store(self, fused: FusedSteps, steps: list, results: list, url: str, boxes: list) -> list:
+        """Keeps the actions planned for steps on the current page, returns the first step's."""
+        fused.planned = {step_idx: actions for (step_idx, _), actions in zip(steps, results)}
+        fused.state = page_state(url, boxes)
+        with self._lock:
+            self._stats["plans"] += 1
+            self._stats["planned_steps"] += len(steps)
+        return fused.planned.pop(steps[0][0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "max_steps": self.max_steps, **self._stats, "replans": dict(self._stats["replans"])}
+
+
+step_fusion = StepFusionPlanner(STEP_FUSION_ENABLED, max_steps=STEP_FUSION_MAX_STEPS, max_dom_change=STEP_FUSION_MAX_DOM_CHANGE)
@@ -0,0 +1,106 @@
+import asyncio
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import VISION_EXTRACTION_PARALLEL, VISION_EXTRACTION_CONCURRENCY
+
+
+def group_steps(steps: list, vision_only: list, batch_size: int = 1) -> list:
+    """
+    Splits plan steps into (extraction, [(step_idx, action), ...]) groups in
+    plan order. Vision only steps don't change the page, so consecutive
+    ones see the same screenshot and up to batch_size of them share a group.
+    """
+    groups = []
+    for step_idx, action in enumerate(steps):
+        extraction = action in vision_only
+        if extraction and groups and groups[-1][0] and len(groups[-1][1]) < batch_size:
+            groups[-1][1].append((step_idx, action))
+        else:
+            groups.append((extraction, [(step_idx, action)]))
+    return groups
+
+
+class ExtractionScheduler:
+    """
+    Extraction LLM calls of one query, running next to its browser steps.
+
+    Once an extraction group's screenshot is taken the browser moves on to
+    the next steps while the call runs on the executor. collect() waits for
+    the calls and returns their results in plan order. Without an executor
+    each call runs inline when submitted, like the sequential loop.
+    """
+    def __init__(self, executor: ThreadPoolExecutor = None):
+        self.executor = executor
+        self._pending = []
+
+    def submit(self, steps: list, fn, *args):
+        if self.executor is None:
+            future = Future()
+            future.set_result(fn(*args))
+        else:
+            # Spans of the call still land on the query's trace
+            future = self.executor.submit(contextvars.copy_context().run, fn, *args)
+        self._pending.append((steps, future))
+
+    def collect(self):
+        """Yields (steps, results) per group in plan order, raises the first failed call's error."""
+        for steps, future in self._pending:
+            yield steps, future.result()
+        self._pending = []
+
+    def settle(self) -> list:
+        """(steps, results) of the calls that succeed, after a failed step. Failed calls are dropped."""
+        settled = []
+        for steps, future in self._pending:
+            try:
+                settled.append((steps, future.result()))
+            except Exception:
+                continue
+        self._pending = []
+        return settled
+
+    def cancel(self):
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+
+
+class AsyncExtractionScheduler:
+    """ExtractionScheduler for the asyncio mode, calls run as tasks on the job's loop."""
+    def __init__(self, parallel: bool = True):
+        self.parallel = parallel
+        self._pending = []
+
+    async def submit(self, steps: list, coro):
+        if self.parallel:
+            task = asyncio.create_task(coro)
+        else:
+            task = asyncio.get_running_loop().create_future()
+            task.set_result(await coro)
+        self._pending.append((steps, task))
+
+    async def collect(self) -> list:
+        results = [(steps, await task) for steps, task in self._pending]
+        self._pending = []
+        return results
+
+    async def settle(self) -> list:
+        settled = []
+        for steps, task in self._pending:
+            try:
+                settled.append((steps, await task))
+            except Exception:
+                continue
+        self._pending = []
+        return settled
+
+    def cancel(self):
+        for _, task in self._pending:
+            task.cancel()
+        self._pending = []
+
+
+# Shared by every worker thread, bounds the extraction calls in flight
+extraction_executor = ThreadPoolExecutor(
+    max_workers=VISION_EXTRACTION_CONCURRENCY, thread_name_prefix="vision-extraction"
+) if VISION_EXTRACTION_PARALLEL else None
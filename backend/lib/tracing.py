@@ -0,0 +1,292 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from config import TRACING_ENABLED, TRACE_RETENTION, METRICS_SUMMARY_SAMPLES
+
+
+class _NoopSpan:
+    """Returned by span() while tracing is disabled, so call sites cost one attribute lookup."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and latency summaries rendered in the Prometheus text
+    format.
+
+    Summaries keep a count, a sum and the last max_samples observations,
+    p50/p95/p99 are computed from those samples at scrape time.
+    """
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, prefix: str = "cd", max_samples: int = 1024):
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self._counters: dict = {}
+        self._gauges: dict = {}
+        self._summaries: dict = {}
+        self._help: dict = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name: str, labels: dict = None, value: float = 1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: dict = None):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, labels: dict = None):
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {"count": 0, "sum": 0.0, "samples": deque(maxlen=self.max_samples)}
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["samples"].append(value)
+
+    def quantiles(self, name: str, labels: dict = None) -> dict:
+        with self._lock:
+            summary = self._summaries.get(self._key(name, labels))
+            samples = sorted(summary["samples"]) if summary else []
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in self.QUANTILES}
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            summaries = {key: (s["count"], s["sum"], sorted(s["samples"])) for key, s in self._summaries.items()}
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            metric = f"{self.prefix}_{name}"
+            if metric not in seen:
+                seen.add(metric)
+                if name in self._help:
+                    lines.append(f"# HELP {metric} {self._help[name]}")
+                lines.append(f"# TYPE {metric} {kind}")
+            return metric
+
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in sorted(values.items()):
+                metric = header(name, kind)
+                lines.append(f"{metric}{self._labels(labels)} {value}")
+        for (name, labels), (count, total, samples) in sorted(summaries.items()):
+            metric = header(name, "summary")
+            for q in self.QUANTILES:
+                value = samples[min(len(samples) - 1, int(q * len(samples)))]
+                lines.append(f"{metric}{self._labels(labels, (('quantile', q),))} {value:.6f}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class QueryTrace:
+    """Spans recorded for one query, in the order they finished, and its LLM calls by kind."""
+    def __init__(self, query_id: str):
+        self.query_id = query_id
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.step_idx = None
+        self.spans = []
+        self.status = "running"
+        self.duration_ms = None
+        self.llm_calls = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, duration: float, attrs: dict, error: str):
+        span = {
+            "name": name,
+            "step_idx": self.step_idx,
+            "start_ms": round((started - self.started) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+        }
+        if attrs:
+            span["attrs"] = attrs
+        if error:
+            span["error"] = error
+        with self._lock:
+            self.spans.append(span)
+            if name == "llm_call":
+                kind = (attrs or {}).get("kind") or (attrs or {}).get("agent") or "other"
+                self.llm_calls[kind] = self.llm_calls.get(kind, 0) + 1
+
+    def timeline(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+            llm_calls = dict(self.llm_calls)
+        return {
+            "query_id": self.query_id,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "llm_calls": {"total": sum(llm_calls.values()), "by_kind": llm_calls},
+            "spans": spans,
+        }
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "started")
+
+    def __init__(self, tracer, name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._record(self, time.perf_counter() - self.started, exc_type.__name__ if exc_type else None)
+        return False
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+class Tracer:
+    """
+    Spans tied to the query running in the current thread or task.
+
+    Every span feeds the span_duration_seconds summary, spans inside a
+    trace() block are also kept on that query's timeline. Finished
+    timelines stay in memory (the last `retention`) and are written next
+    to the job file.
+    """
+    def __init__(self, enabled: bool = True, retention: int = 200, timeline_dir: str = "./jobs", max_samples: int = 1024):
+        self.enabled = enabled
+        self.retention = retention
+        self.timeline_dir = timeline_dir
+        self.metrics = MetricsRegistry(max_samples=max_samples)
+        self.metrics.describe("span_duration_seconds", "Duration of pipeline stages")
+        self.metrics.describe("span_errors_total", "Pipeline stages that raised")
+        self.metrics.describe("query_duration_seconds", "End to end query duration")
+        self.metrics.describe("queries_total", "Finished queries by status")
+        self.metrics.describe("query_llm_calls", "LLM calls made by one query")
+        self._active: dict = {}
+        self._finished: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def set_step(self, step_idx: int):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.step_idx = step_idx
+
+    def set_status(self, status: str):
+        """Overrides the current query's final status, for failures handled inside the query."""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.status = status
+
+    def count(self, name: str, **labels):
+        if self.enabled:
+            self.metrics.inc(name, labels)
+
+    def _record(self, span: Span, duration: float, error: str):
+        self.metrics.observe("span_duration_seconds", duration, {"span": span.name})
+        if error:
+            self.metrics.inc("span_errors_total", {"span": span.name})
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(span.name, span.started, duration, span.attrs, error)
+
+    @contextmanager
+    def trace(self, query_id: str):
+        """Collects the spans of one query, use around the whole query."""
+        if not self.enabled:
+            yield None
+            return
+        trace = QueryTrace(query_id)
+        token = _current_trace.set(trace)
+        with self._lock:
+            self._active[query_id] = trace
+        try:
+            yield trace
+            if trace.status == "running":
+                trace.status = "done"
+        except BaseException as e:
+            trace.status = type(e).__name__
+            raise
+        finally:
+            _current_trace.reset(token)
+            duration = time.perf_counter() - trace.started
+            trace.duration_ms = round(duration * 1000, 2)
+            self.metrics.observe("query_duration_seconds", duration)
+            self.metrics.inc("queries_total", {"status": trace.status})
+            self.metrics.observe("query_llm_calls", sum(trace.llm_calls.values()))
+            with self._lock:
+                self._active.pop(query_id, None)
+                self._finished[query_id] = trace
+                while len(self._finished) > self.retention:
+                    self._finished.popitem(last=False)
+            self._write_timeline(trace)
+
+    def _write_timeline(self, trace: QueryTrace):
+        try:
+            with open(os.path.join(self.timeline_dir, f"{trace.query_id}.trace.json"), "w") as f:
+                json.dump(trace.timeline(), f)
+        except OSError:
+            pass
+
+    def timeline(self, query_id: str) -> dict:
+        if os.path.basename(query_id) != query_id:
+            return None
+        with self._lock:
+            trace = self._active.get(query_id) or self._finished.get(query_id)
+        if trace is not None:
+            return trace.timeline()
+        try:
+            with open(os.path.join(self.timeline_dir, f"{query_id}.trace.json"), "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def render_metrics(self) -> str:
+        return self.metrics.render()
+
+
+tracer = Tracer(enabled=TRACING_ENABLED, retention=TRACE_RETENTION, max_samples=METRICS_SUMMARY_SAMPLES)
@@ -1,65 +1,253 @@
-from flask import Flask, jsonify, request, Response
-from flask_sse import sse
-import json
 import threading
-from service.query_processor import query_processor_service
+from flask import Blueprint, Flask, jsonify, request, Response
+from flask_sse import sse
+from lib.job_queue import JobExists, QueueFull
+from lib.job_repository import ACTIVE_STATUSES, job_repository
 from lib.utils import generate_query_id
-from datetime import datetime
+from lib.cache import cache_stats
+from lib.tracing import tracer
+from lib.event_stream import event_stream, IMAGE_MIME_TYPES
+from lib.logging import log
+from lib.load_profiles import load_profiles
+from lib.checkpoints import checkpoints
+from config import EXECUTION_MODE, REDIS_URL, JOBS_PAGE_MAX_LIMIT, JOB_QUEUE_BACKEND, PREWARM_ENABLED
 from flask_cors import CORS
 
 
-app = Flask(__name__)
+api = Blueprint("api", __name__)
+
+
+def create_app(start_workers: bool = True) -> Flask:
+    """
+    Builds the API app. The job scheduler, browser pools, LLM gateway and
+    agents aren't imported here, the local job workers (unless jobs go to
+    worker.py processes over Redis) import them and prewarm on a background
+    thread while requests are already served, the handlers on first use.
+    """
+    app = Flask(__name__)
+
+    # Enable CORS
+    CORS(app, resources={
+        r"/stream": {"origins": "http://localhost:3000"},
+        r"/stream/*": {"origins": "http://localhost:3000"},
+        r"/screenshots/*": {"origins": "http://localhost:3000"},
+        r"/interact": {"origins": "http://localhost:3000"},
+        r"/jobs*": {"origins": "http://localhost:3000"},
+        r"/": {"origins": "http://localhost:3000"}
+    })
+
+    app.config["REDIS_URL"] = REDIS_URL
+    # Global broadcast channel, job events go to the per query streams below
+    app.register_blueprint(sse, url_prefix='/stream')
+    app.register_blueprint(api)
+
+    # Bounded worker pool draining the persistent job queue. With the Redis
+    # queue the app only enqueues and streams, worker.py processes run the jobs
+    if start_workers and JOB_QUEUE_BACKEND != "redis":
+        threading.Thread(target=start_job_workers, args=(app,), name="job-scheduler-start", daemon=True).start()
+    return app
 
-# Enable CORS
-CORS(app, resources={
-    r"/stream": {"origins": "http://localhost:3000"},
-    r"/interact": {"origins": "http://localhost:3000"},
-    r"/": {"origins": "http://localhost:3000"}
-})
 
-app.config["REDIS_URL"] = "redis://localhost:6379"
-app.register_blueprint(sse, url_prefix='/stream')
+def start_job_workers(app):
+    from service.job_scheduler import job_scheduler, prewarm
+    # Queued jobs wait until the browsers and LLM connections are warm
+    if PREWARM_ENABLED:
+        prewarm()
+    job_scheduler.start(app)
 
-@app.route('/')
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # main.app for `gunicorn main:app`, built on first access
+    global _app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
+def browser_pool_stats() -> dict:
+    if EXECUTION_MODE == "asyncio":
+        from lib.async_browser_interactor import async_browser_pool
+        return async_browser_pool.stats()
+    from lib.browser_interactor import browser_pool
+    return browser_pool.stats()
+
+@api.route('/')
 def health():
     return jsonify({"status": "ok"})
 
-@app.route('/push')
+@api.route('/stats')
+def stats():
+    from service.job_scheduler import job_scheduler
+    from lib.action_resolver import action_resolver
+    from lib.step_fusion import step_fusion
+    from lib.llm_gateway import llm_gateway
+    from agents.action_plan_generator_agent import action_plan_generator
+    return jsonify({
+        "execution_mode": EXECUTION_MODE,
+        "browser_pool": browser_pool_stats(),
+        "job_scheduler": job_scheduler.stats(),
+        "jobs": job_repository.counts(),
+        "caches": cache_stats(),
+        "semantic_plan_cache": action_plan_generator.semantic_cache.stats() if action_plan_generator.semantic_cache else None,
+        "event_stream": event_stream.stats(),
+        "action_resolver": action_resolver.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "logging": log.stats(),
+        "load_profiles": load_profiles.stats(),
+        "step_fusion": step_fusion.stats(),
+        "checkpoints": checkpoints.stats(),
+    })
+
+@api.route('/metrics')
+def metrics():
+    from service.job_scheduler import job_scheduler
+    # Point in time gauges are refreshed on every scrape
+    scheduler_stats = job_scheduler.stats()
+    workers = scheduler_stats.get("workers")
+    if workers is not None:
+        tracer.metrics.set_gauge("job_workers", len(workers))
+        tracer.metrics.set_gauge("job_worker_free_slots", sum(int(worker["free"]) for worker in workers))
+        tracer.metrics.set_gauge("jobs_running", sum(int(worker["running"]) for worker in workers))
+    else:
+        tracer.metrics.set_gauge("jobs_running", len(scheduler_stats["running"]))
+    tracer.metrics.set_gauge("jobs_queued", scheduler_stats["queued"])
+    for name, value in browser_pool_stats().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            tracer.metrics.set_gauge(f"browser_pool_{name}", value)
+    return Response(tracer.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@api.route('/traces/<query_id>')
+def trace_timeline(query_id):
+    timeline = tracer.timeline(query_id)
+    if timeline is None:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(timeline)
+
+@api.route('/stream/<query_id>')
+def stream_query(query_id):
+    # EventSource sends Last-Event-ID on reconnect, the query param is for fresh connections
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if event_stream.finished(query_id, last_event_id):
+        # 204 tells EventSource to stop reconnecting
+        return Response(status=204)
+    return Response(
+        event_stream.subscribe(query_id, last_event_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api.route('/screenshots/<digest>.<ext>')
+def screenshot(digest, ext):
+    if ext not in IMAGE_MIME_TYPES:
+        return jsonify({"error": "Screenshot not found"}), 404
+    if request.headers.get("If-None-Match") == f'"{digest}"':
+        return Response(status=304)
+    data = event_stream.images.get(digest)
+    if data is None:
+        return jsonify({"error": "Screenshot not found"}), 404
+    response = Response(data, mimetype=IMAGE_MIME_TYPES[ext])
+    # Content addressed, the bytes behind a URL never change
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.headers["ETag"] = f'"{digest}"'
+    return response
+
+@api.route('/push')
 def publish_hello():
     sse.publish({"message": "Hello!"})
     return "Message sent!"
 
-@app.route('/interact', methods=['POST'])
+@api.route('/interact', methods=['POST'])
 def interact():
-    data = request.get_json()
+    from service.job_scheduler import job_scheduler
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
     query = data.get('query')
     query_id = data.get('query_id')
+    timeout = data.get('timeout')
+    load_profile = data.get('load_profile')
+    try:
+        priority = int(data.get('priority', 0))
+        timeout_s = float(timeout) if timeout else None
+        if timeout_s is not None and not timeout_s > 0:
+            raise ValueError(timeout)
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer and timeout a positive number"}), 400
     
     if not query:
         return jsonify({"error": "Query is required"}), 400
+
+    if load_profile and load_profile not in load_profiles.profiles:
+        return jsonify({"error": f"Unknown load_profile, expected one of {sorted(load_profiles.profiles)}"}), 400
         
     if not query_id:
         query_id = generate_query_id()
+
+    # A query_id is only reused once its job has finished
+    existing = job_repository.get(query_id)
+    if existing is not None and existing["status"] in ACTIVE_STATUSES:
+        return jsonify({"error": "Job is already queued or running", "query_id": query_id, "status": existing["status"]}), 409
     
-    # Save query to file
-    query_data = {
-        "query": query,
-        "query_id": query_id,
-        "status": "pending",
-        "result": None,
-        "created_at": datetime.now().isoformat()
-    }
-    
-    with open(f"./jobs/{query_id}.json", "w") as f:
-        json.dump(query_data, f)
-    
-    with app.app_context():
-        sse.publish({"message": "Processing query...", "query_data": query_data})
-    
-    # Start processing in background
-    threading.Thread(target=query_processor_service.process_query, args=(query_id, app,)).start()
+    options = {"load_profile": load_profile} if load_profile else None
+    # Queued for the worker pool in the same transaction, a job the saturated
+    # queue rejects with 429 isn't recorded and a reused one keeps its history
+    try:
+        query_data = job_repository.create(query_id, query, priority=priority, options=options,
+                                           enqueue=lambda: job_scheduler.submit(query_id, priority=priority, timeout_s=timeout_s))
+    except QueueFull as e:
+        response = jsonify({"error": str(e), "query_id": query_id, "status": "rejected"})
+        response.headers["Retry-After"] = "30"
+        return response, 429
+    except JobExists:
+        query_data = None
+    if query_data is None:
+        return jsonify({"error": "Job is already queued or running", "query_id": query_id}), 409
+    position = job_scheduler.position(query_id)
+
+    event_stream.publish(query_id, {"message": "Processing query...", "query_data": query_data, "queue_position": position})
     
     return jsonify({
         "query_id": query_id,
-        "status": "processing"
+        "status": "queued",
+        "queue_position": position
+    }), 202
+
+@api.route('/jobs')
+def list_jobs():
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), JOBS_PAGE_MAX_LIMIT)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    jobs, total = job_repository.list_jobs(status=request.args.get("status"), limit=limit, offset=offset)
+    return jsonify({
+        "jobs": jobs,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if offset + limit < total else None,
     })
+
+@api.route('/jobs/<query_id>')
+def get_job(query_id):
+    from service.job_scheduler import job_scheduler
+    job = job_repository.get(query_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    job["queue_position"] = job_scheduler.position(query_id)
+    job["steps"] = job_repository.steps(query_id)
+    return jsonify(job)
+
+@api.route('/interact/<query_id>', methods=['DELETE'])
+def cancel_interact(query_id):
+    from service.job_scheduler import job_scheduler
+    status = job_scheduler.cancel(query_id)
+    if status is None:
+        return jsonify({"error": "Job is not queued or running", "query_id": query_id}), 404
+    return jsonify({"query_id": query_id, "status": status})
@@ -0,0 +1,363 @@
+import asyncio
+import inspect
+import time
+from playwright.async_api import Page
+from playwright_stealth import stealth_async
+from lib.async_browser_interactor import AsyncBrowserInteractor, async_browser_pool
+from lib.async_runner import async_runner
+from lib.job_context import JobCancelled, check_cancelled, current_job, set_current_job
+from lib.screenshot_pipeline import screenshot_pipeline
+from agents.browser_action_generator_agent import browser_action_generator
+from agents.action_plan_generator_agent import action_plan_generator
+from lib.page_fingerprint import box_fingerprint, text_fingerprint
+from lib.page_settle import AsyncPageSettler
+from lib.logging import log
+from lib.llm_gateway import llm_gateway
+from lib.tracing import tracer
+from lib.job_repository import job_repository
+from lib.action_trace import RESOLVE_ELEMENTS_JS, TraceRecorder, action_trace_store
+from lib.action_resolver import action_resolver, element_outline
+from lib.action_stream import StreamedActions, normalize_actions
+from lib.step_scheduler import AsyncExtractionScheduler, group_steps
+from lib.step_fusion import FusedSteps, step_fusion
+from lib.checkpoints import StepFailed, checkpoints
+from service.query_processor import QueryProcessorService, BOX_SELECTOR, PAGE_TEXT_JS
+from lib.page_annotator import page_annotator
+from lib.load_profiles import load_profiles
+from config import ASYNC_MAX_CONCURRENT_JOBS
+from config import VISION_EXTRACTION_PARALLEL, VISION_EXTRACTION_BATCH_SIZE, STREAM_PAGE_ACTIONS
+from config import PAGE_SETTLE_TIMEOUT_S, PAGE_SETTLE_QUIET_MS, PAGE_SETTLE_VISUAL_MAX_DISTANCE
+
+
+class AsyncQueryProcessorService(QueryProcessorService):
+    """
+    asyncio version of QueryProcessorService.
+
+    Browser I/O goes through playwright.async_api and LLM calls through the
+    async OpenAI client, so while one job waits on either the event loop
+    keeps driving the others. The job database, caches and image decoding
+    block, they run on threads (asyncio.to_thread) so the loop never waits
+    on disk or a write lock.
+    """
+    def __init__(self, openai, max_concurrent_jobs: int):
+        super().__init__(openai=openai)
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._job_slots: asyncio.Semaphore = None
+
+    async def anotify(self, query_id, json, app=None, screenshot=None):
+        # Publishing talks to Redis synchronously, keep it off the event loop
+        if app is not None:
+            await asyncio.to_thread(self.notify, query_id, json, app, screenshot)
+
+    async def generate_action_plan(self, user_query, query_id):
+        with tracer.span("plan_generation"):
+            plan = await action_plan_generator.agenerate_action_plan(user_query=user_query, query_id=query_id)
+        return plan
+
+    async def annotate_page(self, page: Page):
+        # Number the visible elements and draw their overlays in one call,
+        # only the boxes that changed since the previous step are redrawn
+        with tracer.span("annotation") as span:
+            result = await page_annotator.aannotate(page)
+            boxes = result.pop("boxes")
+            span.set(boxes=len(boxes), **result)
+        return boxes
+
+    async def draw_bounding_box_and_screenshot(self, page: Page, query_id: str, step_idx: int):
+        boxes = await self.annotate_page(page)
+
+        # Take screenshot
+        screenshot = await screenshot_pipeline.acapture(page, name=f"{query_id}_{step_idx}")
+        return screenshot, boxes
+
+    async def screenshot_vision_only(self, page: Page, query_id: str, step_idx: int):
+        # Stop any further loading
+        await page.evaluate("window.stop()")
+        # Extractions read the page itself, not the previous step's boxes
+        await page_annotator.ahide(page)
+        screenshot = await screenshot_pipeline.acapture(page, name=f"{query_id}_{step_idx}")
+        fingerprint = text_fingerprint(await page.evaluate(PAGE_TEXT_JS))
+        return screenshot, fingerprint
+
+    async def generate_browser_action_on_page(self, screenshot, action, fingerprint):
+        actions = await browser_action_generator.agenerate_page_actions(screenshot, action, fingerprint)
+        return actions
+
+    async def generate_outline_action_on_page(self, boxes, action):
+        try:
+            result = await browser_action_generator.agenerate_outline_actions(element_outline(boxes), action, box_fingerprint(boxes))
+        except ValueError as e:
+            log.warning("Outline action generation failed", {"error": str(e)})
+            return None
+        return action_resolver.accept_text(result, boxes)
+
+    async def resolve_fused_actions(self, page: Page, query_id: str, step_idx: int, boxes: list, fused: FusedSteps, app) -> list:
+        actions = step_fusion.actions(fused, step_idx, page.url, boxes)
+        if actions is not None:
+            return actions
+        steps = fused.remaining(step_idx)
+        if len(steps) < 2:
+            return None
+        screenshot = await screenshot_pipeline.acapture(page, name=f"{query_id}_{step_idx}")
+        await self.anotify(query_id, {"message": f"Screenshot taken for {len(steps)} fused steps"}, app=app, screenshot=screenshot)
+        results = await browser_action_generator.agenerate_fused_page_actions(screenshot, [step for _, step in steps], box_fingerprint(boxes))
+        return step_fusion.store(fused, steps, results, page.url, boxes)
+
+    async def resolve_vision_actions(self, page: Page, query_id: str, step_idx: int, action: str, boxes: list, app):
+        screenshot = await screenshot_pipeline.acapture(page, name=f"{query_id}_{step_idx}")
+        log.debug("Screenshot saved", {"query_id": query_id, "path": screenshot.path})
+        await self.anotify(query_id, {"message": f"Screenshot taken for browser action"}, app=app, screenshot=screenshot)
+        if STREAM_PAGE_ACTIONS:
+            return browser_action_generator.astream_page_actions(screenshot, action, box_fingerprint(boxes))
+        return normalize_actions(await self.generate_browser_action_on_page(screenshot=screenshot, action=action, fingerprint=box_fingerprint(boxes)))
+
+    async def resolve_page_actions(self, page: Page, query_id: str, step_idx: int, action: str, boxes: list, app, fused: FusedSteps = None) -> StreamedActions:
+        started = time.perf_counter()
+        with tracer.span("action_resolve") as span:
+            for tier, resolve in self.page_action_tiers(page, query_id, step_idx, action, boxes, app, fused):
+                # The deterministic tier doesn't touch the page or the LLM
+                actions = resolve()
+                if inspect.isawaitable(actions):
+                    actions = await actions
+                if actions is not None:
+                    break
+            span.set(tier=tier)
+        return StreamedActions(actions, tier, started)
+
+    async def generate_vision_only_action_on_page(self, screenshot, actions, fingerprint):
+        return await browser_action_generator.agenerate_vision_only_batch(screenshot, actions, fingerprint)
+
+    async def act_on_box(self, page: Page, action: str):
+        box_number_to_act_on = action["box_click"]
+        selector = f'[data-box-number="{box_number_to_act_on}"]'
+        element = await page.query_selector(selector)
+        if element:
+            await self.act_on_element(element, action, label=f"box number {box_number_to_act_on}")
+
+    async def act_on_element(self, element, action: dict, label: str):
+        tag = await element.evaluate("el => el.tagName.toLowerCase()")
+        input_type = await element.evaluate("el => el.type?.toLowerCase()") if tag == "input" else None
+
+        if tag == "button" or tag == "a" or (tag == "input" and input_type == "submit"):
+            await element.click()
+            log.debug("Clicked element", {"tag": tag, "target": label})
+        elif tag == "input" or tag == "textarea":
+            await element.fill(action["input_text"])
+            log.debug("Filled element", {"tag": tag, "target": label})
+
+    async def settler_for(self, page: Page) -> AsyncPageSettler:
+        settler = AsyncPageSettler(
+            page,
+            timeout_s=PAGE_SETTLE_TIMEOUT_S,
+            quiet_ms=PAGE_SETTLE_QUIET_MS,
+            visual_max_distance=PAGE_SETTLE_VISUAL_MAX_DISTANCE,
+        )
+        await settler.install()
+        return settler
+
+    async def wait_for_settle(self, settler: AsyncPageSettler):
+        # Wait for the page to react instead of sleeping for a fixed time
+        with tracer.span("settle_wait") as span:
+            settle = await settler.wait()
+            span.set(settled=settle.settled)
+        return settle
+
+    async def do_browser_actions(self, actions, page: Page, settler: AsyncPageSettler):
+        with tracer.span("action_execution") as span:
+            count = 0
+            async for action in actions:
+                await self.act_on_box(page, action=action)
+                count += 1
+            span.set(actions=count)
+        return await self.wait_for_settle(settler)
+
+    async def replay_step(self, page: Page, step: dict, settler: AsyncPageSettler):
+        with tracer.span("replay_resolve") as span:
+            results = await page.evaluate(RESOLVE_ELEMENTS_JS, action_trace_store.resolve_args(step, BOX_SELECTOR))
+            span.set(targets=len(results), resolved=sum(result is not None for result in results))
+        replay = action_trace_store.resolved_actions(step, results)
+        tracer.count("replay_steps_total", result="fallback" if replay is None else "replayed")
+        if replay is None:
+            return None
+
+        with tracer.span("action_execution", actions=len(replay), replayed=True):
+            for selector, action in replay:
+                element = await page.query_selector(selector)
+                if element:
+                    await self.act_on_element(element, action, label="recorded fingerprint")
+        return await self.wait_for_settle(settler)
+
+    async def execute_action_plan(self, plan, app, load_profile=None, resume=None):
+        query_id = plan["query_id"]
+        if query_id is None:
+            return None
+        last_actions = None
+        profile, context_options, url, start_step, step_results = self.plan_setup(plan, load_profile, resume)
+
+        await self.anotify(query_id, {"message": f"Executing action plan for query ID: {query_id}"}, app=app)
+
+        async with async_browser_pool.lease(**context_options) as context:
+            await load_profiles.ainstall(context, profile)
+            await self.anotify(query_id, {"message": f"Browser context leased", "load_profile": profile.name}, app=app)
+
+            page = None
+            extractions = None
+            try:
+                interactor = AsyncBrowserInteractor(context)
+                page = await interactor.new_page()
+                await stealth_async(page) # solve for captcha
+                settler = await self.settler_for(page)
+                log.debug("Created new page", {"query_id": query_id})
+                await self.anotify(query_id, {"message": f"New page created"}, app=app)
+                with tracer.span("navigation", load_profile=profile.name):
+                    await interactor.goto(page=page, url=url)
+
+                await self.anotify(query_id, {"message": f"Navigated to {url}"}, app=app)
+
+                # Steps recorded by an earlier successful run of the same plan
+                recorded_steps = await asyncio.to_thread(action_trace_store.lookup, plan) if action_trace_store else None
+                recorder = TraceRecorder()
+
+                # Vision only extractions run as tasks while the browser
+                # carries on with the next steps
+                extractions = AsyncExtractionScheduler(parallel=VISION_EXTRACTION_PARALLEL)
+
+                # Skipping first action since it's usually navigating to the goto url
+                # Browser steps that stay on one page are planned together
+                for extraction, steps, fused in step_fusion.plan(group_steps(plan["action_plan"][1:], plan["vision_only"], VISION_EXTRACTION_BATCH_SIZE)):
+                    check_cancelled()
+                    interactor.apply_deadline(page)
+                    step_idx, action = steps[0]
+                    if step_idx < start_step:
+                        continue
+                    tracer.set_step(step_idx)
+                    if checkpoints.enabled:
+                        storage_state = await context.storage_state() if checkpoints.keep_storage_state else None
+                        await asyncio.to_thread(checkpoints.save, query_id, step_idx, plan, page.url, storage_state)
+                    for idx, step_action in steps:
+                        log.info("Doing step", {"query_id": query_id, "step": idx, "action": step_action})
+                        await self.anotify(query_id, {"message": f"Doing step {idx}: {step_action}"}, app=app)
+
+                    # if the action is in the vision_only list, then we need to generate the vision only action
+                    if extraction:
+                        screenshot, fingerprint = await self.screenshot_vision_only(page=page, query_id=query_id, step_idx=step_idx)
+                        await self.anotify(query_id, {"message": f"Screenshot taken for vision only action"}, app=app, screenshot=screenshot)
+
+                        await extractions.submit(steps, self.generate_vision_only_action_on_page(screenshot, [action for _, action in steps], fingerprint))
+                        continue
+
+                    # Replay the recorded step while its elements still resolve
+                    step = action_trace_store.replayable(recorded_steps, step_idx, action) if recorded_steps else None
+                    settle = await self.replay_step(page, step, settler) if step else None
+                    if settle is not None:
+                        message = await asyncio.to_thread(self.record_replayed, query_id, step_idx, action, step, settle, recorder, step_results)
+                        await self.anotify(query_id, message, app=app)
+                        continue
+
+                    # draw bounding boxes, the screenshot is only taken if the fast tiers can't resolve the step
+                    boxes = await self.annotate_page(page)
+                    resolved = await self.resolve_page_actions(page, query_id, step_idx, action, boxes, app, fused=fused)
+                    step_results[step_idx] = resolved.actions
+
+                    # do browser interaction, streamed actions run as they are generated
+                    settle = await self.do_browser_actions(resolved, page, settler)
+                    for message in await asyncio.to_thread(self.record_resolved, query_id, step_idx, action, resolved, settle, boxes, recorder):
+                        await self.anotify(query_id, message, app=app)
+
+                # Merge the extraction results back in plan order
+                with tracer.span("extraction_wait"):
+                    for message in await asyncio.to_thread(self.record_extractions, query_id, await extractions.collect(), step_results):
+                        await self.anotify(query_id, message, app=app)
+
+                last_actions = await asyncio.to_thread(self.record_plan_done, plan, resume, recorder, recorded_steps, step_results)
+                await self.anotify(query_id, {"message": f"All actions done", "actions": last_actions}, app=app)
+
+            except JobCancelled:
+                raise
+            except Exception as e:
+                # A call cut short by the job's deadline ends it as timed out
+                check_cancelled()
+                settled = await extractions.settle() if checkpoints.enabled and extractions is not None else []
+                message, last_actions = await asyncio.to_thread(self.record_failure, query_id, e, settled, step_results)
+                await self.anotify(query_id, message, app=app)
+            finally:
+                if extractions is not None:
+                    extractions.cancel()
+                if page:
+                    await page.close()
+                    log.debug("Page closed", {"query_id": query_id})
+        return last_actions
+
+    async def run_action_plan(self, plan, app, load_profile=None, resume=None):
+        query_id = plan["query_id"]
+        attempts = checkpoints.attempts(query_id, resume)
+        while True:
+            try:
+                with attempts.cache():
+                    last_actions = await self.execute_action_plan(plan=plan, app=app, load_profile=load_profile, resume=attempts.resume)
+            except StepFailed as e:
+                await self.anotify(query_id, await asyncio.to_thread(attempts.failed, e), app=app)
+                if attempts.resume is None:
+                    return await asyncio.to_thread(attempts.last_actions)
+                continue
+
+            message = await asyncio.to_thread(attempts.unmet, plan)
+            if message is None:
+                return last_actions
+            await self.anotify(query_id, message, app=app)
+
+    async def process_query(self, query_id, app):
+        with tracer.trace(query_id):
+            try:
+                job = await asyncio.to_thread(job_repository.get, query_id)
+                if job is None:
+                    raise ValueError(f"Job {query_id} not found")
+                await asyncio.to_thread(job_repository.transition, query_id, "in_progress")
+
+                # A job that ran before carries on from its checkpoint
+                resume = await asyncio.to_thread(checkpoints.resume, query_id, "restarted")
+                if resume is not None:
+                    action_plan = resume["plan"]
+                    await self.anotify(query_id, {"message": f"Resuming from step {resume['step_idx']}", "action_plan": action_plan}, app=app)
+                else:
+                    # generate action plan
+                    action_plan = await self.generate_action_plan(user_query=job["query"], query_id=query_id)
+                    await self.anotify(query_id, {"message": f"Action plan generated for query ID: {query_id}", "action_plan": action_plan}, app=app)
+                check_cancelled()
+
+                # execute action plan
+                last_actions = await self.run_action_plan(plan=action_plan, app=app, load_profile=job["options"].get("load_profile"), resume=resume)
+                await asyncio.to_thread(checkpoints.clear, query_id)
+
+                await asyncio.to_thread(job_repository.transition, query_id, "done", result={"action_plan": action_plan, "actions": last_actions})
+                await self.anotify(query_id, {"message": f"Processing complete for query ID: {query_id}", "done": True}, app=app)
+
+            except JobCancelled:
+                raise
+            except Exception as e:
+                log.error("Error processing query", {"query_id": query_id, "error": str(e)})
+                tracer.set_status("error")
+                await asyncio.to_thread(job_repository.transition, query_id, "error", error=str(e))
+                await self.anotify(query_id, {"message": f"An error occurred: {e}", "status": "error", "done": True}, app=app)
+
+    async def _run_job(self, job, query_id, app):
+        # Semaphore is created lazily so it binds to the runner's loop
+        if self._job_slots is None:
+            self._job_slots = asyncio.Semaphore(self.max_concurrent_jobs)
+        async with self._job_slots:
+            set_current_job(job)
+            # The deadline holds even for a call that never returns, the job's
+            # task is cancelled and its lease and page closed on the way out
+            remaining = job.remaining() if job is not None else None
+            try:
+                await asyncio.wait_for(self.process_query(query_id, app), remaining)
+            except asyncio.TimeoutError:
+                job.cancel("timed_out")
+                raise JobCancelled(query_id, "timed_out")
+
+    def run_query(self, query_id, app):
+        """Runs process_query on the shared event loop and blocks until it is done."""
+        async_runner.run(self._run_job(current_job(), query_id, app))
+
+
+async_query_processor_service = AsyncQueryProcessorService(openai=llm_gateway, max_concurrent_jobs=ASYNC_MAX_CONCURRENT_JOBS)
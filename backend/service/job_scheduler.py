@@ -0,0 +1,346 @@
+import os
+import socket
+import threading
+import time
+import redis
+from lib.job_queue import PersistentJobQueue
+from lib.redis_job_queue import RedisJobQueue
+from lib.job_repository import JobRepository, job_repository
+from lib.job_context import JobContext, JobCancelled, set_current_job
+from lib.browser_interactor import browser_pool
+from lib.async_browser_interactor import async_browser_pool
+from lib.async_runner import async_runner
+from lib.event_stream import event_stream
+from lib.llm_gateway import llm_gateway
+from lib.logging import log
+from config import JOB_QUEUE_DB_PATH, JOB_WORKER_CONCURRENCY, JOB_QUEUE_MAX_SIZE, JOB_DEFAULT_TIMEOUT
+from config import JOB_RETENTION_DAYS, JOB_PURGE_INTERVAL_S
+from config import EXECUTION_MODE, ASYNC_MAX_CONCURRENT_JOBS, REDIS_URL
+from config import JOB_QUEUE_BACKEND, JOB_WORKER_ID, JOB_HEARTBEAT_S, JOB_VISIBILITY_TIMEOUT_S, JOB_MAX_DELIVERIES
+
+
+class JobScheduler:
+    """
+    Bounded pool of worker threads draining the persistent job queue.
+
+    Workers run the given job function (QueryProcessorService.process_query)
+    one job at a time, so at most `concurrency` queries execute at once no
+    matter how many are submitted. Cancellation is cooperative, the running
+    job observes it at its next check_cancelled() call. The timeout also
+    caps the job's LLM and Playwright calls (job_context.call_timeout), so a
+    hung call can't hold its worker past the deadline.
+
+    With a shared queue (RedisJobQueue) the scheduler is one of many
+    workers, heartbeat_s enables the heartbeat advertising its capacity and
+    keeping its claimed jobs from being redelivered, and drain() lets it
+    shut down without losing jobs.
+    """
+    def __init__(self, queue: PersistentJobQueue, run_job, concurrency: int, max_queue_size: int, default_timeout: float,
+                 bind_browser_driver: bool = True, jobs: JobRepository = job_repository, heartbeat_s: float = None):
+        self.queue = queue
+        self.jobs = jobs
+        self.run_job = run_job
+        self.concurrency = concurrency
+        self.bind_browser_driver = bind_browser_driver
+        self.max_queue_size = max_queue_size
+        self.default_timeout = default_timeout
+        self.heartbeat_s = heartbeat_s
+
+        self._app = None
+        self._workers: list[threading.Thread] = []
+        self._running: dict[str, JobContext] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._draining = False
+        self._stopped = threading.Event()
+
+    def start(self, app):
+        with self._condition:
+            if self._workers:
+                return
+            self._app = app
+            recovered = self.queue.recover()
+            if recovered:
+                log.info("Requeued interrupted jobs", {"query_ids": recovered})
+            for idx in range(self.concurrency):
+                worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{idx}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            threading.Thread(target=self._retention_loop, name="job-retention", daemon=True).start()
+            if self.heartbeat_s:
+                self._heartbeat()
+                threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    def submit(self, query_id: str, priority: int = 0, timeout_s: float = None) -> int:
+        """Queues a job and returns its queue position, raises QueueFull when saturated."""
+        position = self.queue.put(
+            query_id,
+            priority=priority,
+            timeout_s=timeout_s or self.default_timeout,
+            max_size=self.max_queue_size
+        )
+        with self._condition:
+            self._condition.notify()
+        return position
+
+    def cancel(self, query_id: str) -> str:
+        """Cancels a queued or running job, returns the resulting status or None if unknown."""
+        if self.queue.remove_queued(query_id):
+            self.jobs.transition(query_id, "cancelled", from_statuses=("pending",))
+            return "cancelled"
+        with self._condition:
+            job = self._running.get(query_id)
+        if job is not None:
+            job.cancel("cancelled")
+            return "cancelling"
+        # Running on another worker, which sees the request on its next heartbeat
+        request_cancel = getattr(self.queue, "request_cancel", None)
+        if request_cancel is not None and request_cancel(query_id):
+            return "cancelling"
+        return None
+
+    def position(self, query_id: str) -> int:
+        return self.queue.position(query_id)
+
+    def stats(self) -> dict:
+        with self._condition:
+            running = list(self._running)
+        stats = {
+            "concurrency": self.concurrency,
+            "running": running,
+            "queued": self.queue.size(),
+            "max_queue_size": self.max_queue_size,
+            "draining": self._draining,
+        }
+        if hasattr(self.queue, "workers"):
+            stats["workers"] = self.queue.workers()
+        return stats
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            for job in self._running.values():
+                job.cancel("cancelled")
+            self._condition.notify_all()
+        self._stopped.set()
+
+    def drain(self, timeout_s: float):
+        """
+        Stops taking jobs and waits up to timeout_s for the running ones,
+        jobs still running after that are put back in the queue.
+        """
+        deadline = time.monotonic() + timeout_s
+        with self._condition:
+            self._draining = True
+            self._condition.notify_all()
+            while self._running and time.monotonic() < deadline:
+                self._condition.wait(timeout=min(1.0, max(0.0, deadline - time.monotonic())))
+            for job in self._running.values():
+                job.cancel("requeued")
+            # Their workers requeue them as soon as they reach a cancellation point
+            while self._running and time.monotonic() < deadline + 30:
+                self._condition.wait(timeout=1)
+        self.stop()
+        if self.heartbeat_s:
+            self.queue.remove_worker()
+
+    def _next_job(self) -> dict:
+        while True:
+            with self._condition:
+                if self._stopping or self._draining:
+                    return None
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                # The queue's store is unreachable, keep the worker alive and retry
+                log.error("Job claim failed", {"error": str(e)})
+                job = None
+                self._stopped.wait(1)
+            if job is not None:
+                return job
+            with self._condition:
+                if self._stopping or self._draining:
+                    return None
+                # Poll as well, other processes may enqueue into the same store
+                if self.queue.poll_interval_s:
+                    self._condition.wait(timeout=self.queue.poll_interval_s)
+
+    def _notify(self, query_id: str, data: dict):
+        # Like QueryProcessorService.notify, without importing the service
+        if self._app is not None:
+            event_stream.publish(query_id, data)
+
+    def _worker_loop(self):
+        # Keep one Playwright driver per worker thread for the pool leases,
+        # asyncio mode jobs only wait here while the event loop does the work
+        if self.bind_browser_driver:
+            browser_pool.bind_thread()
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                self._run(job)
+        finally:
+            if self.bind_browser_driver:
+                browser_pool.release_thread()
+
+    def _run(self, job: dict):
+        query_id = job["query_id"]
+        if job.get("exhausted"):
+            # Its workers kept dying, most likely the job itself takes them down
+            log.error("Job abandoned", {"query_id": query_id, "deliveries": job["deliveries"]})
+            error = f"Abandoned after {job['deliveries'] - 1} worker failures"
+            self.jobs.transition(query_id, "error", error=error)
+            self._notify(query_id, {"message": error, "status": "error", "done": True})
+            self.queue.complete(query_id)
+            return
+        context = JobContext(query_id, timeout_s=job["timeout_s"])
+        with self._condition:
+            self._running[query_id] = context
+        set_current_job(context)
+        log.info("Job started", {"query_id": query_id, "priority": job["priority"], "deliveries": job.get("deliveries", 1)})
+        requeue = False
+        try:
+            self.run_job(query_id, self._app)
+        except JobCancelled as e:
+            log.info("Job stopped", {"query_id": query_id, "reason": e.reason})
+            if e.reason == "requeued":
+                # Draining, another worker resumes it from its last checkpoint
+                requeue = True
+                self.jobs.transition(query_id, "pending", from_statuses=("in_progress",))
+                self._notify(query_id, {"message": "Worker shutting down, job requeued"})
+            else:
+                self.jobs.transition(query_id, e.reason)
+                self._notify(query_id, {"message": str(e), "status": e.reason, "done": True})
+        except Exception as e:
+            log.error("Job failed", {"query_id": query_id, "error": str(e)})
+            self.jobs.transition(query_id, "error", error=str(e))
+        finally:
+            set_current_job(None)
+            if requeue:
+                self.queue.requeue(query_id)
+            else:
+                self.queue.complete(query_id)
+            with self._condition:
+                self._running.pop(query_id, None)
+                self._condition.notify_all()
+
+    def _heartbeat(self):
+        with self._condition:
+            running = dict(self._running)
+        cancelled = self.queue.heartbeat({
+            "worker_id": self.queue.consumer,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "capacity": self.concurrency,
+            "running": len(running),
+            "free": 0 if self._draining else self.concurrency - len(running),
+            "state": "draining" if self._draining else "active",
+            "heartbeat_at": time.time(),
+        }, ttl_s=self.heartbeat_s * 3)
+        for query_id in cancelled:
+            if query_id in running:
+                running[query_id].cancel("cancelled")
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(self.heartbeat_s):
+            try:
+                self._heartbeat()
+            except Exception as e:
+                log.error("Job heartbeat failed", {"error": str(e)})
+
+    def _retention_loop(self):
+        # Purges finished jobs past the retention period, at start and then every JOB_PURGE_INTERVAL_S
+        while True:
+            try:
+                purged = self.jobs.purge(JOB_RETENTION_DAYS * 86400)
+                if purged:
+                    log.info("Purged old jobs", {"count": purged})
+            except Exception as e:
+                log.error("Job purge failed", {"error": str(e)})
+            if self._stopped.wait(JOB_PURGE_INTERVAL_S):
+                return
+
+def create_job_queue():
+    if JOB_QUEUE_BACKEND == "redis":
+        return RedisJobQueue(
+            redis.StrictRedis.from_url(REDIS_URL),
+            consumer=JOB_WORKER_ID,
+            visibility_timeout_s=JOB_VISIBILITY_TIMEOUT_S,
+            max_deliveries=JOB_MAX_DELIVERIES,
+        )
+    return PersistentJobQueue(JOB_QUEUE_DB_PATH)
+
+# Only workers on the shared Redis queue need to heartbeat
+heartbeat_s = JOB_HEARTBEAT_S if JOB_QUEUE_BACKEND == "redis" else None
+
+def query_processor():
+    """
+    The service running jobs in EXECUTION_MODE. It pulls in Playwright and
+    the OpenAI SDK, so it is imported by the first job or by prewarm().
+    """
+    if EXECUTION_MODE == "asyncio":
+        from service.async_query_processor import async_query_processor_service
+        return async_query_processor_service
+    from service.query_processor import query_processor_service
+    return query_processor_service
+
+
+def run_query(query_id: str, app):
+    service = query_processor()
+    if EXECUTION_MODE == "asyncio":
+        service.run_query(query_id, app)
+    else:
+        service.process_query(query_id, app)
+
+
+def prewarm() -> dict:
+    """
+    Gets a process ready for its first job: imports the query processor,
+    launches the pool's browsers and opens the LLM connections. Returns
+    the seconds each took.
+    """
+    timings = {}
+    started = time.perf_counter()
+    query_processor()
+    timings["import_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if EXECUTION_MODE == "asyncio":
+        async_runner.run(async_browser_pool.start())
+    else:
+        browser_pool.start()
+    timings["browsers_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if EXECUTION_MODE == "asyncio":
+        async_runner.run(llm_gateway.aprewarm())
+    else:
+        llm_gateway.prewarm()
+    timings["llm_s"] = time.perf_counter() - started
+
+    timings = {name: round(value, 3) for name, value in timings.items()}
+    log.info("Prewarmed", timings)
+    return timings
+
+
+if EXECUTION_MODE == "asyncio":
+    job_scheduler = JobScheduler(
+        queue=create_job_queue(),
+        run_job=run_query,
+        concurrency=ASYNC_MAX_CONCURRENT_JOBS,
+        max_queue_size=JOB_QUEUE_MAX_SIZE,
+        default_timeout=JOB_DEFAULT_TIMEOUT,
+        bind_browser_driver=False,
+        heartbeat_s=heartbeat_s,
+    )
+else:
+    job_scheduler = JobScheduler(
+        queue=create_job_queue(),
+        run_job=run_query,
+        concurrency=JOB_WORKER_CONCURRENCY,
+        max_queue_size=JOB_QUEUE_MAX_SIZE,
+        default_timeout=JOB_DEFAULT_TIMEOUT,
+        heartbeat_s=heartbeat_s,
+    )
@@ -1,187 +1,329 @@
-import json
+import time
 from textwrap import dedent
-import threading
-from flask_sse import sse
-from openai import AzureOpenAI
-from config import openai
-from playwright.sync_api import sync_playwright, Page
+from playwright.sync_api import Page
 from playwright_stealth import stealth_sync
-from lib.browser_interactor import BrowserInteractor
-import random
+from lib.browser_interactor import BrowserInteractor, browser_pool
 from agents.browser_action_generator_agent import browser_action_generator
 from agents.action_plan_generator_agent import action_plan_generator
-from datetime import datetime
-from lib.utils import generate_screenshot_base64
+from lib.screenshot_pipeline import screenshot_pipeline
+from lib.job_context import JobCancelled, check_cancelled
+from lib.page_fingerprint import box_fingerprint, text_fingerprint
+from lib.page_settle import PageSettler
+from lib.page_annotator import BOX_SELECTOR, page_annotator
+from lib.load_profiles import load_profiles
+from lib.logging import log
+from lib.llm_gateway import LLMGateway, llm_gateway
+from lib.tracing import tracer
+from lib.job_repository import job_repository
+from lib.action_trace import RESOLVE_ELEMENTS_JS, TraceRecorder, action_trace_store
+from lib.event_stream import event_stream
+from lib.action_resolver import action_resolver, element_outline
+from lib.action_stream import StreamedActions, normalize_actions
+from lib.step_scheduler import ExtractionScheduler, extraction_executor, group_steps
+from lib.step_fusion import FusedSteps, step_fusion
+from lib.checkpoints import StepFailed, checkpoints
+from config import VISION_EXTRACTION_BATCH_SIZE, STREAM_PAGE_ACTIONS
+from config import PAGE_SETTLE_TIMEOUT_S, PAGE_SETTLE_QUIET_MS, PAGE_SETTLE_VISUAL_MAX_DISTANCE
+
+# Visible text of the page, fingerprinted for steps without annotated boxes
+PAGE_TEXT_JS = "() => (document.body ? document.body.innerText : '').slice(0, 20000)"
 
 class QueryProcessorService:
-    def __init__(self, openai: AzureOpenAI):
+    def __init__(self, openai: LLMGateway):
           self.openai = openai
 
-    def notify(self, json, app=None):
+    def notify(self, query_id, json, app=None, screenshot=None):
+        # Each query has its own channel, screenshots are served from /screenshots
         if app is not None:
-            with app.app_context(): 
-                sse.publish(json)
-                # sse.publish(json, type='status', channel=json["query_id"]) # for Production
+            event_stream.publish(query_id, json, screenshot=screenshot)
 
     def generate_action_plan(self, user_query, query_id):
-        plan = action_plan_generator.generate_action_plan(user_query=user_query, query_id=query_id)
+        with tracer.span("plan_generation"):
+            plan = action_plan_generator.generate_action_plan(user_query=user_query, query_id=query_id)
         return plan
 
     
-    def random_color(self):
-        return f"#{random.randint(0, 0xFFFFFF):06x}"
-    
-    def draw_bounding_box_and_screenshot(self, page: Page, query_id: str, step_idx: int):
-        # Select all buttons and input elements
-        selector = "button, input, textarea, a"
-
-        # Assign data-box-number to each element and get their bounding boxes
-        boxes = page.eval_on_selector_all(
-            selector,
-            """
-            (elements) => {
-                return elements.map((el, idx) => {
-                    el.setAttribute('data-box-number', idx + 1);
-                    const rect = el.getBoundingClientRect();
-                    return {
-                        x: rect.x + window.scrollX,
-                        y: rect.y + window.scrollY,
-                        width: rect.width,
-                        height: rect.height,
-                        box_number: idx + 1,
-                        tag: el.tagName.toLowerCase(),
-                        type: el.type || null
-                    };
-                });
-            }
-            """
-        )
+    def annotate_page(self, page: Page):
+        # Number the visible elements and draw their overlays in one call,
+        # only the boxes that changed since the previous step are redrawn
+        with tracer.span("annotation") as span:
+            result = page_annotator.annotate(page)
+            boxes = result.pop("boxes")
+            span.set(boxes=len(boxes), **result)
+        return boxes
 
-        # Draw overlays for each bounding box
-        for box in boxes:
-            color = self.random_color()
-            page.evaluate(
-                """
-                ([box, color]) => {
-                    const div = document.createElement('div');
-                    div.style.position = 'absolute';
-                    div.style.left = box.x + 'px';
-                    div.style.top = box.y + 'px';
-                    div.style.width = box.width + 'px';
-                    div.style.height = box.height + 'px';
-                    div.style.border = '3px solid ' + color;
-                    div.style.zIndex = 9999;
-                    div.style.pointerEvents = 'none';
-
-                    const label = document.createElement('span');
-                    label.textContent = box.box_number;
-                    label.style.position = 'absolute';
-                    label.style.left = '0';
-                    label.style.top = '0';
-                    label.style.background = color;
-                    label.style.color = '#fff';
-                    label.style.fontWeight = 'bold';
-                    label.style.padding = '2px 6px';
-                    label.style.fontSize = '16px';
-                    div.appendChild(label);
-
-                    document.body.appendChild(div);
-                }
-                """,
-                [box, color]
-            )
+    def draw_bounding_box_and_screenshot(self, page: Page, query_id: str, step_idx: int):
+        boxes = self.annotate_page(page)
 
         # Take screenshot
-        screenshot_path=f"./screenshots/{query_id}_{step_idx}.png"
-        page.screenshot(path=screenshot_path, full_page=False)
-        return screenshot_path
+        screenshot = screenshot_pipeline.capture(page, name=f"{query_id}_{step_idx}")
+        return screenshot, boxes
     
     def screenshot_vision_only(self, page: Page, query_id: str, step_idx: int):
-        screenshot_path=f"./screenshots/{query_id}_{step_idx}.png"
-        print("screenshot_vision_only, Taking screenshot")
-    
         # Stop any further loading
         page.evaluate("window.stop()")
-        print("screenshot_vision_only, Stopped page loading")
-        
-        page.screenshot(path=screenshot_path, full_page=False)
-        print("screenshot_vision_only, screenshot taken")
-        return screenshot_path
-
-    def generate_browser_action_on_page(self, screenshot_path, action):
-        actions = browser_action_generator.generate_page_actions(screenshot_path, action)
+        # Extractions read the page itself, not the previous step's boxes
+        page_annotator.hide(page)
+        screenshot = screenshot_pipeline.capture(page, name=f"{query_id}_{step_idx}")
+        fingerprint = text_fingerprint(page.evaluate(PAGE_TEXT_JS))
+        return screenshot, fingerprint
+
+    def generate_browser_action_on_page(self, screenshot, action, fingerprint):
+        actions = browser_action_generator.generate_page_actions(screenshot, action, fingerprint)
         return actions
     
-    def generate_vision_only_action_on_page(self, screenshot_path, action):
-        actions = browser_action_generator.generate_vision_only_actions(screenshot_path, action)
-        return actions
+    def generate_outline_action_on_page(self, boxes, action):
+        try:
+            result = browser_action_generator.generate_outline_actions(element_outline(boxes), action, box_fingerprint(boxes))
+        except ValueError as e:
+            # Unparseable answer, the vision tier decides instead
+            log.warning("Outline action generation failed", {"error": str(e)})
+            return None
+        return action_resolver.accept_text(result, boxes)
+
+    def resolve_fused_actions(self, page: Page, query_id: str, step_idx: int, boxes: list, fused: FusedSteps, app) -> list:
+        """
+        Actions of a step of a fused group, planned together with the rest
+        of the group from one screenshot. None once a single step is left,
+        it goes through the other tiers.
+        """
+        actions = step_fusion.actions(fused, step_idx, page.url, boxes)
+        if actions is not None:
+            return actions
+        steps = fused.remaining(step_idx)
+        if len(steps) < 2:
+            return None
+        screenshot = screenshot_pipeline.capture(page, name=f"{query_id}_{step_idx}")
+        self.notify(query_id, {"message": f"Screenshot taken for {len(steps)} fused steps"}, app=app, screenshot=screenshot)
+        results = browser_action_generator.generate_fused_page_actions(screenshot, [step for _, step in steps], box_fingerprint(boxes))
+        return step_fusion.store(fused, steps, results, page.url, boxes)
+
+    def resolve_vision_actions(self, page: Page, query_id: str, step_idx: int, action: str, boxes: list, app):
+        screenshot = screenshot_pipeline.capture(page, name=f"{query_id}_{step_idx}")
+        log.debug("Screenshot saved", {"query_id": query_id, "path": screenshot.path})
+        self.notify(query_id, {"message": f"Screenshot taken for browser action"}, app=app, screenshot=screenshot)
+
+        # generate the browser action - action agent - ip: screenshot, action, op: browser_actions
+        if STREAM_PAGE_ACTIONS:
+            return browser_action_generator.stream_page_actions(screenshot, action, box_fingerprint(boxes))
+        return normalize_actions(self.generate_browser_action_on_page(screenshot=screenshot, action=action, fingerprint=box_fingerprint(boxes)))
+
+    def page_action_tiers(self, page: Page, query_id: str, step_idx: int, action: str, boxes: list, app, fused: FusedSteps = None):
+        """
+        The tiers that can resolve a browser step, cheapest first, as
+        (tier, resolve) pairs. resolve() returns the actions, None when
+        the tier isn't confident; the screenshot is only taken by the
+        vision tier, the last one.
+        """
+        yield "deterministic", lambda: action_resolver.match(boxes, action)
+        if fused is not None:
+            yield "fused", lambda: self.resolve_fused_actions(page, query_id, step_idx, boxes, fused, app)
+        if boxes and action_resolver.enabled("text"):
+            yield "text", lambda: self.generate_outline_action_on_page(boxes, action)
+        yield "vision", lambda: self.resolve_vision_actions(page, query_id, step_idx, action, boxes, app)
+
+    def resolve_page_actions(self, page: Page, query_id: str, step_idx: int, action: str, boxes: list, app, fused: FusedSteps = None) -> StreamedActions:
+        """
+        Resolves a browser step with the cheapest tier that is confident.
+        With streaming on, the vision tier's actions arrive while they are
+        being executed.
+        """
+        started = time.perf_counter()
+        with tracer.span("action_resolve") as span:
+            for tier, resolve in self.page_action_tiers(page, query_id, step_idx, action, boxes, app, fused):
+                actions = resolve()
+                if actions is not None:
+                    break
+            span.set(tier=tier)
+        return StreamedActions(actions, tier, started)
+
+    def generate_vision_only_action_on_page(self, screenshot, actions, fingerprint):
+        # One request for every extraction step sharing this screenshot
+        return browser_action_generator.generate_vision_only_batch(screenshot, actions, fingerprint)
     
     def act_on_box(self, page: Page, action: str):
         box_number_to_act_on = action["box_click"]
         selector = f'[data-box-number="{box_number_to_act_on}"]'
         element = page.query_selector(selector)
         if element:
-            tag = element.evaluate("el => el.tagName.toLowerCase()")
-            input_type = element.evaluate("el => el.type?.toLowerCase()") if tag == "input" else None
-            
-            if tag == "button":
+            self.act_on_element(element, action, label=f"box number {box_number_to_act_on}")
+
+    def act_on_element(self, element, action: dict, label: str):
+        tag = element.evaluate("el => el.tagName.toLowerCase()")
+        input_type = element.evaluate("el => el.type?.toLowerCase()") if tag == "input" else None
+
+        if tag == "button":
+            element.click()
+            log.debug("Clicked button", {"target": label})
+        elif tag == "input":
+            if input_type == "submit":
                 element.click()
-                print(f"Clicked button with box number {box_number_to_act_on}")
-            elif tag == "input":
-                if input_type == "submit":
-                    element.click()
-                    print(f"Clicked submit input with box number {box_number_to_act_on}")
-                else:
-                    element.fill(action["input_text"])
-                    print(f"Filled input with box number {box_number_to_act_on}")
-            elif tag == "textarea":
+                log.debug("Clicked submit input", {"target": label})
+            else:
                 element.fill(action["input_text"])
-                print(f"Filled textarea with box number {box_number_to_act_on}")
-            elif tag == "a":
-                element.click()
-                print(f"Clicked link with box number {box_number_to_act_on}")
-                print("Page loaded after clicking link")
+                log.debug("Filled input", {"target": label})
+        elif tag == "textarea":
+            element.fill(action["input_text"])
+            log.debug("Filled textarea", {"target": label})
+        elif tag == "a":
+            element.click()
+            log.debug("Clicked link", {"target": label})
+
+    def settler_for(self, page: Page) -> PageSettler:
+        return PageSettler(
+            page,
+            timeout_s=PAGE_SETTLE_TIMEOUT_S,
+            quiet_ms=PAGE_SETTLE_QUIET_MS,
+            visual_max_distance=PAGE_SETTLE_VISUAL_MAX_DISTANCE,
+        )
 
-        
-    def do_browser_actions(self, actions, page: Page): 
-        for action in actions:
-            self.act_on_box(page, action=action)
-
-        threading.Event().wait(5)  # Simulate processing time
-    
-    def execute_action_plan(self, plan, app):
-        self.notify({"message": f"Executing action plan for query ID: {plan['query_id']}"}, app=app)
-
-        # Use sync_playwright within the thread
-        with sync_playwright() as p:
-            query_id = plan["query_id"]
-            if query_id is None:
-                return
-            
-            # Launch browser (or connect to existing) within the thread
-            browser = p.chromium.launch(headless=False, channel="chrome") # Launch per thread for simplicity.
-                                                    # Reusing a single instance across threads
-                                                    # with sync API requires careful locking and page management.
-
-            # Send a status update using SSE
-            # sse.publish({"message": f"Starting processing for query ID: {query_id}"}, type='status', channel=query_id)
-            self.notify({"message": f"Browser launched"}, app=app)
+    def wait_for_settle(self, settler: PageSettler):
+        # Wait for the page to react instead of sleeping for a fixed time
+        with tracer.span("settle_wait") as span:
+            settle = settler.wait()
+            span.set(settled=settle.settled)
+        return settle
+
+    def do_browser_actions(self, actions, page: Page, settler: PageSettler):
+        # actions may still be streaming in, each runs as soon as it arrives
+        with tracer.span("action_execution") as span:
+            count = 0
+            for action in actions:
+                self.act_on_box(page, action=action)
+                count += 1
+            span.set(actions=count)
+        return self.wait_for_settle(settler)
+
+    def replay_step(self, page: Page, step: dict, settler: PageSettler):
+        """Repeats a recorded step on the elements matching its fingerprints, None if one no longer resolves."""
+        with tracer.span("replay_resolve") as span:
+            results = page.evaluate(RESOLVE_ELEMENTS_JS, action_trace_store.resolve_args(step, BOX_SELECTOR))
+            span.set(targets=len(results), resolved=sum(result is not None for result in results))
+        replay = action_trace_store.resolved_actions(step, results)
+        tracer.count("replay_steps_total", result="fallback" if replay is None else "replayed")
+        if replay is None:
+            return None
+
+        with tracer.span("action_execution", actions=len(replay), replayed=True):
+            for selector, action in replay:
+                element = page.query_selector(selector)
+                if element:
+                    self.act_on_element(element, action, label="recorded fingerprint")
+        return self.wait_for_settle(settler)
+
+    # The bookkeeping of a run, shared with the asyncio service so that only
+    # the browser and LLM calls differ between the two. The helpers return
+    # the messages to notify, the caller sends them the way it sends any.
+
+    def plan_setup(self, plan, load_profile=None, resume=None):
+        """Load profile, context options, start URL and step of a run, and the step results it carries over."""
+        profile = load_profiles.select(plan["goto"], load_profile)
+        context_options = profile.context_options()
+        if resume is None:
+            return profile, context_options, plan["goto"], 0, {}
+        if resume["storage_state"]:
+            context_options["storage_state"] = resume["storage_state"]
+        return profile, context_options, resume["url"], resume["step_idx"], dict(resume["step_results"])
+
+    def record_replayed(self, query_id, step_idx, action, step, settle, recorder: TraceRecorder, step_results: dict) -> dict:
+        replayed_actions = [{"input_text": item["input_text"], "replayed": True} for item in step["actions"]]
+        step_results[step_idx] = replayed_actions
+        recorder.record_replayed(step_idx, step)
+        log.info("Replayed recorded step", {"query_id": query_id, "step": step_idx})
+        job_repository.add_step(query_id, step_idx, {"action": action, "actions": replayed_actions, "replayed": True, "settle_ms": settle.settle_ms})
+        return {"message": f"Replayed step {step_idx} from recorded trace", "actions": replayed_actions, "settle_ms": settle.settle_ms}
+
+    def record_resolved(self, query_id, step_idx, action, resolved: StreamedActions, settle, boxes, recorder: TraceRecorder) -> list:
+        generated_actions, tier = resolved.actions, resolved.tier
+        saved_ms = action_resolver.record(tier, resolved.resolve_ms)
+        log.info("Browser actions generated", {"query_id": query_id, "step": step_idx, "tier": tier, "actions": generated_actions})
+        log.info("Page settled", {"query_id": query_id, "step": step_idx, **settle._asdict()})
+        job_repository.add_step(query_id, step_idx, {"action": action, "actions": generated_actions, "tier": tier, "saved_ms": saved_ms, "first_action_ms": resolved.first_action_ms, "settle_ms": settle.settle_ms})
+        recorder.record(step_idx, action, generated_actions, boxes)
+        return [
+            {"message": f"Browser actions generated", "actions": generated_actions, "tier": tier, "saved_ms": saved_ms, "first_action_ms": resolved.first_action_ms},
+            {"message": f"Browser actions done for step {step_idx}", "actions": generated_actions, "settle_ms": settle.settle_ms},
+        ]
+
+    def record_extractions(self, query_id, collected, step_results: dict = None) -> list:
+        """Records the results of finished extraction groups, step_results is None for a run that failed."""
+        messages = []
+        for steps, results in collected:
+            for (step_idx, action), actions in zip(steps, results):
+                job_repository.add_step(query_id, step_idx, {"action": action, "vision_only": True, "actions": actions})
+                if step_results is None:
+                    continue
+                step_results[step_idx] = actions
+                log.info("Vision only actions generated", {"query_id": query_id, "step": step_idx, "actions": actions})
+                messages.append({"message": f"Vision only actions generated", "actions": actions})
+        return messages
+
+    def record_plan_done(self, plan, resume, recorder: TraceRecorder, recorded_steps, step_results: dict):
+        """Saves the trace of a complete run and returns its last actions."""
+        last_actions = step_results[max(step_results)] if step_results else None
+        # A resumed run only recorded its last steps
+        if action_trace_store is not None and resume is None and recorder.steps != recorded_steps:
+            action_trace_store.save(plan, recorder)
+        log.info("All actions done", {"query_id": plan["query_id"], "actions": last_actions})
+        return last_actions
+
+    def record_failure(self, query_id, error: Exception, settled, step_results: dict):
+        """
+        Handles a failed run: with checkpoints on, raises StepFailed once
+        what the extractions in flight found is kept, the job resumes after
+        them. Otherwise returns the error message and last actions.
+        """
+        log.error("Error processing query", {"query_id": query_id, "error": str(error)})
+        if checkpoints.enabled:
+            self.record_extractions(query_id, settled)
+            raise StepFailed(query_id, error) from error
+        tracer.set_status("error")
+        last_actions = step_results[max(step_results)] if step_results else None
+        return {"message": f"An error occurred: {error}", "status": "error"}, last_actions
+
+    def execute_action_plan(self, plan, app, load_profile=None, resume=None):
+        """
+        Runs the plan's steps in one browser context. With checkpoints on a
+        checkpoint is saved before every step and a failed step raises
+        StepFailed, resume (from checkpoints.resume) continues a run from
+        its checkpoint.
+        """
+        query_id = plan["query_id"]
+        if query_id is None:
+            return None
+        last_actions = None
+        profile, context_options, url, start_step, step_results = self.plan_setup(plan, load_profile, resume)
+
+        self.notify(query_id, {"message": f"Executing action plan for query ID: {query_id}"}, app=app)
+
+        # Lease an isolated context from the warm browser pool instead of
+        # launching a browser per query
+        with browser_pool.lease(**context_options) as context:
+            load_profiles.install(context, profile)
+            self.notify(query_id, {"message": f"Browser context leased", "load_profile": profile.name}, app=app)
 
             page = None
+            extractions = None
             try:
-                page = browser.new_page()
+                # Create a SyncBrowserInteractor instance for this task's context
+                interactor = BrowserInteractor(context)
+                page = interactor.new_page()
                 stealth_sync(page) # solve for captcha
-                print(f"Query {query_id}: Created new page.")
-                self.notify({"message": f"New page created"}, app=app)
-                # Create a SyncBrowserInteractor instance for this task's page
-                interactor = BrowserInteractor(browser) # Pass the browser instance
-                interactor.goto(page=page, url=plan["goto"])
+                settler = self.settler_for(page)
+                log.debug("Created new page", {"query_id": query_id})
+                self.notify(query_id, {"message": f"New page created"}, app=app)
+                with tracer.span("navigation", load_profile=profile.name):
+                    interactor.goto(page=page, url=url)
                 
-                self.notify({"message": f"Navigated to {plan['goto']}"}, app=app)
+                self.notify(query_id, {"message": f"Navigated to {url}"}, app=app)
 
                 
                 action_plan_list = plan["action_plan"]
 
+                # Steps recorded by an earlier successful run of the same plan
+                recorded_steps = action_trace_store.lookup(plan) if action_trace_store else None
+                recorder = TraceRecorder()
+
                 """
                     browser_actions = [{
                         "box_click": 1,
@@ -189,95 +331,140 @@ class QueryProcessorService:
                         "extracted_data": ""
                     }]
                 """
-                last_actions = None
 
 
+                # Vision only steps don't change the page, their extraction
+                # runs while the browser carries on with the next steps
+                extractions = ExtractionScheduler(extraction_executor)
+
                 # Skipping first action since it's usually navigating to the goto url
-                for step_idx, action in enumerate(action_plan_list[1:]):
-                    print("------------------------------")
+                # Browser steps that stay on one page are planned together
+                for extraction, steps, fused in step_fusion.plan(group_steps(action_plan_list[1:], plan["vision_only"], VISION_EXTRACTION_BATCH_SIZE)):
+                    check_cancelled()
+                    interactor.apply_deadline(page)
+                    step_idx, action = steps[0]
+                    if step_idx < start_step:
+                        continue
+                    tracer.set_step(step_idx)
+                    if checkpoints.enabled:
+                        storage_state = context.storage_state() if checkpoints.keep_storage_state else None
+                        checkpoints.save(query_id, step_idx, plan, page.url, storage_state)
 
-                    print(f"Doing step {step_idx}: {action}")
-                    self.notify({"message": f"Doing step {step_idx}: {action}"})
+                    for idx, step_action in steps:
+                        log.info("Doing step", {"query_id": query_id, "step": idx, "action": step_action})
+                        self.notify(query_id, {"message": f"Doing step {idx}: {step_action}"}, app=app)
 
                     # if the action is in the vision_only list, then we need to generate the vision only action
-                    if action in plan["vision_only"]:
-                        screenshot_path = self.screenshot_vision_only(page=page, query_id=query_id, step_idx=step_idx)
-                        self.notify({"message": f"Screenshot taken for vision only action", "img": generate_screenshot_base64(screenshot_path)}, app=app)
-                        
-                        actions = self.generate_vision_only_action_on_page(screenshot_path=screenshot_path, action=action)
-                        self.notify({"message": f"Vision only actions generated", "actions": actions}, app=app)
+                    if extraction:
+                        screenshot, fingerprint = self.screenshot_vision_only(page=page, query_id=query_id, step_idx=step_idx)
+                        self.notify(query_id, {"message": f"Screenshot taken for vision only action"}, app=app, screenshot=screenshot)
 
-                        last_actions = actions
-                        
-                        print("vision only actions generated", json.dumps(actions, indent=2))
+                        extractions.submit(steps, self.generate_vision_only_action_on_page, screenshot, [action for _, action in steps], fingerprint)
+                        continue
 
+                    # Replay the recorded step while its elements still resolve,
+                    # the vision agent only runs for steps that don't
+                    step = action_trace_store.replayable(recorded_steps, step_idx, action) if recorded_steps else None
+                    settle = self.replay_step(page, step, settler) if step else None
+                    if settle is not None:
+                        self.notify(query_id, self.record_replayed(query_id, step_idx, action, step, settle, recorder, step_results), app=app)
                         continue
 
-                    # draw bounding box & take screenshot
-                    # self.draw_bounding_box_and_screenshot(page=page)
-                    screenshot_path = self.draw_bounding_box_and_screenshot(page=page, query_id=query_id, step_idx=step_idx)
-                    print(f"Screenshot saved as {screenshot_path}")
-                    self.notify({"message": f"Screenshot taken for browser action", "img": generate_screenshot_base64(screenshot_path)}, app=app)
-
-                    # generate the browser action - action agent - ip: screenshot, action, op: browser_actions
-                    generated_actions = self.generate_browser_action_on_page(screenshot_path=screenshot_path, action=action)
-                    print("browser actions generated", json.dumps(generated_actions, indent=2))
-                    self.notify({"message": f"Browser actions generated", "actions": generated_actions}, app=app)
-                    
-                    last_actions = generated_actions
-
-                    # do browser interaction
-                    self.do_browser_actions(generated_actions, page)
-                    print("browser actions done for step", step_idx)
-                    self.notify({"message": f"Browser actions done for step {step_idx}", "actions": generated_actions}, app=app)
-                
-                print("All actions done", json.dumps(last_actions, indent=2))
-                self.notify({"message": f"All actions done", "actions": last_actions}, app=app)
+                    # draw bounding boxes, the element list alone often resolves
+                    # the step and the screenshot + vision agent is the last tier
+                    boxes = self.annotate_page(page)
+                    resolved = self.resolve_page_actions(page, query_id, step_idx, action, boxes, app, fused=fused)
+                    step_results[step_idx] = resolved.actions
+
+                    # do browser interaction, streamed actions run as they are generated
+                    settle = self.do_browser_actions(resolved, page, settler)
+                    for message in self.record_resolved(query_id, step_idx, action, resolved, settle, boxes, recorder):
+                        self.notify(query_id, message, app=app)
+
+                # Merge the extraction results back in plan order
+                with tracer.span("extraction_wait"):
+                    for message in self.record_extractions(query_id, extractions.collect(), step_results):
+                        self.notify(query_id, message, app=app)
+
+                last_actions = self.record_plan_done(plan, resume, recorder, recorded_steps, step_results)
+                self.notify(query_id, {"message": f"All actions done", "actions": last_actions}, app=app)
                 
+            except JobCancelled:
+                raise
             except Exception as e:
-                print(f"Error processing query {query_id}: {e}")
-                self.notify({"message": f"An error occurred: {e}", "status": "error"}, app=app)
+                # A call cut short by the job's deadline ends it as timed out
+                check_cancelled()
+                settled = extractions.settle() if checkpoints.enabled and extractions is not None else []
+                message, last_actions = self.record_failure(query_id, e, settled, step_results)
+                self.notify(query_id, message, app=app)
             finally:
+                if extractions is not None:
+                    extractions.cancel()
                 if page:
                     page.close()
-                    print(f"Query {query_id}: Page closed.")
-                if browser:
-                    browser.close() # Close browser launched in this thread
-        return
-
+                    log.debug("Page closed", {"query_id": query_id})
+        return last_actions
+
+    def run_action_plan(self, plan, app, load_profile=None, resume=None):
+        """
+        Executes the plan, a failed step resumes from its checkpoint up to
+        max_resumes times. Once every step ran, a plan whose goal is missing
+        an extracted result is retried from that step without the cache.
+        """
+        query_id = plan["query_id"]
+        attempts = checkpoints.attempts(query_id, resume)
+        while True:
+            try:
+                with attempts.cache():
+                    last_actions = self.execute_action_plan(plan=plan, app=app, load_profile=load_profile, resume=attempts.resume)
+            except StepFailed as e:
+                self.notify(query_id, attempts.failed(e), app=app)
+                if attempts.resume is None:
+                    return attempts.last_actions()
+                continue
+
+            message = attempts.unmet(plan)
+            if message is None:
+                return last_actions
+            self.notify(query_id, message, app=app)
 
     def process_query(self, query_id, app):
         # Simulate some processing and send SSE updates
-        try:
-            # Read the query file
-            with open(f"./jobs/{query_id}.json", "r") as f:
-                query_data = json.load(f)
-            query_data["status"] = "in_progress"
-            with open(f"./jobs/{query_id}.json", "w") as f:
-                json.dump(query_data, f)
-
-            query = query_data["query"]
-
-            # generate action plan
-            action_plan = self.generate_action_plan(user_query=query, query_id=query_id)
-            
-            self.notify({"message": f"Action plan generated for query ID: {query_id}", "action_plan": action_plan}, app=app)
-
-            # execute action plan
-            self.execute_action_plan(plan=action_plan, app=app)
-
-            self.notify({"message": f"Processing complete for query ID: {query_id}", "done": True}, app=app)
-
-            # Update status to done
-            query_data["status"] = "done"
-            query_data["completed_at"] = datetime.now().isoformat()
-            with open(f"./jobs/{query_id}.json", "w") as f:
-                json.dump(query_data, f)
-
-        except Exception as e:  
-            print(f"Error processing query {query_id}: {str(e)}")
-
-query_processor_service = QueryProcessorService(openai=openai)
+        with tracer.trace(query_id):
+            try:
+                job = job_repository.get(query_id)
+                if job is None:
+                    raise ValueError(f"Job {query_id} not found")
+                job_repository.transition(query_id, "in_progress")
+
+                # A job that ran before (requeued, its worker died) carries on
+                # from its checkpoint with the plan it already had
+                resume = checkpoints.resume(query_id, "restarted")
+                if resume is not None:
+                    action_plan = resume["plan"]
+                    self.notify(query_id, {"message": f"Resuming from step {resume['step_idx']}", "action_plan": action_plan}, app=app)
+                else:
+                    # generate action plan
+                    action_plan = self.generate_action_plan(user_query=job["query"], query_id=query_id)
+                    self.notify(query_id, {"message": f"Action plan generated for query ID: {query_id}", "action_plan": action_plan}, app=app)
+                check_cancelled()
+
+                # execute action plan
+                last_actions = self.run_action_plan(plan=action_plan, app=app, load_profile=job["options"].get("load_profile"), resume=resume)
+                checkpoints.clear(query_id)
+
+                job_repository.transition(query_id, "done", result={"action_plan": action_plan, "actions": last_actions})
+                self.notify(query_id, {"message": f"Processing complete for query ID: {query_id}", "done": True}, app=app)
+
+            except JobCancelled:
+                raise
+            except Exception as e:  
+                log.error("Error processing query", {"query_id": query_id, "error": str(e)})
+                tracer.set_status("error")
+                job_repository.transition(query_id, "error", error=str(e))
+                self.notify(query_id, {"message": f"An error occurred: {e}", "status": "error", "done": True}, app=app)
+
+query_processor_service = QueryProcessorService(openai=llm_gateway)
 
 # if __name__ == "__main__":
     # processor = QueryProcessorService(openai=openai)
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Set before config is imported: no Redis, nothing written inside the tree
+_tmp = tempfile.mkdtemp(prefix="browser-agent-tests-")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+os.environ.setdefault("JOB_DB_PATH", os.path.join(_tmp, "jobs.db"))
+os.environ.setdefault("LOG_FILE_PATTERN", os.path.join(_tmp, "app_%Y%m%d.log"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
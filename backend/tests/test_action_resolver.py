@@ -0,0 +1,61 @@
+from lib.action_resolver import match_click, match_fill, match_step
+
+
+def box(number: int, tag: str, **fields) -> dict:
+    return {"box_number": number, "tag": tag, **fields}
+
+
+SEARCH_PAGE = [
+    box(1, "input", type="text", label="Search", name="q"),
+    box(2, "input", type="submit", label="Google Search"),
+    box(3, "a", text="Images"),
+    box(4, "button", text="I'm Feeling Lucky"),
+]
+
+
+def test_fill_types_quoted_text_into_the_named_field():
+    match = match_fill(SEARCH_PAGE, "Type 'green frontier capital' into the search bar")
+    assert match.actions == [{"box_click": 1, "input_text": "green frontier capital", "extracted_data": None}]
+    assert match.confidence == 1.0
+
+
+def test_fill_and_submit_clicks_the_submit_button():
+    match = match_fill(SEARCH_PAGE, "Type 'acme' into the search bar and submit")
+    assert [action["box_click"] for action in match.actions] == [1, 2]
+
+
+def test_fill_needs_quoted_text():
+    assert match_fill(SEARCH_PAGE, "Type the company name into the search bar").actions is None
+
+
+def test_fill_is_ambiguous_between_unrelated_fields():
+    boxes = [box(1, "input", type="text", label="First name"), box(2, "input", type="text", label="Last name")]
+    match = match_fill(boxes, "Type 'ada' into the email field")
+    assert match.actions is None
+    assert match.reason == "ambiguous input"
+
+
+def test_click_by_quoted_text():
+    match = match_click(SEARCH_PAGE, "Click on 'Images'")
+    assert match.actions == [{"box_click": 3, "input_text": None, "extracted_data": None}]
+
+
+def test_click_by_explicit_link_text():
+    boxes = [box(1, "a", text="Pricing"), box(2, "a", text="Docs")]
+    assert match_click(boxes, "Click the link named Pricing").actions[0]["box_click"] == 1
+
+
+def test_click_ordinals_need_the_page():
+    boxes = [box(1, "a", text="Article one"), box(2, "a", text="Article two")]
+    assert match_click(boxes, "Click the first link containing Article").reason == "no explicit target"
+
+
+def test_click_is_ambiguous_between_equal_candidates():
+    boxes = [box(1, "a", text="More"), box(2, "a", text="More")]
+    assert match_click(boxes, "Click 'More'").reason == "ambiguous element"
+
+
+def test_match_step_dispatches_on_the_verb():
+    assert match_step(SEARCH_PAGE, "Type 'x' into the search bar").reason == "fill"
+    assert match_step(SEARCH_PAGE, "Click on 'Images'").reason == "click"
+    assert match_step(SEARCH_PAGE, "Read the title of the first result").actions is None
@@ -0,0 +1,40 @@
+from lib.action_stream import ActionStreamParser, normalize_actions
+
+
+def feed_all(parser: ActionStreamParser, chunks) -> list:
+    actions = []
+    for chunk in chunks:
+        actions.extend(parser.feed(chunk))
+    return actions
+
+
+def test_actions_are_emitted_as_soon_as_they_close():
+    parser = ActionStreamParser()
+    assert parser.feed('{"actions": [{"box_click": 3, "input_text": "hi"') == []
+    assert parser.feed(', "extracted_data": null}, {"box_') == [{"box_click": 3, "input_text": "hi", "extracted_data": None}]
+    assert parser.feed('click": 5}]}') == [{"box_click": 5}]
+    assert parser.emitted == 2
+
+
+def test_split_at_every_character():
+    text = '[{"box_click": 1, "input_text": "a"}, {"box_click": 2, "input_text": "b"}]'
+    actions = feed_all(ActionStreamParser(), text)
+    assert [action["box_click"] for action in actions] == [1, 2]
+
+
+def test_braces_and_quotes_inside_strings():
+    text = '{"box_click": 1, "input_text": "say \\"{hi}\\" }"}'
+    assert feed_all(ActionStreamParser(), [text[:20], text[20:]]) == [{"box_click": 1, "input_text": 'say "{hi}" }'}]
+
+
+def test_objects_that_are_not_actions_are_skipped():
+    text = '{"meta": {"model": "x"}, "actions": [{"extracted_data": "42"}]}'
+    assert feed_all(ActionStreamParser(), [text]) == [{"extracted_data": "42"}]
+
+
+def test_normalize_actions_shapes():
+    action = {"box_click": 1}
+    assert normalize_actions([action, "noise"]) == [action]
+    assert normalize_actions(action) == [action]
+    assert normalize_actions({"browser_actions": [action]}) == [action]
+    assert normalize_actions(None) == []
@@ -0,0 +1,145 @@
+import pytest
+
+import lib.browser_pool as browser_pool_module
+from lib.browser_pool import BrowserPool, BrowserPoolExhausted
+
+
+class FakeBrowser:
+    def __init__(self, browser_id: int):
+        self.browser_id = browser_id
+        self.cdp_endpoint = f"http://127.0.0.1:{9000 + browser_id}"
+        self.active_contexts = 0
+        self.jobs_served = 0
+        self.retiring = False
+        self.launched_at = 0.0
+        self.healthy = True
+        self.closed = False
+
+    def is_healthy(self) -> bool:
+        return self.healthy
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def new_context(self, **context_options):
+        return FakeContext()
+
+    def close(self):
+        pass
+
+
+class FakePlaywright:
+    class chromium:
+        @staticmethod
+        def connect_over_cdp(endpoint):
+            return FakeConnection()
+
+    def stop(self):
+        pass
+
+
+class FakeBrowserPool(BrowserPool):
+    """Launches FakeBrowsers instead of Chromium processes."""
+    def __init__(self, **options):
+        super().__init__(**{"size": 2, "max_contexts_per_browser": 2, "max_jobs_per_browser": 10,
+                            "lease_timeout": 0.05, "headless": True, **options})
+        self.launched = []
+
+    def _launch(self, playwright) -> FakeBrowser:
+        browser = FakeBrowser(next(self._browser_ids))
+        self.launched.append(browser)
+        return browser
+
+
+@pytest.fixture(autouse=True)
+def fake_playwright(monkeypatch):
+    monkeypatch.setattr(browser_pool_module, "_start_playwright", FakePlaywright)
+
+
+def test_leases_share_a_browser_up_to_its_context_cap():
+    pool = FakeBrowserPool()
+    with pool.lease(), pool.lease():
+        assert len(pool.launched) == 1
+        with pool.lease():
+            assert len(pool.launched) == 2
+    assert [browser.active_contexts for browser in pool.launched] == [0, 0]
+    assert pool.stats()["leases"] == 3
+
+
+def test_released_context_is_reused():
+    pool = FakeBrowserPool()
+    for _ in range(3):
+        with pool.lease():
+            pass
+    assert len(pool.launched) == 1
+
+
+def test_full_pool_times_out():
+    pool = FakeBrowserPool(size=1, max_contexts_per_browser=1)
+    with pool.lease():
+        with pytest.raises(BrowserPoolExhausted):
+            with pool.lease():
+                pass
+    assert pool.stats()["lease_timeouts"] == 1
+
+
+def test_browser_is_recycled_after_max_jobs():
+    pool = FakeBrowserPool(max_jobs_per_browser=2)
+    for _ in range(3):
+        with pool.lease():
+            pass
+    first, second = pool.launched
+    assert first.jobs_served == 2
+    assert pool._browsers == [second]
+    assert pool.stats()["recycles"] == 1
+
+
+def test_unhealthy_browser_is_evicted_at_lease():
+    pool = FakeBrowserPool()
+    with pool.lease():
+        pass
+    sick = pool.launched[0]
+    sick.healthy = False
+    with pool.lease():
+        assert len(pool.launched) == 2
+    assert sick not in pool._browsers
+    assert sick.jobs_served == 1
+    stats = pool.stats()
+    assert stats["health_check_failures"] == 1
+    assert stats["recycles"] == 1
+
+
+def test_failed_context_retires_an_unhealthy_browser():
+    pool = FakeBrowserPool()
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pool.launched[0].healthy = False
+            raise RuntimeError("page crashed")
+    assert pool._browsers == []
+
+
+def test_start_launches_the_missing_browsers():
+    pool = FakeBrowserPool(size=3)
+    with pool.lease():
+        pool.start()
+    assert len(pool.launched) == 3
+    assert pool._launching == 0
+    pool.start()
+    assert len(pool.launched) == 3
+
+
+def test_start_releases_its_reservation_when_playwright_fails(monkeypatch):
+    def broken_driver():
+        raise RuntimeError("driver missing")
+    monkeypatch.setattr(browser_pool_module, "_start_playwright", broken_driver)
+    pool = FakeBrowserPool()
+    with pytest.raises(RuntimeError):
+        pool.start()
+    assert pool._launching == 0
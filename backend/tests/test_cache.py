@@ -0,0 +1,107 @@
+import json
+import time
+
+import pytest
+
+from lib.cache import Cache, JsonlCacheBackend, MemoryCacheBackend, SQLiteCacheBackend, bypass_cache
+
+BACKENDS = {
+    "memory": lambda tmp_path: MemoryCacheBackend(),
+    "sqlite": lambda tmp_path: SQLiteCacheBackend(str(tmp_path / "cache.db")),
+    "jsonl": lambda tmp_path: JsonlCacheBackend(str(tmp_path / "cache.jsonl")),
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request, tmp_path):
+    return BACKENDS[request.param](tmp_path)
+
+
+def test_backend_round_trip(backend):
+    plan = {"goto": "https://shop.example/", "action_plan": ["Read the price"]}
+    backend.set("plans", "price of a lamp", plan, 100.0)
+    backend.set("actions", "price of a lamp", [1], 100.0)
+    assert backend.get("plans", "price of a lamp") == (plan, 100.0)
+    assert backend.count("plans") == 1
+    assert list(backend.items("plans")) == [("price of a lamp", plan, 100.0)]
+    backend.delete("plans", "price of a lamp")
+    assert backend.get("plans", "price of a lamp") is None
+    assert backend.count("plans") == 0
+    assert backend.count("actions") == 1
+
+
+@pytest.mark.parametrize("name", ["sqlite", "jsonl"])
+def test_durable_backend_survives_a_restart(name, tmp_path):
+    backend = BACKENDS[name](tmp_path)
+    backend.set("plans", "a", {"v": 1}, 100.0)
+    backend.set("plans", "a", {"v": 2}, 101.0)
+    backend.set("plans", "b", {"v": 3}, 100.0)
+    backend.delete("plans", "b")
+    reopened = BACKENDS[name](tmp_path)
+    assert reopened.get("plans", "a") == ({"v": 2}, 101.0)
+    assert reopened.get("plans", "b") is None
+
+
+def test_jsonl_skips_a_torn_last_line(tmp_path):
+    backend = JsonlCacheBackend(str(tmp_path / "cache.jsonl"))
+    backend.set("plans", "a", {"v": 1}, 100.0)
+    with open(tmp_path / "cache.jsonl", "a") as f:
+        f.write('{"ns": "plans", "key": "b", "val')
+    assert JsonlCacheBackend(str(tmp_path / "cache.jsonl")).get("plans", "a") == ({"v": 1}, 100.0)
+
+
+def test_jsonl_compacts_overwritten_records(tmp_path):
+    path = tmp_path / "cache.jsonl"
+    backend = JsonlCacheBackend(str(path))
+    for idx in range(250):
+        backend.set("plans", "a", {"v": idx}, 100.0)
+    assert len(path.read_text().splitlines()) < 250
+    assert JsonlCacheBackend(str(path)).get("plans", "a") == ({"v": 249}, 100.0)
+
+
+def test_least_recently_used_entry_leaves_memory_first():
+    cache = Cache("plans", MemoryCacheBackend(), max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert list(cache._entries) == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+    # Still in the backend, read back into memory
+    assert cache.get("b") == 2
+    assert cache.stats()["backend_hits"] == 1
+    assert list(cache._entries) == ["c", "b"]
+
+
+def test_expired_entry_is_dropped_from_both_layers():
+    backend = MemoryCacheBackend()
+    cache = Cache("plans", backend, ttl_s=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert backend.get("plans", "a") is None
+    assert list(cache.items()) == []
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_bypass_misses_and_writes_through():
+    cache = Cache("plans", MemoryCacheBackend())
+    cache.set("a", 1)
+    with bypass_cache():
+        assert cache.get("a") is None
+        cache.set("a", 2)
+    assert cache.get("a") == 2
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_legacy_json_file_is_imported_once(tmp_path):
+    legacy = tmp_path / "action_plans.json"
+    legacy.write_text(json.dumps({"price of a lamp": {"goto": "https://shop.example/"}}))
+    backend = MemoryCacheBackend()
+    assert Cache("plans", backend, legacy_json_path=str(legacy)).get("price of a lamp") == {"goto": "https://shop.example/"}
+    legacy.write_text(json.dumps({"price of a chair": {}}))
+    assert Cache("plans", backend, legacy_json_path=str(legacy)).get("price of a chair") is None
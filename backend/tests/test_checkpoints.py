@@ -0,0 +1,98 @@
+import pytest
+
+from lib.checkpoints import CheckpointStore, StepFailed, unmet_step
+from lib.job_repository import JobRepository
+
+PLAN = {
+    "goto": "https://shop.example/",
+    "action_plan": ["Open shop", "Type 'lamp' into the search bar", "Click 'Lamps'", "Read the price"],
+    "vision_only": ["Read the price"],
+}
+
+
+@pytest.fixture
+def store(tmp_path) -> CheckpointStore:
+    jobs = JobRepository(str(tmp_path / "jobs.db"))
+    jobs.create("q1", "price of a lamp")
+    return CheckpointStore(jobs, enabled=True, max_resumes=2, validation_retries=1)
+
+
+def step(step_idx: int, actions, vision_only: bool = False) -> dict:
+    return {"step_idx": step_idx, "actions": actions, **({"vision_only": True} if vision_only else {})}
+
+
+def test_unmet_step_is_the_first_missing_step():
+    assert unmet_step(PLAN, [step(0, [{"box_click": 1}])]) == 1
+
+
+def test_unmet_step_is_an_extraction_without_data():
+    steps = [step(0, []), step(1, []), step(2, [{"extracted_data": ""}], vision_only=True)]
+    assert unmet_step(PLAN, steps) == 2
+
+
+def test_goal_met():
+    steps = [step(0, []), step(1, []), step(2, [{"extracted_data": "$30"}], vision_only=True)]
+    assert unmet_step(PLAN, steps) is None
+
+
+def test_resume_without_checkpoint(store):
+    assert store.resume("q1", "restarted") is None
+
+
+def test_resume_goes_back_to_the_step_that_arrived_on_the_page(store):
+    store.save("q1", 0, PLAN, "https://shop.example/", None)
+    store.jobs.add_step("q1", 0, {"actions": [{"box_click": 1}]})
+    store.save("q1", 1, PLAN, "https://shop.example/search?q=lamp", {"cookies": []})
+    store.jobs.add_step("q1", 1, {"actions": [{"box_click": 7}]})
+    # Same page as step 1, the value typed there isn't in storage_state
+    store.save("q1", 2, PLAN, "https://shop.example/search?q=lamp#results", {"cookies": []})
+
+    resume = store.resume("q1", "step_failed")
+    assert resume["step_idx"] == 1
+    assert resume["url"] == "https://shop.example/search?q=lamp"
+    assert resume["step_results"] == {0: [{"box_click": 1}]}
+    assert [saved["step_idx"] for saved in store.jobs.steps("q1")] == [0]
+    assert store.stats()["resumes"] == {"step_failed": 1}
+
+
+def test_resume_from_step_bounds_the_resume_point(store):
+    for step_idx, url in enumerate(["https://shop.example/", "https://shop.example/a", "https://shop.example/b"]):
+        store.save("q1", step_idx, PLAN, url, None)
+        store.jobs.add_step("q1", step_idx, {"actions": []})
+    assert store.resume("q1", "goal_unmet", from_step=1)["step_idx"] == 1
+
+
+def test_finished_job_drops_its_checkpoints(store):
+    store.save("q1", 0, PLAN, "https://shop.example/", {"cookies": [{"name": "session"}]})
+    store.jobs.transition("q1", "in_progress", from_statuses=("pending",))
+    store.jobs.transition("q1", "pending", from_statuses=("in_progress",))
+    assert store.jobs.checkpoints("q1")
+    store.jobs.transition("q1", "error", error="boom")
+    assert store.jobs.checkpoints("q1") == []
+    assert store.resume("q1", "restarted") is None
+
+
+def test_disabled_store_never_resumes(tmp_path):
+    store = CheckpointStore(JobRepository(str(tmp_path / "jobs.db")), enabled=False)
+    assert store.resume("q1", "restarted") is None
+
+
+def test_attempts_give_up_after_max_resumes(store):
+    store.save("q1", 0, PLAN, "https://shop.example/", None)
+    attempts = store.attempts("q1")
+    for _ in range(store.max_resumes):
+        assert "resuming from step 0" in attempts.failed(StepFailed("q1", RuntimeError("boom")))["message"]
+        assert attempts.resume is not None
+    assert attempts.failed(StepFailed("q1", RuntimeError("boom")))["status"] == "error"
+    assert attempts.resume is None
+
+
+def test_attempts_retry_an_unmet_goal_once(store):
+    store.save("q1", 0, PLAN, "https://shop.example/", None)
+    for step_idx in range(2):
+        store.jobs.add_step("q1", step_idx, {"actions": []})
+    store.jobs.add_step("q1", 2, {"actions": [{"extracted_data": ""}], "vision_only": True})
+    attempts = store.attempts("q1")
+    assert attempts.unmet(PLAN)["message"] == "Step 2 found nothing, retrying from step 0"
+    assert attempts.retries == 1
+    assert attempts.unmet(PLAN) is None
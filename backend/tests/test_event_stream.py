@@ -0,0 +1,102 @@
+import hashlib
+import json
+import time
+from types import SimpleNamespace
+
+import fakeredis
+
+from lib.event_stream import EventStream
+
+
+def stream(**options) -> EventStream:
+    return EventStream(redis_client=fakeredis.FakeStrictRedis(), **{"progress_interval_ms": 0, "keepalive_s": 0.05, **options})
+
+
+def events(stream: EventStream, query_id: str, last_event_id: str = None) -> list:
+    """(id, payload) of every event up to the final one."""
+    received = []
+    for frame in stream.subscribe(query_id, last_event_id):
+        if frame.startswith(":"):
+            continue
+        fields = dict(line.split(":", 1) for line in frame.strip().splitlines())
+        received.append((fields["id"], json.loads(fields["data"])))
+    return received
+
+
+def test_subscriber_gets_only_its_query():
+    events_stream = stream()
+    events_stream.publish("q1", {"message": "Processing query...", "step": 0})
+    events_stream.publish("q2", {"message": "Other query", "done": True})
+    events_stream.publish("q1", {"message": "Done", "done": True})
+    assert [payload["message"] for _, payload in events(events_stream, "q1")] == ["Processing query...", "Done"]
+
+
+def test_replay_resumes_after_last_event_id():
+    events_stream = stream()
+    for step in range(3):
+        events_stream.publish("q1", {"message": f"Step {step}", "step": step})
+    events_stream.publish("q1", {"message": "Done", "done": True})
+    received = events(events_stream, "q1")
+    assert [payload["message"] for _, payload in events(events_stream, "q1", received[1][0])] == ["Step 2", "Done"]
+    # Not a stream id, replays everything
+    assert len(events(events_stream, "q1", "not-an-id")) == 4
+
+
+def test_replay_buffer_is_capped():
+    events_stream = stream(replay_size=2)
+    for step in range(3):
+        events_stream.publish("q1", {"message": f"Step {step}", "step": step})
+    events_stream.publish("q1", {"message": "Done", "done": True})
+    assert [payload["message"] for _, payload in events(events_stream, "q1")] == ["Step 2", "Done"]
+
+
+def test_finished_after_the_final_event():
+    events_stream = stream()
+    events_stream.publish("q1", {"message": "Step 0", "step": 0})
+    events_stream.publish("q1", {"message": "Done", "done": True})
+    (first, _), (last, _) = events(events_stream, "q1")
+    assert events_stream.finished("q1", last)
+    assert not events_stream.finished("q1", first)
+    assert not events_stream.finished("q1", None)
+
+
+def test_progress_messages_are_coalesced_until_the_next_event():
+    events_stream = stream(progress_interval_ms=10_000)
+    for idx in range(4):
+        events_stream.publish("q1", {"message": f"Thinking {idx}"})
+    events_stream.publish("q1", {"message": "Done", "done": True})
+    assert [payload for _, payload in events(events_stream, "q1")] == [
+        {"message": "Thinking 0"},
+        {"message": "Thinking 3", "coalesced": 2},
+        {"message": "Done", "done": True},
+    ]
+    stats = events_stream.stats()
+    assert stats["coalesced"] == 2
+    assert stats["open_channels"] == 0
+
+
+def test_pending_progress_message_is_sent_after_the_interval():
+    events_stream = stream(progress_interval_ms=50)
+    events_stream.publish("q1", {"message": "Thinking 0"})
+    events_stream.publish("q1", {"message": "Thinking 1"})
+    time.sleep(0.2)
+    entries = events_stream.redis.xrange(events_stream.stream_key("q1"))
+    assert [json.loads(fields[b"data"])["message"] for _, fields in entries] == ["Thinking 0", "Thinking 1"]
+
+
+def test_screenshot_is_stored_once_by_its_hash():
+    events_stream = stream()
+    screenshot = SimpleNamespace(data=b"\x89PNG frame", mime_type="image/png")
+    events_stream.publish("q1", {"message": "Step 0", "step": 0}, screenshot=screenshot)
+    events_stream.publish("q1", {"message": "Step 1", "step": 1}, screenshot=screenshot)
+    events_stream.publish("q1", {"message": "Done", "done": True})
+    digest = hashlib.sha256(screenshot.data).hexdigest()
+    first, second, _ = [payload for _, payload in events(events_stream, "q1")]
+    assert first["img_url"] == second["img_url"] == f"/screenshots/{digest}.png"
+    assert events_stream.images.get(digest) == screenshot.data
+    assert len(events_stream.redis.keys("sse:img:*")) == 1
+
+
+def test_idle_subscriber_gets_keepalives():
+    events_stream = stream()
+    assert next(events_stream.subscribe("q1")) == ": keepalive\n\n"
@@ -0,0 +1,78 @@
+import pytest
+
+from lib.job_queue import JobExists, PersistentJobQueue, QueueFull
+
+
+@pytest.fixture
+def queue(tmp_path) -> PersistentJobQueue:
+    return PersistentJobQueue(str(tmp_path / "queue.db"))
+
+
+def test_claims_highest_priority_then_oldest(queue):
+    queue.put("low", priority=0)
+    queue.put("high", priority=5)
+    queue.put("low-2", priority=0)
+    assert [queue.claim()["query_id"] for _ in range(3)] == ["high", "low", "low-2"]
+    assert queue.claim() is None
+
+
+def test_positions_follow_claim_order(queue):
+    queue.put("a")
+    queue.put("b", priority=1)
+    assert queue.position("b") == 1
+    assert queue.position("a") == 2
+    queue.claim()
+    assert queue.position("b") == 0
+    assert queue.position("a") == 1
+    assert queue.position("unknown") is None
+
+
+def test_claim_returns_timeout(queue):
+    queue.put("a", priority=2, timeout_s=30)
+    assert queue.claim() == {"query_id": "a", "priority": 2, "timeout_s": 30}
+
+
+def test_full_queue_rejects(queue):
+    queue.put("a", max_size=1)
+    with pytest.raises(QueueFull):
+        queue.put("b", max_size=1)
+    assert queue.size() == 1
+    assert queue.position("b") is None
+
+
+def test_queued_or_running_job_cannot_be_put_again(queue):
+    queue.put("a", priority=0)
+    with pytest.raises(JobExists):
+        queue.put("a", priority=9)
+    queue.claim()
+    with pytest.raises(JobExists):
+        queue.put("a")
+    queue.complete("a")
+    assert queue.put("a") == 1
+
+
+def test_only_queued_jobs_are_removed(queue):
+    queue.put("a")
+    queue.put("b")
+    queue.claim()
+    assert not queue.remove_queued("a")
+    assert queue.remove_queued("b")
+    assert queue.size() == 0
+
+
+def test_requeued_job_is_claimed_again(queue):
+    queue.put("a")
+    queue.claim()
+    queue.requeue("a")
+    assert queue.position("a") == 1
+    assert queue.claim()["query_id"] == "a"
+
+
+def test_recover_requeues_jobs_of_dead_workers(queue, tmp_path):
+    queue.put("a")
+    queue.put("b")
+    queue.claim()
+    # A restarted process finds the job its previous run was holding
+    restarted = PersistentJobQueue(str(tmp_path / "queue.db"))
+    assert restarted.recover() == ["a"]
+    assert [restarted.claim()["query_id"] for _ in range(2)] == ["a", "b"]
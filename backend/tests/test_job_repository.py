@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from lib.job_queue import QueueFull
+from lib.job_repository import JobRepository
+
+
+@pytest.fixture
+def jobs(tmp_path) -> JobRepository:
+    return JobRepository(str(tmp_path / "jobs.db"))
+
+
+def test_create_records_a_pending_job(jobs):
+    job = jobs.create("q1", "price of a lamp", priority=3, options={"load_profile": "light"})
+    assert job["status"] == "pending"
+    assert job["priority"] == 3
+    assert job["options"] == {"load_profile": "light"}
+
+
+def test_transition_only_applies_from_the_expected_statuses(jobs):
+    jobs.create("q1", "price of a lamp")
+    assert not jobs.transition("q1", "pending", from_statuses=("in_progress",))
+    assert jobs.transition("q1", "in_progress", from_statuses=("pending",))
+    assert jobs.get("q1")["started_at"] is not None
+    assert jobs.transition("q1", "done", result={"price": "$30"})
+    # Finished jobs stay finished, a late cancel doesn't overwrite them
+    assert not jobs.transition("q1", "cancelled")
+    job = jobs.get("q1")
+    assert job["status"] == "done"
+    assert job["result"] == {"price": "$30"}
+    assert job["completed_at"] is not None
+
+
+def test_transition_of_unknown_job(jobs):
+    assert not jobs.transition("missing", "done")
+
+
+def test_active_job_is_not_recreated(jobs):
+    jobs.create("q1", "price of a lamp")
+    jobs.add_step("q1", 0, {"actions": []})
+    assert jobs.create("q1", "price of a chair") is None
+    assert jobs.get("q1")["query"] == "price of a lamp"
+    assert len(jobs.steps("q1")) == 1
+
+
+def test_finished_job_starts_over(jobs):
+    jobs.create("q1", "price of a lamp")
+    jobs.add_step("q1", 0, {"actions": []})
+    jobs.transition("q1", "error", error="boom")
+    job = jobs.create("q1", "price of a chair")
+    assert job["status"] == "pending"
+    assert job["query"] == "price of a chair"
+    assert job["error"] is None
+    assert jobs.steps("q1") == []
+
+
+def test_failed_enqueue_records_nothing(jobs):
+    def saturated():
+        raise QueueFull("Job queue is full")
+
+    with pytest.raises(QueueFull):
+        jobs.create("q1", "price of a lamp", enqueue=saturated)
+    assert jobs.get("q1") is None
+
+    jobs.create("q2", "price of a lamp")
+    jobs.add_step("q2", 0, {"actions": []})
+    jobs.transition("q2", "done")
+    with pytest.raises(QueueFull):
+        jobs.create("q2", "price of a chair", enqueue=saturated)
+    assert jobs.get("q2")["status"] == "done"
+    assert len(jobs.steps("q2")) == 1
+
+
+def test_list_and_count_by_status(jobs):
+    for query_id in ("q1", "q2", "q3"):
+        jobs.create(query_id, "price of a lamp")
+    jobs.transition("q2", "done")
+    listed, total = jobs.list_jobs(status="pending", limit=1)
+    assert total == 2
+    assert len(listed) == 1
+    assert jobs.counts() == {"pending": 2, "done": 1}
+
+
+def test_purge_keeps_active_and_recent_jobs(jobs):
+    for query_id in ("old", "recent", "active"):
+        jobs.create(query_id, "price of a lamp")
+    jobs.transition("old", "done")
+    jobs.add_step("old", 0, {"actions": []})
+    time.sleep(0.05)
+    jobs.transition("recent", "done")
+    assert jobs.purge(0.02) == 1
+    assert jobs.get("old") is None
+    assert jobs.steps("old") == []
+    assert jobs.get("recent") is not None
+    assert jobs.get("active") is not None
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from lib.job_context import check_cancelled
+from lib.job_queue import PersistentJobQueue, QueueFull
+from lib.job_repository import JobRepository
+from service.job_scheduler import JobScheduler
+
+
+def wait_for(predicate, timeout_s: float = 5):
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.01)
+
+
+class Jobs:
+    """Job functions for the scheduler, recording the order they ran in."""
+    def __init__(self, jobs: JobRepository):
+        self.jobs = jobs
+        self.ran = []
+        self.started = threading.Event()
+
+    def run(self, query_id: str, app):
+        self.jobs.transition(query_id, "in_progress", from_statuses=("pending",))
+        self.ran.append(query_id)
+        self.started.set()
+        if query_id.startswith("fail"):
+            raise RuntimeError("step failed")
+        if query_id.startswith("hang"):
+            while True:
+                check_cancelled()
+                time.sleep(0.01)
+        self.jobs.transition(query_id, "done", from_statuses=("in_progress",))
+
+
+@pytest.fixture
+def jobs(tmp_path) -> JobRepository:
+    return JobRepository(str(tmp_path / "jobs.db"))
+
+
+@pytest.fixture
+def runner(jobs) -> Jobs:
+    return Jobs(jobs)
+
+
+@pytest.fixture
+def scheduler(tmp_path, jobs, runner):
+    scheduler = JobScheduler(PersistentJobQueue(str(tmp_path / "queue.db")), runner.run, concurrency=1, max_queue_size=3,
+                             default_timeout=None, bind_browser_driver=False, jobs=jobs)
+    scheduler.queue.poll_interval_s = 0.01
+    yield scheduler
+    scheduler.stop()
+
+
+def submit(scheduler, query_id: str, priority: int = 0, timeout_s: float = None):
+    scheduler.jobs.create(query_id, "price of a lamp", priority=priority,
+                          enqueue=lambda: scheduler.submit(query_id, priority=priority, timeout_s=timeout_s))
+
+
+def test_jobs_run_in_priority_order(scheduler, runner):
+    submit(scheduler, "a")
+    submit(scheduler, "b", priority=1)
+    submit(scheduler, "c")
+    scheduler.start(None)
+    wait_for(lambda: scheduler.jobs.counts() == {"done": 3})
+    assert runner.ran == ["b", "a", "c"]
+    assert scheduler.queue.size() == 0
+    assert scheduler.position("b") is None
+
+
+def test_saturated_queue_rejects(scheduler):
+    for query_id in ("a", "b", "c"):
+        submit(scheduler, query_id)
+    with pytest.raises(QueueFull):
+        submit(scheduler, "d")
+    assert scheduler.jobs.get("d") is None
+
+
+def test_cancel_queued_job(scheduler):
+    submit(scheduler, "a")
+    assert scheduler.cancel("a") == "cancelled"
+    assert scheduler.jobs.get("a")["status"] == "cancelled"
+    assert scheduler.cancel("a") is None
+
+
+def test_cancel_running_job(scheduler, runner):
+    submit(scheduler, "hang")
+    scheduler.start(None)
+    assert runner.started.wait(5)
+    assert scheduler.cancel("hang") == "cancelling"
+    wait_for(lambda: scheduler.jobs.get("hang")["status"] == "cancelled")
+    wait_for(lambda: not scheduler.stats()["running"])
+
+
+def test_job_past_its_timeout_is_stopped(scheduler):
+    submit(scheduler, "hang", timeout_s=0.05)
+    scheduler.start(None)
+    wait_for(lambda: scheduler.jobs.get("hang")["status"] == "timed_out")
+
+
+def test_failed_job_frees_its_worker(scheduler):
+    submit(scheduler, "fail")
+    submit(scheduler, "a")
+    scheduler.start(None)
+    wait_for(lambda: scheduler.jobs.get("a")["status"] == "done")
+    job = scheduler.jobs.get("fail")
+    assert job["status"] == "error"
+    assert job["error"] == "step failed"
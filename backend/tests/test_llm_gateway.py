@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+try:
+    import httpx
+except ImportError:
+    # Newer openai releases are built on the httpx2 fork
+    import httpx2 as httpx
+
+from lib.job_context import JobContext, set_current_job
+from lib.llm_gateway import LLMGateway
+
+PARAMS = {"model": "gpt-4o", "messages": [{"role": "user", "content": "price of a lamp"}]}
+
+
+def status_error(error_cls, status: int, headers: dict = None):
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "https://llm.example/chat"))
+    return error_cls(f"status {status}", response=response, body=None)
+
+
+class FakeCompletions:
+    """Raises the queued errors first, then answers."""
+    def __init__(self, *errors, answer="ok"):
+        self.errors = list(errors)
+        self.answer = answer
+        self.calls = 0
+
+    def create(self, **params):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.answer
+
+
+def gateway_for(completions, **options) -> LLMGateway:
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return LLMGateway(client=client, **{"retry_base_s": 0.001, "retry_max_s": 0.01, **options})
+
+
+@pytest.fixture(autouse=True)
+def no_job():
+    yield
+    set_current_job(None)
+
+
+def test_rate_limited_call_is_retried():
+    completions = FakeCompletions(status_error(openai.RateLimitError, 429), status_error(openai.InternalServerError, 503))
+    gateway = gateway_for(completions)
+    assert gateway.create(**PARAMS) == "ok"
+    assert completions.calls == 3
+    stats = gateway.stats()
+    assert stats["retries"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_client_error_is_not_retried():
+    completions = FakeCompletions(status_error(openai.BadRequestError, 400))
+    gateway = gateway_for(completions)
+    with pytest.raises(openai.BadRequestError):
+        gateway.create(**PARAMS)
+    assert completions.calls == 1
+    assert gateway.stats()["failures"] == 1
+
+
+def test_gives_up_after_max_retries():
+    completions = FakeCompletions(*(status_error(openai.RateLimitError, 429) for _ in range(3)))
+    gateway = gateway_for(completions, max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        gateway.create(**PARAMS)
+    assert completions.calls == 3
+
+
+def test_backoff_follows_retry_after_up_to_the_cap():
+    gateway = gateway_for(FakeCompletions(), retry_max_s=5)
+    assert gateway._backoff_s(0, status_error(openai.RateLimitError, 429, {"retry-after-ms": "250"})) == 0.25
+    assert gateway._backoff_s(0, status_error(openai.RateLimitError, 429, {"retry-after": "2"})) == 2
+    assert gateway._backoff_s(0, status_error(openai.RateLimitError, 429, {"retry-after": "60"})) == 5
+    assert 0 <= gateway._backoff_s(3, status_error(openai.RateLimitError, 429)) <= 5
+
+
+def test_identical_calls_in_flight_share_one_request():
+    entered, answer = threading.Event(), threading.Event()
+
+    class SlowCompletions(FakeCompletions):
+        def create(self, **params):
+            entered.set()
+            answer.wait(5)
+            return super().create(**params)
+
+    completions = SlowCompletions()
+    gateway = gateway_for(completions)
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(gateway.create(**PARAMS))) for _ in range(2)]
+    callers[0].start()
+    assert entered.wait(5)
+    callers[1].start()
+    deadline = time.monotonic() + 5
+    while gateway.stats()["coalesced"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    answer.set()
+    for caller in callers:
+        caller.join(5)
+    assert results == ["ok", "ok"]
+    assert completions.calls == 1
+    assert gateway.stats()["coalesced"] == 1
+
+
+def test_stream_holds_its_slot_until_consumed():
+    gateway = gateway_for(FakeCompletions(answer=iter(["a", "b"])), max_concurrency=1)
+    stream = gateway.create(stream=True, **PARAMS)
+    assert gateway.stats()["in_flight"] == 1
+    assert not gateway._slots.acquire(blocking=False)
+    assert list(stream) == ["a", "b"]
+    assert gateway.stats()["in_flight"] == 0
+    assert gateway._slots.acquire(blocking=False)
+
+
+def test_rate_limit_wait_is_capped_by_the_job_deadline():
+    gateway = gateway_for(FakeCompletions(), rpm=1)
+    # The first request empties the bucket, the next would wait a minute
+    assert gateway._wait_rate_limit(PARAMS) == 0
+    set_current_job(JobContext("q1", timeout_s=0.2))
+    assert 0 < gateway._wait_rate_limit(PARAMS) <= 0.2
+
+
+def test_async_identical_calls_share_one_request():
+    class AsyncCompletions(FakeCompletions):
+        async def create(self, **params):
+            await asyncio.sleep(0.05)
+            return super().create(**params)
+
+    completions = AsyncCompletions()
+    gateway = LLMGateway(async_client=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+    async def both():
+        return await asyncio.gather(gateway.acreate(**PARAMS), gateway.acreate(**PARAMS))
+
+    assert asyncio.run(both()) == ["ok", "ok"]
+    assert completions.calls == 1
+    assert gateway.stats()["coalesced"] == 1
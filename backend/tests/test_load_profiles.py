@@ -0,0 +1,34 @@
+import pytest
+
+from lib.load_profiles import LoadProfiles, build_profiles
+
+
+@pytest.fixture
+def profiles() -> LoadProfiles:
+    return LoadProfiles(build_profiles(["doubleclick.net"]), default="full", domain_rules={"news.example": "text-first"})
+
+
+def test_requested_profile_wins(profiles):
+    assert profiles.select("https://news.example/", "no-media").name == "no-media"
+
+
+def test_domain_rule_covers_subdomains(profiles):
+    assert profiles.select("https://www.news.example/story").name == "text-first"
+    assert profiles.select("https://notnews.example/").name == "full"
+
+
+def test_default_without_a_rule(profiles):
+    assert profiles.select("https://example.org/").name == "full"
+    assert profiles.select(None).name == "full"
+
+
+def test_unknown_profile_is_rejected(profiles):
+    with pytest.raises(ValueError):
+        profiles.select("https://example.org/", "turbo")
+    with pytest.raises(ValueError):
+        LoadProfiles(build_profiles([]), domain_rules={"example.org": "turbo"})
+
+
+def test_context_options_carry_the_viewport(profiles):
+    assert profiles.select(None, "full").context_options() == {}
+    assert profiles.select(None, "text-first").context_options() == {"viewport": {"width": 1024, "height": 768}}
@@ -0,0 +1,132 @@
+import time
+
+import fakeredis
+import pytest
+
+from lib.job_queue import JobExists, QueueFull
+from lib.redis_job_queue import RedisJobQueue
+
+
+@pytest.fixture
+def server() -> fakeredis.FakeServer:
+    return fakeredis.FakeServer()
+
+
+def worker(server, consumer: str = "worker-1", **options) -> RedisJobQueue:
+    """A worker process's view of the shared queue, claim() returns at once."""
+    return RedisJobQueue(fakeredis.FakeStrictRedis(server=server), consumer=consumer, **{"block_ms": 0, **options})
+
+
+@pytest.fixture
+def queue(server) -> RedisJobQueue:
+    return worker(server)
+
+
+def test_claims_high_priority_then_oldest(queue):
+    queue.put("low", priority=0)
+    queue.put("high", priority=5, timeout_s=30)
+    queue.put("low-2", priority=0)
+    first = queue.claim()
+    assert first == {"query_id": "high", "priority": 5, "timeout_s": 30.0, "deliveries": 1, "exhausted": False}
+    assert [queue.claim()["query_id"] for _ in range(2)] == ["low", "low-2"]
+    assert queue.claim() is None
+
+
+def test_positions(queue):
+    queue.put("a")
+    queue.put("b", priority=1)
+    assert (queue.position("b"), queue.position("a")) == (1, 2)
+    queue.claim()
+    assert (queue.position("b"), queue.position("a")) == (0, 1)
+    queue.complete("b")
+    assert queue.position("b") is None
+    assert queue.size() == 1
+
+
+def test_full_queue_rejects(queue):
+    queue.put("a", max_size=1)
+    with pytest.raises(QueueFull):
+        queue.put("b", max_size=1)
+
+
+def test_queued_or_running_job_cannot_be_put_again(queue):
+    queue.put("a")
+    with pytest.raises(JobExists):
+        queue.put("a")
+    queue.claim()
+    with pytest.raises(JobExists):
+        queue.put("a")
+    queue.complete("a")
+    assert queue.put("a") == 1
+
+
+def test_cancelled_queued_job_is_skipped(queue):
+    queue.put("a")
+    queue.put("b")
+    assert queue.remove_queued("a")
+    assert not queue.remove_queued("a")
+    assert queue.claim() is None
+    assert queue.claim()["query_id"] == "b"
+
+
+def test_jobs_go_to_one_worker_each(server):
+    first, second = worker(server, "worker-1"), worker(server, "worker-2")
+    first.put("a")
+    first.put("b")
+    assert {first.claim()["query_id"], second.claim()["query_id"]} == {"a", "b"}
+    assert first.claim() is None and second.claim() is None
+
+
+def test_job_of_a_dead_worker_is_claimed_again(server):
+    crashed = worker(server, "worker-1", visibility_timeout_s=0.05, max_deliveries=1)
+    crashed.put("a")
+    crashed.claim()
+    other = worker(server, "worker-2", visibility_timeout_s=0.05, max_deliveries=1)
+    assert other.claim() is None
+    time.sleep(0.1)
+    job = other.claim()
+    assert job["query_id"] == "a"
+    assert job["deliveries"] == 2
+    # Its workers keep dying, the scheduler gives up on it
+    assert job["exhausted"]
+
+
+def test_heartbeat_keeps_a_running_job(server):
+    running = worker(server, "worker-1", visibility_timeout_s=0.3)
+    running.put("a")
+    running.claim()
+    other = worker(server, "worker-2", visibility_timeout_s=0.3)
+    for _ in range(3):
+        time.sleep(0.15)
+        running.heartbeat({"running": 1}, ttl_s=1)
+    assert other.claim() is None
+    assert [info["running"] for info in other.workers()] == ["1"]
+
+
+def test_cancel_reaches_the_running_worker(server):
+    running = worker(server, "worker-1")
+    running.put("a")
+    running.claim()
+    api = worker(server, "api")
+    assert api.request_cancel("a")
+    assert not api.request_cancel("unknown")
+    assert running.heartbeat({"running": 1}, ttl_s=1) == ["a"]
+    running.complete("a")
+    assert not api.request_cancel("a")
+
+
+def test_requeued_job_is_claimed_again(queue):
+    queue.put("a")
+    queue.claim()
+    queue.requeue("a")
+    assert queue.position("a") == 1
+    assert queue.claim()["query_id"] == "a"
+
+
+def test_restarted_worker_recovers_its_jobs(server):
+    worker(server, "worker-1").put("a")
+    worker(server, "worker-1").claim()
+    restarted = worker(server, "worker-1")
+    assert restarted.recover() == ["a"]
+    assert restarted.position("a") == 1
+    assert restarted.claim()["query_id"] == "a"
@@ -0,0 +1,75 @@
+from lib.semantic_cache import PlanTemplate, SemanticPlanCache, normalize_query
+
+
+def search_plan(term: str) -> dict:
+    return {
+        "goto": f"https://www.google.com/search?q={term.replace(' ', '+')}",
+        "action_plan": ["Open google", f"Type '{term}' into the search bar and submit", "Read the title of the first result"],
+        "vision_only": ["Read the title of the first result"],
+    }
+
+
+def flight_plan(origin: str, destination: str) -> dict:
+    return {
+        "goto": "https://www.google.com/travel/flights",
+        "action_plan": [f"Search flights from {origin} to {destination} departing next week", "Read the first result"],
+        "vision_only": ["Read the first result"],
+    }
+
+
+def test_slots_are_the_values_the_plan_quotes():
+    template = PlanTemplate("search google for green frontier capital", search_plan("green frontier capital"))
+    assert template.slot_values() == ["green frontier capital"]
+
+
+def test_reworded_query_is_a_semantic_hit():
+    cache = SemanticPlanCache()
+    cache.add("search google for green frontier capital", search_plan("green frontier capital"))
+    plan, kind, similarity = cache.lookup("Search Google for Green Frontier Capital!")
+    assert kind == "semantic"
+    assert plan == search_plan("green frontier capital")
+    assert similarity >= cache.threshold
+
+
+def test_new_slot_value_is_a_template_hit_with_the_value_filled_in():
+    cache = SemanticPlanCache()
+    cache.add("search google for green frontier capital", search_plan("green frontier capital"))
+    plan, kind, _ = cache.lookup("search google for blue harbor partners")
+    assert kind == "template"
+    assert plan["goto"] == "https://www.google.com/search?q=blue+harbor+partners"
+    assert plan["action_plan"][1] == "Type 'blue harbor partners' into the search bar and submit"
+
+
+def test_content_word_outside_the_slots_misses():
+    # Paris is plain text in the plan, no slot, the cached plan flies there
+    cache = SemanticPlanCache()
+    cache.add("find the cheapest flight from new york to paris next week", flight_plan("new york", "paris"))
+    assert cache.lookup("find the cheapest flight from new york to london next week") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_template_with_unslotted_change_does_not_fill():
+    template = PlanTemplate("search google for acme reviews in paris", search_plan("acme"))
+    assert template.slot_values() == ["acme"]
+    assert template.fill(normalize_query("search google for initech reviews in paris")) is not None
+    assert template.fill(normalize_query("search google for initech reviews in london")) is None
+
+
+def test_different_numbers_are_not_covered():
+    template = PlanTemplate("book a table for 2 at the ritz", {"goto": "https://example.com", "action_plan": ["Book a table for 2"]})
+    assert template.covers(normalize_query("book a table for 2 at the ritz"))
+    assert not template.covers(normalize_query("book a table for 4 at the ritz"))
+
+
+def test_unrelated_query_misses():
+    cache = SemanticPlanCache()
+    cache.add("search google for green frontier capital", search_plan("green frontier capital"))
+    assert cache.lookup("what is the weather in tokyo tomorrow") is None
+
+
+def test_hits_are_copies():
+    cache = SemanticPlanCache()
+    cache.add("search google for green frontier capital", search_plan("green frontier capital"))
+    plan, _, _ = cache.lookup("search google for green frontier capital")
+    plan["action_plan"].clear()
+    assert cache.lookup("search google for green frontier capital")[0]["action_plan"]
@@ -0,0 +1,67 @@
+"""
+Job worker for JOB_QUEUE_BACKEND=redis. Runs up to --concurrency jobs from
+the shared Redis queue, start as many as needed on any host pointing at the
+same REDIS_URL and job database:
+
+    JOB_QUEUE_BACKEND=redis python worker.py --concurrency 4
+
+Unless PREWARM_ENABLED=false it launches its browsers and opens the LLM
+connections before claiming a job. SIGTERM or Ctrl-C drains the worker, it
+stops taking jobs, waits up to JOB_DRAIN_TIMEOUT_S for the running ones and
+requeues what is left.
+"""
+import argparse
+import os
+import signal
+import threading
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, help="jobs run at once, JOB_WORKER_CONCURRENCY by default")
+    parser.add_argument("--worker-id", help="consumer name, stable ids let a restarted worker requeue its jobs at once")
+    args = parser.parse_args()
+
+    # Read by config, before the services are imported
+    os.environ["JOB_QUEUE_BACKEND"] = "redis"
+    if args.worker_id:
+        os.environ["JOB_WORKER_ID"] = args.worker_id
+
+    from flask import Flask
+    from lib.logging import log
+    from lib.browser_interactor import browser_pool
+    from lib.async_browser_interactor import async_browser_pool
+    from lib.async_runner import async_runner
+    from service.job_scheduler import job_scheduler, prewarm
+    from config import REDIS_URL, EXECUTION_MODE, JOB_DRAIN_TIMEOUT_S, PREWARM_ENABLED
+
+    if args.concurrency:
+        job_scheduler.concurrency = args.concurrency
+
+    # Events are published to the per query Redis streams the API serves
+    app = Flask("worker")
+    app.config["REDIS_URL"] = REDIS_URL
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    # Browsers and LLM connections are up before the first job is claimed
+    if PREWARM_ENABLED:
+        prewarm()
+    job_scheduler.start(app)
+    log.info("Worker started", {"worker_id": job_scheduler.queue.consumer, "concurrency": job_scheduler.concurrency})
+    stop.wait()
+
+    log.info("Worker draining", {"worker_id": job_scheduler.queue.consumer})
+    job_scheduler.drain(JOB_DRAIN_TIMEOUT_S)
+    if EXECUTION_MODE == "asyncio":
+        async_runner.run(async_browser_pool.shutdown())
+        async_runner.stop()
+    else:
+        browser_pool.shutdown()
+    log.info("Worker stopped", {"worker_id": job_scheduler.queue.consumer})
+
+
+if __name__ == "__main__":
+    main()
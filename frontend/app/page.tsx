@@ -1,32 +1,44 @@
 'use client';
 import Image from 'next/image';
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
+
+const API_URL = 'http://localhost:8000';
 
 export default function Home() {
 	const [query, setQuery] = useState('');
 	const [messages, setMessages] = useState<string[]>([]);
+	const eventSourceRef = useRef<EventSource | null>(null);
 
 	useEffect(() => {
-		const eventSource = new EventSource('http://localhost:8000/stream');
+		return () => {
+			eventSourceRef.current?.close();
+		};
+	}, []);
+
+	// Follow only this query's events, EventSource resumes from the last
+	// event id by itself if the connection drops
+	const subscribe = (queryId: string) => {
+		eventSourceRef.current?.close();
+		const eventSource = new EventSource(`${API_URL}/stream/${queryId}`);
 
 		eventSource.onmessage = (event) => {
 			const data = JSON.parse(event.data);
 			setMessages((prev) => [...prev, JSON.stringify(data)]);
+			if (data.done) {
+				eventSource.close();
+			}
 		};
 
-		return () => {
-			eventSource.close();
-		};
-	}, []);
+		eventSourceRef.current = eventSource;
+	};
 
 	const handleSubmit = async () => {
 		const payload = {
 			query,
-			query_id: '47204a6b-8eb1-4d83-bcf1-2d7ba8cba740',
 		};
 
 		try {
-			const response = await fetch('http://localhost:8000/interact', {
+			const response = await fetch(`${API_URL}/interact`, {
 				method: 'POST',
 				headers: {
 					'Content-Type': 'application/json',
@@ -35,6 +47,9 @@ export default function Home() {
 			});
 			const data = await response.json();
 			console.log('Response:', data);
+			if (response.ok) {
+				subscribe(data.query_id);
+			}
 		} catch (error) {
 			console.error('Error:', error);
 		}
@@ -62,13 +77,14 @@ export default function Home() {
 					const data = JSON.parse(message);
 					return (
 						<div key={index} className='mb-2'>
-							{data.img ? (
+							{data.img_url ? (
 								<>
 									<Image
-										src={`data:image/png;base64,${data.img}`}
+										src={`${API_URL}${data.img_url}`}
 										alt='Screenshot'
 										width={800}
 										height={600}
+										unoptimized
 										className='max-w-full h-auto mb-2'
 									/>
 									<div>{data.message}</div>